@@ -0,0 +1,612 @@
+import argparse
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import anyio
+from sqlalchemy import DateTime, case, delete, func, insert, literal_column, select, type_coerce, union_all
+
+import config
+import models
+from retencion import CONTADORES_FALLA, SENSORES
+
+# =====================================================
+#  Agregados por máquina y hora / día (rollups)
+# =====================================================
+# machine_rollups_hourly y machine_rollups_daily guardan, por máquina y
+# hora / día, la cantidad de lecturas, de fallas (en total y por tipo) y la
+# suma, mínimo y máximo de cada sensor, de TODO el historial: lecturas crudas
+# y las que la retención ya pasó a machine_readings_hourly. La analítica de
+# la flota (analitica_endpoints.py) se responde solo desde estas tablas, así
+# su costo depende de las máquinas y del rango pedido, no de cuántas lecturas
+# crudas haya.
+#
+# Se mantienen al escribir. Cada lote suma su delta con un upsert (INSERT ...
+# ON CONFLICT DO UPDATE) por tabla:
+#   escritura diferida        persistencia.insertar_lecturas   misma transacción (ya en un hilo)
+#   importación de CSV        importar_csv.py                  misma transacción
+#   /predecir, /predecir/lote main.guardar_lecturas            machine_rollup_deltas
+#   y la ingesta continua
+#
+# En el camino de las peticiones un upsert por petición bloquea la fila de
+# (máquina, hora) y la del día hasta el commit: con muchas peticiones de las
+# mismas máquinas (Postgres) se encolan unas detrás de otras. Por eso ahí el
+# delta por hora se INSERTA en machine_rollup_deltas, en la transacción de las
+# lecturas (sin bloquear filas compartidas), y un hilo de cada worker
+# (AcumuladorAgregados) los pasa a los agregados cada AGREGADOS_INTERVALO_S,
+# juntos y ordenados. La analítica va hasta AGREGADOS_INTERVALO_S atrasada;
+# nada se pierde si el proceso muere (los deltas ya están en la BD).
+# Con AGREGADOS_INTERVALO_S=0 se vuelve al upsert en la transacción de la petición.
+#
+# Los borrados y correcciones de lecturas (CRUD) recalculan el día afectado
+# de esa máquina desde el historial y borran sus deltas pendientes de ese
+# día, que el recálculo ya cuenta (ver recalcular).
+#
+# Reconstrucción completa (ej: después de cargar lecturas directo en la BD):
+#   python agregados.py [--desde 2026-01-01] [--hasta 2026-02-01]
+# python migraciones.py la corre sola la primera vez que crea las tablas.
+
+TABLAS = (models.MachineRollupHourly, models.MachineRollupDaily)
+VENTANA = timedelta(days=1)       # La reconstrucción va de a un día (una transacción por día)
+
+
+def truncar(columna, dialecto, unidad):
+    """Inicio de la hora / día / semana (lunes) / mes de 'columna' en SQL, como DateTime."""
+    if dialecto == "postgresql":
+        return func.date_trunc(literal_column(f"'{unidad}'"), columna)
+    if dialecto == "sqlite":
+        # El mismo formato con el que SQLAlchemy guarda DateTime en SQLite
+        if unidad == "hour":
+            texto = func.strftime(literal_column("'%Y-%m-%d %H:00:00.000000'"), columna)
+        elif unidad == "day":
+            texto = func.strftime(literal_column("'%Y-%m-%d 00:00:00.000000'"), columna)
+        elif unidad == "week":
+            texto = func.strftime(
+                literal_column("'%Y-%m-%d 00:00:00.000000'"), columna,
+                literal_column("'-6 days'"), literal_column("'weekday 1'"),
+            )
+        else:
+            texto = func.strftime(literal_column("'%Y-%m-01 00:00:00.000000'"), columna)
+        return type_coerce(texto, DateTime)
+    raise NotImplementedError(f"Agregados no implementados para '{dialecto}'.")
+
+
+def inicio_hora(momento):
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def inicio_dia(momento):
+    return momento.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# ================================
+# Upsert (suma de deltas)
+# ================================
+
+def _insert(dialecto):
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert, func.least, func.greatest
+    if dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert, func.min, func.max  # min/max con dos argumentos son escalares en SQLite
+    raise NotImplementedError(f"Agregados no implementados para '{dialecto}'.")
+
+
+def upsert(dialecto, tabla, consulta=None):
+    """
+    INSERT en 'tabla' (un modelo de TABLAS) de las filas con que se ejecute
+    (executemany) o del SELECT 'consulta' (columnas en el orden de la tabla);
+    si la (máquina, bucket) ya existe, suma los contadores y combina sumas,
+    mínimos y máximos.
+    """
+    insert, menor, mayor = _insert(dialecto)
+    t = tabla.__table__
+    if consulta is not None:
+        sentencia = insert(t).from_select([c.name for c in t.columns], consulta)
+    else:
+        sentencia = insert(t)
+    nuevo = sentencia.excluded
+    cambios = {nombre: t.c[nombre] + nuevo[nombre] for nombre in ["reading_count", "failure_count", *CONTADORES_FALLA]}
+    for sensor in SENSORES:
+        # COALESCE: un lado en NULL (sensor sin valores) no anula al otro
+        for sufijo, combinar in (("_sum", lambda a, b: a + b), ("_min", menor), ("_max", mayor)):
+            actual, entrante = t.c[sensor + sufijo], nuevo[sensor + sufijo]
+            cambios[sensor + sufijo] = func.coalesce(combinar(actual, entrante), actual, entrante)
+    return sentencia.on_conflict_do_update(index_elements=["machine_id", "bucket"], set_=cambios)
+
+
+# Una sentencia por (dialecto, tabla): con executemany se compila una sola vez
+_UPSERTS = {}
+
+
+def _upsert_filas(dialecto, tabla):
+    sentencia = _UPSERTS.get((dialecto, tabla))
+    if sentencia is None:
+        sentencia = _UPSERTS[(dialecto, tabla)] = upsert(dialecto, tabla)
+    return sentencia
+
+
+# ================================
+# Al escribir: delta de un lote de lecturas
+# ================================
+_COLUMNAS_SENSOR = [(sensor, f"{sensor}_sum", f"{sensor}_min", f"{sensor}_max") for sensor in SENSORES]
+_BITS_FALLA = [(nombre, models.FAILURE_FLAGS[tipo]) for nombre, tipo in CONTADORES_FALLA.items()]
+
+
+def _vacio(machine_id, bucket):
+    fila = {"machine_id": machine_id, "bucket": bucket, "reading_count": 0, "failure_count": 0}
+    fila.update({nombre: 0 for nombre in CONTADORES_FALLA})
+    for _, suma, minimo, maximo in _COLUMNAS_SENSOR:
+        fila.update({suma: None, minimo: None, maximo: None})
+    return fila
+
+
+def _combinar(acumulado, otro):
+    """Suma el agregado 'otro' a 'acumulado' (misma máquina; la hora entra en el día)."""
+    for nombre in ["reading_count", "failure_count", *CONTADORES_FALLA]:
+        acumulado[nombre] += otro[nombre]
+    for _, suma, minimo, maximo in _COLUMNAS_SENSOR:
+        if otro[suma] is None:
+            continue
+        if acumulado[suma] is None:
+            acumulado[suma], acumulado[minimo], acumulado[maximo] = otro[suma], otro[minimo], otro[maximo]
+        else:
+            acumulado[suma] += otro[suma]
+            acumulado[minimo] = min(acumulado[minimo], otro[minimo])
+            acumulado[maximo] = max(acumulado[maximo], otro[maximo])
+
+
+def deltas(filas):
+    """
+    {tabla: [filas de agregado]} de las lecturas 'filas' (dicts con las
+    columnas de machine_readings, timestamp incluido), ordenadas por
+    (machine_id, bucket): los upserts concurrentes bloquean en el mismo orden.
+    Una sola pasada por las lecturas; los días salen de sumar sus horas.
+    """
+    horas = {}
+    for fila in filas:
+        clave = (fila["machine_id"], inicio_hora(fila["timestamp"]))
+        acumulado = horas.get(clave)
+        if acumulado is None:
+            acumulado = horas[clave] = _vacio(*clave)
+        acumulado["reading_count"] += 1
+        if fila.get("machine_failure"):
+            acumulado["failure_count"] += 1
+        flags = fila.get("failure_flags")
+        if flags:
+            for nombre, bit in _BITS_FALLA:
+                if flags & bit:
+                    acumulado[nombre] += 1
+        for sensor, suma, minimo, maximo in _COLUMNAS_SENSOR:
+            valor = fila.get(sensor)
+            if valor is None:
+                continue
+            valor = float(valor)
+            if acumulado[suma] is None:
+                acumulado[suma] = acumulado[minimo] = acumulado[maximo] = valor
+            else:
+                acumulado[suma] += valor
+                if valor < acumulado[minimo]:
+                    acumulado[minimo] = valor
+                elif valor > acumulado[maximo]:
+                    acumulado[maximo] = valor
+
+    dias = {}
+    for (machine_id, hora), acumulado in horas.items():
+        clave = (machine_id, inicio_dia(hora))
+        if clave in dias:
+            _combinar(dias[clave], acumulado)
+        else:
+            dias[clave] = {**acumulado, "bucket": clave[1]}
+    return {
+        models.MachineRollupHourly: [horas[clave] for clave in sorted(horas)],
+        models.MachineRollupDaily: [dias[clave] for clave in sorted(dias)],
+    }
+
+
+def registrar(conn, filas):
+    """Suma las lecturas 'filas' a los agregados, dentro de la transacción de 'conn' (motor síncrono)."""
+    for tabla, agregados in deltas(filas).items():
+        conn.execute(_upsert_filas(conn.dialect.name, tabla), agregados)
+
+
+async def registrar_async(db, filas):
+    """Como registrar(), con la AsyncSession de la petición (se confirma con su commit)."""
+    for tabla, agregados in deltas(filas).items():
+        await db.execute(_upsert_filas(db.bind.dialect.name, tabla), agregados)
+
+
+# ================================
+# Deltas pendientes (camino de las peticiones)
+# ================================
+
+def registrar_pendiente(conn, filas):
+    """
+    Guarda el delta por hora de las lecturas 'filas' en machine_rollup_deltas,
+    dentro de la transacción de 'conn' (se confirma junto con las lecturas).
+    Son INSERTs de filas nuevas: no bloquean las de machine_rollups_*.
+    """
+    horas = deltas(filas)[models.MachineRollupHourly]
+    if horas:
+        conn.execute(insert(models.MachineRollupDelta), horas)
+
+
+async def registrar_pendiente_async(db, filas):
+    """Como registrar_pendiente(), con la AsyncSession de la petición."""
+    horas = deltas(filas)[models.MachineRollupHourly]
+    if horas:
+        await db.execute(insert(models.MachineRollupDelta), horas)
+
+
+class AcumuladorAgregados:
+    """Suma periódicamente (en un hilo) los deltas de machine_rollup_deltas a los agregados."""
+
+    LOTE_DELTAS = 5000  # Deltas tomados por transacción
+
+    def __init__(self, intervalo_s=1.0):
+        self.intervalo = intervalo_s
+        self._lock_vaciado = threading.Lock()  # Un vaciado a la vez en este worker
+        self._tarea = None
+        self._engine = None
+        self._vaciados = 0
+        self._deltas_leidos = 0
+        self._filas_escritas = 0
+        self._ultimo_vaciado = None
+        self.ultimo_error = None
+
+    @property
+    def activo(self):
+        return self._tarea is not None
+
+    def vaciar(self, engine):
+        """
+        Pasa los deltas pendientes (de todos los workers) a los agregados, de a
+        LOTE_DELTAS por transacción: los borra con DELETE ... RETURNING (cada
+        delta lo toma un solo worker) y suma a cada (máquina, hora / día) un
+        upsert, ordenado por (machine_id, bucket) para que los workers bloqueen
+        las filas en el mismo orden. Si falla, los deltas siguen en la tabla
+        para el próximo vaciado. Retorna la cantidad de filas de agregado escritas.
+        """
+        with self._lock_vaciado:
+            escritas = 0
+            while True:
+                leidos, filas = self._vaciar_lote(engine)
+                escritas += filas
+                if leidos < self.LOTE_DELTAS:
+                    break
+            self._vaciados += 1
+            self._ultimo_vaciado = datetime.now()
+            return escritas
+
+    def _vaciar_lote(self, engine):
+        pendiente = models.MachineRollupDelta
+        columnas = [c for c in pendiente.__table__.columns if c.name != "delta_id"]
+        with engine.begin() as conn:
+            lote = select(pendiente.delta_id).order_by(pendiente.delta_id).limit(self.LOTE_DELTAS)
+            tomados = conn.execute(
+                delete(pendiente).where(pendiente.delta_id.in_(lote)).returning(*columnas)
+            ).mappings().all()
+            if not tomados:
+                return 0, 0
+            horas, dias = {}, {}
+            for delta in tomados:
+                for por_bucket, bucket in ((horas, delta["bucket"]), (dias, inicio_dia(delta["bucket"]))):
+                    clave = (delta["machine_id"], bucket)
+                    if clave in por_bucket:
+                        _combinar(por_bucket[clave], delta)
+                    else:
+                        por_bucket[clave] = {**delta, "bucket": bucket}
+            escritas = 0
+            for tabla, por_bucket in ((models.MachineRollupHourly, horas), (models.MachineRollupDaily, dias)):
+                conn.execute(_upsert_filas(conn.dialect.name, tabla), [por_bucket[clave] for clave in sorted(por_bucket)])
+                escritas += len(por_bucket)
+        self._deltas_leidos += len(tomados)
+        self._filas_escritas += escritas
+        return len(tomados), escritas
+
+    # ---------- Ciclo de vida ----------
+
+    async def iniciar(self, engine):
+        """Vaciado periódico; con intervalo 0 queda inactivo (upsert en la transacción de cada petición)."""
+        self._engine = engine
+        if self.intervalo > 0:
+            self._tarea = asyncio.create_task(self._vaciado_periodico())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._engine is not None:
+            await anyio.to_thread.run_sync(self.vaciar, self._engine)  # Los agregados quedan al día al apagar
+
+    async def _vaciado_periodico(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await anyio.to_thread.run_sync(self.vaciar, self._engine)
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+
+    def estadisticas(self):
+        return {
+            "activo": self.activo,
+            "vaciados": self._vaciados,
+            "deltas_leidos": self._deltas_leidos,
+            "filas_escritas": self._filas_escritas,
+            "ultimo_vaciado": self._ultimo_vaciado.isoformat() if self._ultimo_vaciado else None,
+            "intervalo_s": self.intervalo,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+acumulador_agregados = AcumuladorAgregados(config.AGREGADOS_INTERVALO_S)
+
+
+# ================================
+# Desde el historial: recálculo y reconstrucción
+# ================================
+
+def consulta_desde_lecturas(dialecto, desde, hasta, machine_id=None):
+    """SELECT de machine_readings agregado por (máquina, hora), con las columnas de MachineRollupHourly."""
+    lectura = models.MachineReading
+
+    def contar(condicion):
+        return func.coalesce(func.sum(case((condicion, 1), else_=0)), 0)
+
+    hora = truncar(lectura.timestamp, dialecto, "hour")
+    expresiones = {
+        "machine_id": lectura.machine_id,
+        "bucket": hora,
+        "reading_count": func.count(),
+        "failure_count": contar(lectura.machine_failure.is_(True)),
+        **{nombre: contar(models.has_failure_type(lectura.failure_flags, tipo)) for nombre, tipo in CONTADORES_FALLA.items()},
+    }
+    for sensor in SENSORES:
+        columna = getattr(lectura, sensor)
+        expresiones[f"{sensor}_sum"] = func.sum(columna)
+        expresiones[f"{sensor}_min"] = func.min(columna)
+        expresiones[f"{sensor}_max"] = func.max(columna)
+
+    consulta = select(*(expresiones[c.name].label(c.name) for c in models.MachineRollupHourly.__table__.columns))\
+        .where(lectura.timestamp >= desde, lectura.timestamp < hasta)\
+        .group_by(lectura.machine_id, hora)
+    if machine_id is not None:
+        consulta = consulta.where(lectura.machine_id == machine_id)
+    return consulta
+
+
+def consulta_desde_resumenes(desde, hasta, machine_id=None):
+    """SELECT de machine_readings_hourly (lo que la retención ya resumió) con las columnas de MachineRollupHourly."""
+    resumen = models.MachineReadingHourly
+    expresiones = {
+        "machine_id": resumen.machine_id,
+        "bucket": resumen.hour,
+        **{nombre: getattr(resumen, nombre) for nombre in ["reading_count", "failure_count", *CONTADORES_FALLA]},
+    }
+    for sensor in SENSORES:
+        expresiones[f"{sensor}_sum"] = getattr(resumen, f"{sensor}_avg") * resumen.reading_count
+        expresiones[f"{sensor}_min"] = getattr(resumen, f"{sensor}_min")
+        expresiones[f"{sensor}_max"] = getattr(resumen, f"{sensor}_max")
+
+    consulta = select(*(expresiones[c.name].label(c.name) for c in models.MachineRollupHourly.__table__.columns))\
+        .where(resumen.hour >= desde, resumen.hour < hasta)
+    if machine_id is not None:
+        consulta = consulta.where(resumen.machine_id == machine_id)
+    return consulta
+
+
+def consulta_diaria(dialecto, desde, hasta, machine_id=None):
+    """SELECT de machine_rollups_hourly agregado por (máquina, día), con las columnas de MachineRollupDaily."""
+    hora = models.MachineRollupHourly
+    dia = truncar(hora.bucket, dialecto, "day")
+    expresiones = {
+        "machine_id": hora.machine_id,
+        "bucket": dia,
+        **{nombre: func.sum(getattr(hora, nombre)) for nombre in ["reading_count", "failure_count", *CONTADORES_FALLA]},
+    }
+    for sensor in SENSORES:
+        expresiones[f"{sensor}_sum"] = func.sum(getattr(hora, f"{sensor}_sum"))
+        expresiones[f"{sensor}_min"] = func.min(getattr(hora, f"{sensor}_min"))
+        expresiones[f"{sensor}_max"] = func.max(getattr(hora, f"{sensor}_max"))
+
+    consulta = select(*(expresiones[c.name].label(c.name) for c in models.MachineRollupDaily.__table__.columns))\
+        .where(hora.bucket >= desde, hora.bucket < hasta)\
+        .group_by(hora.machine_id, dia)
+    if machine_id is not None:
+        consulta = consulta.where(hora.machine_id == machine_id)
+    return consulta
+
+
+def _recalcular(conn, desde, hasta, machine_id=None):
+    """Rehace los agregados de [desde, hasta) (días completos) desde el historial, en la transacción de 'conn'."""
+    dialecto = conn.dialect.name
+    # Los deltas pendientes del rango (de cualquier worker) ya están en el historial: el recálculo los cuenta
+    for tabla in (*TABLAS, models.MachineRollupDelta):
+        borrar = delete(tabla).where(tabla.bucket >= desde, tabla.bucket < hasta)
+        if machine_id is not None:
+            borrar = borrar.where(tabla.machine_id == machine_id)
+        conn.execute(borrar)
+    # Lecturas crudas y resumidas: una misma hora puede tener de las dos (importaciones tardías)
+    conn.execute(upsert(dialecto, models.MachineRollupHourly, consulta=consulta_desde_lecturas(dialecto, desde, hasta, machine_id)))
+    conn.execute(upsert(dialecto, models.MachineRollupHourly, consulta=consulta_desde_resumenes(desde, hasta, machine_id)))
+    conn.execute(upsert(dialecto, models.MachineRollupDaily, consulta=consulta_diaria(dialecto, desde, hasta, machine_id)))
+
+
+def recalcular(conn, machine_id, momento):
+    """
+    Rehace el día de 'momento' de una máquina desde el historial: después de
+    borrar una lectura o de corregir sus tipos de falla (mínimos y máximos
+    no se pueden "restar").
+
+    En Postgres bloquea antes la fila de la máquina (FOR UPDATE): espera a las
+    transacciones que están insertando lecturas suyas (la FK toma FOR KEY
+    SHARE) y frena las nuevas hasta el commit. Así cada lectura del día queda
+    o en el recálculo o en un delta pendiente posterior, nunca en los dos.
+    """
+    conn.execute(select(models.Machine.machine_id).where(models.Machine.machine_id == machine_id).with_for_update())
+    desde = inicio_dia(momento)
+    _recalcular(conn, desde, desde + VENTANA, machine_id)
+
+
+def _siguiente(conn, desde, hasta):
+    """Inicio del primer día >= desde con lecturas, resúmenes o agregados (None si no queda ninguno)."""
+    lectura, resumen, agregado = models.MachineReading, models.MachineReadingHourly, models.MachineRollupHourly
+    primeros = union_all(
+        select(func.min(lectura.timestamp).label("m")).where(lectura.timestamp >= desde, lectura.timestamp < hasta),
+        select(func.min(resumen.hour).label("m")).where(resumen.hour >= desde, resumen.hour < hasta),
+        select(func.min(agregado.bucket).label("m")).where(agregado.bucket >= desde, agregado.bucket < hasta),
+    ).subquery()
+    siguiente = conn.execute(select(func.min(type_coerce(primeros.c.m, DateTime)))).scalar()
+    return inicio_dia(siguiente) if siguiente is not None else None
+
+
+def reconstruir(engine, desde=None, hasta=None, reportar=print):
+    """
+    Rehace los agregados de [desde, hasta) (días completos; sin límites,
+    todo el historial) desde machine_readings y machine_readings_hourly, un
+    día (una transacción) a la vez, saltando los días vacíos. Las lecturas
+    que se escriban en un día mientras se reconstruye pueden quedar fuera:
+    conviene correrlo sin ingesta o repetir esos días.
+    """
+    inicio = time.perf_counter()
+    desde = inicio_dia(desde) if desde is not None else datetime.min
+    hasta = inicio_dia(hasta - timedelta(microseconds=1)) + VENTANA if hasta is not None else datetime.max
+    dias = 0
+    while True:
+        with engine.connect() as conn:
+            dia = _siguiente(conn, desde, hasta)
+        if dia is None:
+            break
+        with engine.begin() as conn:
+            _recalcular(conn, dia, dia + VENTANA)
+        dias += 1
+        desde = dia + VENTANA
+    segundos = time.perf_counter() - inicio
+    if reportar is not None:
+        reportar(f"Agregados reconstruidos: {dias} días en {segundos:.1f} s.")
+    return {"dias": dias, "segundos": segundos}
+
+
+# ================================
+# Analítica de la flota
+# ================================
+
+def tabla_para(unidad, desde, hasta):
+    """Los agregados diarios alcanzan para buckets de un día o más con límites en días completos."""
+    alineado = all(m is None or m == inicio_dia(m) for m in (desde, hasta))
+    return models.MachineRollupDaily if unidad != "hour" and alineado else models.MachineRollupHourly
+
+
+def consulta_analitica(dialecto, agrupar=(), unidad="day", desde=None, hasta=None,
+                       machine_ids=None, tipos=None, ubicaciones=None):
+    """
+    SELECT sobre los agregados agrupado por bucket de 'unidad' (None = todo el
+    rango en un solo bucket) y las dimensiones 'agrupar' (machine, type,
+    location; failure_mode se desdobla después en Python, ver filas_analiticas).
+    Retorna (consulta, tabla usada).
+    """
+    tabla = tabla_para(unidad, desde, hasta)
+    maquina = models.Machine
+    columnas, grupos = [], []
+    if unidad is not None:
+        bucket = tabla.bucket if (unidad == "hour" or (unidad == "day" and tabla is models.MachineRollupDaily)) \
+            else truncar(tabla.bucket, dialecto, unidad)
+        columnas.append(bucket.label("bucket"))
+        grupos.append(bucket)
+    for dimension, columna in (("machine", tabla.machine_id), ("type", maquina.type), ("location", maquina.location)):
+        if dimension in agrupar:
+            columnas.append(columna.label("machine_id" if dimension == "machine" else dimension))
+            grupos.append(columna)
+
+    columnas += [func.sum(getattr(tabla, nombre)).label(nombre)
+                 for nombre in ["reading_count", "failure_count", *CONTADORES_FALLA]]
+    for sensor in SENSORES:
+        columnas += [
+            func.sum(getattr(tabla, f"{sensor}_sum")).label(f"{sensor}_sum"),
+            func.min(getattr(tabla, f"{sensor}_min")).label(f"{sensor}_min"),
+            func.max(getattr(tabla, f"{sensor}_max")).label(f"{sensor}_max"),
+        ]
+
+    consulta = select(*columnas).select_from(tabla)
+    if "type" in agrupar or "location" in agrupar or tipos or ubicaciones:
+        # machines es chica: Type y ubicación se toman al consultar (un cambio de ubicación reagrupa todo el historial)
+        consulta = consulta.join(maquina, maquina.machine_id == tabla.machine_id)
+    if desde is not None:
+        consulta = consulta.where(tabla.bucket >= desde)
+    if hasta is not None:
+        consulta = consulta.where(tabla.bucket < hasta)
+    if machine_ids:
+        consulta = consulta.where(tabla.machine_id.in_(machine_ids))
+    if tipos:
+        consulta = consulta.where(maquina.type.in_(tipos))
+    if ubicaciones:
+        consulta = consulta.where(maquina.location.in_(ubicaciones))
+    if grupos:
+        consulta = consulta.group_by(*grupos).order_by(*grupos)
+    return consulta, tabla
+
+
+def filas_analiticas(filas, por_modo=False, modos=None):
+    """
+    Filas de la respuesta a partir del resultado de consulta_analitica:
+    tasa de fallas y promedio / mínimo / máximo de cada sensor. Con
+    'por_modo' cada fila se desdobla en una por tipo de falla (failure_mode),
+    con el conteo y la tasa de ese tipo.
+    """
+    salida = []
+    for fila in filas:
+        fila = dict(fila)
+        n = fila["reading_count"] or 0
+        base = {clave: fila[clave] for clave in ("bucket", "machine_id", "type", "location") if clave in fila}
+        base["reading_count"] = n
+        sensores = {
+            sensor: {
+                "avg": fila[f"{sensor}_sum"] / n if n and fila[f"{sensor}_sum"] is not None else None,
+                "min": fila[f"{sensor}_min"],
+                "max": fila[f"{sensor}_max"],
+            }
+            for sensor in SENSORES
+        }
+        if not por_modo:
+            salida.append({
+                **base,
+                "failure_count": fila["failure_count"],
+                "failure_rate": fila["failure_count"] / n if n else None,
+                **{nombre: fila[nombre] for nombre in CONTADORES_FALLA},
+                "sensors": _sensores_o_nada(sensores),
+            })
+            continue
+        for nombre, modo in CONTADORES_FALLA.items():
+            if modos and modo not in modos:
+                continue
+            salida.append({
+                **base,
+                "failure_mode": modo,
+                "failure_count": fila[nombre],
+                "failure_rate": fila[nombre] / n if n else None,
+                "sensors": _sensores_o_nada(sensores),
+            })
+    return salida
+
+
+def _sensores_o_nada(sensores):
+    """None si ningún sensor tiene valores (ej: solo horas sin mediciones)."""
+    return sensores if any(valores["avg"] is not None for valores in sensores.values()) else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye los agregados por hora / día desde el historial de lecturas.")
+    parser.add_argument("--desde", type=datetime.fromisoformat, help="Primer día a reconstruir (default: el más viejo)")
+    parser.add_argument("--hasta", type=datetime.fromisoformat, help="Día siguiente al último a reconstruir (default: sin límite)")
+    args = parser.parse_args()
+
+    from database import engine
+
+    reconstruir(engine, args.desde, args.hasta)
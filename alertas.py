@@ -0,0 +1,171 @@
+import asyncio
+from collections import deque
+
+import config
+
+# =====================================================
+#  Alertas de falla en tiempo real (pub/sub)
+# =====================================================
+# Cada vez que una predicción guarda una lectura con falla se publica una alerta.
+# Los dashboards se suscriben (SSE o WebSocket, ver alertas_endpoints.py) con
+# filtros por máquina y tipo de falla, en vez de consultar las lecturas de
+# cada máquina cada pocos segundos.
+#
+# El bus en memoria solo ve las alertas de SU proceso: con varios workers de
+# uvicorn se reemplaza por una implementación de BusAlertas sobre un broker
+# externo (Redis pub/sub, LISTEN/NOTIFY de Postgres...), sin tocar los
+# endpoints ni a quien publica.
+
+TIPOS_FALLA = ("twf", "hdf", "pwf", "osf", "rnf")
+
+
+class Suscripcion:
+    """
+    Cola acotada de UN suscriptor. Si el cliente no da abasto, la
+    suscripción se marca como desbordada y termina al vaciarse: el cliente
+    reconecta con el último id recibido y recupera lo que falte del historial.
+    """
+
+    def __init__(self, machine_ids=None, tipos=None, capacidad=1000):
+        self.machine_ids = set(machine_ids) if machine_ids else None
+        self.tipos = set(tipos) if tipos else None
+        self.cola = asyncio.Queue(maxsize=capacidad)
+        self.desbordada = False
+
+    def acepta(self, alerta):
+        if self.machine_ids is not None and alerta["machine_id"] not in self.machine_ids:
+            return False
+        return self.tipos is None or not self.tipos.isdisjoint(alerta["tipos"])
+
+    def entregar(self, alerta):
+        if self.desbordada or not self.acepta(alerta):
+            return
+        try:
+            self.cola.put_nowait(alerta)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+
+class BusAlertas:
+    """
+    Interfaz del bus de alertas.
+
+    - publicar(alertas): no bloquea; se llama desde el event loop justo
+      después de guardar las lecturas.
+    - suscribir(machine_ids, tipos, desde_id): generador asíncrono de
+      alertas. Si 'desde_id' no es None, primero repite las alertas
+      posteriores a ese id que sigan en el historial.
+    - desincronizado(desde_id): True si reanudar desde 'desde_id' puede
+      haber perdido alertas (el cliente debe releer el estado por la API).
+    """
+
+    def publicar(self, alertas):
+        raise NotImplementedError
+
+    def desincronizado(self, desde_id):
+        return False
+
+    def suscribir(self, machine_ids=None, tipos=None, desde_id=None):
+        raise NotImplementedError
+
+    def estadisticas(self):
+        return {}
+
+
+class BusAlertasMemoria(BusAlertas):
+    """
+    Bus en el mismo proceso. Los ids son un contador del proceso; el
+    historial guarda las últimas 'historial' alertas para reanudar.
+    """
+
+    def __init__(self, historial=1000, capacidad_suscriptor=1000):
+        self.capacidad_suscriptor = capacidad_suscriptor
+        self._historial = deque(maxlen=historial)
+        self._suscripciones = set()
+        self._ultimo_id = 0
+        self._publicadas = 0
+        self._desbordes = 0
+
+    def publicar(self, alertas):
+        for alerta in alertas:
+            self._ultimo_id += 1
+            alerta = {"id": self._ultimo_id, **alerta}
+            self._historial.append(alerta)
+            self._publicadas += 1
+            for suscripcion in self._suscripciones:
+                if not suscripcion.desbordada:
+                    suscripcion.entregar(alerta)
+                    if suscripcion.desbordada:
+                        self._desbordes += 1
+
+    def desincronizado(self, desde_id):
+        """
+        True si no se puede reanudar exactamente desde 'desde_id': el id es
+        de otro arranque del proceso (mayor que el último) o las alertas
+        siguientes ya salieron del historial.
+        """
+        if desde_id is None:
+            return False
+        if desde_id > self._ultimo_id:
+            return True
+        return bool(self._historial) and desde_id < self._historial[0]["id"] - 1
+
+    async def suscribir(self, machine_ids=None, tipos=None, desde_id=None):
+        suscripcion = Suscripcion(machine_ids, tipos, self.capacidad_suscriptor)
+        # Se registra ANTES de copiar el historial: ninguna alerta queda entre medio
+        self._suscripciones.add(suscripcion)
+        try:
+            if desde_id is not None:
+                if desde_id > self._ultimo_id:
+                    desde_id = 0  # Otro arranque del proceso: se repite todo el historial
+                pendientes = [a for a in self._historial if a["id"] > desde_id and suscripcion.acepta(a)]
+                ultimo_repetido = pendientes[-1]["id"] if pendientes else desde_id
+                for alerta in pendientes:
+                    yield alerta
+            else:
+                ultimo_repetido = 0
+
+            while not (suscripcion.desbordada and suscripcion.cola.empty()):
+                alerta = await suscripcion.cola.get()
+                if alerta["id"] > ultimo_repetido:  # Ya enviada desde el historial
+                    yield alerta
+        finally:
+            self._suscripciones.discard(suscripcion)
+
+    def estadisticas(self):
+        return {
+            "implementacion": "memoria",
+            "suscriptores": len(self._suscripciones),
+            "publicadas": self._publicadas,
+            "ultimo_id": self._ultimo_id,
+            "en_historial": len(self._historial),
+            "suscripciones_desbordadas": self._desbordes,
+        }
+
+
+def alertas_de_lecturas(elementos, reading_ids):
+    """
+    Alertas de las lecturas recién guardadas que tienen detalle de falla.
+    'elementos' son los (fila_lectura, detalles_falla_dict o None) de
+    main.guardar_lecturas, en el orden de 'reading_ids'. El timestamp de la
+    alerta es el de la lectura guardada, no el de la publicación.
+    """
+    return [
+        {
+            "reading_id": reading_id,
+            "machine_id": fila["machine_id"],
+            "timestamp": fila["timestamp"].isoformat(),
+            "tipos": [tipo for tipo in TIPOS_FALLA if detalles.get(tipo)],
+            "air_temperature": fila["air_temperature"],
+            "process_temperature": fila["process_temperature"],
+            "rotational_speed": fila["rotational_speed"],
+            "torque": fila["torque"],
+            "tool_wear": fila["tool_wear"],
+            "model_version": fila.get("model_version"),
+        }
+        for reading_id, (fila, detalles) in zip(reading_ids, elementos) if detalles is not None
+    ]
+
+
+# Instancia única del proceso, compartida por main.py y alertas_endpoints.py
+bus_alertas = BusAlertasMemoria(config.ALERTAS_HISTORIAL, config.ALERTAS_CAPACIDAD_SUSCRIPTOR)
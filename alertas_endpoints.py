@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Header, Query, WebSocket
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from contextlib import aclosing
+import asyncio
+import json
+
+from alertas import bus_alertas
+import config
+from metricas import RutaMedida
+
+# Endpoints de alertas de falla en tiempo real (en vez de consultar las lecturas)
+router = APIRouter(
+    prefix="/api/alertas",
+    tags=["Alertas en Tiempo Real"],
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
+)
+
+TipoFalla = Literal["twf", "hdf", "pwf", "osf", "rnf"]
+
+# ================================
+# Suscripción
+# ================================
+
+async def _alertas_con_latidos(machine_ids, tipos, desde_id):
+    """
+    Alertas del bus que pasan los filtros; cada ALERTAS_LATIDO_S sin alertas
+    produce None (latido) para mantener viva la conexión y notar a los
+    clientes que se fueron.
+    """
+    suscripcion = bus_alertas.suscribir(machine_ids, tipos, desde_id)
+    siguiente = None
+    try:
+        while True:
+            if siguiente is None:
+                siguiente = asyncio.ensure_future(suscripcion.__anext__())
+            listas, _ = await asyncio.wait({siguiente}, timeout=config.ALERTAS_LATIDO_S)
+            if not listas:
+                yield None
+                continue
+            try:
+                alerta = siguiente.result()
+            except StopAsyncIteration:
+                return  # Suscripción desbordada: el cliente debe reconectar
+            siguiente = None
+            yield alerta
+    finally:
+        if siguiente is not None:
+            siguiente.cancel()
+            await asyncio.gather(siguiente, return_exceptions=True)
+        await suscripcion.aclose()
+
+def _desde(desde_id, last_event_id):
+    # EventSource reenvía el último id recibido en el header Last-Event-ID al reconectar
+    if desde_id is not None:
+        return desde_id
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+@router.get("/stream")
+async def alertas_sse(
+    machine_id: Optional[List[int]] = Query(None),
+    tipo: Optional[List[TipoFalla]] = Query(None),
+    desde_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events con una alerta ('event: falla') por cada lectura
+    guardada con detalle de falla. Filtros opcionales y repetibles: ?machine_id=1&machine_id=2
+    y ?tipo=hdf&tipo=osf. Para reanudar, ?desde_id= (o el header Last-Event-ID,
+    que EventSource manda solo al reconectar). Si no se puede reanudar sin
+    huecos, primero llega 'event: desincronizado'.
+    """
+    desde_id = _desde(desde_id, last_event_id)
+
+    async def eventos():
+        yield "retry: 3000\n\n"
+        if bus_alertas.desincronizado(desde_id):
+            yield f"event: desincronizado\ndata: {json.dumps({'desde_id': desde_id})}\n\n"
+        # aclosing: al desconectarse el cliente la suscripción se da de baja en el acto
+        async with aclosing(_alertas_con_latidos(machine_id, tipo, desde_id)) as alertas:
+            async for alerta in alertas:
+                if alerta is None:
+                    yield ": latido\n\n"
+                else:
+                    yield f"id: {alerta['id']}\nevent: falla\ndata: {json.dumps(alerta, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # Sin buffer en nginx
+    )
+
+@router.websocket("/ws")
+async def alertas_websocket(
+    websocket: WebSocket,
+    machine_id: Optional[List[int]] = Query(None),
+    tipo: Optional[List[TipoFalla]] = Query(None),
+    desde_id: Optional[int] = None,
+):
+    """
+    Mismo flujo que /stream sobre WebSocket: mensajes JSON con
+    "evento": "falla" | "desincronizado" | "latido".
+    """
+    await websocket.accept()
+    try:
+        if bus_alertas.desincronizado(desde_id):
+            await websocket.send_json({"evento": "desincronizado", "desde_id": desde_id})
+        async with aclosing(_alertas_con_latidos(machine_id, tipo, desde_id)) as alertas:
+            async for alerta in alertas:
+                await websocket.send_json({"evento": "latido"} if alerta is None else {"evento": "falla", **alerta})
+    except Exception:
+        return  # El cliente se desconectó
+    await websocket.close()
+
+@router.get("/estadisticas")
+def estadisticas_alertas():
+    return bus_alertas.estadisticas()
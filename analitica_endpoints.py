@@ -0,0 +1,69 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import agregados
+from database import get_db
+from metricas import RutaMedida
+
+# Analítica de la flota: tasa de fallas y sensores por máquina, Type (L/M/H),
+# ubicación y tipo de falla a lo largo del tiempo. Se responde solo desde los
+# agregados por hora / día (agregados.py), que se mantienen al escribir: el
+# costo depende de las máquinas y del rango pedido, no del historial crudo.
+router = APIRouter(
+    prefix="/api",
+    tags=["Analítica de la Flota"],
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
+)
+
+MAX_FILAS_ANALITICA = 10000
+
+# ================================
+# Fallas de la flota
+# ================================
+
+@router.get("/analytics/failures")
+async def analitica_fallas(
+    group_by: List[Literal["machine", "type", "location", "failure_mode"]] = Query([]),
+    bucket: Literal["hour", "day", "week", "month", "none"] = "day",
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    machine_id: Optional[List[int]] = Query(None),
+    machine_type: Optional[List[Literal["L", "M", "H"]]] = Query(None, alias="type"),
+    location: Optional[List[str]] = Query(None),
+    failure_mode: Optional[List[Literal["twf", "hdf", "pwf", "osf", "rnf"]]] = Query(None),
+    limit: int = Query(1000, ge=1, le=MAX_FILAS_ANALITICA),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Lecturas, fallas, tasa de fallas y promedio / mínimo / máximo de cada
+    sensor por bucket de tiempo (?bucket=hour|day|week|month|none) y por las
+    dimensiones de ?group_by= (machine, type, location, failure_mode; se
+    pueden repetir). Con failure_mode cada fila se desdobla en una por tipo
+    de falla (?failure_mode= restringe los tipos).
+
+    Filtros: ?from= y ?to= (a nivel de hora: se cuentan los buckets que
+    empiezan en el rango), ?machine_id=, ?type= (L/M/H) y ?location=. Con
+    buckets de un día o más y límites en días completos se lee
+    machine_rollups_daily; si no, machine_rollups_hourly.
+    """
+    if date_from is not None and date_to is not None and date_from >= date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' debe ser anterior a 'to'")
+
+    unidad = None if bucket == "none" else bucket
+    consulta, tabla = agregados.consulta_analitica(
+        db.bind.dialect.name, agrupar=set(group_by), unidad=unidad, desde=date_from, hasta=date_to,
+        machine_ids=machine_id, tipos=machine_type, ubicaciones=location,
+    )
+    # Una fila de más para saber si el resultado quedó truncado
+    resultado = (await db.execute(consulta.limit(limit + 1))).mappings().all()
+    filas = agregados.filas_analiticas(resultado, por_modo="failure_mode" in group_by, modos=failure_mode)
+    return {
+        "source": tabla.__tablename__,
+        "bucket": bucket,
+        "group_by": sorted(set(group_by)),
+        "truncated": len(resultado) > limit or len(filas) > limit,
+        "rows": filas[:limit],
+    }
@@ -0,0 +1,307 @@
+"""
+Prueba de carga de la API: levanta la app contra una BD desechable, siembra
+máquinas y lecturas, y golpea cada escenario con concurrencia fija.
+Reporta throughput y latencias p50/p95/p99 por escenario.
+
+Escenarios:
+  predecir        POST /predecir (una lectura por petición)
+  lote            POST /predecir/lote (TAMANO_LOTE lecturas por petición)
+  flujo           POST /predecir/flujo (NDJSON; 'concurrencia' flujos en paralelo)
+  maquinas        GET /api/machines/ (resumen de todas las máquinas)
+  lecturas        GET /api/machines/{id}/readings/?limit=50
+  analitica       GET /api/analytics/failures (fallas por día y Type, y por
+                  ubicación y tipo de falla; desde los agregados)
+
+Servidor:
+  --servidor uvicorn  app en un proceso uvicorn aparte (lo más parecido a producción)
+  --servidor asgi     app en el mismo proceso vía httpx.ASGITransport (sin red;
+                      cliente y servidor comparten CPU y event loop)
+
+BD: un SQLite temporal por defecto; --database-url apunta a otra (ej: un
+Postgres efímero en Docker). Los modelos son la versión activa del registro.
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_api.py [--concurrencia 16] [--peticiones 2000] [--escenarios predecir,lote]
+"""
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+ESCENARIOS = ("predecir", "lote", "flujo", "maquinas", "lecturas", "analitica")
+N_MAQUINAS = 50
+TAMANO_LOTE = 100
+LECTURAS_SEMILLA = 5000
+CALENTAMIENTO = 50
+
+
+def lectura_aleatoria(rng, maquinas):
+    machine_id, tipo = maquinas[rng.randrange(len(maquinas))]
+    return {
+        "machine_id": machine_id,
+        "temp_aire": round(rng.uniform(295, 305), 1),
+        "temp_proceso": round(rng.uniform(305, 314), 1),
+        "velocidad_rotacion": rng.randint(1200, 2800),
+        "torque": round(rng.uniform(5, 75), 1),
+        "desgaste_herramienta": rng.randint(0, 250),
+        "Type": tipo,
+    }
+
+
+def percentiles_ms(latencias):
+    ms = np.asarray(latencias) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+async def con_concurrencia(peticion, total, concurrencia):
+    """
+    Ejecuta 'peticion(i)' (corrutina) 'total' veces con 'concurrencia'
+    clientes. Retorna (latencias en s, errores, segundos totales).
+    """
+    siguiente = iter(range(total))
+    latencias = []
+    errores = 0
+
+    async def cliente():
+        nonlocal errores
+        for i in siguiente:
+            inicio = time.perf_counter()
+            try:
+                ok = await peticion(i)
+            except httpx.HTTPError:
+                ok = False
+            latencias.append(time.perf_counter() - inicio)
+            errores += not ok
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    return latencias, errores, time.perf_counter() - inicio
+
+
+async def sembrar(cliente, rng):
+    """Crea N_MAQUINAS máquinas y LECTURAS_SEMILLA lecturas (vía /predecir/lote). Retorna [(id, type)]."""
+    maquinas = []
+    for i in range(N_MAQUINAS):
+        tipo = "LMH"[i % 3]
+        r = await cliente.post("/api/machines/", json={"type": tipo, "location": f"Línea {i % 5}"})
+        r.raise_for_status()
+        maquinas.append((r.json()["machine_id"], tipo))
+    for _ in range(LECTURAS_SEMILLA // TAMANO_LOTE):
+        r = await cliente.post("/predecir/lote", json=[lectura_aleatoria(rng, maquinas) for _ in range(TAMANO_LOTE)])
+        r.raise_for_status()
+    return maquinas
+
+
+async def escenario(nombre, cliente, maquinas, peticiones, concurrencia, rng):
+    if nombre == "flujo":
+        return await escenario_flujo(cliente, maquinas, peticiones, concurrencia, rng)
+
+    if nombre == "predecir":
+        cuerpos = [lectura_aleatoria(rng, maquinas) for _ in range(peticiones)]
+        peticion = lambda i: cliente.post("/predecir", json=cuerpos[i])
+        filas = 1
+    elif nombre == "lote":
+        peticiones = max(1, peticiones // 10)  # Cada petición lleva TAMANO_LOTE lecturas
+        cuerpos = [[lectura_aleatoria(rng, maquinas) for _ in range(TAMANO_LOTE)] for _ in range(peticiones)]
+        peticion = lambda i: cliente.post("/predecir/lote", json=cuerpos[i])
+        filas = TAMANO_LOTE
+    elif nombre == "maquinas":
+        peticion = lambda i: cliente.get("/api/machines/")
+        filas = 1
+    elif nombre == "lecturas":
+        ids = [rng.choice(maquinas)[0] for _ in range(peticiones)]
+        peticion = lambda i: cliente.get(f"/api/machines/{ids[i]}/readings/", params={"limit": 50})
+        filas = 1
+    elif nombre == "analitica":
+        consultas = [
+            {"bucket": "day", "group_by": ["type"]},
+            {"bucket": "none", "group_by": ["location", "failure_mode"]},
+        ]
+        peticion = lambda i: cliente.get("/api/analytics/failures", params=consultas[i % len(consultas)])
+        filas = 1
+    else:
+        raise ValueError(f"Escenario desconocido: {nombre}")
+
+    async def medida(i):
+        return (await peticion(i)).status_code < 400
+
+    latencias, errores, segundos = await con_concurrencia(medida, peticiones, concurrencia)
+    resultado = {
+        "peticiones": peticiones,
+        "errores": errores,
+        "peticiones_por_s": peticiones / segundos,
+        **percentiles_ms(latencias),
+    }
+    if filas > 1:
+        resultado["lecturas_por_s"] = peticiones * filas / segundos
+    return resultado
+
+
+async def escenario_flujo(cliente, maquinas, lecturas, concurrencia, rng):
+    """'concurrencia' flujos NDJSON en paralelo que se reparten 'lecturas'."""
+    por_flujo = max(1, lecturas // concurrencia)
+    cuerpos = [
+        "".join(json.dumps(lectura_aleatoria(rng, maquinas)) + "\n" for _ in range(por_flujo))
+        for _ in range(concurrencia)
+    ]
+
+    async def flujo(i):
+        r = await cliente.post("/predecir/flujo", content=cuerpos[i])
+        veredictos = r.text.splitlines()
+        return r.status_code == 200 and len(veredictos) == por_flujo and all('"error":null' in v for v in veredictos)
+
+    latencias, errores, segundos = await con_concurrencia(flujo, concurrencia, concurrencia)
+    return {
+        "flujos": concurrencia,
+        "errores": errores,
+        "lecturas_por_s": por_flujo * concurrencia / segundos,
+        "duracion_flujo_ms": float(np.median(latencias) * 1000),
+    }
+
+
+# ================================
+# Servidor
+# ================================
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorUvicorn:
+    def __init__(self, entorno):
+        self.entorno = entorno
+        self.puerto = _puerto_libre()
+        self.base = f"http://127.0.0.1:{self.puerto}"
+
+    async def __aenter__(self):
+        self.proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.puerto), "--log-level", "warning"],
+            cwd=RAIZ, env={**os.environ, **self.entorno},
+            stdout=subprocess.DEVNULL,
+        )
+        async with httpx.AsyncClient(base_url=self.base) as cliente:
+            for _ in range(300):
+                if self.proceso.poll() is not None:
+                    raise RuntimeError("uvicorn terminó antes de responder (revisa la salida de arriba).")
+                try:
+                    # Listo = modelos cargados y cargas de arranque terminadas (main.py)
+                    if (await cliente.get("/salud/listo")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn no quedó listo en 30 s.")
+        self.cliente = httpx.AsyncClient(base_url=self.base, timeout=60, limits=httpx.Limits(max_connections=None))
+        return self.cliente
+
+    async def __aexit__(self, *exc):
+        await self.cliente.aclose()
+        self.proceso.terminate()
+        self.proceso.wait(timeout=30)
+
+
+class ServidorAsgi:
+    def __init__(self, entorno):
+        os.environ.update(entorno)
+
+    async def __aenter__(self):
+        os.chdir(RAIZ)
+        if "database" in sys.modules:
+            raise RuntimeError("El modo asgi debe importar la app antes que cualquier otro módulo que use la BD.")
+        if "config" in sys.modules:
+            importlib.reload(sys.modules["config"])  # Toma el entorno del benchmark
+        import main  # Lee DATABASE_URL y el resto de la configuración al importarse
+        self.vida = main.app.router.lifespan_context(main.app)
+        await self.vida.__aenter__()
+        self.cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60)
+        for _ in range(300):
+            if (await self.cliente.get("/salud/listo")).status_code == 200:
+                break
+            await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("La app no quedó lista en 30 s.")
+        return self.cliente
+
+    async def __aexit__(self, *exc):
+        await self.cliente.aclose()
+        await self.vida.__aexit__(None, None, None)
+
+
+async def ejecutar(escenarios=ESCENARIOS, concurrencia=16, peticiones=2000, servidor=None,
+                   database_url=None, semilla=42, reportar=print):
+    """
+    Corre los escenarios y retorna {"api.<escenario>": {métricas}}.
+    Sin 'database_url' usa un SQLite temporal que se borra al terminar.
+    """
+    if servidor is None:
+        servidor = "uvicorn" if importlib.util.find_spec("uvicorn") else "asgi"
+    temporal = None
+    if database_url is None:
+        temporal = tempfile.mkdtemp(prefix="bench_api_")
+        database_url = f"sqlite:///{os.path.join(temporal, 'bench.db')}"
+    entorno = {
+        "DATABASE_URL": database_url,
+        "MODELOS_INTERVALO_RECARGA_S": "0",  # La versión no cambia durante la medición
+        "ESQUEMA_AL_ARRANCAR": "1",  # BD desechable: la API crea el esquema
+        "DB_POOL_SIZE": str(max(concurrencia, 5)),
+    }
+    rng = random.Random(semilla)
+    resultados = {}
+    try:
+        clase = ServidorUvicorn if servidor == "uvicorn" else ServidorAsgi
+        reportar(f"Servidor: {servidor}   BD: {database_url}   concurrencia: {concurrencia}")
+        async with clase(entorno) as cliente:
+            maquinas = await sembrar(cliente, rng)
+            for nombre in escenarios:
+                # Calentamiento: cachés, pool de conexiones y páginas del modelo
+                await escenario(nombre, cliente, maquinas, CALENTAMIENTO, min(concurrencia, 4), rng)
+                resultado = await escenario(nombre, cliente, maquinas, peticiones, concurrencia, rng)
+                resultados[f"api.{nombre}"] = resultado
+                reportar(f"  {nombre:<10} " + "  ".join(
+                    f"{clave}={valor:.1f}" if isinstance(valor, float) else f"{clave}={valor}"
+                    for clave, valor in resultado.items()
+                ))
+    finally:
+        if temporal is not None:
+            shutil.rmtree(temporal, ignore_errors=True)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--servidor", choices=("uvicorn", "asgi"))
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    asyncio.run(ejecutar(
+        args.escenarios.split(","), args.concurrencia, args.peticiones, args.servidor, args.database_url
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Tiempo de arranque en frío de la API, cada repetición en un proceso nuevo
+contra un SQLite temporal con el esquema ya creado (python migraciones.py,
+fuera de la medición, como en un despliegue):
+
+  importar_ms           import main (FastAPI, routers, SQLAlchemy, NumPy)
+  primera_respuesta_ms  desde el inicio del proceso hasta que GET /salud
+                        responde (lifespan arrancado)
+  listo_ms              hasta que GET /salud/listo responde 200 (modelos
+                        cargados y calentados, machine_stats y buffers leídos)
+  proceso_ms            listo_ms más el arranque del intérprete, medido
+                        desde afuera
+
+Se informa la mediana de las repeticiones y se compara contra PRESUPUESTO_MS:
+superar el presupuesto es un fallo, igual que un error en bench_api.py.
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_arranque.py [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Presupuesto de arranque en frío (mediana, ms). En una máquina de desarrollo
+# de 1 CPU 'import main' ronda 1.0 s (1.6 s cuando creaba el esquema y cargaba
+# los modelos al importarse) y /salud/listo llega a 200 en ~1.3 s.
+PRESUPUESTO_MS = {
+    "importar_ms": 1500,
+    "primera_respuesta_ms": 2000,
+    "listo_ms": 4000,
+}
+
+# Corre en el proceso hijo: mide desde su propio inicio
+_HIJO = r"""
+import time
+inicio = time.perf_counter()
+import main
+importar = time.perf_counter() - inicio
+
+import asyncio, json
+import httpx
+
+async def medir():
+    vida = main.app.router.lifespan_context(main.app)
+    await vida.__aenter__()
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://arranque") as cliente:
+        (await cliente.get("/salud")).raise_for_status()
+        primera = time.perf_counter() - inicio
+        while (await cliente.get("/salud/listo")).status_code != 200:
+            if time.perf_counter() - inicio > 60:
+                raise RuntimeError("La API no quedó lista en 60 s.")
+            await asyncio.sleep(0.005)
+        listo = time.perf_counter() - inicio
+    await vida.__aexit__(None, None, None)
+    return primera, listo
+
+primera, listo = asyncio.run(medir())
+print("RESULTADO " + json.dumps({
+    "importar_ms": importar * 1000, "primera_respuesta_ms": primera * 1000, "listo_ms": listo * 1000,
+}))
+"""
+
+
+def _una_vez(entorno):
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-c", _HIJO], cwd=RAIZ, env=entorno, capture_output=True, text=True,
+    )
+    proceso = time.perf_counter() - inicio
+    lineas = [linea for linea in salida.stdout.splitlines() if linea.startswith("RESULTADO ")]
+    if salida.returncode != 0 or not lineas:
+        raise RuntimeError(f"El proceso de arranque falló:\n{salida.stdout}\n{salida.stderr}")
+    return {**json.loads(lineas[-1][len("RESULTADO "):]), "proceso_ms": proceso * 1000}
+
+
+def medir_arranque(repeticiones=5, reportar=print):
+    """Retorna {"arranque": {métrica: mediana}} y avisa qué métricas superan el presupuesto."""
+    temporal = tempfile.mkdtemp(prefix="bench_arranque_")
+    try:
+        entorno = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(temporal, 'arranque.db')}",
+            "MODELOS_INTERVALO_RECARGA_S": "0",
+            "ESQUEMA_AL_ARRANCAR": "0",
+        }
+        subprocess.run([sys.executable, "migraciones.py"], cwd=RAIZ, env=entorno,
+                       stdout=subprocess.DEVNULL, check=True)
+        corridas = [_una_vez(entorno) for _ in range(repeticiones)]
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    resultado = {metrica: statistics.median(c[metrica] for c in corridas) for metrica in corridas[0]}
+    for metrica, valor in resultado.items():
+        limite = PRESUPUESTO_MS.get(metrica)
+        estado = "" if limite is None else f"  (presupuesto {limite} ms{', EXCEDIDO' if valor > limite else ''})"
+        reportar(f"  {metrica:<22}{valor:8.1f} ms{estado}")
+    resultado["excedidos"] = sum(resultado[m] > limite for m, limite in PRESUPUESTO_MS.items())
+    return {"arranque": resultado}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+    resultados = medir_arranque(args.repeticiones)
+    sys.exit(1 if resultados["arranque"]["excedidos"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Microbenchmark: inferencia de UNA fila con sklearn (predict + predict_proba de
+modelo_falla y predict de modelo_tipo_falla) contra EvaluadorPlano.
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_bosque_plano.py
+"""
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bosque_plano import EvaluadorPlano
+from features import CodificadorFeatures
+from registro_modelos import gestor_modelos
+
+warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+N_FILAS = 1000
+
+
+def latencias(funcion, filas):
+    tiempos = np.empty(len(filas))
+    for i, fila in enumerate(filas):
+        inicio = time.perf_counter()
+        funcion(fila)
+        tiempos[i] = time.perf_counter() - inicio
+    return tiempos * 1e6
+
+
+def main():
+    ruta = lambda nombre: os.path.join(gestor_modelos.registro.directorio_activo(), nombre)
+    modelo_falla = joblib.load(ruta("modelo_fallas.pkl"))
+    modelo_tipo_falla = joblib.load(ruta("modelo_tipo_falla.pkl"))
+    evaluador = EvaluadorPlano.cargar(ruta("bosques_planos"))
+
+    df = pd.read_csv("machine failure.csv").rename(columns={
+        'Air temperature [K]': 'temp_aire',
+        'Process temperature [K]': 'temp_proceso',
+        'Rotational speed [rpm]': 'velocidad_rotacion',
+        'Torque [Nm]': 'torque',
+        'Tool wear [min]': 'desgaste_herramienta'
+    })
+    X = CodificadorFeatures(joblib.load(ruta("columnas_modelo.pkl"))).codificar_dataframe(df)
+    filas = [X[i:i + 1] for i in range(N_FILAS)]
+
+    def sklearn(fila):
+        modelo_falla.predict(fila)
+        modelo_falla.predict_proba(fila)
+        modelo_tipo_falla.predict(fila)
+
+    for nombre, funcion in [("sklearn", sklearn), ("EvaluadorPlano", evaluador.evaluar)]:
+        t = latencias(funcion, filas)
+        p50, p95, p99 = np.percentile(t, [50, 95, 99])
+        print(f"{nombre:<16} p50={p50:>9.1f} µs  p95={p95:>9.1f} µs  p99={p99:>9.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
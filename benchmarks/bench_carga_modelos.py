@@ -0,0 +1,121 @@
+"""
+Carga de modelos por worker: tiempo de carga y memoria (RSS / PSS / privada)
+con N procesos vivos a la vez, como N workers de uvicorn.
+
+Compara:
+  - pkl:  joblib.load de modelo_fallas.pkl + modelo_tipo_falla.pkl (sklearn)
+  - npz:  EvaluadorPlano desde bosques_planos.npz (formato anterior, copia en memoria;
+          solo si quedó en la raíz de un entrenamiento viejo)
+  - mmap: EvaluadorPlano desde bosques_planos/ con mmap_mode='r' (compartido)
+
+PSS reparte las páginas compartidas entre los procesos que las usan: es la
+memoria que de verdad "cuesta" cada worker. Solo Linux (/proc/self/smaps_rollup).
+
+Los modelos se leen de la versión activa del registro (modelos/).
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_carga_modelos.py [--workers 4]
+"""
+import argparse
+import importlib
+import multiprocessing as mp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+N_FILAS_CALENTAMIENTO = 50
+
+
+def memoria_kb():
+    """{'Rss': kB, 'Pss': kB, 'Private': kB} del proceso actual."""
+    valores = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0].rstrip(":") in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                valores[partes[0].rstrip(":")] = int(partes[1])
+    return {"Rss": valores["Rss"], "Pss": valores["Pss"],
+            "Private": valores["Private_Clean"] + valores["Private_Dirty"]}
+
+
+def worker(metodo, directorio, barrera_cargado, barrera_medido, resultados):
+    import warnings
+    import joblib
+    import pandas as pd
+    from bosque_plano import EvaluadorPlano
+    from features import COLUMNAS_CSV, CodificadorFeatures
+    importlib.import_module("sklearn.ensemble")  # La importación de sklearn no cuenta como carga
+
+    warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+    ruta = lambda nombre: os.path.join(directorio, nombre)
+    df = pd.read_csv("machine failure.csv", nrows=N_FILAS_CALENTAMIENTO).rename(columns=COLUMNAS_CSV)
+    X = CodificadorFeatures(joblib.load(ruta("columnas_modelo.pkl"))).codificar_dataframe(df)
+    antes = memoria_kb()
+
+    inicio = time.perf_counter()
+    if metodo == "pkl":
+        modelo_falla = joblib.load(ruta("modelo_fallas.pkl"))
+        modelo_tipo_falla = joblib.load(ruta("modelo_tipo_falla.pkl"))
+        evaluar = lambda X: (modelo_falla.predict_proba(X), modelo_tipo_falla.predict(X))
+    else:
+        evaluador = EvaluadorPlano.cargar("bosques_planos.npz" if metodo == "npz" else ruta("bosques_planos"))
+        evaluar = evaluador.evaluar
+    segundos_carga = time.perf_counter() - inicio
+
+    # Calentamiento: una evaluación chica y, en los bosques planos, leer todos
+    # los arrays para que TODAS sus páginas estén residentes (peor caso de mmap)
+    evaluar(X)
+    if metodo != "pkl":
+        for bosque in (evaluador.bosque_falla, evaluador.bosque_tipo):
+            for arr in (bosque.feature, bosque.threshold, bosque.hijos, bosque.valores):
+                float(arr.sum())
+
+    barrera_cargado.wait()  # Todos los workers vivos y cargados antes de medir
+    despues = memoria_kb()
+    resultados.put({
+        "carga_ms": segundos_carga * 1e3,
+        **{k: (despues[k] - antes[k]) / 1024 for k in ("Rss", "Pss", "Private")},
+    })
+    barrera_medido.wait()
+
+
+def medir(metodo, directorio, n_workers):
+    contexto = mp.get_context("spawn")
+    barrera_cargado = contexto.Barrier(n_workers)
+    barrera_medido = contexto.Barrier(n_workers)
+    resultados = contexto.Queue()
+    procesos = [
+        contexto.Process(target=worker, args=(metodo, directorio, barrera_cargado, barrera_medido, resultados))
+        for _ in range(n_workers)
+    ]
+    for p in procesos:
+        p.start()
+    filas = [resultados.get() for _ in procesos]
+    for p in procesos:
+        p.join()
+
+    promedio = lambda clave: sum(f[clave] for f in filas) / len(filas)
+    print(f"{metodo:<5} carga={promedio('carga_ms'):>8.1f} ms   "
+          f"RSS={promedio('Rss'):>7.1f} MB   PSS={promedio('Pss'):>7.1f} MB   "
+          f"privada={promedio('Private'):>7.1f} MB   (por worker, sobre la base)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from registro_modelos import gestor_modelos
+    directorio = gestor_modelos.registro.directorio_activo()
+
+    print(f"{args.workers} workers simultáneos (modelos: {directorio})")
+    for metodo in ("pkl", "npz", "mmap"):
+        if metodo == "npz" and not os.path.exists("bosques_planos.npz"):
+            continue
+        medir(metodo, directorio, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Tiempo de entrenamiento (entrenar.py completo) e inferencia de una fila
+contra inferencia por lotes sobre 'machine failure.csv'.
+
+  entrenamiento       entrenar.py --sin-activar --sin-cache en un subproceso,
+                      con un registro de modelos temporal (no toca modelos/)
+  inferencia.una_fila codificar_lote([datos]) + evaluar de UNA lectura
+                      (el camino de /predecir sin HTTP ni BD)
+  inferencia.lote     codificar_dataframe + evaluar de todo el CSV de una vez
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_entrenamiento.py [--sin-entrenamiento]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+
+N_FILAS_UNA = 2000
+REPETICIONES_LOTE = 5
+
+
+def medir_entrenamiento(argumentos=("--sin-cache",), reportar=print):
+    """Segundos de un entrenamiento completo (carga, ajuste de ambos bosques, exportación)."""
+    temporal = tempfile.mkdtemp(prefix="bench_entrenamiento_")
+    try:
+        inicio = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "entrenar.py", "--sin-activar", *argumentos],
+            cwd=RAIZ, env={**os.environ, "MODELOS_DIR": temporal},
+            stdout=subprocess.DEVNULL, check=True,
+        )
+        segundos = time.perf_counter() - inicio
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+    reportar(f"  entrenamiento       {segundos:.2f} s")
+    return {"entrenamiento": {"segundos": segundos}}
+
+
+def medir_inferencia(reportar=print):
+    import schemas
+    from features import COLUMNAS_CSV
+    from registro_modelos import gestor_modelos
+
+    registro = gestor_modelos.registro
+    paquete = registro.cargar_paquete(registro.version_activa())
+    paquete.calentar()
+    df = pd.read_csv(os.path.join(RAIZ, "machine failure.csv")).rename(columns=COLUMNAS_CSV)
+
+    lecturas = [
+        schemas.DatosMaquinaPrediccion(machine_id=1, **fila)
+        for fila in df[["temp_aire", "temp_proceso", "velocidad_rotacion", "torque",
+                        "desgaste_herramienta", "Type"]].head(N_FILAS_UNA).to_dict("records")
+    ]
+    tiempos = np.empty(len(lecturas))
+    for i, datos in enumerate(lecturas):
+        inicio = time.perf_counter()
+        paquete.evaluador.evaluar(paquete.codificador.codificar_lote([datos]))
+        tiempos[i] = time.perf_counter() - inicio
+    una_fila = {
+        "p50_us": float(np.percentile(tiempos, 50) * 1e6),
+        "p95_us": float(np.percentile(tiempos, 95) * 1e6),
+        "p99_us": float(np.percentile(tiempos, 99) * 1e6),
+        "filas_por_s": float(len(tiempos) / tiempos.sum()),
+    }
+
+    mejor = float("inf")
+    for _ in range(REPETICIONES_LOTE):
+        inicio = time.perf_counter()
+        paquete.evaluador.evaluar(paquete.codificador.codificar_dataframe(df))
+        mejor = min(mejor, time.perf_counter() - inicio)
+    lote = {"filas": len(df), "segundos": mejor, "filas_por_s": len(df) / mejor}
+
+    reportar(f"  inferencia.una_fila p50={una_fila['p50_us']:.1f} µs  p99={una_fila['p99_us']:.1f} µs  "
+             f"{una_fila['filas_por_s']:.0f} filas/s")
+    reportar(f"  inferencia.lote     {lote['filas']} filas en {lote['segundos'] * 1000:.1f} ms  "
+             f"{lote['filas_por_s']:.0f} filas/s ({lote['filas_por_s'] / una_fila['filas_por_s']:.0f}x)")
+    return {"inferencia.una_fila": una_fila, "inferencia.lote": lote}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sin-entrenamiento", action="store_true")
+    args = parser.parse_args()
+
+    os.chdir(RAIZ)
+    if not args.sin_entrenamiento:
+        medir_entrenamiento()
+    medir_inferencia()
+
+
+if __name__ == "__main__":
+    main()
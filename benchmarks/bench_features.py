@@ -0,0 +1,76 @@
+"""
+Microbenchmark: construcción de features con pandas (camino original de
+/predecir) contra CodificadorFeatures (features.py).
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/bench_features.py
+"""
+import os
+import sys
+import timeit
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import schemas
+from features import CodificadorFeatures
+from registro_modelos import gestor_modelos
+
+REPETICIONES = 2000
+TAMANO_LOTE = 500
+
+
+def features_pandas(lista_datos, columnas_modelo):
+    """Réplica exacta del pipeline de pandas que usaba predecir_falla."""
+    input_df = pd.DataFrame([datos.model_dump(exclude={"machine_id"}) for datos in lista_datos])
+    input_dummies = pd.get_dummies(input_df, columns=['Type'])
+    input_final = pd.DataFrame(columns=columnas_modelo)
+    input_final = pd.concat([input_final, input_dummies]).fillna(0)
+    return input_final[columnas_modelo]
+
+
+def medir(nombre, funcion, repeticiones):
+    segundos = min(timeit.repeat(funcion, number=repeticiones, repeat=3)) / repeticiones
+    print(f"  {nombre:<28} {segundos * 1e6:>10.1f} µs/llamada")
+    return segundos
+
+
+def main():
+    columnas_modelo = joblib.load(os.path.join(gestor_modelos.registro.directorio_activo(), "columnas_modelo.pkl"))
+    codificador = CodificadorFeatures(columnas_modelo)
+
+    rng = np.random.default_rng(42)
+    lote = [
+        schemas.DatosMaquinaPrediccion(
+            machine_id=1,
+            temp_aire=float(rng.normal(300, 2)),
+            temp_proceso=float(rng.normal(310, 1.5)),
+            velocidad_rotacion=int(rng.integers(1200, 2800)),
+            torque=float(rng.normal(40, 10)),
+            desgaste_herramienta=int(rng.integers(0, 250)),
+            Type=str(rng.choice(["L", "M", "H"])),
+        )
+        for _ in range(TAMANO_LOTE)
+    ]
+
+    # Ambos caminos deben producir exactamente la misma matriz
+    esperado = features_pandas(lote, columnas_modelo).to_numpy(dtype=np.float64)
+    assert np.array_equal(esperado, codificador.codificar_lote(lote)), "Las matrices no coinciden"
+
+    uno = lote[:1]
+    print("1 lectura:")
+    t_pd = medir("pandas", lambda: features_pandas(uno, columnas_modelo), REPETICIONES)
+    t_np = medir("CodificadorFeatures", lambda: codificador.codificar(uno[0]), REPETICIONES)
+    print(f"  aceleración: {t_pd / t_np:.1f}x")
+
+    print(f"Lote de {TAMANO_LOTE} lecturas:")
+    t_pd = medir("pandas", lambda: features_pandas(lote, columnas_modelo), REPETICIONES // 100)
+    t_np = medir("CodificadorFeatures", lambda: codificador.codificar_lote(lote), REPETICIONES // 100)
+    print(f"  aceleración: {t_pd / t_np:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Suite de rendimiento reproducible: API (bench_api.py), arranque en frío
+(bench_arranque.py), entrenamiento e inferencia (bench_entrenamiento.py).
+Guarda los resultados en JSON y los compara contra una línea base para
+detectar regresiones.
+
+Dirección de cada métrica según su nombre:
+  *_ms, *_us, segundos, duracion_*   menor es mejor
+  *_por_s                            mayor es mejor
+  (el resto, ej: 'peticiones', 'errores', 'filas', solo se informa)
+
+Una métrica es regresión si empeora más que --umbral (0.15 = 15%) contra
+la base. Los errores de la API y los tiempos de arranque por encima de
+bench_arranque.PRESUPUESTO_MS se tratan aparte: son fallo sin importar la base.
+
+Uso (desde la raíz del proyecto, después de correr entrenar.py):
+    python benchmarks/suite.py --guardar-base        # Primera vez en una máquina: crea la base
+    python benchmarks/suite.py                       # Compara; sale con código 1 si hay regresiones
+    python benchmarks/suite.py --solo api --peticiones 500 --salida resultados.json
+
+Las líneas base solo son comparables en la misma máquina, con la misma BD
+y el mismo modo de servidor: la base guarda esos datos y la comparación
+avisa si no coinciden.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_api
+import bench_arranque
+import bench_entrenamiento
+
+BASE_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+GRUPOS = ("api", "arranque", "entrenamiento", "inferencia")
+
+
+def direccion(metrica):
+    """-1 si menor es mejor, +1 si mayor es mejor, 0 si solo se informa."""
+    if metrica.endswith(("_ms", "_us")) or metrica == "segundos" or metrica.startswith("duracion_"):
+        return -1
+    if metrica.endswith("_por_s"):
+        return 1
+    return 0
+
+
+def comparar(resultados, base, umbral):
+    """Retorna [(bench, metrica, valor_base, valor, cambio)] con las métricas que empeoraron más que 'umbral'."""
+    regresiones = []
+    for bench, metricas in resultados.items():
+        anteriores = base.get(bench, {})
+        for metrica, valor in metricas.items():
+            sentido = direccion(metrica)
+            anterior = anteriores.get(metrica)
+            if not sentido or not anterior:
+                continue
+            cambio = (valor - anterior) / anterior
+            if -sentido * cambio > umbral:
+                regresiones.append((bench, metrica, anterior, valor, cambio))
+    return regresiones
+
+
+def _commit_git():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar(args):
+    resultados = {}
+    # La API primero: en modo asgi importa main (y config) con la BD del benchmark
+    if "api" in args.solo:
+        print("== API ==")
+        resultados.update(asyncio.run(bench_api.ejecutar(
+            args.escenarios.split(","), args.concurrencia, args.peticiones, args.servidor, args.database_url,
+        )))
+    if "arranque" in args.solo:
+        print("== Arranque ==")
+        resultados.update(bench_arranque.medir_arranque())
+    if "inferencia" in args.solo:
+        print("== Inferencia ==")
+        resultados.update(bench_entrenamiento.medir_inferencia())
+    if "entrenamiento" in args.solo:
+        print("== Entrenamiento ==")
+        resultados.update(bench_entrenamiento.medir_entrenamiento())
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--solo", default=",".join(GRUPOS), help=f"Subconjunto de: {','.join(GRUPOS)}")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--escenarios", default=",".join(bench_api.ESCENARIOS))
+    parser.add_argument("--servidor", choices=("uvicorn", "asgi"))
+    parser.add_argument("--database-url")
+    parser.add_argument("--base", default=BASE_POR_DEFECTO)
+    parser.add_argument("--guardar-base", action="store_true", help="Escribe los resultados como nueva línea base")
+    parser.add_argument("--umbral", type=float, default=0.15)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados de esta corrida")
+    args = parser.parse_args()
+    args.solo = args.solo.split(",")
+
+    os.chdir(RAIZ)
+    entorno = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_git(),
+        "python": platform.python_version(),
+        "maquina": platform.node(),
+        "cpus": os.cpu_count(),
+        "servidor": args.servidor or ("uvicorn" if bench_api.importlib.util.find_spec("uvicorn") else "asgi"),
+        "bd": "sqlite" if args.database_url is None else args.database_url.split(":", 1)[0],
+        "concurrencia": args.concurrencia,
+        "peticiones": args.peticiones,
+    }
+    resultados = ejecutar(args)
+    documento = {"entorno": entorno, "resultados": resultados}
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(documento, f, indent=2)
+
+    if args.guardar_base:
+        with open(args.base, "w") as f:
+            json.dump(documento, f, indent=2)
+        print(f"\nLínea base guardada en '{args.base}'.")
+        return
+
+    fallos = [bench for bench, metricas in resultados.items() if metricas.get("errores")]
+    for bench in fallos:
+        print(f"\nERROR: {bench} tuvo {resultados[bench]['errores']} peticiones con error.")
+    if resultados.get("arranque", {}).get("excedidos"):
+        print(f"\nERROR: el arranque superó su presupuesto ({bench_arranque.PRESUPUESTO_MS}).")
+        fallos.append("arranque")
+
+    if not os.path.exists(args.base):
+        print(f"\nSin línea base ('{args.base}'); créala con --guardar-base.")
+        sys.exit(1 if fallos else 0)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    distintos = [
+        clave for clave in ("maquina", "cpus", "servidor", "bd", "concurrencia", "peticiones")
+        if base["entorno"].get(clave) != entorno[clave]
+    ]
+    if distintos:
+        print(f"\nAviso: la base se midió con otro entorno ({', '.join(distintos)}); la comparación es orientativa.")
+
+    regresiones = comparar(resultados, base["resultados"], args.umbral)
+    print(f"\nComparación contra la base del commit {base['entorno'].get('commit')} (umbral {args.umbral:.0%}):")
+    if not regresiones:
+        print("  Sin regresiones.")
+    for bench, metrica, anterior, valor, cambio in regresiones:
+        print(f"  REGRESIÓN {bench}.{metrica}: {anterior:.4g} -> {valor:.4g} ({cambio:+.1%})")
+    sys.exit(1 if regresiones or fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import json
+import os
+
+import numpy as np
+
+# =====================================================
+#  Bosques "aplanados" para inferencia de baja latencia
+# =====================================================
+# entrenar.py convierte cada RandomForestClassifier en unos pocos arrays
+# contiguos de NumPy (feature, threshold, hijos y valores de hoja).
+# La API recorre TODOS los árboles a la vez, nivel por nivel, con operaciones
+# vectorizadas: sin validación de sklearn, sin joblib y sin un bucle de Python
+# por árbol. El resultado es idéntico bit a bit a predict/predict_proba.
+#
+# En disco se guardan como un directorio de .npy sin comprimir: la API los
+# abre con mmap_mode='r', así todos los workers de uvicorn comparten UNA copia
+# en el page cache del sistema en vez de tener cada uno la suya.
+
+
+class BosquePlano:
+    """
+    Un RandomForestClassifier de sklearn en forma de arrays planos.
+
+    Los nodos de todos los árboles se concatenan; 'raices' indica dónde empieza
+    cada árbol. Las hojas apuntan a sí mismas en 'hijos', así un recorrido de
+    'profundidad' pasos siempre termina en una hoja.
+
+    Varios bosques pueden compartir los mismos arrays de nodos (ver
+    combinar_bosques): 'desplazamiento' es el índice global del primer nodo
+    de este bosque, y 'valores' solo cubre sus propios nodos.
+    """
+
+    def __init__(self, feature, threshold, hijos, valores, raices, clases, n_clases, profundidad, desplazamiento=0):
+        self.feature = feature          # (n_nodos,) int32: columna que compara cada nodo
+        self.threshold = threshold      # (n_nodos,) float64: umbral (x <= umbral -> izquierda)
+        self.hijos = hijos              # (n_nodos, 2) intp: [izquierdo, derecho] en índices globales
+        self.valores = valores          # (n_nodos, n_outputs, max_clases) float64: proba normalizada por árbol
+        self.raices = raices            # (n_arboles,) intp
+        self.clases = clases            # (n_outputs, max_clases) int64
+        self.n_clases = n_clases        # (n_outputs,) int64
+        self.profundidad = int(profundidad)
+        self.desplazamiento = int(desplazamiento)
+
+    @property
+    def n_arboles(self):
+        return len(self.raices)
+
+    @property
+    def n_outputs(self):
+        return len(self.n_clases)
+
+    @classmethod
+    def desde_sklearn(cls, modelo):
+        """Aplana un RandomForestClassifier ya entrenado."""
+        n_outputs = modelo.n_outputs_
+        clases_por_output = [modelo.classes_] if n_outputs == 1 else list(modelo.classes_)
+        n_clases = np.array([len(c) for c in clases_por_output], dtype=np.int64)
+        max_clases = int(n_clases.max())
+
+        clases = np.zeros((n_outputs, max_clases), dtype=np.int64)
+        for k, c in enumerate(clases_por_output):
+            clases[k, :len(c)] = c
+
+        features, thresholds, hijos, valores, raices = [], [], [], [], []
+        desplazamiento = 0
+        profundidad = 0
+        for estimador in modelo.estimators_:
+            arbol = estimador.tree_
+            n_nodos = arbol.node_count
+            es_hoja = arbol.children_left == -1
+            indices = np.arange(n_nodos)
+
+            izquierdo = np.where(es_hoja, indices, arbol.children_left) + desplazamiento
+            derecho = np.where(es_hoja, indices, arbol.children_right) + desplazamiento
+
+            # Misma normalización que DecisionTreeClassifier.predict_proba,
+            # hecha por adelantado para cada nodo (solo se leen las hojas).
+            valor = np.zeros((n_nodos, n_outputs, max_clases))
+            for k in range(n_outputs):
+                proba_k = arbol.value[:, k, :n_clases[k]].astype(np.float64, copy=True)
+                normalizador = proba_k.sum(axis=1)[:, np.newaxis]
+                normalizador[normalizador == 0.0] = 1.0
+                proba_k /= normalizador
+                valor[:, k, :n_clases[k]] = proba_k
+
+            features.append(np.where(es_hoja, 0, arbol.feature).astype(np.int32))
+            thresholds.append(np.where(es_hoja, 0.0, arbol.threshold))
+            hijos.append(np.stack([izquierdo, derecho], axis=1))
+            valores.append(valor)
+            raices.append(desplazamiento)
+
+            desplazamiento += n_nodos
+            profundidad = max(profundidad, arbol.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            hijos=np.ascontiguousarray(np.concatenate(hijos).astype(np.intp)),
+            valores=np.ascontiguousarray(np.concatenate(valores)),
+            raices=np.array(raices, dtype=np.intp),
+            clases=clases,
+            n_clases=n_clases,
+            profundidad=profundidad,
+        )
+
+    @classmethod
+    def desde_arrays(cls, datos, prefijo=""):
+        """Lee un bosque del formato anterior (np.savez con un prefijo por bosque)."""
+        return cls(
+            feature=datos[f"{prefijo}feature"],
+            threshold=datos[f"{prefijo}threshold"],
+            hijos=datos[f"{prefijo}hijos"].astype(np.intp, copy=False),
+            valores=datos[f"{prefijo}valores"],
+            raices=datos[f"{prefijo}raices"].astype(np.intp, copy=False),
+            clases=datos[f"{prefijo}clases"],
+            n_clases=datos[f"{prefijo}n_clases"],
+            profundidad=int(datos[f"{prefijo}profundidad"]),
+        )
+
+    def hojas(self, X):
+        """Índice de la hoja alcanzada en cada árbol: array (n_filas, n_arboles)."""
+        return _recorrer(X, self.feature, self.threshold, self.hijos, self.raices, self.profundidad)
+
+    def proba_desde_hojas(self, hojas):
+        """
+        Lista (una por output) de arrays (n_filas, n_clases) con la probabilidad
+        promedio del bosque. La suma es secuencial árbol por árbol, igual que
+        RandomForestClassifier.predict_proba, por eso el resultado es idéntico.
+        """
+        if self.desplazamiento:
+            hojas = hojas - self.desplazamiento
+        suma = self.valores[hojas].sum(axis=1)  # (n_filas, n_outputs, max_clases)
+        suma /= self.n_arboles
+        return [suma[:, k, :self.n_clases[k]] for k in range(self.n_outputs)]
+
+    def predict_proba(self, X):
+        probas = self.proba_desde_hojas(self.hojas(X))
+        return probas[0] if self.n_outputs == 1 else probas
+
+    def prediccion_desde_proba(self, probas):
+        """Clase predicha por output: (n_filas,) si hay un output, (n_filas, n_outputs) si hay varios."""
+        predicciones = np.stack(
+            [self.clases[k].take(np.argmax(proba_k, axis=1)) for k, proba_k in enumerate(probas)],
+            axis=1
+        )
+        return predicciones[:, 0] if self.n_outputs == 1 else predicciones
+
+    def predict(self, X):
+        return self.prediccion_desde_proba(self.proba_desde_hojas(self.hojas(X)))
+
+
+def _recorrer(X, feature, threshold, hijos, raices, profundidad):
+    # sklearn compara en float32 (así se convierte X internamente); para que
+    # las decisiones en los umbrales sean idénticas convertimos igual.
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n_filas, n_columnas = X.shape
+    X_plano = X.ravel()
+    base_fila = (np.arange(n_filas) * n_columnas)[:, np.newaxis]
+    hijos_plano = hijos.ravel()  # [izq0, der0, izq1, der1, ...]
+
+    nodos = np.broadcast_to(raices, (n_filas, len(raices))).copy()
+    for _ in range(profundidad):
+        va_derecha = X_plano.take(base_fila + feature.take(nodos)) > threshold.take(nodos)
+        nodos = hijos_plano.take(nodos * 2 + va_derecha)
+    return nodos
+
+
+def combinar_bosques(*bosques):
+    """
+    Concatena los nodos de varios bosques independientes en UN solo juego de
+    arrays (feature, threshold, hijos) y retorna bosques que los comparten,
+    cada uno con sus raíces y su 'desplazamiento' en índices globales.
+    """
+    desplazamientos = np.cumsum([0] + [len(b.feature) for b in bosques[:-1]])
+    feature = np.concatenate([b.feature for b in bosques])
+    threshold = np.concatenate([b.threshold for b in bosques])
+    hijos = np.concatenate([b.hijos + d for b, d in zip(bosques, desplazamientos)])
+    return [
+        BosquePlano(feature, threshold, hijos, b.valores, b.raices + d, b.clases, b.n_clases, b.profundidad, d)
+        for b, d in zip(bosques, desplazamientos)
+    ]
+
+
+# Archivos de los arrays compartidos y de los propios de cada bosque
+_ARRAYS_NODOS = ("feature", "threshold", "hijos")
+_ARRAYS_BOSQUE = ("raices", "valores", "clases", "n_clases")
+_BOSQUES = ("falla", "tipo")
+
+
+class EvaluadorPlano:
+    """
+    Evalúa modelo_falla y modelo_tipo_falla en UNA sola pasada: los nodos de
+    ambos bosques comparten los mismos arrays y se recorren juntos.
+    """
+
+    def __init__(self, bosque_falla, bosque_tipo):
+        if bosque_tipo.feature is not bosque_falla.feature:
+            bosque_falla, bosque_tipo = combinar_bosques(bosque_falla, bosque_tipo)
+        self.bosque_falla = bosque_falla
+        self.bosque_tipo = bosque_tipo
+
+        self._raices = np.concatenate([bosque_falla.raices, bosque_tipo.raices])
+        self._profundidad = max(bosque_falla.profundidad, bosque_tipo.profundidad)
+
+    @classmethod
+    def desde_sklearn(cls, modelo_falla, modelo_tipo_falla):
+        return cls(BosquePlano.desde_sklearn(modelo_falla), BosquePlano.desde_sklearn(modelo_tipo_falla))
+
+    def guardar(self, directorio):
+        """
+        Guarda un .npy sin comprimir por array (más un meta.json con los
+        escalares) en 'directorio', listo para abrirse con mmap.
+        """
+        os.makedirs(directorio, exist_ok=True)
+        for nombre in _ARRAYS_NODOS:
+            np.save(os.path.join(directorio, f"{nombre}.npy"), getattr(self.bosque_falla, nombre))
+
+        meta = {"formato": 1}
+        for nombre_bosque, bosque in zip(_BOSQUES, (self.bosque_falla, self.bosque_tipo)):
+            for nombre in _ARRAYS_BOSQUE:
+                np.save(os.path.join(directorio, f"{nombre_bosque}_{nombre}.npy"), getattr(bosque, nombre))
+            meta[nombre_bosque] = {"profundidad": bosque.profundidad, "desplazamiento": bosque.desplazamiento}
+
+        with open(os.path.join(directorio, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def cargar(cls, ruta, mmap=True):
+        """
+        Carga un directorio escrito por guardar(). Con mmap=True los arrays
+        quedan mapeados en solo lectura (no se copian a la memoria del proceso).
+        También acepta el formato anterior (un .npz), que siempre se copia.
+        """
+        if ruta.endswith(".npz"):
+            with np.load(ruta) as datos:
+                return cls(BosquePlano.desde_arrays(datos, "falla_"), BosquePlano.desde_arrays(datos, "tipo_"))
+
+        with open(os.path.join(ruta, "meta.json")) as f:
+            meta = json.load(f)
+
+        def leer(nombre):
+            # np.asarray: vista ndarray normal sobre el mapeo (sin el overhead de np.memmap)
+            return np.asarray(np.load(os.path.join(ruta, f"{nombre}.npy"), mmap_mode="r" if mmap else None))
+
+        feature, threshold = leer("feature"), leer("threshold")
+        hijos = leer("hijos").astype(np.intp, copy=False)
+        bosques = [
+            BosquePlano(
+                feature, threshold, hijos,
+                valores=leer(f"{nombre_bosque}_valores"),
+                raices=leer(f"{nombre_bosque}_raices").astype(np.intp, copy=False),
+                clases=leer(f"{nombre_bosque}_clases"),
+                n_clases=leer(f"{nombre_bosque}_n_clases"),
+                **meta[nombre_bosque],
+            )
+            for nombre_bosque in _BOSQUES
+        ]
+        return cls(*bosques)
+
+    def evaluar(self, X):
+        """
+        Retorna (prediccion_falla, probabilidad_falla, prediccion_tipo):
+          - prediccion_falla: (n_filas,) clase de modelo_falla
+          - probabilidad_falla: (n_filas, n_clases) como modelo_falla.predict_proba
+          - prediccion_tipo: (n_filas, n_labels) como modelo_tipo_falla.predict
+        """
+        nodos = self.bosque_falla
+        hojas = _recorrer(X, nodos.feature, nodos.threshold, nodos.hijos, self._raices, self._profundidad)
+        n_falla = self.bosque_falla.n_arboles
+
+        probas_falla = self.bosque_falla.proba_desde_hojas(hojas[:, :n_falla])
+        probas_tipo = self.bosque_tipo.proba_desde_hojas(hojas[:, n_falla:])
+
+        return (
+            self.bosque_falla.prediccion_desde_proba(probas_falla),
+            probas_falla[0],
+            self.bosque_tipo.prediccion_desde_proba(probas_tipo),
+        )
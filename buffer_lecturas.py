@@ -0,0 +1,214 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+import config
+from tendencias import N_SENSORES
+
+# Columnas de machine_readings en el orden de features.COLUMNAS_NUMERICAS
+SENSORES_FILA = ("air_temperature", "process_temperature", "rotational_speed", "torque", "tool_wear")
+
+# =====================================================
+#  Buffer circular de lecturas recientes por máquina
+# =====================================================
+# Las features de tendencia (tendencias.py) necesitan las últimas N lecturas
+# de la máquina. En vez de consultar machine_readings en cada /predecir, cada
+# proceso guarda las últimas 'capacidad' lecturas de cada máquina en un array
+# fijo de NumPy (los sensores en el orden de features.COLUMNAS_NUMERICAS) y lo
+# sobrescribe en círculo. Al arrancar se llena con una sola consulta que lee
+# solo las últimas lecturas de cada máquina.
+#
+# Toda lectura de /predecir, /predecir/lote y la ingesta continua entra al
+# buffer una vez guardada (o encolada) en la BD, aunque la versión en servicio
+# no use tendencias: así una versión con tendencias empieza con las ventanas
+# llenas, y una lectura cuyo guardado falla (o que la cola rechaza) no queda
+# en las ventanas de las siguientes. Las ventanas de una petición se arman
+# antes de guardar, sin tocar el buffer: dos peticiones simultáneas de la
+# misma máquina no se ven entre sí.
+#
+# Con varios workers cada uno ve solo las lecturas que atendió desde que
+# arrancó (más las del calentamiento): para ventanas completas conviene que el
+# balanceador mande cada máquina siempre al mismo worker.
+
+
+class BufferCircular:
+    """Las últimas 'capacidad' lecturas de UNA máquina."""
+
+    __slots__ = ("datos", "posicion", "n")
+
+    def __init__(self, capacidad):
+        self.datos = np.full((capacidad, N_SENSORES), np.nan)  # Lo nunca escrito queda en NaN
+        self.posicion = 0  # Dónde va la próxima lectura
+        self.n = 0
+
+    @property
+    def capacidad(self):
+        return len(self.datos)
+
+    def agregar(self, fila):
+        self.datos[self.posicion] = fila
+        self.posicion = (self.posicion + 1) % self.capacidad
+        self.n = min(self.n + 1, self.capacidad)
+
+    def ultimas(self, k):
+        """(k, 5) con las últimas k lecturas de la más vieja a la más nueva; NaN a la izquierda si hay menos."""
+        # Antes de completar la primera vuelta, los índices "negativos" caen en posiciones nunca escritas (NaN)
+        return self.datos[(self.posicion - k + np.arange(k)) % self.capacidad]
+
+    def con_capacidad(self, capacidad):
+        """Copia con otra capacidad que conserva las lecturas más recientes."""
+        nuevo = BufferCircular(capacidad)
+        for fila in self.ultimas(min(self.n, capacidad)):
+            nuevo.agregar(fila)
+        return nuevo
+
+
+class BufferMaquinas:
+    """Un BufferCircular por máquina, compartido por las peticiones del proceso."""
+
+    def __init__(self, capacidad=32):
+        self.capacidad = capacidad
+        self._buffers = {}  # machine_id -> BufferCircular
+        self._lock = threading.Lock()
+        self._calentadas = 0
+        # Hasta que termina calentar(): lo agregado por máquina, con su
+        # reading_id, para no repetir lo que la consulta de calentar() también trae
+        self._sin_calentar = {}  # machine_id -> deque de (reading_id, fila)
+
+    def _buffer(self, machine_id):
+        buffer = self._buffers.get(machine_id)
+        if buffer is None:
+            buffer = self._buffers[machine_id] = BufferCircular(self.capacidad)
+        return buffer
+
+    def ventanas(self, machine_ids, X, ventana):
+        """
+        (n, ventana, 5): la ventana de cada lectura de X (n, 5), es decir ella
+        y las ventana - 1 anteriores de su máquina, incluidas las de este mismo
+        lote que vienen antes. No modifica el buffer (ver agregar).
+        """
+        if ventana > self.capacidad:
+            self.asegurar_capacidad(ventana)
+        ventanas = np.empty((len(X), ventana, N_SENSORES))
+        del_lote = {}  # machine_id -> lecturas de este lote hasta ahora
+        with self._lock:
+            for i, machine_id in enumerate(machine_ids):
+                propias = del_lote.setdefault(machine_id, [])
+                propias.append(X[i])
+                k = min(len(propias), ventana)
+                faltan = ventana - k
+                if faltan:
+                    buffer = self._buffers.get(machine_id)
+                    ventanas[i, :faltan] = buffer.ultimas(faltan) if buffer is not None else np.nan
+                ventanas[i, faltan:] = propias[-k:]
+        return ventanas
+
+    def agregar(self, machine_ids, X, reading_ids=None):
+        """Agrega las lecturas X (n, 5) en orden, cada una al buffer de su máquina."""
+        with self._lock:
+            for i, machine_id in enumerate(machine_ids):
+                self._buffer(machine_id).agregar(X[i])
+                if self._sin_calentar is not None:
+                    recibidas = self._sin_calentar.get(machine_id)
+                    if recibidas is None:
+                        recibidas = self._sin_calentar[machine_id] = deque(maxlen=self.capacidad)
+                    recibidas.append((reading_ids[i] if reading_ids is not None else None, X[i]))
+
+    def agregar_filas(self, filas_lectura, reading_ids=None):
+        """Agrega lecturas ya guardadas (dicts con las columnas de machine_readings) y sus reading_id."""
+        X = np.array([[fila[sensor] for sensor in SENSORES_FILA] for fila in filas_lectura], dtype=np.float64)
+        self.agregar([fila["machine_id"] for fila in filas_lectura], X.reshape(len(filas_lectura), N_SENSORES), reading_ids)
+
+    def asegurar_capacidad(self, capacidad):
+        """Agranda todos los buffers (una versión de modelos con una ventana mayor que la capacidad)."""
+        with self._lock:
+            if capacidad <= self.capacidad:
+                return
+            self.capacidad = capacidad
+            self._buffers = {machine_id: buffer.con_capacidad(capacidad) for machine_id, buffer in self._buffers.items()}
+
+    def descartar(self, machine_id):
+        with self._lock:
+            self._buffers.pop(machine_id, None)
+
+    def calentar(self, engine):
+        """
+        Llena los buffers con las últimas 'capacidad' lecturas de cada máquina,
+        en UNA consulta que recorre el índice (machine_id, timestamp,
+        reading_id) de cada máquina hasta 'capacidad' filas, sin leer el resto
+        del historial. Lo recibido mientras tanto va después, sin repetir las
+        lecturas que la consulta ya trajo. Retorna cuántas lecturas cargó.
+        """
+        with self._lock:
+            if self._sin_calentar is None:  # Calentado otra vez: vuelve a anotar lo que llega
+                self._sin_calentar = {}
+        with engine.connect() as conn:
+            filas = conn.execute(self._consulta_recientes(engine.dialect.name)).all()
+        buffers, cargadas = {}, {}
+        for machine_id, reading_id, *valores in filas:
+            if machine_id not in buffers:
+                buffers[machine_id], cargadas[machine_id] = BufferCircular(self.capacidad), set()
+            cargadas[machine_id].add(reading_id)
+            # Numeric llega como Decimal; las lecturas sin algún sensor no entran
+            if None not in valores:
+                buffers[machine_id].agregar(np.array(valores, dtype=np.float64))
+        with self._lock:
+            for machine_id, recibidas in self._sin_calentar.items():
+                base = buffers.setdefault(machine_id, BufferCircular(self.capacidad))
+                ya_cargadas = cargadas.get(machine_id, ())
+                for reading_id, fila in recibidas:
+                    if reading_id is None or reading_id not in ya_cargadas:
+                        base.agregar(fila)
+            self._buffers = {machine_id: buffer if buffer.capacidad == self.capacidad else buffer.con_capacidad(self.capacidad)
+                             for machine_id, buffer in buffers.items()}
+            self._sin_calentar = None
+            self._calentadas = len(filas)
+        return len(filas)
+
+    def _consulta_recientes(self, dialecto):
+        """
+        (machine_id, reading_id, sensores...) de las últimas 'capacidad'
+        lecturas de cada máquina, de la más vieja a la más nueva. Postgres:
+        LATERAL por máquina con ORDER BY ... LIMIT; los demás (SQLite, sin
+        LATERAL): subconsulta correlacionada con el mismo LIMIT en un IN.
+        """
+        from sqlalchemy import select, true
+        from sqlalchemy.orm import aliased
+        import models
+
+        maquina, lectura = models.Machine, models.MachineReading
+        orden_reciente = (lectura.timestamp.desc(), lectura.reading_id.desc())
+        if dialecto == "postgresql":
+            recientes = select(lectura.reading_id, lectura.timestamp, *(getattr(lectura, s) for s in SENSORES_FILA))\
+                .where(lectura.machine_id == maquina.machine_id)\
+                .order_by(*orden_reciente)\
+                .limit(self.capacidad)\
+                .lateral("recientes")
+            return select(maquina.machine_id, recientes.c.reading_id, *(recientes.c[s] for s in SENSORES_FILA))\
+                .select_from(maquina)\
+                .join(recientes, true())\
+                .order_by(maquina.machine_id, recientes.c.timestamp, recientes.c.reading_id)
+
+        reciente = aliased(lectura)
+        ultimas = select(reciente.reading_id)\
+            .where(reciente.machine_id == maquina.machine_id)\
+            .order_by(reciente.timestamp.desc(), reciente.reading_id.desc())\
+            .limit(self.capacidad)
+        return select(maquina.machine_id, lectura.reading_id, *(getattr(lectura, s) for s in SENSORES_FILA))\
+            .select_from(maquina)\
+            .join(lectura, lectura.reading_id.in_(ultimas))\
+            .order_by(maquina.machine_id, lectura.timestamp, lectura.reading_id)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "maquinas": len(self._buffers),
+                "capacidad": self.capacidad,
+                "lecturas": sum(buffer.n for buffer in self._buffers.values()),
+                "lecturas_calentamiento": self._calentadas,
+            }
+
+
+# Instancia única del proceso, compartida por main.py, registro_modelos.py y crud_endpoints.py
+buffer_lecturas = BufferMaquinas(config.TENDENCIAS_CAPACIDAD)
@@ -0,0 +1,89 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import fbeta_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+
+# =====================================================
+#  Búsqueda de hiperparámetros del modelo de falla
+# =====================================================
+# Cada candidato (pesos de clase + parámetros del bosque) se entrena en un
+# proceso del pool con n_jobs=1: los candidatos se reparten entre los
+# núcleos en vez de paralelizar los árboles de uno solo. La matriz se envía
+# UNA vez a cada proceso (initializer), no con cada candidato.
+#
+# Se evalúa sobre una partición de validación sacada del split de
+# entrenamiento (el de prueba queda intacto para el reporte final) con F2:
+# el recall pesa más que la precisión, porque una falla no detectada cuesta
+# más que una falsa alarma (la misma idea que los pesos {0: 1, 1: 20}).
+
+GRILLA_POR_DEFECTO = {
+    "class_weight": [{0: 1, 1: 5}, {0: 1, 1: 10}, {0: 1, 1: 20}, {0: 1, 1: 40}, "balanced_subsample"],
+    "max_depth": [None, 16],
+    "min_samples_leaf": [1, 3],
+    "n_estimators": [100],
+}
+
+# Estado de cada proceso del pool (lo llena _iniciar_proceso)
+_datos_proceso = {}
+
+
+def candidatos(grilla):
+    """Producto cartesiano de la grilla: lista de dicts de parámetros."""
+    nombres = list(grilla)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*(grilla[n] for n in nombres))]
+
+
+def _iniciar_proceso(X_ajuste, y_ajuste, X_validacion, y_validacion, random_state):
+    _datos_proceso.update(
+        X_ajuste=X_ajuste, y_ajuste=y_ajuste, X_validacion=X_validacion, y_validacion=y_validacion,
+        random_state=random_state,
+    )
+
+
+def _evaluar_candidato(parametros):
+    d = _datos_proceso
+    inicio = time.perf_counter()
+    modelo = RandomForestClassifier(random_state=d["random_state"], n_jobs=1, **parametros)
+    modelo.fit(d["X_ajuste"], d["y_ajuste"])
+    prediccion = modelo.predict(d["X_validacion"])
+    return {
+        "parametros": parametros,
+        "f2": fbeta_score(d["y_validacion"], prediccion, beta=2, zero_division=0),
+        "recall": recall_score(d["y_validacion"], prediccion, zero_division=0),
+        "precision": precision_score(d["y_validacion"], prediccion, zero_division=0),
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+def buscar(X, y, grilla=GRILLA_POR_DEFECTO, procesos=None, random_state=42, reportar=print):
+    """
+    Evalúa todos los candidatos de 'grilla' en un pool de 'procesos'
+    (None = un proceso por núcleo). Retorna los resultados ordenados del
+    mejor al peor; resultados[0]["parametros"] es el ganador.
+    """
+    X_ajuste, X_validacion, y_ajuste, y_validacion = train_test_split(
+        X, y, test_size=0.25, random_state=random_state, stratify=y
+    )
+    lista = candidatos(grilla)
+    procesos = min(procesos or os.cpu_count() or 1, len(lista))
+    reportar(f"Búsqueda: {len(lista)} candidatos en {procesos} procesos "
+             f"({len(X_ajuste):,} filas de ajuste, {len(X_validacion):,} de validación).")
+
+    resultados = []
+    with ProcessPoolExecutor(
+        max_workers=procesos, initializer=_iniciar_proceso,
+        initargs=(X_ajuste, y_ajuste, X_validacion, y_validacion, random_state),
+    ) as pool:
+        for resultado in pool.map(_evaluar_candidato, lista):
+            resultados.append(resultado)
+            reportar(f"  F2={resultado['f2']:.3f} recall={resultado['recall']:.3f} "
+                     f"precision={resultado['precision']:.3f} ({resultado['segundos']:.1f} s)  {resultado['parametros']}")
+
+    # Empates en F2: gana el candidato más barato (menos profundidad, hojas más grandes)
+    resultados.sort(key=lambda r: (-r["f2"], r["parametros"].get("max_depth") or float("inf"),
+                                   -r["parametros"].get("min_samples_leaf", 1)))
+    return resultados
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import select
+
+import config
+import models
+
+# =====================================================
+#  Caché en memoria de los metadatos de las máquinas
+# =====================================================
+# /predecir solo necesita saber si la máquina existe y cuál es su 'type'.
+# La tabla machines casi nunca cambia, así que se guarda en memoria (LRU
+# acotado + TTL). Los endpoints del CRUD que modifican máquinas invalidan la
+# entrada correspondiente; el TTL cubre los cambios hechos por otros workers.
+
+InfoMaquina = namedtuple("InfoMaquina", ["machine_id", "type", "location"])
+
+
+class CacheMaquinas:
+    def __init__(self, max_entradas=10000, ttl_s=60.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl_s
+        self._entradas = OrderedDict()  # machine_id -> (InfoMaquina, expira_en)
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidaciones = 0
+
+    def _buscar(self, machine_id, ahora):
+        entrada = self._entradas.get(machine_id)
+        if entrada is None:
+            return None
+        info, expira_en = entrada
+        if expira_en < ahora:
+            del self._entradas[machine_id]
+            return None
+        self._entradas.move_to_end(machine_id)
+        return info
+
+    def _guardar(self, info, ahora):
+        self._entradas[info.machine_id] = (info, ahora + self.ttl)
+        self._entradas.move_to_end(info.machine_id)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    async def obtener(self, db, machine_id):
+        """InfoMaquina de 'machine_id', o None si no existe. Consulta la BD solo si no está en caché."""
+        return (await self.obtener_varios(db, [machine_id])).get(machine_id)
+
+    async def obtener_varios(self, db, machine_ids):
+        """
+        Dict {machine_id: InfoMaquina} de las máquinas que existen ('db' es una
+        AsyncSession). Las que no están en caché se cargan con UNA sola consulta.
+        Las inexistentes no se guardan (así una máquina recién creada en otro
+        worker se ve de inmediato).
+        """
+        ahora = time.monotonic()
+        encontradas = {}
+        faltantes = []
+        with self._lock:
+            for machine_id in set(machine_ids):
+                info = self._buscar(machine_id, ahora)
+                if info is None:
+                    faltantes.append(machine_id)
+                else:
+                    encontradas[machine_id] = info
+            self._aciertos += len(encontradas)
+            self._fallos += len(faltantes)
+
+        if faltantes:
+            filas = (await db.execute(
+                select(models.Machine.machine_id, models.Machine.type, models.Machine.location)
+                .where(models.Machine.machine_id.in_(faltantes))
+            )).all()
+            with self._lock:
+                for fila in filas:
+                    info = InfoMaquina(*fila)
+                    self._guardar(info, ahora)
+                    encontradas[info.machine_id] = info
+
+        return encontradas
+
+    def invalidar(self, machine_id=None):
+        """Borra una máquina de la caché (o toda la caché si machine_id es None)."""
+        with self._lock:
+            self._invalidaciones += 1
+            if machine_id is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(machine_id, None)
+
+    def estadisticas(self):
+        consultas = self._aciertos + self._fallos
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_s": self.ttl,
+            "aciertos": self._aciertos,
+            "fallos": self._fallos,
+            "tasa_aciertos": self._aciertos / consultas if consultas else 0.0,
+            "invalidaciones": self._invalidaciones,
+        }
+
+
+# Instancia única del proceso, compartida por main.py y crud_endpoints.py
+cache_maquinas = CacheMaquinas(config.CACHE_MAQUINAS_MAX, config.CACHE_MAQUINAS_TTL_S)
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+import metricas
+
+# =====================================================
+#  Caché de predicciones por vector de features
+# =====================================================
+# Una máquina detenida u ociosa manda la misma lectura una y otra vez. En vez
+# de evaluar ambos bosques cada vez, el resultado se guarda en un LRU acotado
+# con clave (versión de los modelos, fila de features codificada). La lectura
+# se guarda en la BD igual que siempre: la caché solo reemplaza la evaluación.
+#
+# Cuantización (CACHE_PREDICCIONES_CUANTIZACION): con paso > 0 cada feature se
+# redondea a múltiplos del paso antes de armar la clave, así lecturas casi
+# idénticas (ruido del sensor) comparten el resultado de la primera que se
+# evaluó. Con 0 (por defecto) solo coinciden vectores exactamente iguales y
+# la respuesta es idéntica a evaluar los modelos.
+#
+# La versión va en la clave: una petición que empezó con la versión anterior
+# nunca deja resultados que la nueva pueda usar. Además GestorModelos vacía la
+# caché en cada intercambio para liberar las entradas viejas.
+
+
+class CachePredicciones:
+    def __init__(self, max_entradas=100000, cuantizacion=0.0, activa=True):
+        self.max_entradas = max_entradas
+        self.paso = cuantizacion
+        self.activa = activa and max_entradas > 0
+        self._entradas = OrderedDict()  # (version, bytes de la fila) -> (prediccion, probabilidades, tipo)
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+        self._invalidaciones = 0
+
+    def _clave(self, version, fila):
+        if self.paso > 0:
+            fila = np.round(fila / self.paso) + 0.0  # + 0.0: -0.0 y 0.0 dan la misma clave
+        return version, fila.tobytes()
+
+    def obtener_varios(self, version, X):
+        """Lista con el resultado guardado de cada fila de X, o None si no está."""
+        claves = [self._clave(version, fila) for fila in X]
+        resultados = []
+        with self._lock:
+            for clave in claves:
+                resultado = self._entradas.get(clave)
+                if resultado is not None:
+                    self._entradas.move_to_end(clave)
+                resultados.append(resultado)
+        aciertos = sum(resultado is not None for resultado in resultados)
+        self._contar(aciertos, len(resultados) - aciertos)
+        return resultados
+
+    def guardar_varios(self, version, X, resultados):
+        """Guarda (prediccion, probabilidades, tipo) de cada fila de X."""
+        claves = [self._clave(version, fila) for fila in X]
+        with self._lock:
+            for clave, (prediccion, probabilidades, tipo) in zip(claves, resultados):
+                # Copias: las filas de un lote son vistas que mantendrían vivo el array completo
+                self._entradas[clave] = (prediccion, np.array(probabilidades), np.array(tipo))
+                self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def _contar(self, aciertos, fallos):
+        with self._lock:
+            self._aciertos += aciertos
+            self._fallos += fallos
+        if aciertos:
+            metricas.CACHE_PREDICCIONES.inc(aciertos, "acierto")
+        if fallos:
+            metricas.CACHE_PREDICCIONES.inc(fallos, "fallo")
+
+    def invalidar(self):
+        """Vacía la caché (se llama al cambiar la versión de los modelos en servicio)."""
+        with self._lock:
+            self._invalidaciones += 1
+            self._entradas.clear()
+
+    def estadisticas(self):
+        consultas = self._aciertos + self._fallos
+        return {
+            "activa": self.activa,
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "cuantizacion": self.paso,
+            "aciertos": self._aciertos,
+            "fallos": self._fallos,
+            "tasa_aciertos": self._aciertos / consultas if consultas else 0.0,
+            "invalidaciones": self._invalidaciones,
+        }
+
+
+# Instancia única del proceso, compartida por main.py y registro_modelos.py
+cache_predicciones = CachePredicciones(
+    config.CACHE_PREDICCIONES_MAX, config.CACHE_PREDICCIONES_CUANTIZACION, config.CACHE_PREDICCIONES_ACTIVA
+)
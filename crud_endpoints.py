@@ -1,75 +1,210 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, literal_column, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Literal, Optional
+from datetime import datetime
+import base64
 
 # Importa los modelos, schemas y el get_db
+import agregados
 import models
 import schemas
 from database import get_db
+from buffer_lecturas import buffer_lecturas
+from cache_maquinas import cache_maquinas
+from estadisticas_maquinas import estadisticas_maquinas
+from retencion import combinar_resumenes, consulta_resumen_horario
+from metricas import RutaMedida
 
 # Crea un "mini-FastAPI" para agrupar estos endpoints
 router = APIRouter(
     prefix="/api",  # Todos los endpoints aquí empezarán con /api
-    tags=["CRUD Management"] # Se agruparán en Swagger bajo "CRUD Management"
+    tags=["CRUD Management"], # Se agruparán en Swagger bajo "CRUD Management"
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
 )
 
 # ================================
 # CRUD para Machines (Máquinas)
 # ================================
+# Las lecturas solo se devuelven en /machines/detail/ (opt-in, las últimas
+# de cada máquina); el resto de endpoints devuelve un resumen calculado en la
+# BD. El historial completo se pagina en /machines/{id}/readings/.
+MAX_MACHINES_DETAIL = 50
+MAX_READINGS_DETAIL = 200
+
+async def get_machine_or_404(machine_id: int, db: AsyncSession):
+    """
+    Obtiene el objeto ORM de una máquina o lanza 404. (Sin cargar sus lecturas)
+    """
+    db_machine = await db.get(models.Machine, machine_id)
+    if db_machine is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+    return db_machine
+
+async def query_machine_summaries(db: AsyncSession, machines_query):
+    """
+    Resume las máquinas de 'machines_query' (un select de models.Machine) con
+    UNA sola consulta agregada: cantidad de lecturas, fecha de la última y si
+    esa última lectura fue una falla. No carga ninguna lectura en memoria.
+    Las lecturas ya resumidas por la retención (machine_readings_hourly)
+    también cuentan.
+    """
+    machines = machines_query.subquery()
+    reading = models.MachineReading
+    hourly = models.MachineReadingHourly
+
+    stats = select(
+        reading.machine_id,
+        func.count(reading.reading_id).label("reading_count"),
+        func.max(reading.timestamp).label("last_reading_at"),
+        func.max(reading.reading_id).label("last_reading_id"),
+    ).where(reading.machine_id.in_(select(machines.c.machine_id)))\
+     .group_by(reading.machine_id)\
+     .subquery()
+    hourly_stats = select(
+        hourly.machine_id,
+        func.sum(hourly.reading_count).label("reading_count"),
+        func.max(hourly.hour).label("last_hour"),
+    ).where(hourly.machine_id.in_(select(machines.c.machine_id)))\
+     .group_by(hourly.machine_id)\
+     .subquery()
+    last_reading = aliased(reading)
+
+    rows = (await db.execute(
+        select(
+            machines,
+            (func.coalesce(stats.c.reading_count, 0) + func.coalesce(hourly_stats.c.reading_count, 0)).label("reading_count"),
+            func.coalesce(stats.c.last_reading_at, hourly_stats.c.last_hour).label("last_reading_at"),
+            last_reading.machine_failure.label("last_machine_failure"),
+        )
+        .outerjoin(stats, stats.c.machine_id == machines.c.machine_id)
+        .outerjoin(hourly_stats, hourly_stats.c.machine_id == machines.c.machine_id)
+        .outerjoin(last_reading, last_reading.reading_id == stats.c.last_reading_id)
+        .order_by(machines.c.machine_id)
+    )).mappings().all()
+    return [schemas.MachineSummaryResponse(**row) for row in rows]
 
 @router.post("/machines/", response_model=schemas.MachineResponse, status_code=status.HTTP_201_CREATED)
-def create_machine(machine: schemas.MachineCreate, db: Session = Depends(get_db)):
+async def create_machine(machine: schemas.MachineCreate, db: AsyncSession = Depends(get_db)):
     """
     CREATE: Crea una nueva máquina.
     """
     db_machine = models.Machine(**machine.model_dump())
     db.add(db_machine)
-    db.commit()
-    db.refresh(db_machine)
+    await db.commit()
+    await db.refresh(db_machine)
+    cache_maquinas.invalidar(db_machine.machine_id)
     return db_machine
 
-@router.get("/machines/{machine_id}", response_model=schemas.MachineResponse)
-def read_machine(machine_id: int, db: Session = Depends(get_db)):
+@router.get("/machines/detail/", response_model=List[schemas.MachineDetailResponse])
+async def read_machines_detail(
+    skip: int = 0,
+    limit: int = Query(10, ge=1, le=MAX_MACHINES_DETAIL),
+    readings_limit: int = Query(20, ge=1, le=MAX_READINGS_DETAIL),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    READ (One): Obtiene una máquina específica por su ID.
+    READ (All, detalle): Máquinas CON sus últimas lecturas y detalles de falla
+    (?readings_limit= por máquina, de la más reciente a la más antigua). Es
+    opt-in y paginado en pocas máquinas por página; el resto del historial se
+    pagina en /machines/{id}/readings/.
     """
-    db_machine = db.query(models.Machine).filter(models.Machine.machine_id == machine_id).first()
-    if db_machine is None:
+    machines = (await db.scalars(
+        select(models.Machine).order_by(models.Machine.machine_id).offset(skip).limit(limit)
+    )).all()
+    by_machine = {machine.machine_id: [] for machine in machines}
+    if by_machine:
+        latest = latest_readings_query(db.bind.dialect.name, list(by_machine), readings_limit)
+        for reading in (await db.scalars(latest)).all():
+            by_machine[reading.machine_id].append(reading)
+    for machine in machines:
+        # Sin marcar la relación como modificada (no es una asignación del cliente)
+        set_committed_value(machine, "readings", by_machine[machine.machine_id])
+    return machines
+
+def latest_readings_query(dialect: str, machine_ids: List[int], per_machine: int):
+    """
+    Las últimas 'per_machine' lecturas de cada máquina de 'machine_ids', en
+    UNA consulta que recorre el índice (machine_id, timestamp, reading_id) de
+    cada máquina hasta ese límite (no lee el resto del historial). Postgres:
+    LATERAL por máquina; SQLite (sin LATERAL): el mismo LIMIT en un IN
+    correlacionado.
+    """
+    machine, reading = models.Machine, models.MachineReading
+    if dialect == "postgresql":
+        recent = select(reading)\
+            .where(reading.machine_id == machine.machine_id)\
+            .order_by(reading.timestamp.desc(), reading.reading_id.desc())\
+            .limit(per_machine)\
+            .lateral("recent")
+        latest = aliased(reading, recent)
+        return select(latest)\
+            .select_from(machine)\
+            .join(recent, true())\
+            .where(machine.machine_id.in_(machine_ids))\
+            .order_by(machine.machine_id, latest.timestamp.desc(), latest.reading_id.desc())
+
+    recent = aliased(reading)
+    latest_ids = select(recent.reading_id)\
+        .where(recent.machine_id == machine.machine_id)\
+        .order_by(recent.timestamp.desc(), recent.reading_id.desc())\
+        .limit(per_machine)
+    return select(reading)\
+        .select_from(machine)\
+        .join(reading, reading.reading_id.in_(latest_ids))\
+        .where(machine.machine_id.in_(machine_ids))\
+        .order_by(machine.machine_id, reading.timestamp.desc(), reading.reading_id.desc())
+
+@router.get("/machines/{machine_id}", response_model=schemas.MachineSummaryResponse)
+async def read_machine(machine_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    READ (One): Obtiene una máquina específica por su ID (con el resumen de sus lecturas).
+    """
+    summaries = await query_machine_summaries(db, select(models.Machine).where(models.Machine.machine_id == machine_id))
+    if not summaries:
         raise HTTPException(status_code=404, detail="Machine not found")
-    return db_machine
+    return summaries[0]
 
-@router.get("/machines/", response_model=List[schemas.MachineResponse])
-def read_machines(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.get("/machines/", response_model=List[schemas.MachineSummaryResponse])
+async def read_machines(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
     """
-    READ (All): Obtiene una lista de todas las máquinas.
+    READ (All): Obtiene una lista de todas las máquinas (con el resumen de sus lecturas).
     """
-    machines = db.query(models.Machine).offset(skip).limit(limit).all()
-    return machines
+    return await query_machine_summaries(
+        db, select(models.Machine).order_by(models.Machine.machine_id).offset(skip).limit(limit)
+    )
 
 @router.put("/machines/{machine_id}", response_model=schemas.MachineResponse)
-def update_machine(machine_id: int, machine: schemas.MachineCreate, db: Session = Depends(get_db)):
+async def update_machine(machine_id: int, machine: schemas.MachineCreate, db: AsyncSession = Depends(get_db)):
     """
     UPDATE: Actualiza la información de una máquina existente.
     """
-    db_machine = read_machine(machine_id, db) # Reutiliza la función read_machine para obtener y chequear 404
+    db_machine = await get_machine_or_404(machine_id, db) # Obtener y chequear 404
     
     # Actualiza los campos
     db_machine.type = machine.type
     db_machine.location = machine.location
     db_machine.description = machine.description
+    db_machine.product_id = machine.product_id
     
-    db.commit()
-    db.refresh(db_machine)
+    await db.commit()
+    await db.refresh(db_machine)
+    cache_maquinas.invalidar(machine_id) # El 'type' de /predecir pudo cambiar
     return db_machine
 
 @router.delete("/machines/{machine_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_machine(machine_id: int, db: Session = Depends(get_db)):
+async def delete_machine(machine_id: int, db: AsyncSession = Depends(get_db)):
     """
-    DELETE: Elimina una máquina. (Las lecturas se borrarán en cascada por el ON DELETE CASCADE)
+    DELETE: Elimina una máquina. (Las lecturas y sus resúmenes por hora se borrarán en cascada por el ON DELETE CASCADE)
     """
-    db_machine = read_machine(machine_id, db) # Obtener y chequear 404
-    db.delete(db_machine)
-    db.commit()
+    db_machine = await get_machine_or_404(machine_id, db) # Obtener y chequear 404
+    await db.delete(db_machine)
+    await db.commit()
+    cache_maquinas.invalidar(machine_id)
+    buffer_lecturas.descartar(machine_id)
+    estadisticas_maquinas.descartar(machine_id)  # Su fila de machine_stats se va en cascada
     return
 
 # ================================
@@ -77,38 +212,129 @@ def delete_machine(machine_id: int, db: Session = Depends(get_db)):
 # ================================
 # Nota: El endpoint /predecir ya funciona como un "CREATE" de lecturas.
 # Estos son endpoints adicionales para gestión manual.
+MAX_READINGS_PAGE = 1000
+MAX_HOURLY_PAGE = 5000
 
-@router.get("/readings/{reading_id}", response_model=schemas.MachineReadingResponse)
-def read_reading(reading_id: int, db: Session = Depends(get_db)):
+async def get_reading_or_404(reading_id: int, db: AsyncSession):
     """
-    READ (One): Obtiene una lectura específica por su ID.
+    Obtiene el objeto ORM de una lectura o lanza 404. (Sin cargar su detalle de falla)
     """
-    db_reading = db.query(models.MachineReading).filter(models.MachineReading.reading_id == reading_id).first()
+    db_reading = await db.get(models.MachineReading, reading_id)
     if db_reading is None:
         raise HTTPException(status_code=404, detail="Reading not found")
     return db_reading
 
-@router.get("/machines/{machine_id}/readings/", response_model=List[schemas.MachineReadingResponse])
-def read_readings_for_machine(machine_id: int, skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+@router.get("/readings/{reading_id}", response_model=schemas.MachineReadingResponse)
+async def read_reading(reading_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    READ (One): Obtiene una lectura específica por su ID.
+    """
+    # failure_details sale de la columna failure_flags de la misma fila
+    return await get_reading_or_404(reading_id, db)
+
+def encode_reading_cursor(reading):
+    """Cursor opaco con la posición (timestamp, reading_id) de la última lectura entregada."""
+    raw = f"{reading.timestamp.isoformat()}|{reading.reading_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_reading_cursor(cursor: str):
+    try:
+        timestamp, reading_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/machines/{machine_id}/readings/", response_model=schemas.MachineReadingPage)
+async def read_readings_for_machine(
+    machine_id: int,
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=MAX_READINGS_PAGE),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    READ (All): Obtiene todas las lecturas de una máquina específica.
+    READ (All): Obtiene las lecturas de una máquina, de la más reciente a la más antigua.
+    Paginación por cursor sobre (timestamp, reading_id): cada página es una
+    búsqueda en el índice ix_machine_readings_machine_ts_id, sin OFFSET.
+    Para la siguiente página, pasar el 'next_cursor' recibido como ?cursor=.
     """
     # Primero, verifica que la máquina exista
-    read_machine(machine_id, db)
-    
-    readings = db.query(models.MachineReading)\
-                 .filter(models.MachineReading.machine_id == machine_id)\
-                 .offset(skip).limit(limit).all()
-    return readings
+    await get_machine_or_404(machine_id, db)
+
+    reading = models.MachineReading
+    query = select(reading)\
+        .where(reading.machine_id == machine_id)\
+        .order_by(reading.timestamp.desc(), reading.reading_id.desc())\
+        .limit(limit + 1) # Una fila extra para saber si hay otra página
+
+    if date_from is not None:
+        query = query.where(reading.timestamp >= date_from)
+    if date_to is not None:
+        query = query.where(reading.timestamp < date_to)
+    if cursor is not None:
+        query = query.where(tuple_(reading.timestamp, reading.reading_id) < tuple_(*decode_reading_cursor(cursor)))
+
+    readings = (await db.scalars(query)).all()
+    has_more = len(readings) > limit
+    readings = readings[:limit]
+    return {
+        "items": readings,
+        "next_cursor": encode_reading_cursor(readings[-1]) if has_more else None,
+    }
+
+@router.get("/machines/{machine_id}/readings/hourly/", response_model=List[schemas.MachineReadingHourlyResponse])
+async def read_hourly_readings_for_machine(
+    machine_id: int,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(168, ge=1, le=MAX_HOURLY_PAGE),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    READ (All): Lecturas de una máquina resumidas por hora, de la más reciente
+    a la más antigua. Combina los dos niveles del historial: las horas que la
+    retención ya resumió (machine_readings_hourly) y las que todavía tienen
+    lecturas crudas (resumidas al vuelo), así la serie es continua.
+    Para la siguiente página, pasar como ?to= la 'hour' más antigua recibida.
+    """
+    await get_machine_or_404(machine_id, db)
+
+    hourly = models.MachineReadingHourly
+    stored_query = select(hourly).where(hourly.machine_id == machine_id).order_by(hourly.hour.desc()).limit(limit)
+    if date_from is not None:
+        stored_query = stored_query.where(hourly.hour >= date_from)
+    if date_to is not None:
+        stored_query = stored_query.where(hourly.hour < date_to)
+    raw_query = consulta_resumen_horario(db.bind.dialect.name, machine_id, date_from, date_to)\
+        .order_by(literal_column("hour").desc()).limit(limit)
+
+    hours = {}
+    for row in (await db.scalars(stored_query)).all():
+        hours[row.hour] = schemas.MachineReadingHourlyResponse.model_validate(row).model_dump()
+    for row in (await db.execute(raw_query)).mappings().all():
+        row = dict(row)
+        hours[row["hour"]] = combinar_resumenes(hours[row["hour"]], row) if row["hour"] in hours else row
+    return [hours[hour] for hour in sorted(hours, reverse=True)[:limit]]
+
+async def recalculate_rollups(db: AsyncSession, reading):
+    """
+    Rehace los agregados por hora / día (agregados.py) del día de 'reading'
+    después de borrarla o corregirla, en la misma transacción.
+    """
+    machine_id, timestamp = reading.machine_id, reading.timestamp
+    await db.flush()
+    await db.run_sync(lambda session: agregados.recalcular(session.connection(), machine_id, timestamp))
 
 @router.delete("/readings/{reading_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_reading(reading_id: int, db: Session = Depends(get_db)):
+async def delete_reading(reading_id: int, db: AsyncSession = Depends(get_db)):
     """
-    DELETE: Elimina una lectura. (El detalle de falla se borrará en cascada)
+    DELETE: Elimina una lectura (y con ella su detalle de falla).
     """
-    db_reading = read_reading(reading_id, db) # Obtener y chequear 404
-    db.delete(db_reading)
-    db.commit()
+    db_reading = await get_reading_or_404(reading_id, db) # Obtener y chequear 404
+    await db.delete(db_reading)
+    await recalculate_rollups(db, db_reading)
+    await db.commit()
     return
 
 # ================================
@@ -116,52 +342,93 @@ def delete_reading(reading_id: int, db: Session = Depends(get_db)):
 # ================================
 # Nota: El endpoint /predecir ya funciona como un "CREATE" de fallas.
 # Estos endpoints son para LEER o CORREGIR (Update/Delete) una falla.
+# El detalle de falla es la columna failure_flags de la lectura (bits de
+# models.FAILURE_FLAGS); su failure_id es el reading_id, salvo en las fallas
+# migradas de failure_types, que conservan el suyo (legacy_failure_id).
+MAX_FAILURES_PAGE = 1000
+
+async def get_failure_reading_or_404(failure_id: int, db: AsyncSession):
+    """
+    Lectura dueña del detalle de falla 'failure_id' o 404. Primero como id
+    migrado de failure_types; si no, como reading_id, solo de lecturas sin
+    id migrado: un failure_id viejo nunca cae en otra lectura.
+    """
+    reading = models.MachineReading
+    db_reading = await db.scalar(select(reading).where(reading.legacy_failure_id == failure_id))
+    if db_reading is None:
+        db_reading = await db.get(reading, failure_id)
+        if db_reading is not None and db_reading.legacy_failure_id is not None:
+            db_reading = None
+    if db_reading is None or db_reading.failure_flags is None:
+        raise HTTPException(status_code=404, detail="FailureType record not found")
+    return db_reading
+
+@router.get("/failures/", response_model=List[schemas.MachineReadingResponse])
+async def read_failures(
+    failure_type: Optional[List[Literal["twf", "hdf", "pwf", "osf", "rnf"]]] = Query(None, alias="type"),
+    machine_id: Optional[int] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(100, ge=1, le=MAX_FAILURES_PAGE),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    READ (All): Lecturas con falla, de la más reciente a la más antigua.
+    Filtros opcionales: ?type=hdf&type=osf (cualquiera de esos tipos),
+    ?machine_id=, ?from= y ?to=. Sin tipo lista toda lectura con machine_failure,
+    también las que no registraron tipos (failure_flags en 0 o NULL), por el
+    índice parcial ix_machine_readings_machine_failure; con tipo recorre el de
+    fallas tipadas (ix_machine_readings_failures). Nunca la tabla completa.
+    """
+    reading = models.MachineReading
+    query = select(reading)\
+        .order_by(reading.timestamp.desc(), reading.reading_id.desc())\
+        .limit(limit)
+    if failure_type:
+        mask = sum(models.FAILURE_FLAGS[name] for name in set(failure_type))
+        query = query.where(reading.failure_flags != 0, reading.failure_flags.bitwise_and(mask) != 0)
+    else:
+        # "= 1" / "= true", la misma forma que el predicado del índice parcial
+        query = query.where(reading.machine_failure == True)  # noqa: E712
+    if machine_id is not None:
+        query = query.where(reading.machine_id == machine_id)
+    if date_from is not None:
+        query = query.where(reading.timestamp >= date_from)
+    if date_to is not None:
+        query = query.where(reading.timestamp < date_to)
+    return (await db.scalars(query)).all()
 
 @router.get("/readings/{reading_id}/failure_details/", response_model=schemas.FailureTypeResponse)
-def read_failure_for_reading(reading_id: int, db: Session = Depends(get_db)):
+async def read_failure_for_reading(reading_id: int, db: AsyncSession = Depends(get_db)):
     """
     READ (One): Obtiene el detalle de falla asociado a una lectura específica.
     """
-    # Primero, verifica que la lectura exista
-    read_reading(reading_id, db)
-    
-    db_failure = db.query(models.FailureType).filter(models.FailureType.reading_id == reading_id).first()
-    
-    if db_failure is None:
+    db_reading = await get_reading_or_404(reading_id, db)
+    if db_reading.failure_details is None:
         raise HTTPException(status_code=404, detail="No failure details found for this reading")
-    return db_failure
+    return db_reading.failure_details
 
 @router.put("/failure_types/{failure_id}", response_model=schemas.FailureTypeResponse)
-def update_failure_type(failure_id: int, failure: schemas.FailureTypeCreate, db: Session = Depends(get_db)):
+async def update_failure_type(failure_id: int, failure: schemas.FailureTypeCreate, db: AsyncSession = Depends(get_db)):
     """
     UPDATE: Actualiza/corrige un detalle de falla (ej. si el ML se equivocó).
     """
-    db_failure = db.query(models.FailureType).filter(models.FailureType.failure_id == failure_id).first()
-    
-    if db_failure is None:
-        raise HTTPException(status_code=404, detail="FailureType record not found")
+    db_reading = await get_failure_reading_or_404(failure_id, db)
 
-    # Actualiza todos los campos
-    db_failure.twf = failure.twf
-    db_failure.hdf = failure.hdf
-    db_failure.pwf = failure.pwf
-    db_failure.osf = failure.osf
-    db_failure.rnf = failure.rnf
-    
-    db.commit()
-    db.refresh(db_failure)
-    return db_failure
+    # Actualiza todos los campos (un solo UPDATE de la columna failure_flags)
+    db_reading.failure_flags = models.encode_failure_flags(failure.model_dump())
+    await recalculate_rollups(db, db_reading)
+
+    await db.commit()
+    return db_reading.failure_details
 
 @router.delete("/failure_types/{failure_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_failure_type(failure_id: int, db: Session = Depends(get_db)):
+async def delete_failure_type(failure_id: int, db: AsyncSession = Depends(get_db)):
     """
-    DELETE: Elimina un registro de detalle de falla.
+    DELETE: Elimina un registro de detalle de falla (la lectura se conserva).
     """
-    db_failure = db.query(models.FailureType).filter(models.FailureType.failure_id == failure_id).first()
-    
-    if db_failure is None:
-        raise HTTPException(status_code=404, detail="FailureType record not found")
-
-    db.delete(db_failure)
-    db.commit()
+    db_reading = await get_failure_reading_or_404(failure_id, db)
+    db_reading.failure_flags = None
+    await recalculate_rollups(db, db_reading)
+    await db.commit()
     return
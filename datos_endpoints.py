@@ -0,0 +1,83 @@
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from datetime import datetime
+import importlib.util
+import anyio
+
+from database import engine
+from registro_modelos import gestor_modelos
+import exportar_lecturas
+from metricas import RutaMedida
+
+# Endpoints para mover datos históricos dentro/fuera de la BD en bloque
+router = APIRouter(
+    prefix="/api/datos",
+    tags=["Importación / Exportación"],
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
+)
+
+# ================================
+# Importación de CSV
+# ================================
+
+@router.post("/importar")
+async def importar(archivo: UploadFile = File(...), puntuar: bool = False, bloque: Optional[int] = 5000):
+    """
+    Importa un CSV con el formato de 'machine failure.csv'. El archivo se
+    procesa por bloques desde el archivo temporal de la subida (memoria
+    constante). Con ?puntuar=true las fallas se predicen con los modelos en vez
+    de tomarse de las etiquetas del CSV.
+    """
+    if bloque is None or bloque < 1:
+        raise HTTPException(status_code=400, detail="'bloque' debe ser mayor que 0")
+
+    paquete_modelos = None
+    if puntuar:
+        # Se usa la versión en servicio de la API (la misma que /predecir)
+        modelo = gestor_modelos.actual
+        if modelo is None:
+            raise HTTPException(status_code=503, detail="Modelos no cargados. No se puede puntuar el CSV.")
+        paquete_modelos = modelo.paquete
+
+    # pandas se importa recién aquí: no pesa en el arranque de la API
+    from importar_csv import importar_csv
+
+    # La importación es bloqueante (pandas + BD): se corre en un hilo
+    try:
+        resumen = await anyio.to_thread.run_sync(
+            lambda: importar_csv(archivo.file, engine, tamano_bloque=bloque,
+                                 paquete_modelos=paquete_modelos, reportar=None)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return resumen
+
+# ================================
+# Exportación de lecturas
+# ================================
+
+@router.get("/exportar")
+def exportar(
+    formato: Literal["csv", "ndjson", "parquet"] = "csv",
+    machine_id: Optional[int] = None,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    machine_failure: Optional[bool] = None,
+):
+    """
+    Exporta lecturas (con sus detalles de falla) en streaming, con las columnas
+    de 'machine failure.csv' + 'timestamp'. Filtros opcionales: máquina, rango
+    de fechas [from, to) y si la lectura fue falla. No arma la respuesta en
+    memoria: las filas salen de un cursor de servidor por lotes.
+    """
+    if formato == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="La exportación a Parquet requiere instalar pyarrow.")
+
+    consulta = exportar_lecturas.consulta_exportacion(machine_id, date_from, date_to, machine_failure)
+    lotes = exportar_lecturas.lotes_de_filas(engine, consulta)
+    return StreamingResponse(
+        exportar_lecturas.EXPORTADORES[formato](lotes),
+        media_type=exportar_lecturas.FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="lecturas.{formato}"'},
+    )
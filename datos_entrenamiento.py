@@ -0,0 +1,199 @@
+import hashlib
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from features import COLUMNAS_CSV, COLUMNAS_NUMERICAS
+from tendencias import CalculadorTendencias
+
+# =====================================================
+#  Datos de entrenamiento (CSV o BD) con caché en disco
+# =====================================================
+# entrenar.py pide aquí la matriz de features y las etiquetas. Ambas fuentes
+# se leen por bloques y cada bloque se codifica apenas llega: en memoria solo
+# quedan las matrices NumPy, nunca el DataFrame completo.
+#
+#   csv  'machine failure.csv' (o cualquier archivo con ese formato)
+#   bd   machine_readings + machines, con la misma consulta
+#        (y el mismo cursor de servidor) que la exportación de lecturas
+#
+# Con features de tendencia (entrenar.py --tendencias N) las ventanas se
+# arman en el orden en que llegan las lecturas: el CSV es UNA secuencia (el
+# orden de sus filas) y la BD una secuencia por máquina (por reading_id).
+#
+# La matriz codificada se guarda en ENTRENAMIENTO_CACHE_DIR con una clave
+# derivada de la huella de los datos y de las columnas del modelo: si nada
+# cambió, la siguiente corrida salta la carga y la codificación.
+
+# RNF (Random No Failure) no se predice
+ETIQUETAS_TIPO_FALLA = ['TWF', 'HDF', 'PWF', 'OSF']
+
+# Subir si cambia el formato del archivo de caché o la codificación
+VERSION_CACHE = 1
+
+DatosEntrenamiento = namedtuple("DatosEntrenamiento", ["X", "y_falla", "Y_tipo", "clave", "desde_cache"])
+
+
+# ================================
+# Huellas de los datos
+# ================================
+
+def huella_csv(ruta):
+    """SHA-256 del contenido del archivo (leer los bytes es mucho más barato que parsearlo)."""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def huella_bd(engine):
+    """
+    Huella de las tablas de entrenamiento calculada DENTRO de la BD: conteos,
+    máximos y sumas de cada columna que entra al modelo. Es un solo recorrido
+    sin transferir filas; cualquier lectura nueva, borrada o editada (sensores,
+    etiquetas o el Type de su máquina) cambia alguna de las sumas.
+    """
+    from sqlalchemy import case, func, select
+    import models  # Solo con --fuente bd: entrenar desde el CSV no toca la BD
+
+    lectura = models.MachineReading
+    maquina = models.Machine
+
+    def bandera(condicion):
+        return func.sum(case((condicion, 1), else_=0))
+
+    consultas = [
+        select(
+            func.count(), func.max(lectura.reading_id), func.sum(lectura.reading_id),
+            func.sum(lectura.air_temperature), func.sum(lectura.process_temperature),
+            func.sum(lectura.rotational_speed), func.sum(lectura.torque), func.sum(lectura.tool_wear),
+            bandera(lectura.machine_failure.is_(True)),
+        ),
+        select(
+            func.count(lectura.failure_flags), func.sum(case((lectura.failure_flags.isnot(None), lectura.reading_id))),
+            *(bandera(models.has_failure_type(lectura.failure_flags, tipo)) for tipo in ("twf", "hdf", "pwf", "osf")),
+        ),
+        select(maquina.type, func.count(), func.sum(maquina.machine_id)).group_by(maquina.type).order_by(maquina.type),
+    ]
+    sha = hashlib.sha256()
+    with engine.connect() as conn:
+        for consulta in consultas:
+            for fila in conn.execute(consulta):
+                sha.update(repr(tuple(fila)).encode())
+    return sha.hexdigest()
+
+
+def clave_cache(huella, columnas_modelo):
+    contenido = f"{VERSION_CACHE}|{','.join(columnas_modelo)}|{huella}"
+    return hashlib.sha256(contenido.encode()).hexdigest()[:20]
+
+
+# ================================
+# Carga por bloques
+# ================================
+
+def _codificar_bloque(df, codificador, calculador=None):
+    """
+    (X, y_falla, Y_tipo) de un bloque con las columnas del CSV. Descarta filas
+    con sensores vacíos. 'calculador' (CalculadorTendencias) viene si el
+    modelo usa features de tendencia; agrupa por la columna 'machine_id' si existe.
+    """
+    df = df.rename(columns=COLUMNAS_CSV).dropna(subset=COLUMNAS_NUMERICAS)
+    tendencias = None
+    if calculador is not None:
+        grupos = df['machine_id'].to_numpy() if 'machine_id' in df.columns else None
+        tendencias = calculador.calcular(df[COLUMNAS_NUMERICAS].to_numpy(dtype=np.float64), grupos)
+    # float32: es lo que usan internamente sklearn y bosque_plano (mismas predicciones, mitad de memoria)
+    X = codificador.codificar_dataframe(df, tendencias=tendencias).astype(np.float32)
+    y_falla = df['Machine failure'].to_numpy(dtype=np.int8)
+    Y_tipo = df[ETIQUETAS_TIPO_FALLA].fillna(0).to_numpy(dtype=np.int8)
+    return X, y_falla, Y_tipo
+
+
+def _bloques_csv(ruta, tamano_bloque):
+    yield from pd.read_csv(ruta, chunksize=tamano_bloque)
+
+
+def _bloques_bd(engine, tamano_bloque):
+    from exportar_lecturas import COLUMNAS_EXPORTACION, consulta_exportacion, lotes_de_filas
+    import models
+
+    # machine_id: las ventanas de tendencia son por máquina
+    consulta = consulta_exportacion().add_columns(models.MachineReading.machine_id.label('machine_id'))
+    for lote in lotes_de_filas(engine, consulta, tamano_bloque):
+        yield pd.DataFrame(lote, columns=[*COLUMNAS_EXPORTACION, 'machine_id'])
+
+
+def _codificar_bloques(bloques, codificador, reportar):
+    partes = []
+    filas = 0
+    calculador = CalculadorTendencias(codificador.ventana) if codificador.usa_tendencias else None
+    for df in bloques:
+        partes.append(_codificar_bloque(df, codificador, calculador))
+        filas += len(partes[-1][0])
+        if len(partes) % 20 == 0:
+            reportar(f"  ... {filas:,} filas codificadas")
+    if not partes:
+        raise ValueError("La fuente no tiene lecturas para entrenar.")
+    X, y_falla, Y_tipo = (np.concatenate(columna) for columna in zip(*partes))
+    return X, y_falla, Y_tipo
+
+
+# ================================
+# Caché en disco
+# ================================
+
+def _ruta_cache(directorio, clave):
+    return os.path.join(directorio, f"{clave}.npz")
+
+
+def _leer_cache(directorio, clave):
+    ruta = _ruta_cache(directorio, clave)
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta) as archivo:
+        return archivo["X"], archivo["y_falla"], archivo["Y_tipo"]
+
+
+def _escribir_cache(directorio, clave, X, y_falla, Y_tipo):
+    """Escritura atómica: un archivo a medio escribir nunca queda con el nombre definitivo."""
+    os.makedirs(directorio, exist_ok=True)
+    temporal = os.path.join(directorio, f".{clave}.{os.getpid()}.npz")
+    np.savez(temporal, X=X, y_falla=y_falla, Y_tipo=Y_tipo)
+    os.replace(temporal, _ruta_cache(directorio, clave))
+
+
+def cargar_datos(fuente, codificador, ruta_csv=None, engine=None, directorio_cache=None,
+                 tamano_bloque=50000, reportar=print):
+    """
+    DatosEntrenamiento de 'fuente' ('csv' o 'bd'). Con 'directorio_cache'
+    (None = sin caché) reutiliza la matriz de una corrida anterior si la
+    huella de los datos y las columnas del modelo coinciden.
+    """
+    inicio = time.perf_counter()
+    if fuente == "csv":
+        huella = huella_csv(ruta_csv)
+        bloques = lambda: _bloques_csv(ruta_csv, tamano_bloque)
+    elif fuente == "bd":
+        huella = huella_bd(engine)
+        bloques = lambda: _bloques_bd(engine, tamano_bloque)
+    else:
+        raise ValueError(f"Fuente desconocida: {fuente}")
+    clave = clave_cache(f"{fuente}:{huella}", codificador.columnas)
+
+    if directorio_cache:
+        en_cache = _leer_cache(directorio_cache, clave)
+        if en_cache is not None:
+            reportar(f"Matriz de features desde la caché ({clave}): {len(en_cache[0]):,} filas "
+                     f"en {time.perf_counter() - inicio:.2f} s.")
+            return DatosEntrenamiento(*en_cache, clave=clave, desde_cache=True)
+
+    X, y_falla, Y_tipo = _codificar_bloques(bloques(), codificador, reportar)
+    if directorio_cache:
+        _escribir_cache(directorio_cache, clave, X, y_falla, Y_tipo)
+    reportar(f"Datos cargados desde '{fuente}' y codificados: {len(X):,} filas en {time.perf_counter() - inicio:.2f} s.")
+    return DatosEntrenamiento(X, y_falla, Y_tipo, clave=clave, desde_cache=False)
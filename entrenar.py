@@ -1,89 +1,204 @@
-import pandas as pd
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report
 import joblib
+import numpy as np
 
-print("Iniciando Misión 1 (Actualizada): Entrenando AMBOS modelos...")
-
-# 1. Cargar los Datos
-try:
-    df = pd.read_csv("machine failure.csv")
-    print("Datos cargados correctamente.")
-except FileNotFoundError:
-    print("Error: No se encontró el archivo 'machine failure.csv'.")
-    exit()
-
-# 2. Limpieza y Preparación de Datos (General)
-df_procesado = df.rename(columns={
-    'Air temperature [K]': 'temp_aire',
-    'Process temperature [K]': 'temp_proceso',
-    'Rotational speed [rpm]': 'velocidad_rotacion',
-    'Torque [Nm]': 'torque',
-    'Tool wear [min]': 'desgaste_herramienta'
-})
-df_procesado = pd.get_dummies(df_procesado, columns=['Type'], drop_first=True)
-
-# Columnas de features (entradas) que usarán AMBOS modelos
-features = [
-    'temp_aire', 'temp_proceso', 'velocidad_rotacion', 'torque', 
-    'desgaste_herramienta', 'Type_L', 'Type_M'
-]
-# Asegurarnos de que todas las columnas de features existan
-for col in features:
-    if col not in df_procesado.columns:
-        df_procesado[col] = 0 # En caso de que Type_L o Type_M no estuvieran en el split
-
-print(f"Modelos serán entrenados con estas features: {features}")
-
-# 3. --- ENTRENAMIENTO DEL MODELO 1: ¿HAY FALLA? ---
-print("\n--- Entrenando Modelo 1 (Predicción de Falla) ---")
-X1 = df_procesado[features]
-y1 = df_procesado['Machine failure']
-
-# Guardamos los nombres de las columnas para la API
-joblib.dump(features, 'columnas_modelo.pkl')
-
-X1_train, X1_test, y1_train, y1_test = train_test_split(X1, y1, test_size=0.2, random_state=42, stratify=y1)
+import config
+from bosque_plano import EvaluadorPlano
+from busqueda_hiperparametros import buscar
+from datos_entrenamiento import ETIQUETAS_TIPO_FALLA, cargar_datos
+from estadisticas_maquinas import EstadisticasSensores
+from features import COLUMNAS_NUMERICAS, CodificadorFeatures, columnas_features
+from registro_modelos import RegistroModelos
 
+# Parámetros del modelo de falla sin búsqueda (--buscar los reemplaza por los del ganador).
 # Le decimos que la clase "1" (falla) pesa 20 VECES MÁS que la clase "0" (normal)
-pesos = {0: 1, 1: 20} 
-modelo_falla = RandomForestClassifier(n_estimators=100, random_state=42, class_weight=pesos)
-modelo_falla.fit(X1_train, y1_train)
-
-# Evaluación Modelo 1
-y1_pred = modelo_falla.predict(X1_test)
-print("Evaluación Modelo 1 (Falla Sí/No):")
-print(classification_report(y1_test, y1_pred))
-
-joblib.dump(modelo_falla, 'modelo_fallas.pkl')
-print("¡Modelo 1 ('modelo_fallas.pkl') guardado!")
-
-
-# 4. --- ENTRENAMIENTO DEL MODELO 2: ¿QUÉ TIPO DE FALLA? ---
-print("\n--- Entrenando Modelo 2 (Tipo de Falla) ---")
-
-# Filtramos solo las filas donde SÍ hubo falla
-df_solo_fallas = df_procesado[df_procesado['Machine failure'] == 1].copy()
-
-# Definimos las entradas (X2) y las salidas (y2)
-# Las entradas son las mismas que antes
-X2 = df_solo_fallas[features]
-# Las salidas son las columnas de tipo de falla
-# RNF (Random No Failure) no nos interesa predecir
-labels_tipo_falla = ['TWF', 'HDF', 'PWF', 'OSF']
-y2 = df_solo_fallas[labels_tipo_falla]
+PARAMETROS_FALLA = {"n_estimators": 100, "class_weight": {0: 1, 1: 20}}
+
+
+def main(args):
+    print("Iniciando Misión 1 (Actualizada): Entrenando AMBOS modelos...")
+    tiempos = {}
+
+    # 1. Cargar los Datos (CSV o BD, por bloques; o la matriz ya codificada de la caché)
+    # Columnas de features (entradas) que usarán AMBOS modelos.
+    # Vienen de features.py, el mismo módulo que usa la API para codificar,
+    # así el one-hot de 'Type' (Type_L, Type_M) es idéntico en ambos lados.
+    # Con --tendencias N se suman las features de tendencia de tendencias.py,
+    # con las mismas ventanas que la API arma desde buffer_lecturas.py.
+    if args.tendencias is not None and args.tendencias < 2:
+        print("Error: --tendencias necesita una ventana de al menos 2 lecturas.")
+        return
+    features = columnas_features(args.tendencias)
+    codificador = CodificadorFeatures(features)
+    inicio = time.perf_counter()
+    engine = None
+    if args.fuente == "bd":
+        from database import engine
+    elif not os.path.exists(args.csv):
+        print(f"Error: No se encontró el archivo '{args.csv}'.")
+        return
+    datos = cargar_datos(
+        args.fuente, codificador, ruta_csv=args.csv, engine=engine,
+        directorio_cache=None if args.sin_cache else config.ENTRENAMIENTO_CACHE_DIR,
+        tamano_bloque=args.bloque,
+    )
+    tiempos["carga"] = time.perf_counter() - inicio
+    print(f"Modelos serán entrenados con estas features: {features}")
+
+    # Cada entrenamiento es una versión nueva del registro (ver registro_modelos.py).
+    # Todo se escribe en un directorio temporal y solo se publica al final; si
+    # no se llega a publicar (error o salida anticipada), el temporal se borra.
+    registro = RegistroModelos(config.MODELOS_DIR)
+    with registro.version_temporal() as (version, directorio):
+        entrenar_y_publicar(args, datos, features, tiempos, registro, version, directorio)
+
+
+def entrenar_y_publicar(args, datos, features, tiempos, registro, version, directorio):
+    """Entrena ambos modelos en 'directorio' (temporal del registro) y publica 'version'."""
+    ruta = lambda nombre: os.path.join(directorio, nombre)
+    print(f"Versión de modelos: {version}")
+
+    # 2. --- ENTRENAMIENTO DEL MODELO 1: ¿HAY FALLA? ---
+    print("\n--- Entrenando Modelo 1 (Predicción de Falla) ---")
+    X1 = datos.X
+    y1 = datos.y_falla
+
+    # Guardamos los nombres de las columnas para la API
+    joblib.dump(features, ruta('columnas_modelo.pkl'))
+
+    X1_train, X1_test, y1_train, y1_test = train_test_split(X1, y1, test_size=0.2, random_state=42, stratify=y1)
+
+    # Búsqueda opcional de pesos de clase e hiperparámetros (un candidato por proceso)
+    parametros = PARAMETROS_FALLA
+    busqueda = None
+    if args.buscar:
+        inicio = time.perf_counter()
+        resultados = buscar(X1_train, y1_train, procesos=args.procesos)
+        parametros = resultados[0]["parametros"]
+        busqueda = [{**r, "parametros": {k: str(v) for k, v in r["parametros"].items()}} for r in resultados[:5]]
+        tiempos["busqueda"] = time.perf_counter() - inicio
+        print(f"Mejor candidato: {parametros} (F2={resultados[0]['f2']:.3f})")
+
+    # n_jobs: los árboles de cada bosque se ajustan en paralelo (-1 = todos los núcleos)
+    inicio = time.perf_counter()
+    modelo_falla = RandomForestClassifier(random_state=42, n_jobs=args.n_jobs, **parametros)
+    modelo_falla.fit(X1_train, y1_train)
+    tiempos["modelo_falla"] = time.perf_counter() - inicio
+
+    # Evaluación Modelo 1
+    y1_pred = modelo_falla.predict(X1_test)
+    print("Evaluación Modelo 1 (Falla Sí/No):")
+    print(classification_report(y1_test, y1_pred))
+
+    joblib.dump(modelo_falla, ruta('modelo_fallas.pkl'))
+    print("¡Modelo 1 ('modelo_fallas.pkl') guardado!")
+
+
+    # 3. --- ENTRENAMIENTO DEL MODELO 2: ¿QUÉ TIPO DE FALLA? ---
+    print("\n--- Entrenando Modelo 2 (Tipo de Falla) ---")
+
+    # Filtramos solo las filas donde SÍ hubo falla
+    mascara_fallas = datos.y_falla == 1
+
+    # Definimos las entradas (X2) y las salidas (y2)
+    # Las entradas son las mismas que antes
+    X2 = datos.X[mascara_fallas]
+    # Las salidas son las columnas de tipo de falla
+    # RNF (Random No Failure) no nos interesa predecir
+    labels_tipo_falla = ETIQUETAS_TIPO_FALLA
+    y2 = datos.Y_tipo[mascara_fallas]
+
+    if len(X2) == 0:
+        print("No se encontraron datos de fallas para entrenar el modelo 2.")
+        return
 
-if len(X2) > 0:
     # Este modelo predice múltiples etiquetas a la vez (ej: [1, 0, 1, 0])
-    modelo_tipo_falla = RandomForestClassifier(n_estimators=100, random_state=42)
+    inicio = time.perf_counter()
+    modelo_tipo_falla = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=args.n_jobs)
     modelo_tipo_falla.fit(X2, y2)
+    tiempos["modelo_tipo_falla"] = time.perf_counter() - inicio
 
-    joblib.dump(modelo_tipo_falla, 'modelo_tipo_falla.pkl')
+    joblib.dump(modelo_tipo_falla, ruta('modelo_tipo_falla.pkl'))
     # Guardamos los nombres de las etiquetas que predice
-    joblib.dump(labels_tipo_falla, 'labels_tipo_falla.pkl')
+    joblib.dump(labels_tipo_falla, ruta('labels_tipo_falla.pkl'))
     print("¡Modelo 2 ('modelo_tipo_falla.pkl') guardado!")
-else:
-    print("No se encontraron datos de fallas para entrenar el modelo 2.")
 
-print("\n¡Misión 1 (Actualizada) Completa!")
\ No newline at end of file
+    # 4. --- EXPORTAR AMBOS BOSQUES EN FORMATO PLANO (para la API) ---
+    print("\n--- Exportando bosques planos ---")
+    inicio = time.perf_counter()
+    evaluador = EvaluadorPlano.desde_sklearn(modelo_falla, modelo_tipo_falla)
+
+    # Verificación bit a bit contra sklearn sobre el split de prueba
+    pred_plana, proba_plana, tipo_plano = evaluador.evaluar(X1_test)
+    if not (np.array_equal(pred_plana, modelo_falla.predict(X1_test))
+            and np.array_equal(proba_plana, modelo_falla.predict_proba(X1_test))
+            and np.array_equal(tipo_plano, modelo_tipo_falla.predict(X1_test))):
+        raise RuntimeError("El evaluador plano no coincide con sklearn; no se exportan los bosques.")
+
+    evaluador.guardar(ruta('bosques_planos'))
+    tiempos["exportacion"] = time.perf_counter() - inicio
+    print(f"Verificado contra sklearn en {len(X1_test)} filas de prueba: idéntico.")
+    print("¡Bosques planos ('bosques_planos/', mapeables con mmap) guardados!")
+
+    # 5. --- PERFIL DE REFERENCIA DE LOS DATOS (para medir la deriva en la API) ---
+    # Mismo resumen que la API lleva por máquina (estadisticas_maquinas.py):
+    # media/varianza, mín/máx e histograma de cada sensor y tasa de fallas.
+    perfil = EstadisticasSensores()
+    perfil.actualizar(datos.X[:, [features.index(c) for c in COLUMNAS_NUMERICAS]], datos.y_falla)
+    with open(ruta('perfil_referencia.json'), 'w') as f:
+        json.dump(perfil.a_dict(), f)
+    print("¡Perfil de referencia ('perfil_referencia.json') guardado!")
+
+    # 6. --- PUBLICAR LA VERSIÓN EN EL REGISTRO ---
+    # La API la toma sola (recarga en caliente) en cuanto queda activa.
+    # Con --sin-activar se publica sin ponerla en servicio (se activa luego por /api/modelos).
+    registro.publicar(version, directorio, {
+        "creado": datetime.now().isoformat(),
+        "features": features,
+        "ventana_tendencias": args.tendencias,
+        "labels_tipo_falla": labels_tipo_falla,
+        "fuente": args.fuente,
+        "clave_datos": datos.clave,
+        "filas_entrenamiento": len(datos.X),
+        "parametros_modelo_falla": {k: str(v) for k, v in parametros.items()},
+        "busqueda": busqueda,
+        "accuracy_modelo_falla": accuracy_score(y1_test, y1_pred),
+        "tiempos_s": tiempos,
+        "sklearn": sklearn.__version__,
+    })
+    if args.sin_activar:
+        print(f"¡Versión '{version}' publicada en '{config.MODELOS_DIR}/' (sin activar)!")
+    else:
+        registro.activar(version)
+        print(f"¡Versión '{version}' publicada y activada en '{config.MODELOS_DIR}/'!")
+
+    print("Tiempos: " + ", ".join(f"{etapa} {segundos:.1f} s" for etapa, segundos in tiempos.items()))
+    print("\n¡Misión 1 (Actualizada) Completa!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena ambos modelos y publica una versión nueva en el registro.")
+    parser.add_argument("--fuente", choices=("csv", "bd"), default="csv",
+                        help="'csv' (default) o 'bd': machine_readings de DATABASE_URL")
+    parser.add_argument("--csv", default="machine failure.csv", help="Ruta del CSV con --fuente csv")
+    parser.add_argument("--bloque", type=int, default=50000, help="Filas por bloque al leer la fuente (default: 50000)")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="Recarga y recodifica los datos aunque estén en ENTRENAMIENTO_CACHE_DIR")
+    parser.add_argument("--buscar", action="store_true",
+                        help="Busca pesos de clase e hiperparámetros del modelo de falla (busqueda_hiperparametros.py)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos de la búsqueda (default: uno por núcleo)")
+    parser.add_argument("--n-jobs", type=int, default=config.ENTRENAMIENTO_N_JOBS,
+                        help="Núcleos para ajustar cada bosque (-1 = todos)")
+    parser.add_argument("--tendencias", type=int, metavar="N", default=None,
+                        help="Variante con features de tendencia sobre las últimas N lecturas de cada máquina (tendencias.py)")
+    parser.add_argument("--sin-activar", action="store_true", help="Publica la versión sin ponerla en servicio")
+    main(parser.parse_args())
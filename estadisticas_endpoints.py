@@ -0,0 +1,104 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+import anyio
+
+from cache_maquinas import cache_maquinas
+import config
+from database import engine, get_db
+from estadisticas_maquinas import EstadisticasSensores, comparar_con_referencia, estadisticas_maquinas
+from metricas import RutaMedida
+from registro_modelos import gestor_modelos
+
+# Estadísticas en línea por máquina y deriva respecto de los datos de
+# entrenamiento (estadisticas_maquinas.py). Todo se responde desde memoria:
+# ninguna consulta recorre machine_readings.
+router = APIRouter(
+    prefix="/api",
+    tags=["Estadísticas y Deriva"],
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
+)
+
+# ================================
+# Auxiliares
+# ================================
+
+async def _maquina_o_404(db, machine_id):
+    if await cache_maquinas.obtener(db, machine_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Máquina con id {machine_id} no encontrada")
+
+def _perfil_activo():
+    modelo = gestor_modelos.actual
+    if modelo is None or modelo.paquete.perfil_referencia is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La versión de modelos en servicio no tiene perfil de referencia. Reentrena con 'entrenar.py'."
+        )
+    return modelo.version, modelo.paquete.perfil_referencia
+
+def _deriva(machine_id, actual, version, perfil):
+    if actual.n < config.DERIVA_MIN_LECTURAS:
+        return {
+            "machine_id": machine_id, "model_version": version, "lecturas": actual.n,
+            "puntaje": None, "estado": "insuficiente",
+        }
+    return {
+        "machine_id": machine_id, "model_version": version, "lecturas": actual.n,
+        **comparar_con_referencia(actual, perfil),
+    }
+
+# ================================
+# Estadísticas
+# ================================
+
+@router.get("/machines/{machine_id}/stats")
+async def estadisticas_de_maquina(machine_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Media, desviación, mínimo, máximo y cuantiles aproximados de cada sensor,
+    más la tasa de fallas, de todas las lecturas de la máquina que pasaron por
+    /predecir desde el último reinicio de sus estadísticas.
+    """
+    await _maquina_o_404(db, machine_id)
+    actual = estadisticas_maquinas.obtener(machine_id)
+    if actual is None:
+        return {"machine_id": machine_id, "lecturas": 0, "fallas": 0, "tasa_fallas": None, "sensores": {}}
+    return {"machine_id": machine_id, **actual.resumen()}
+
+@router.delete("/machines/{machine_id}/stats", status_code=status.HTTP_204_NO_CONTENT)
+async def reiniciar_estadisticas(machine_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Reinicia las estadísticas de la máquina (ej: después de un mantenimiento).
+    Con varios workers, las lecturas que los otros aún no guardaron vuelven a
+    sumarse en su próximo checkpoint.
+    """
+    await _maquina_o_404(db, machine_id)
+    await anyio.to_thread.run_sync(estadisticas_maquinas.reiniciar, engine, machine_id)
+    return None
+
+# ================================
+# Deriva
+# ================================
+
+@router.get("/machines/{machine_id}/drift")
+async def deriva_de_maquina(machine_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Compara las lecturas de la máquina con los datos de entrenamiento de la
+    versión de modelos en servicio. 'puntaje' es el mayor PSI entre los
+    sensores: < 0.1 estable, < 0.25 moderada, desde 0.25 deriva.
+    """
+    await _maquina_o_404(db, machine_id)
+    version, perfil = _perfil_activo()
+    actual = estadisticas_maquinas.obtener(machine_id) or EstadisticasSensores()
+    return _deriva(machine_id, actual, version, perfil)
+
+@router.get("/drift/")
+def deriva_de_todas():
+    """Deriva de todas las máquinas con estadísticas, de la más derivada a la menos."""
+    version, perfil = _perfil_activo()
+    resultados = []
+    for machine_id in estadisticas_maquinas.machine_ids():
+        actual = estadisticas_maquinas.obtener(machine_id)
+        resultado = _deriva(machine_id, actual, version, perfil)
+        resultado.pop("sensores", None)
+        resultados.append(resultado)
+    resultados.sort(key=lambda r: -1 if r["puntaje"] is None else r["puntaje"], reverse=True)
+    return resultados
@@ -0,0 +1,460 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+
+import anyio
+import numpy as np
+
+import config
+
+# =====================================================
+#  Estadísticas por máquina en línea + deriva de datos
+# =====================================================
+# Cada lectura guardada (/predecir, /predecir/lote, ingesta continua) actualiza
+# las estadísticas de su máquina en O(1), sin consultar el historial:
+#
+#   - media y varianza (Welford; un lote entra de una vez con la fórmula de Chan)
+#   - mínimo y máximo
+#   - histograma de cubetas fijas por sensor (RANGOS_SENSORES): aproxima los
+#     cuantiles y es sumable, así el estado de dos workers se combina sin error
+#   - tasa de fallas
+#
+# entrenar.py guarda el mismo resumen de los datos de entrenamiento en cada
+# versión (perfil_referencia.json). La deriva de una máquina es el PSI
+# (Population Stability Index) de cada sensor contra ese perfil, calculado en
+# memoria.
+#
+# Persistencia: cada worker acumula un 'delta' desde su último checkpoint y
+# cada ESTADISTICAS_CHECKPOINT_S lo suma a la fila de machine_stats (bloqueada
+# mientras tanto), así varios workers no se pisan y el estado sobrevive a los
+# reinicios. Lo que ve un worker = último checkpoint + su propio delta; después
+# de cada checkpoint relee las filas que otros workers cambiaron (updated_at).
+
+# Columnas de machine_readings, en el mismo orden que features.COLUMNAS_NUMERICAS
+SENSORES = ["air_temperature", "process_temperature", "rotational_speed", "torque", "tool_wear"]
+
+# Rango cubierto por las cubetas de cada sensor (lo de afuera cae en dos cubetas de desborde)
+RANGOS_SENSORES = {
+    "air_temperature": (290.0, 310.0),
+    "process_temperature": (300.0, 320.0),
+    "rotational_speed": (1000.0, 3000.0),
+    "torque": (0.0, 80.0),
+    "tool_wear": (0.0, 260.0),
+}
+N_CUBETAS = 100
+
+_SIN_VERSION = object()  # Máquina que este worker todavía no leyó de machine_stats
+
+# Subir si cambian las cubetas o el formato: los checkpoints viejos se descartan
+VERSION_ESTADO = 1
+
+CUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Grupos del PSI: las cubetas se juntan en ~10 grupos de igual masa en la referencia
+GRUPOS_PSI = 10
+EPSILON_PSI = 1e-4
+
+# Umbrales usuales del PSI
+PSI_MODERADA = 0.1
+PSI_DERIVA = 0.25
+
+_BORDES = np.array([np.linspace(*RANGOS_SENSORES[s], N_CUBETAS + 1) for s in SENSORES])
+_INICIO = _BORDES[:, 0]
+_ANCHO = (_BORDES[:, -1] - _BORDES[:, 0]) / N_CUBETAS
+_DESPLAZAMIENTO = np.arange(len(SENSORES)) * (N_CUBETAS + 2)  # Fila de cada sensor en el histograma aplanado
+
+
+class EstadisticasSensores:
+    """Resumen sumable de un conjunto de lecturas (una máquina o los datos de entrenamiento)."""
+
+    def __init__(self):
+        k = len(SENSORES)
+        self.n = 0
+        self.fallas = 0
+        self.media = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.minimo = np.full(k, np.inf)
+        self.maximo = np.full(k, -np.inf)
+        # Cubeta 0: por debajo del rango; cubeta N_CUBETAS + 1: por encima
+        self.histograma = np.zeros((k, N_CUBETAS + 2), dtype=np.int64)
+
+    def actualizar(self, X, fallas):
+        """Agrega un lote: X (n, len(SENSORES)) y 'fallas' (n,) de 0/1."""
+        X = np.asarray(X, dtype=np.float64)
+        n_b = len(X)
+        if n_b == 0:
+            return
+        # Cubeta de cada valor en el histograma aplanado (cubetas de igual ancho: aritmética en vez de búsqueda)
+        cubetas = np.clip(np.floor((X - _INICIO) / _ANCHO) + 1, 0, N_CUBETAS + 1).astype(np.intp) + _DESPLAZAMIENTO
+        if n_b == 1:
+            # Una lectura (/predecir): Welford clásico, sin reducciones
+            x = X[0]
+            self.n += 1
+            delta = x - self.media
+            self.media += delta / self.n
+            self.m2 += delta * (x - self.media)
+            self.fallas += int(fallas[0])
+            np.minimum(self.minimo, x, out=self.minimo)
+            np.maximum(self.maximo, x, out=self.maximo)
+            self.histograma.reshape(-1)[cubetas[0]] += 1
+            return
+        media_b = X.mean(axis=0)
+        m2_b = ((X - media_b) ** 2).sum(axis=0)
+        n = self.n + n_b
+        delta = media_b - self.media
+        self.media = self.media + delta * (n_b / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (self.n * n_b / n)
+        self.n = n
+        self.fallas += int(np.sum(fallas))
+        self.minimo = np.minimum(self.minimo, X.min(axis=0))
+        self.maximo = np.maximum(self.maximo, X.max(axis=0))
+        self.histograma += np.bincount(cubetas.ravel(), minlength=self.histograma.size).reshape(self.histograma.shape)
+
+    def combinar(self, otra):
+        """Nuevo resumen con las lecturas de ambos (el orden no importa)."""
+        combinado = EstadisticasSensores()
+        n = self.n + otra.n
+        if n == 0:
+            return combinado
+        delta = otra.media - self.media
+        combinado.n = n
+        combinado.fallas = self.fallas + otra.fallas
+        combinado.media = self.media + delta * (otra.n / n)
+        combinado.m2 = self.m2 + otra.m2 + delta ** 2 * (self.n * otra.n / n)
+        combinado.minimo = np.minimum(self.minimo, otra.minimo)
+        combinado.maximo = np.maximum(self.maximo, otra.maximo)
+        combinado.histograma = self.histograma + otra.histograma
+        return combinado
+
+    def desviacion(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.zeros(len(SENSORES))
+
+    def cuantiles(self, probabilidades=CUANTILES):
+        """
+        {p: array por sensor} interpolando dentro de la cubeta que contiene
+        cada cuantil. El error es a lo sumo el ancho de una cubeta (en las de
+        desborde se interpola entre el mínimo/máximo y el borde del rango).
+        """
+        resultado = {p: np.full(len(SENSORES), np.nan) for p in probabilidades}
+        if self.n == 0:
+            return resultado
+        for j in range(len(SENSORES)):
+            acumulado = np.cumsum(self.histograma[j])
+            bordes = np.concatenate(([min(self.minimo[j], _BORDES[j][0])], _BORDES[j], [max(self.maximo[j], _BORDES[j][-1])]))
+            for p in probabilidades:
+                objetivo = p * self.n
+                cubeta = int(np.searchsorted(acumulado, objetivo, side="left"))
+                antes = acumulado[cubeta - 1] if cubeta > 0 else 0
+                fraccion = (objetivo - antes) / max(self.histograma[j][cubeta], 1)
+                valor = bordes[cubeta] + fraccion * (bordes[cubeta + 1] - bordes[cubeta])
+                resultado[p][j] = min(max(valor, self.minimo[j]), self.maximo[j])
+        return resultado
+
+    def resumen(self):
+        """Dict para las respuestas de la API."""
+        cuantiles = self.cuantiles()
+        desviacion = self.desviacion()
+        sensores = {}
+        for j, sensor in enumerate(SENSORES):
+            sensores[sensor] = {
+                "media": float(self.media[j]) if self.n else None,
+                "desviacion": float(desviacion[j]) if self.n else None,
+                "minimo": float(self.minimo[j]) if self.n else None,
+                "maximo": float(self.maximo[j]) if self.n else None,
+                "cuantiles": {f"p{round(p * 100):02d}": (float(v[j]) if self.n else None) for p, v in cuantiles.items()},
+            }
+        return {
+            "lecturas": self.n,
+            "fallas": self.fallas,
+            "tasa_fallas": self.fallas / self.n if self.n else None,
+            "sensores": sensores,
+        }
+
+    def a_dict(self):
+        return {
+            "version": VERSION_ESTADO,
+            "n": self.n,
+            "fallas": self.fallas,
+            "media": self.media.tolist(),
+            "m2": self.m2.tolist(),
+            # JSON no tiene infinitos: sin lecturas quedan en None
+            "minimo": self.minimo.tolist() if self.n else None,
+            "maximo": self.maximo.tolist() if self.n else None,
+            "histograma": self.histograma.tolist(),
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """Resumen guardado con a_dict(); None si es de otra VERSION_ESTADO."""
+        if datos.get("version") != VERSION_ESTADO:
+            return None
+        estadisticas = cls()
+        estadisticas.n = datos["n"]
+        estadisticas.fallas = datos["fallas"]
+        estadisticas.media = np.array(datos["media"], dtype=np.float64)
+        estadisticas.m2 = np.array(datos["m2"], dtype=np.float64)
+        if datos["n"]:
+            estadisticas.minimo = np.array(datos["minimo"], dtype=np.float64)
+            estadisticas.maximo = np.array(datos["maximo"], dtype=np.float64)
+        estadisticas.histograma = np.array(datos["histograma"], dtype=np.int64)
+        return estadisticas
+
+
+def psi(histograma, histograma_referencia):
+    """
+    PSI entre dos histogramas de un sensor. Las cubetas se agrupan en
+    GRUPOS_PSI tramos de igual masa en la referencia (deciles), así el
+    resultado no depende del ancho de las cubetas.
+    """
+    total, total_referencia = histograma.sum(), histograma_referencia.sum()
+    if total == 0 or total_referencia == 0:
+        return None
+    acumulado = np.cumsum(histograma_referencia) / total_referencia
+    grupos = np.minimum((acumulado * GRUPOS_PSI - 1e-9).astype(np.int64), GRUPOS_PSI - 1)
+    esperado = np.bincount(grupos, weights=histograma_referencia, minlength=GRUPOS_PSI) / total_referencia
+    observado = np.bincount(grupos, weights=histograma, minlength=GRUPOS_PSI) / total
+    esperado, observado = np.maximum(esperado, EPSILON_PSI), np.maximum(observado, EPSILON_PSI)
+    return float(np.sum((observado - esperado) * np.log(observado / esperado)))
+
+
+def comparar_con_referencia(actual, referencia):
+    """Deriva de 'actual' respecto de 'referencia' (ambos EstadisticasSensores), por sensor y total."""
+    desviacion_referencia = referencia.desviacion()
+    mediana, mediana_referencia = actual.cuantiles((0.5,))[0.5], referencia.cuantiles((0.5,))[0.5]
+    sensores = {}
+    for j, sensor in enumerate(SENSORES):
+        escala = desviacion_referencia[j] or 1.0
+        sensores[sensor] = {
+            "psi": psi(actual.histograma[j], referencia.histograma[j]),
+            # Corrimiento de la media en desviaciones estándar de la referencia
+            "desplazamiento_media": float((actual.media[j] - referencia.media[j]) / escala) if actual.n else None,
+            "media": float(actual.media[j]) if actual.n else None,
+            "media_referencia": float(referencia.media[j]),
+            "mediana": float(mediana[j]) if actual.n else None,
+            "mediana_referencia": float(mediana_referencia[j]),
+        }
+    valores_psi = [s["psi"] for s in sensores.values() if s["psi"] is not None]
+    puntaje = max(valores_psi) if valores_psi else None
+    if puntaje is None:
+        estado = "sin_datos"
+    elif puntaje >= PSI_DERIVA:
+        estado = "deriva"
+    elif puntaje >= PSI_MODERADA:
+        estado = "moderada"
+    else:
+        estado = "estable"
+    return {
+        "puntaje": puntaje,
+        "estado": estado,
+        "tasa_fallas": actual.fallas / actual.n if actual.n else None,
+        "tasa_fallas_referencia": referencia.fallas / referencia.n if referencia.n else None,
+        "sensores": sensores,
+    }
+
+
+class EstadisticasMaquinas:
+    """Estadísticas en línea de todas las máquinas del proceso, con checkpoint en machine_stats."""
+
+    def __init__(self, intervalo_checkpoint_s=30.0):
+        self.intervalo_checkpoint = intervalo_checkpoint_s
+        self._base = {}   # machine_id -> EstadisticasSensores del último checkpoint leído/escrito
+        self._delta = {}  # machine_id -> EstadisticasSensores de este worker aún sin guardar
+        self._versiones = {}  # machine_id -> updated_at de la fila de machine_stats que está en _base
+        self._lock = threading.Lock()
+        self._tarea = None
+        self._engine = None
+        self._checkpoints = 0
+        self._ultimo_checkpoint = None
+        self.ultimo_error = None
+
+    # ---------- Actualización (camino de /predecir) ----------
+
+    def registrar(self, filas):
+        """Agrega las lecturas guardadas ('filas' con las columnas de machine_readings)."""
+        if not filas:
+            return
+        X = np.array([[fila[sensor] for sensor in SENSORES] for fila in filas], dtype=np.float64)
+        fallas = np.array([bool(fila["machine_failure"]) for fila in filas], dtype=np.int64)
+        machine_ids = np.array([fila["machine_id"] for fila in filas])
+        with self._lock:
+            if len(filas) == 1:
+                self._delta_de(int(machine_ids[0])).actualizar(X, fallas)
+                return
+            for machine_id in np.unique(machine_ids):
+                mascara = machine_ids == machine_id
+                self._delta_de(int(machine_id)).actualizar(X[mascara], fallas[mascara])
+
+    def _delta_de(self, machine_id):
+        delta = self._delta.get(machine_id)
+        if delta is None:
+            delta = self._delta[machine_id] = EstadisticasSensores()
+        return delta
+
+    # ---------- Consulta ----------
+
+    def obtener(self, machine_id):
+        """EstadisticasSensores de la máquina (último checkpoint + delta de este worker), o None."""
+        with self._lock:
+            base, delta = self._base.get(machine_id), self._delta.get(machine_id)
+        if base is None and delta is None:
+            return None
+        return (base or EstadisticasSensores()).combinar(delta or EstadisticasSensores())
+
+    def machine_ids(self):
+        with self._lock:
+            return sorted(set(self._base) | set(self._delta))
+
+    # ---------- Checkpoint en la BD ----------
+
+    def cargar(self, engine):
+        """
+        Sincroniza _base con machine_stats: lee el estado de las filas que
+        cambiaron desde la última lectura (updated_at distinto; al arrancar,
+        todas) y olvida las máquinas cuya fila ya no existe. Así lo que guardan
+        los otros workers llega a este en cada ciclo de checkpoint. Si un
+        checkpoint de este worker toca una máquina mientras tanto, se queda lo
+        de memoria, que es más nuevo. Retorna la cantidad de filas leídas.
+        """
+        from sqlalchemy import select
+        import models
+
+        with self._lock:
+            conocidas = dict(self._versiones)
+        with engine.connect() as conn:
+            versiones = dict(conn.execute(select(models.MachineStats.machine_id, models.MachineStats.updated_at)).all())
+            cambiadas = [m for m, version in versiones.items() if conocidas.get(m, _SIN_VERSION) != version]
+            filas = []
+            for i in range(0, len(cambiadas), 500):
+                filas += conn.execute(
+                    select(models.MachineStats.machine_id, models.MachineStats.state, models.MachineStats.updated_at)
+                    .where(models.MachineStats.machine_id.in_(cambiadas[i:i + 500]))
+                ).all()
+        with self._lock:
+            for machine_id, estado, version in filas:
+                if self._versiones.get(machine_id, _SIN_VERSION) != conocidas.get(machine_id, _SIN_VERSION):
+                    continue  # Un checkpoint de este worker la escribió mientras tanto
+                estadisticas = EstadisticasSensores.desde_dict(json.loads(estado))
+                if estadisticas is not None:
+                    self._base[machine_id] = estadisticas
+                else:
+                    self._base.pop(machine_id, None)
+                self._versiones[machine_id] = version
+            for machine_id in set(conocidas) - set(versiones):  # Reiniciadas o borradas por otro worker
+                if self._versiones.get(machine_id, _SIN_VERSION) == conocidas[machine_id]:
+                    self._base.pop(machine_id, None)
+                    self._versiones.pop(machine_id, None)
+        return len(filas)
+
+    def checkpoint(self, engine):
+        """
+        Suma el delta de cada máquina a su fila de machine_stats (bloqueada con
+        FOR UPDATE en Postgres) en una transacción. Si falla, el delta vuelve a
+        la memoria y se reintenta en el siguiente checkpoint.
+        Retorna la cantidad de máquinas guardadas.
+        """
+        from sqlalchemy import select
+        from sqlalchemy.orm import Session
+        import models
+
+        with self._lock:
+            deltas, self._delta = self._delta, {}
+        if not deltas:
+            return 0
+        guardadas = {}
+        try:
+            with Session(engine) as session, session.begin():
+                # Las máquinas borradas mientras tanto se descartan (la FK rechazaría la fila)
+                existentes = set(session.scalars(
+                    select(models.Machine.machine_id).where(models.Machine.machine_id.in_(deltas))
+                ))
+                for machine_id in sorted(existentes):  # Siempre en el mismo orden: sin interbloqueos entre workers
+                    fila = session.get(models.MachineStats, machine_id, with_for_update=True)
+                    guardada = EstadisticasSensores.desde_dict(json.loads(fila.state)) if fila else None
+                    combinada = (guardada or EstadisticasSensores()).combinar(deltas[machine_id])
+                    if fila is None:
+                        fila = models.MachineStats(machine_id=machine_id)
+                        session.add(fila)
+                    fila.reading_count = combinada.n
+                    fila.failure_count = combinada.fallas
+                    fila.state = json.dumps(combinada.a_dict())
+                    fila.updated_at = datetime.now()
+                    guardadas[machine_id] = (combinada, fila.updated_at)
+        except Exception:
+            with self._lock:
+                for machine_id, delta in deltas.items():
+                    pendiente = self._delta.get(machine_id)
+                    self._delta[machine_id] = delta.combinar(pendiente) if pendiente else delta
+            raise
+        with self._lock:
+            for machine_id in deltas:
+                self._base.pop(machine_id, None)
+                self._versiones.pop(machine_id, None)
+            for machine_id, (combinada, version) in guardadas.items():
+                self._base[machine_id] = combinada
+                self._versiones[machine_id] = version
+            self._checkpoints += 1
+            self._ultimo_checkpoint = datetime.now()
+        return len(guardadas)
+
+    def reiniciar(self, engine, machine_id):
+        """Borra las estadísticas de una máquina (ej: después de un mantenimiento o recalibración)."""
+        from sqlalchemy import delete
+        import models
+
+        self.descartar(machine_id)
+        with engine.begin() as conn:
+            conn.execute(delete(models.MachineStats).where(models.MachineStats.machine_id == machine_id))
+
+    def descartar(self, machine_id):
+        """Olvida la máquina solo en memoria (ej: al borrarla; su fila se va en cascada)."""
+        with self._lock:
+            self._base.pop(machine_id, None)
+            self._delta.pop(machine_id, None)
+            self._versiones.pop(machine_id, None)
+
+    # ---------- Ciclo de vida ----------
+
+    async def iniciar(self, engine):
+        """Checkpoint periódico; la carga de machine_stats la lanza main.py en segundo plano."""
+        self._engine = engine
+        if self.intervalo_checkpoint > 0:
+            self._tarea = asyncio.create_task(self._checkpoint_periodico())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._engine is not None:
+            await anyio.to_thread.run_sync(self.checkpoint, self._engine)  # Lo pendiente no se pierde al apagar
+
+    async def _checkpoint_periodico(self):
+        while True:
+            await asyncio.sleep(self.intervalo_checkpoint)
+            try:
+                await anyio.to_thread.run_sync(self.checkpoint, self._engine)
+                await anyio.to_thread.run_sync(self.cargar, self._engine)  # Lo que guardaron los otros workers
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+
+    def estadisticas(self):
+        with self._lock:
+            pendientes = sum(delta.n for delta in self._delta.values())
+            maquinas = len(set(self._base) | set(self._delta))
+        return {
+            "maquinas": maquinas,
+            "lecturas_sin_guardar": pendientes,
+            "checkpoints": self._checkpoints,
+            "ultimo_checkpoint": self._ultimo_checkpoint.isoformat() if self._ultimo_checkpoint else None,
+            "intervalo_checkpoint_s": self.intervalo_checkpoint,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+# Instancia única del proceso: main.py la alimenta y estadisticas_endpoints.py la consulta
+estadisticas_maquinas = EstadisticasMaquinas(config.ESTADISTICAS_CHECKPOINT_S)
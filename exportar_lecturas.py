@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+
+from sqlalchemy import Float, case, select, type_coerce
+
+import models
+
+# =====================================================
+#  Exportación en streaming de lecturas (CSV / NDJSON / Parquet)
+# =====================================================
+# Lee machine_readings (+ machines) con un cursor del lado del servidor
+# (stream_results + yield_per) y va serializando por lotes: la memoria no
+# depende de cuántas lecturas se exporten. Las columnas son las de
+# 'machine failure.csv', así la salida sirve directo para entrenar.py
+# (y para importar_csv.py, que además usa la columna 'timestamp').
+
+FILAS_POR_LOTE = 5000
+
+COLUMNAS_EXPORTACION = [
+    'UDI', 'Product ID', 'Type',
+    'Air temperature [K]', 'Process temperature [K]', 'Rotational speed [rpm]', 'Torque [Nm]', 'Tool wear [min]',
+    'Machine failure', 'TWF', 'HDF', 'PWF', 'OSF', 'RNF',
+    'timestamp',
+]
+
+FORMATOS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def consulta_exportacion(machine_id=None, desde=None, hasta=None, machine_failure=None):
+    """SELECT de Core (sin ORM) con las columnas de COLUMNAS_EXPORTACION y los filtros pedidos."""
+    lectura = models.MachineReading
+    maquina = models.Machine
+
+    # Booleanos como 0/1 (RNF..TWF en 0 si la lectura no tiene detalle de falla)
+    def bandera(columna):
+        return case((columna.is_(True), 1), else_=0)
+
+    def bit(tipo):
+        return case((lectura.failure_flags.bitwise_and(models.FAILURE_FLAGS[tipo]) != 0, 1), else_=0)
+
+    # Numeric(6, 2) llega como Decimal; se entrega como float, igual que en el CSV
+    consulta = select(
+        lectura.reading_id.label('UDI'),
+        maquina.product_id.label('Product ID'),
+        maquina.type.label('Type'),
+        type_coerce(lectura.air_temperature, Float).label('Air temperature [K]'),
+        type_coerce(lectura.process_temperature, Float).label('Process temperature [K]'),
+        lectura.rotational_speed.label('Rotational speed [rpm]'),
+        type_coerce(lectura.torque, Float).label('Torque [Nm]'),
+        lectura.tool_wear.label('Tool wear [min]'),
+        bandera(lectura.machine_failure).label('Machine failure'),
+        bit('twf').label('TWF'),
+        bit('hdf').label('HDF'),
+        bit('pwf').label('PWF'),
+        bit('osf').label('OSF'),
+        bit('rnf').label('RNF'),
+        lectura.timestamp.label('timestamp'),
+    ).join(maquina, maquina.machine_id == lectura.machine_id)\
+     .order_by(lectura.reading_id)
+
+    if machine_id is not None:
+        consulta = consulta.where(lectura.machine_id == machine_id)
+    if desde is not None:
+        consulta = consulta.where(lectura.timestamp >= desde)
+    if hasta is not None:
+        consulta = consulta.where(lectura.timestamp < hasta)
+    if machine_failure is not None:
+        consulta = consulta.where(lectura.machine_failure.is_(machine_failure))
+    return consulta
+
+
+def lotes_de_filas(engine, consulta, filas_por_lote=FILAS_POR_LOTE):
+    """Genera listas de tuplas (en el orden de COLUMNAS_EXPORTACION) leídas con un cursor de servidor."""
+    with engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, yield_per=filas_por_lote).execute(consulta)
+        for particion in resultado.partitions():
+            yield particion
+
+
+def _timestamp_iso(fila):
+    *valores, timestamp = fila
+    return (*valores, timestamp.isoformat() if timestamp is not None else None)
+
+
+def exportar_csv(lotes):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    for lote in lotes:
+        escritor.writerows(map(_timestamp_iso, lote))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()  # Solo el encabezado si no hubo lecturas
+
+
+def exportar_ndjson(lotes):
+    for lote in lotes:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNAS_EXPORTACION, _timestamp_iso(fila)))) + "\n" for fila in lote
+        )
+
+
+class _SalidaIncremental(io.RawIOBase):
+    """Archivo de solo escritura que acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def exportar_parquet(lotes):
+    """Un row group por lote; cada row group se envía apenas se escribe. Requiere pyarrow."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ('UDI', pa.int64()), ('Product ID', pa.string()), ('Type', pa.string()),
+        ('Air temperature [K]', pa.float64()), ('Process temperature [K]', pa.float64()),
+        ('Rotational speed [rpm]', pa.int64()), ('Torque [Nm]', pa.float64()), ('Tool wear [min]', pa.int64()),
+        ('Machine failure', pa.int8()), ('TWF', pa.int8()), ('HDF', pa.int8()),
+        ('PWF', pa.int8()), ('OSF', pa.int8()), ('RNF', pa.int8()),
+        ('timestamp', pa.timestamp('us')),
+    ])
+    salida = _SalidaIncremental()
+    with pq.ParquetWriter(salida, esquema) as escritor:
+        for lote in lotes:
+            columnas = list(zip(*lote))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)], schema=esquema
+            ))
+            yield salida.vaciar()
+    yield salida.vaciar()  # Footer del archivo
+
+
+EXPORTADORES = {
+    "csv": exportar_csv,
+    "ndjson": exportar_ndjson,
+    "parquet": exportar_parquet,
+}
@@ -0,0 +1,134 @@
+import numpy as np
+
+from tendencias import columnas_tendencia, ventana_de_columnas
+
+# ================================
+#  Definición ÚNICA de las features
+# ================================
+# Este módulo es compartido por entrenar.py (entrenamiento) y main.py (API),
+# así ambos lados nunca pueden discrepar en el orden de las columnas ni en
+# la codificación one-hot del 'Type' (Type_L / Type_M / Type_H).
+
+# Columnas numéricas, con el nombre que usan los schemas de predicción
+COLUMNAS_NUMERICAS = ['temp_aire', 'temp_proceso', 'velocidad_rotacion', 'torque', 'desgaste_herramienta']
+
+# Tipos de máquina conocidos. Igual que pd.get_dummies(..., drop_first=True),
+# el primero en orden alfabético ('H') es la categoría base y no tiene columna.
+TIPOS_MAQUINA = ['H', 'L', 'M']
+
+# Nombres de las columnas de 'machine failure.csv' -> nombres internos
+COLUMNAS_CSV = {
+    'Air temperature [K]': 'temp_aire',
+    'Process temperature [K]': 'temp_proceso',
+    'Rotational speed [rpm]': 'velocidad_rotacion',
+    'Torque [Nm]': 'torque',
+    'Tool wear [min]': 'desgaste_herramienta',
+}
+
+def columnas_features(ventana_tendencias=None):
+    """
+    Lista de columnas (en orden) con la que se entrenan AMBOS modelos.
+    Es lo que entrenar.py guarda en 'columnas_modelo.pkl'. Con
+    'ventana_tendencias' (N) se agregan las features de tendencia sobre las
+    últimas N lecturas de la máquina (tendencias.py).
+    """
+    columnas = COLUMNAS_NUMERICAS + [f"Type_{tipo}" for tipo in TIPOS_MAQUINA[1:]]
+    if ventana_tendencias:
+        columnas += columnas_tendencia(ventana_tendencias)
+    return columnas
+
+def matriz_sensores(lista_datos):
+    """Array (n_lecturas, 5) con las COLUMNAS_NUMERICAS de una lista de DatosMaquinaPrediccion."""
+    return np.array(
+        [(d.temp_aire, d.temp_proceso, d.velocidad_rotacion, d.torque, d.desgaste_herramienta) for d in lista_datos],
+        dtype=np.float64
+    ).reshape(len(lista_datos), len(COLUMNAS_NUMERICAS))
+
+
+class CodificadorFeatures:
+    """
+    Convierte lecturas (DatosMaquinaPrediccion o un DataFrame del CSV) en una
+    matriz float64 con el orden exacto de 'columnas_modelo'.
+
+    Se construye UNA sola vez a partir de columnas_modelo.pkl; después cada
+    codificación es llenar un array de NumPy (sin DataFrames, sin get_dummies).
+
+    Si el modelo usa features de tendencia ('ventana' no es None), quien
+    codifica las calcula (tendencias.py) y las pasa en 'tendencias'.
+    """
+
+    def __init__(self, columnas_modelo):
+        self.columnas = list(columnas_modelo)
+        self.n_columnas = len(self.columnas)
+
+        faltantes = [c for c in COLUMNAS_NUMERICAS if c not in self.columnas]
+        if faltantes:
+            raise ValueError(f"columnas_modelo no contiene las columnas numéricas {faltantes}")
+        self._idx_numericas = np.array([self.columnas.index(c) for c in COLUMNAS_NUMERICAS])
+
+        # Columnas de tendencia (ej: tasa_desgaste_10), en el orden de tendencias.COLUMNAS_TENDENCIA
+        self.ventana = ventana_de_columnas(self.columnas)
+        self._idx_tendencia = np.array(
+            [self.columnas.index(c) for c in columnas_tendencia(self.ventana)] if self.ventana else [], dtype=np.intp
+        )
+
+        # Columnas one-hot de 'Type' presentes en el modelo (ej: Type_L, Type_M)
+        self._idx_tipo = np.array([i for i, c in enumerate(self.columnas) if c.startswith("Type_")], dtype=np.intp)
+        tipos_columna = [self.columnas[i][len("Type_"):] for i in self._idx_tipo]
+
+        # Tabla de búsqueda: fila 0 = tipo sin columna propia (base o desconocido),
+        # fila k = one-hot del tipo k-ésimo. Indexar la tabla reemplaza a get_dummies.
+        self._tabla_tipo = np.zeros((len(tipos_columna) + 1, len(tipos_columna)))
+        self._indice_tipo = {}
+        for k, tipo in enumerate(tipos_columna, start=1):
+            self._tabla_tipo[k, k - 1] = 1.0
+            self._indice_tipo[tipo] = k
+
+    def _nueva_salida(self, n_filas, salida):
+        if salida is None:
+            return np.empty((n_filas, self.n_columnas))
+        if salida.shape != (n_filas, self.n_columnas):
+            raise ValueError(f"'salida' debe tener forma {(n_filas, self.n_columnas)}, no {salida.shape}")
+        return salida
+
+    @property
+    def usa_tendencias(self):
+        return self.ventana is not None
+
+    def _llenar_tendencias(self, matriz, tendencias):
+        if not self.usa_tendencias:
+            return
+        if tendencias is None:
+            raise ValueError(f"El modelo usa features de tendencia (ventana de {self.ventana} lecturas): falta 'tendencias'")
+        matriz[:, self._idx_tendencia] = tendencias
+
+    def codificar(self, datos, salida=None, tendencias=None):
+        """Codifica UNA lectura (DatosMaquinaPrediccion) en un array de forma (1, n_columnas)."""
+        return self.codificar_lote([datos], salida, tendencias)
+
+    def codificar_lote(self, lista_datos, salida=None, tendencias=None):
+        """Codifica una lista de DatosMaquinaPrediccion en un array (n_lecturas, n_columnas)."""
+        n_filas = len(lista_datos)
+        matriz = self._nueva_salida(n_filas, salida)
+
+        matriz[:, self._idx_numericas] = matriz_sensores(lista_datos)
+
+        indices = np.fromiter((self._indice_tipo.get(d.Type, 0) for d in lista_datos), dtype=np.intp, count=n_filas)
+        matriz[:, self._idx_tipo] = self._tabla_tipo[indices]
+        self._llenar_tendencias(matriz, tendencias)
+        return matriz
+
+    def codificar_dataframe(self, df, salida=None, tendencias=None):
+        """
+        Codifica un DataFrame con las COLUMNAS_NUMERICAS y una columna 'Type'
+        (el formato de 'machine failure.csv' ya renombrado). Usado al entrenar.
+        """
+        n_filas = len(df)
+        matriz = self._nueva_salida(n_filas, salida)
+
+        matriz[:, self._idx_numericas] = df[COLUMNAS_NUMERICAS].to_numpy(dtype=np.float64)
+
+        indices = df['Type'].map(self._indice_tipo).fillna(0).to_numpy(dtype=np.intp)
+        matriz[:, self._idx_tipo] = self._tabla_tipo[indices]
+        self._llenar_tendencias(matriz, tendencias)
+        return matriz
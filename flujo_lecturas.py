@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+from pydantic import ValidationError
+
+import schemas
+
+# =====================================================
+#  Ingesta continua de lecturas (WebSocket / NDJSON)
+# =====================================================
+# Los gateways mantienen UNA conexión abierta y mandan lecturas cada pocos
+# cientos de ms. Cada sesión tiene dos tareas:
+#
+#   lector      mensajes -> cola 'entrada' (acotada)
+#   procesador  junta una ventana (hasta 'max_ventana' lecturas o
+#               'max_espera_ms'), la evalúa y la guarda de una vez
+#               (procesar_ventana) y deja los veredictos en 'salida'
+#
+# Control de flujo: si el cliente no lee los veredictos, 'salida' se llena, el
+# procesador se detiene, 'entrada' se llena y el lector deja de leer del
+# socket (el gateway siente la contrapresión de TCP). Si el cliente pasa más
+# de 'timeout_envio_s' sin leer, la sesión se corta (ConsumidorLento) en vez
+# de retener memoria y conexiones indefinidamente.
+
+_FIN = object()
+
+
+class ConsumidorLento(Exception):
+    """El cliente dejó de leer los veredictos por más tiempo del permitido."""
+
+
+class IngestaFlujo:
+    """
+    Configuración y estadísticas de las sesiones de ingesta continua.
+
+    'procesar_ventana(lecturas)' es una corrutina que recibe una lista de
+    DatosMaquinaPrediccion y retorna un PrediccionLoteItem por lectura (en el
+    mismo orden), con UNA evaluación de los modelos y UNA escritura en la BD.
+    """
+
+    def __init__(self, procesar_ventana, max_ventana=256, max_espera_ms=50.0,
+                 max_pendientes=1024, timeout_envio_s=30.0):
+        self.procesar_ventana = procesar_ventana
+        self.max_ventana = max_ventana
+        self.max_espera = max_espera_ms / 1000
+        self.max_pendientes = max_pendientes
+        self.timeout_envio = timeout_envio_s
+
+        self._sesiones_activas = 0
+        self._sesiones = 0
+        self._cortadas_por_lentitud = 0
+        self._mensajes = 0
+        self._invalidos = 0
+        self._ventanas = 0
+        self._lecturas = 0
+        self._tamano_max_ventana = 0
+        self._tiempo_proceso = 0.0
+
+    async def veredictos(self, mensajes):
+        """
+        Generador asíncrono de la sesión: consume 'mensajes' (iterador
+        asíncrono de textos JSON, uno por lectura) y produce, por cada ventana,
+        una lista de PrediccionFlujoItem en el orden de llegada. 'indice' es
+        la posición del mensaje dentro de la sesión.
+        Lanza ConsumidorLento si el cliente deja de leer.
+        """
+        entrada = asyncio.Queue(maxsize=self.max_pendientes)
+        salida = asyncio.Queue(maxsize=2)  # Ventanas listas esperando al cliente
+        tareas = [
+            asyncio.create_task(self._leer(mensajes, entrada)),
+            asyncio.create_task(self._procesar(entrada, salida)),
+        ]
+        self._sesiones += 1
+        self._sesiones_activas += 1
+        try:
+            while True:
+                obtener = asyncio.ensure_future(salida.get())
+                # Si una tarea falla (ej: el cliente se desconectó) no se espera más
+                hechas, _ = await asyncio.wait([obtener, *tareas], return_when=asyncio.FIRST_COMPLETED)
+                if obtener not in hechas:
+                    obtener.cancel()
+                    for tarea in hechas:
+                        if tarea.exception() is not None:
+                            raise tarea.exception()
+                    # El lector terminó sin error: se sigue esperando al procesador
+                    tareas = [tarea for tarea in tareas if tarea not in hechas]
+                    continue
+                ventana = obtener.result()
+                if ventana is _FIN:
+                    return
+                yield ventana
+        finally:
+            self._sesiones_activas -= 1
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+    async def _leer(self, mensajes, entrada):
+        indice = 0
+        async for mensaje in mensajes:
+            try:
+                elemento = schemas.DatosMaquinaPrediccion.model_validate_json(mensaje)
+            except ValidationError as e:
+                elemento = f"Mensaje inválido: {e.errors()[0]['msg']}"
+                self._invalidos += 1
+            self._mensajes += 1
+            await entrada.put((indice, elemento))  # Bloquea si 'entrada' está llena
+            indice += 1
+        await entrada.put(_FIN)
+
+    async def _procesar(self, entrada, salida):
+        loop = asyncio.get_running_loop()
+        terminado = False
+        while not terminado:
+            primero = await entrada.get()
+            if primero is _FIN:
+                break
+            ventana = [primero]
+            limite = loop.time() + self.max_espera
+
+            # Lo que ya está en cola entra sin esperar; después, hasta el límite
+            while len(ventana) < self.max_ventana:
+                restante = limite - loop.time()
+                try:
+                    elemento = entrada.get_nowait() if restante <= 0 else await asyncio.wait_for(entrada.get(), restante)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if elemento is _FIN:
+                    terminado = True
+                    break
+                ventana.append(elemento)
+
+            veredictos = await self._evaluar_ventana(ventana)
+            try:
+                await asyncio.wait_for(salida.put(veredictos), self.timeout_envio)
+            except asyncio.TimeoutError:
+                self._cortadas_por_lentitud += 1
+                raise ConsumidorLento(
+                    f"El cliente no leyó los veredictos en {self.timeout_envio:g} s; se cierra la sesión."
+                )
+
+        await salida.put(_FIN)
+
+    async def _evaluar_ventana(self, ventana):
+        """PrediccionFlujoItem de cada elemento de la ventana (lectura o error de formato)."""
+        validos = [(indice, datos) for indice, datos in ventana if not isinstance(datos, str)]
+
+        resultados_validos = []
+        if validos:
+            inicio = time.perf_counter()
+            try:
+                resultados_validos = await self.procesar_ventana([datos for _, datos in validos])
+            except Exception as e:
+                # Una ventana fallida (ej: la BD no responde) no corta la sesión:
+                # sus lecturas se reportan con error y el gateway puede reenviarlas
+                error = f"Error durante la predicción: {str(e)}"
+                resultados_validos = [
+                    schemas.PrediccionLoteItem(indice=k, machine_id=datos.machine_id, error=error)
+                    for k, (_, datos) in enumerate(validos)
+                ]
+            self._tiempo_proceso += time.perf_counter() - inicio
+            self._ventanas += 1
+            self._lecturas += len(validos)
+            self._tamano_max_ventana = max(self._tamano_max_ventana, len(validos))
+
+        por_indice = {
+            indice: schemas.PrediccionFlujoItem(
+                indice=indice, machine_id=item.machine_id, resultado=item.resultado, error=item.error
+            )
+            for (indice, _), item in zip(validos, resultados_validos)
+        }
+        return [
+            por_indice[indice] if not isinstance(datos, str)
+            else schemas.PrediccionFlujoItem(indice=indice, error=datos)
+            for indice, datos in ventana
+        ]
+
+    def estadisticas(self):
+        return {
+            "sesiones_activas": self._sesiones_activas,
+            "sesiones": self._sesiones,
+            "cortadas_por_lentitud": self._cortadas_por_lentitud,
+            "mensajes": self._mensajes,
+            "mensajes_invalidos": self._invalidos,
+            "ventanas": self._ventanas,
+            "tamano_medio_ventana": self._lecturas / self._ventanas if self._ventanas else 0.0,
+            "tamano_max_ventana": self._tamano_max_ventana,
+            "proceso_medio_ventana_ms": self._tiempo_proceso / self._ventanas * 1000 if self._ventanas else 0.0,
+            "max_ventana": self.max_ventana,
+            "max_espera_ms": self.max_espera * 1000,
+            "max_pendientes": self.max_pendientes,
+        }
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import io
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+import agregados
+import models
+import persistencia
+from features import COLUMNAS_CSV, COLUMNAS_NUMERICAS
+from inferencia import detalles_falla
+from tendencias import CalculadorTendencias
+
+# =====================================================
+#  Importación masiva de historiales de sensores (CSV)
+# =====================================================
+# Carga archivos con el formato de 'machine failure.csv' (UDI, Product ID,
+# Type, sensores y etiquetas de falla) en machines / machine_readings (los
+# tipos de falla en failure_flags). El archivo se lee por bloques (memoria
+# constante sin importar su tamaño) y cada bloque se inserta en una sola
+# transacción: COPY en Postgres, executemany en los demás motores.
+
+COLUMNAS_FALLA_CSV = ['TWF', 'HDF', 'PWF', 'OSF', 'RNF']
+COLUMNAS_REQUERIDAS = ['Product ID', 'Type', *COLUMNAS_CSV, 'Machine failure', *COLUMNAS_FALLA_CSV]
+
+# Columnas de machine_readings en el orden del COPY (reading_id lo asigna la secuencia)
+COLUMNAS_LECTURA = [
+    'machine_id', 'air_temperature', 'process_temperature',
+    'rotational_speed', 'torque', 'tool_wear', 'machine_failure', 'timestamp', 'model_version', 'failure_flags'
+]
+
+
+def importar_csv(archivo, engine, tamano_bloque=5000, paquete_modelos=None, reportar=print):
+    """
+    Importa 'archivo' (ruta o archivo abierto) bloque por bloque.
+
+    - Las máquinas se buscan por 'Product ID' (machines.product_id) y se crean
+      si no existen, con el 'Type' del CSV.
+    - Si se pasa 'paquete_modelos' (inferencia.PaqueteModelos) cada fila se
+      puntúa con los modelos en vez de usar las etiquetas de falla del CSV.
+      Si esa versión usa features de tendencia, las ventanas de cada máquina
+      se arman con las filas del archivo, en su orden.
+    - Si el CSV trae una columna 'timestamp' se usa; si no, la hora de importación.
+
+    Retorna un dict con el resumen (filas, fallas, máquinas creadas, filas/s).
+    """
+    resumen = {"filas": 0, "fallas": 0, "maquinas_creadas": 0, "rechazadas": 0, "segundos": 0.0}
+    maquinas = {}  # product_id -> (machine_id, type)
+    calculador = None
+    if paquete_modelos is not None and paquete_modelos.codificador.usa_tendencias:
+        calculador = CalculadorTendencias(paquete_modelos.codificador.ventana)
+    inicio = time.perf_counter()
+
+    lector = pd.read_csv(archivo, chunksize=tamano_bloque, encoding="utf-8-sig")
+    for bloque in lector:
+        faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in bloque.columns]
+        if faltantes:
+            raise ValueError(f"El CSV no tiene las columnas {faltantes}")
+
+        bloque = bloque.rename(columns=COLUMNAS_CSV)
+        with engine.begin() as conn:
+            creadas = _resolver_maquinas(conn, bloque, maquinas)
+            filas_lectura, rechazadas = _preparar_bloque(bloque, maquinas, paquete_modelos, calculador)
+            n_filas = len(filas_lectura)
+            n_fallas = sum(fila["machine_failure"] for fila in filas_lectura)
+            _cargar(conn, filas_lectura)
+
+        resumen["filas"] += n_filas
+        resumen["fallas"] += n_fallas
+        resumen["maquinas_creadas"] += creadas
+        resumen["rechazadas"] += rechazadas
+
+        transcurrido = time.perf_counter() - inicio
+        if reportar is not None:
+            reportar(f"{resumen['filas']} filas importadas ({resumen['filas'] / transcurrido:,.0f} filas/s)")
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    resumen["filas_por_segundo"] = resumen["filas"] / resumen["segundos"] if resumen["segundos"] else 0.0
+    return resumen
+
+
+def _resolver_maquinas(conn, bloque, maquinas):
+    """Completa 'maquinas' con los Product ID del bloque; crea los que no existen. Retorna cuántas creó."""
+    nuevos = bloque.loc[~bloque['Product ID'].isin(maquinas.keys()), ['Product ID', 'Type']]\
+                   .drop_duplicates('Product ID')
+    if nuevos.empty:
+        return 0
+
+    productos = nuevos['Product ID'].tolist()
+    for machine_id, product_id, tipo in conn.execute(
+        select(models.Machine.machine_id, models.Machine.product_id, models.Machine.type)
+        .where(models.Machine.product_id.in_(productos))
+    ):
+        maquinas[product_id] = (machine_id, tipo)
+
+    por_crear = nuevos[~nuevos['Product ID'].isin(maquinas.keys())]
+    if por_crear.empty:
+        return 0
+
+    creadas = conn.execute(
+        insert(models.Machine).returning(
+            models.Machine.machine_id, models.Machine.product_id, models.Machine.type,
+            sort_by_parameter_order=True
+        ),
+        [
+            {"product_id": product_id, "type": tipo, "description": "Importada desde CSV"}
+            for product_id, tipo in por_crear.itertuples(index=False)
+        ]
+    ).all()
+    for machine_id, product_id, tipo in creadas:
+        maquinas[product_id] = (machine_id, tipo)
+    return len(creadas)
+
+
+def _preparar_bloque(bloque, maquinas, paquete_modelos, calculador=None):
+    """Filas (dicts) de machine_readings de un bloque y cuántas se rechazaron."""
+    machine_ids = bloque['Product ID'].map(lambda p: maquinas[p][0])
+    tipos_maquina = bloque['Product ID'].map(lambda p: maquinas[p][1])
+
+    # Una lectura cuyo 'Type' no coincide con el de la máquina se rechaza, igual que en /predecir
+    validas = (tipos_maquina == bloque['Type']).to_numpy()
+    rechazadas = int((~validas).sum())
+    bloque = bloque[validas]
+    machine_ids = machine_ids[validas].to_numpy()
+
+    if paquete_modelos is not None:
+        tendencias = None
+        if calculador is not None:
+            tendencias = calculador.calcular(bloque[COLUMNAS_NUMERICAS].to_numpy(dtype=np.float64), machine_ids)
+        X = paquete_modelos.codificador.codificar_dataframe(bloque, tendencias=tendencias)
+        prediccion_falla, _, prediccion_tipo = paquete_modelos.evaluador.evaluar(X)
+        hubo_falla = prediccion_falla == 1
+        flags = [
+            models.encode_failure_flags(detalles_falla(prediccion_tipo[k], paquete_modelos.labels_tipo_falla))
+            if hubo_falla[k] else None
+            for k in range(len(bloque))
+        ]
+    else:
+        hubo_falla = bloque['Machine failure'].to_numpy() == 1
+        # Bitmask de las columnas TWF..RNF (models.FAILURE_FLAGS) de todas las filas de una vez
+        bits = np.array([models.FAILURE_FLAGS[columna.lower()] for columna in COLUMNAS_FALLA_CSV])
+        mascaras = (bloque[COLUMNAS_FALLA_CSV].to_numpy() == 1) @ bits
+        flags = [int(mascara) if falla else None for mascara, falla in zip(mascaras, hubo_falla)]
+
+    # Versión de modelos que puntuó las filas (None = etiquetas del CSV)
+    model_version = paquete_modelos.version if paquete_modelos is not None else None
+
+    if 'timestamp' in bloque.columns:
+        timestamps = pd.to_datetime(bloque['timestamp']).dt.to_pydatetime()
+    else:
+        timestamps = np.full(len(bloque), datetime.now(), dtype=object)
+
+    filas_lectura = [
+        {
+            "machine_id": int(machine_id),
+            "air_temperature": float(temp_aire),
+            "process_temperature": float(temp_proceso),
+            "rotational_speed": int(velocidad),
+            "torque": float(torque),
+            "tool_wear": int(desgaste),
+            "machine_failure": bool(falla),
+            "timestamp": timestamp,
+            "model_version": model_version,
+            "failure_flags": flag,
+        }
+        for machine_id, temp_aire, temp_proceso, velocidad, torque, desgaste, falla, timestamp, flag in zip(
+            machine_ids, bloque['temp_aire'], bloque['temp_proceso'], bloque['velocidad_rotacion'],
+            bloque['torque'], bloque['desgaste_herramienta'], hubo_falla, timestamps, flags
+        )
+    ]
+    return filas_lectura, rechazadas
+
+
+def _cargar(conn, filas_lectura):
+    """
+    Inserta las lecturas del bloque y las suma a los agregados por hora / día
+    (agregados.py), en la misma transacción. Con los tipos de falla en la
+    misma fila no hace falta conocer los reading_id: en Postgres van por COPY
+    (la secuencia los asigna), en otros motores por executemany.
+    """
+    if not filas_lectura:
+        return
+    if conn.dialect.name == "postgresql":
+        _copy(conn, "machine_readings", COLUMNAS_LECTURA, filas_lectura)
+    else:
+        reserva = persistencia.reserva_activa(conn.engine)
+        if reserva is not None:
+            # Escritura diferida activa en este proceso (sin secuencia): los
+            # reading_id salen de su misma reserva, no del autoincremento
+            for fila, reading_id in zip(filas_lectura, reserva.siguientes(len(filas_lectura))):
+                fila["reading_id"] = reading_id
+        conn.execute(insert(models.MachineReading), filas_lectura)
+    agregados.registrar(conn, filas_lectura)
+
+
+def _copy(conn, tabla, columnas, filas):
+    """COPY ... FROM STDIN (psycopg2) dentro de la transacción de 'conn'."""
+    if not filas:
+        return
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for fila in filas:
+        escritor.writerow([fila[columna] for columna in columnas])
+    buffer.seek(0)
+
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa un historial de sensores (formato 'machine failure.csv') a la BD.")
+    parser.add_argument("archivo", help="Ruta del CSV")
+    parser.add_argument("--bloque", type=int, default=5000, help="Filas por bloque/transacción (default: 5000)")
+    parser.add_argument("--puntuar", action="store_true",
+                        help="Puntuar cada fila con los modelos entrenados en vez de usar las etiquetas del CSV")
+    args = parser.parse_args()
+
+    from database import engine
+    from registro_modelos import gestor_modelos
+
+    # Con --puntuar se usa la versión activa del registro de modelos
+    registro = gestor_modelos.registro
+    paquete_modelos = registro.cargar_paquete(registro.version_activa()) if args.puntuar else None
+
+    resumen = importar_csv(args.archivo, engine, tamano_bloque=args.bloque, paquete_modelos=paquete_modelos)
+    print(f"¡Importación completa! {resumen['filas']} lecturas ({resumen['fallas']} con falla), "
+          f"{resumen['maquinas_creadas']} máquinas creadas, {resumen['rechazadas']} filas rechazadas, "
+          f"{resumen['filas_por_segundo']:,.0f} filas/s.")
@@ -0,0 +1,91 @@
+import json
+import os
+
+import numpy as np
+
+from bosque_plano import EvaluadorPlano
+from estadisticas_maquinas import EstadisticasSensores
+from features import CodificadorFeatures
+
+# =====================================================
+#  Carga de los modelos entrenados por entrenar.py
+# =====================================================
+# Lo usan la API (main.py) y las herramientas que puntúan lecturas fuera de
+# /predecir (importar_csv.py), para que todos carguen y evalúen igual.
+
+
+class PaqueteModelos:
+    """
+    Todo lo necesario para puntuar lecturas: columnas, labels, codificador y
+    evaluador, más la versión del registro de modelos de la que salió (None si
+    se cargó de archivos sueltos) y el perfil de sus datos de entrenamiento
+    (None si la versión es anterior a perfil_referencia.json).
+    """
+
+    def __init__(self, columnas_modelo, labels_tipo_falla, evaluador, version=None, metadata=None,
+                 perfil_referencia=None):
+        self.columnas_modelo = columnas_modelo
+        self.labels_tipo_falla = labels_tipo_falla
+        self.codificador = CodificadorFeatures(columnas_modelo)
+        self.evaluador = evaluador
+        self.version = version
+        self.metadata = metadata or {}
+        self.perfil_referencia = perfil_referencia
+
+    def calentar(self):
+        """
+        Deja el paquete listo para responder sin latencia extra en la primera
+        petición: lee todas las páginas de los bosques (mapeados con mmap) y
+        hace una evaluación de prueba.
+        """
+        for bosque in (self.evaluador.bosque_falla, self.evaluador.bosque_tipo):
+            for arr in (bosque.feature, bosque.threshold, bosque.hijos, bosque.valores):
+                float(arr.sum())
+        self.evaluador.evaluar(np.zeros((1, self.codificador.n_columnas)))
+
+
+def cargar_paquete(directorio=".", version=None):
+    """
+    Carga los archivos de entrenar.py desde 'directorio'. Usa los bosques
+    planos mapeados en memoria (bosques_planos/, compartidos entre workers);
+    si no existen (modelos entrenados con una versión anterior) usa
+    bosques_planos.npz o, en último caso, aplana los .pkl de sklearn.
+    Si el directorio tiene un metadata.json (versión del registro) o un
+    perfil_referencia.json (estadisticas_maquinas.py) se adjuntan.
+    Lanza FileNotFoundError si faltan archivos.
+    """
+    import joblib  # Se importa al cargar (en segundo plano), no al arrancar la API
+
+    ruta = lambda nombre: os.path.join(directorio, nombre)
+
+    columnas_modelo = joblib.load(ruta("columnas_modelo.pkl"))
+    labels_tipo_falla = joblib.load(ruta("labels_tipo_falla.pkl"))
+    if os.path.isdir(ruta("bosques_planos")):
+        evaluador = EvaluadorPlano.cargar(ruta("bosques_planos"))
+    elif os.path.exists(ruta("bosques_planos.npz")):
+        evaluador = EvaluadorPlano.cargar(ruta("bosques_planos.npz"))
+    else:
+        evaluador = EvaluadorPlano.desde_sklearn(
+            joblib.load(ruta("modelo_fallas.pkl")), joblib.load(ruta("modelo_tipo_falla.pkl"))
+        )
+
+    metadata = None
+    if os.path.exists(ruta("metadata.json")):
+        with open(ruta("metadata.json")) as f:
+            metadata = json.load(f)
+    perfil_referencia = None
+    if os.path.exists(ruta("perfil_referencia.json")):
+        with open(ruta("perfil_referencia.json")) as f:
+            perfil_referencia = EstadisticasSensores.desde_dict(json.load(f))
+    return PaqueteModelos(columnas_modelo, labels_tipo_falla, evaluador, version, metadata, perfil_referencia)
+
+
+def detalles_falla(fila_prediccion_tipo, labels_tipo_falla):
+    """
+    Tipos de falla (twf, hdf, pwf, osf, rnf; van a machine_readings.failure_flags)
+    para una fila de salida de modelo_tipo_falla. Si el modelo no marca ningún
+    tipo se registra como RNF.
+    """
+    detalles = {label.lower(): bool(fila_prediccion_tipo[i] == 1) for i, label in enumerate(labels_tipo_falla)}
+    detalles["rnf"] = not any(detalles.values())
+    return detalles
@@ -1,27 +1,114 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware  # Importa el Middleware de CORS
-from sqlalchemy.orm import Session
-import joblib
-import pandas as pd
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+import asyncio
+import json
+import anyio
 import warnings
 
 # --- Importaciones de la Base de Datos ---
+import agregados
+from agregados import acumulador_agregados
 import models
 import schemas  # Importa todos los schemas
-from database import engine, get_db  # Importa get_db desde database.py
+import migraciones
+from database import DATABASE_URL, AsyncSessionLocal, engine, engine_async, get_db  # Importa get_db desde database.py
+from buffer_lecturas import buffer_lecturas
+from cache_maquinas import cache_maquinas
+from cache_predicciones import cache_predicciones
+from estadisticas_maquinas import estadisticas_maquinas
+from features import matriz_sensores
+from inferencia import detalles_falla
+from tendencias import features_tendencia
+from registro_modelos import gestor_modelos
+from persistencia import ColaLlena, EscritorDiferido
+from flujo_lecturas import ConsumidorLento, IngestaFlujo
+from alertas import alertas_de_lecturas, bus_alertas
+import metricas
+from metricas import MiddlewareMetricas, RutaMedida, etapa
+import config
 
 # --- Importa el router del CRUD ---
 import crud_endpoints
+import datos_endpoints
+import modelos_endpoints
+import alertas_endpoints
+import estadisticas_endpoints
+import analitica_endpoints
 
 # --- Configuración de Advertencias ---
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
-# --- Creación de Tablas ---
-# Esta línea crea las tablas definidas en models.py si no existen
-models.Base.metadata.create_all(bind=engine)
+# --- Ciclo de vida de la aplicación ---
+# El arranque no toca la BD ni los modelos de forma bloqueante: el proceso
+# acepta conexiones en cuanto se importa este archivo. El esquema se crea
+# aparte (python migraciones.py) y lo que hay que cargar (versión activa de
+# los modelos, checkpoints de machine_stats, últimas lecturas de cada
+# máquina) se carga en segundo plano y en paralelo. /salud responde siempre;
+# /salud/listo responde 200 recién cuando todo eso terminó.
+
+# Cargas de arranque que leen la BD: nombre -> "pendiente" | "lista" | último error
+estado_arranque = {}
+tareas_arranque = []
+
+async def cargar_en_segundo_plano(nombre, funcion, *args):
+    """
+    Corre 'funcion' en un hilo hasta que termine sin error, con espera
+    exponencial entre intentos: un worker arranca aunque la BD todavía no
+    responda (ej: se reinician juntas) y se pone al día cuando vuelve.
+    """
+    espera = 0.5
+    while True:
+        try:
+            await anyio.to_thread.run_sync(funcion, *args)
+            estado_arranque[nombre] = "lista"
+            return
+        except Exception as e:
+            estado_arranque[nombre] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+            print(f"Arranque: {nombre} falló ({estado_arranque[nombre]}); reintento en {espera:.1f} s.")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, config.ARRANQUE_REINTENTO_MAX_S)
+
+def lanzar_carga(nombre, funcion, *args):
+    estado_arranque[nombre] = "pendiente"
+    tareas_arranque.append(asyncio.create_task(cargar_en_segundo_plano(nombre, funcion, *args)))
+
+# Arranca (y detiene ordenadamente) los componentes en segundo plano.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"Base de datos: {DATABASE_URL.render_as_string(hide_password=True)}")
+    if config.ESQUEMA_AL_ARRANCAR:
+        # Solo desarrollo / benchmarks: en producción el esquema es 'python migraciones.py'
+        await anyio.to_thread.run_sync(migraciones.crear_esquema, engine)
+    await gestor_modelos.iniciar()  # Versión activa en segundo plano + micro-lotes + recarga en caliente
+    await estadisticas_maquinas.iniciar(engine)  # Checkpoint periódico de machine_stats
+    await acumulador_agregados.iniciar(engine)  # Suma periódica de los deltas a los agregados por hora / día
+    lanzar_carga("estadisticas_maquinas", estadisticas_maquinas.cargar, engine)  # Último checkpoint de cada máquina
+    lanzar_carga("buffer_lecturas", buffer_lecturas.calentar, engine)  # Últimas lecturas de cada máquina
+    if escritor_diferido is not None:
+        escritor_diferido.iniciar()
+    yield
+    for tarea in tareas_arranque:
+        tarea.cancel()
+    await asyncio.gather(*tareas_arranque, return_exceptions=True)
+    tareas_arranque.clear()
+    await gestor_modelos.detener()
+    if escritor_diferido is not None:
+        # Vacía la cola en la BD antes de terminar el proceso
+        await anyio.to_thread.run_sync(escritor_diferido.detener)
+    await estadisticas_maquinas.detener()  # Guarda lo que falte en machine_stats
+    await acumulador_agregados.detener()  # Suma los deltas de agregados pendientes
+    # Cierra las conexiones del pool asíncrono
+    await engine_async.dispose()
 
 # 1. Inicializar la aplicación FastAPI
-app = FastAPI(title="API de Predicción de Fallas de Maquinaria v2.1 (con DB y CRUD)")
+app = FastAPI(title="API de Predicción de Fallas de Maquinaria v2.1 (con DB y CRUD)", lifespan=lifespan)
+app.router.route_class = RutaMedida  # Tiempos por etapa de los endpoints de este archivo (metricas.py)
 
 # --- Configuración de CORS ---
 origins = [
@@ -36,25 +123,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# --- Métricas (metricas.py) ---
+# Latencia por ruta y por etapa, peticiones en curso, espera del pool y
+# llamadas a los modelos, en /metrics. Con METRICAS_HEADER_ETAPAS=1 cada
+# respuesta trae además sus etapas en el header Server-Timing.
+app.add_middleware(MiddlewareMetricas, header_etapas=config.METRICAS_HEADER_ETAPAS)
+
 # --- Incluir el Router del CRUD ---
 # Ahora tendrás endpoints como /api/machines/, /api/readings/{id}, etc.
 app.include_router(crud_endpoints.router)
+app.include_router(datos_endpoints.router)
+app.include_router(modelos_endpoints.router)
+app.include_router(alertas_endpoints.router)
+app.include_router(estadisticas_endpoints.router)
+app.include_router(analitica_endpoints.router)
 
 
-# 2. Cargar TODOS los modelos y helpers
-try:
-    modelo_falla = joblib.load("modelo_fallas.pkl")
-    columnas_modelo = joblib.load("columnas_modelo.pkl")
-    modelo_tipo_falla = joblib.load("modelo_tipo_falla.pkl")
-    labels_tipo_falla = joblib.load("labels_tipo_falla.pkl")
-    
-    print("Todos los modelos cargados exitosamente. ¡Listos para predecir!")
-except FileNotFoundError:
-    print("Error: Faltan archivos .pkl. Asegúrate de ejecutar 'entrenar.py' primero.")
-    modelo_falla = None
-    modelo_tipo_falla = None
+# 2. Versión activa de los modelos (registro_modelos.py)
+#    Cada versión trae su codificador, sus bosques planos (mmap) y su
+#    agrupador de micro-lotes (ver config.MICROLOTES_*). Se cargan en
+#    segundo plano desde el lifespan, la primera al arrancar y las nuevas
+#    cuando entrenar.py las publica, y se intercambian sin reiniciar.
+
+# Escritura diferida: las lecturas se encolan y un hilo las inserta en lotes
+# (ver config.ESCRITURA_DIFERIDA_*). Desactivada por defecto.
+escritor_diferido = None
+if config.ESCRITURA_DIFERIDA_ACTIVA:
+    escritor_diferido = EscritorDiferido(
+        engine,
+        capacidad=config.ESCRITURA_DIFERIDA_CAPACIDAD,
+        tamano_lote=config.ESCRITURA_DIFERIDA_TAMANO_LOTE,
+        intervalo_ms=config.ESCRITURA_DIFERIDA_INTERVALO_MS,
+        politica_desborde=config.ESCRITURA_DIFERIDA_POLITICA,
+        timeout_bloqueo_s=config.ESCRITURA_DIFERIDA_TIMEOUT_S,
+        bloque_ids=config.ESCRITURA_DIFERIDA_BLOQUE_IDS,
+        reintento_max_s=config.ESCRITURA_DIFERIDA_REINTENTO_MAX_S,
+        archivo_pendientes=config.ESCRITURA_DIFERIDA_PENDIENTES,
+    )
 
 # 3. Diccionario de Recomendaciones
 RECOMENDACIONES = {
@@ -65,23 +173,183 @@ RECOMENDACIONES = {
     "OTRA": "Falla Indeterminada. Realizar una inspección general de la máquina."
 }
 
-# 4. Endpoint de bienvenida
+# 4. Funciones auxiliares de predicción
+#    Compartidas por /predecir y /predecir/lote para que ambos caminos
+#    construyan las features y traduzcan las fallas exactamente igual.
+def preparar_features(modelo, lista_datos):
+    """
+    Convierte una lista de DatosMaquinaPrediccion en la matriz de features
+    (un array de NumPy con las columnas en el orden de columnas_modelo).
+    Si la versión usa features de tendencia, salen de las ventanas del buffer
+    de cada máquina (buffer_lecturas.py), sin consultar el historial en la BD.
+    Las lecturas entran al buffer recién al guardarse (guardar_lecturas).
+    """
+    codificador = modelo.paquete.codificador
+    tendencias = None
+    if codificador.ventana is not None:
+        ventanas = buffer_lecturas.ventanas(
+            [datos.machine_id for datos in lista_datos], matriz_sensores(lista_datos), codificador.ventana
+        )
+        tendencias = features_tendencia(ventanas)
+    return codificador.codificar_lote(lista_datos, tendencias=tendencias)
+
+def interpretar_tipo_falla(fila_prediccion_tipo, labels_tipo_falla):
+    """
+    Traduce una fila de salida de modelo_tipo_falla (ej: [1, 0, 1, 0]) al texto
+    de la respuesta y al dict de tipos de falla (models.FAILURE_FLAGS).
+    Retorna (tipo_falla_str, recomendacion_str, detalles_falla_dict).
+    """
+    # Tipos de falla: {'twf': ..., 'hdf': ..., 'rnf': True si no hay ningún tipo}
+    detalles_falla_dict = detalles_falla(fila_prediccion_tipo, labels_tipo_falla)
+
+    falla_str_lista = []
+    rec_str_lista = []
+    for i, label in enumerate(labels_tipo_falla): # ['TWF', 'HDF', 'PWF', 'OSF']
+        if fila_prediccion_tipo[i] == 1:
+            recomendacion = RECOMENDACIONES.get(label, "Revisión requerida.")
+            falla_str_lista.append(recomendacion.split('.')[0])
+            rec_str_lista.append(recomendacion.split('.')[1].strip())
+
+    if not falla_str_lista:
+        tipo_falla_str = RECOMENDACIONES["OTRA"].split('.')[0]
+        recomendacion_str = RECOMENDACIONES["OTRA"].split('.')[1].strip()
+    else:
+        tipo_falla_str = ", ".join(falla_str_lista)
+        recomendacion_str = " ".join(rec_str_lista)
+
+    return tipo_falla_str, recomendacion_str, detalles_falla_dict
+
+async def evaluar_una(modelo, input_final):
+    """
+    Evalúa UNA fila de features con el ModeloActivo 'modelo'. Primero busca
+    el vector en la caché de predicciones; si no está y el agrupador está
+    activo, la fila viaja en un micro-lote junto con las de otras peticiones
+    concurrentes.
+    Retorna (prediccion_falla, probabilidad_falla, prediccion_tipo) de esa fila.
+    """
+    if cache_predicciones.activa:
+        guardado = cache_predicciones.obtener_varios(modelo.version, input_final)[0]
+        if guardado is not None:
+            return guardado
+
+    if modelo.agrupador is not None and modelo.agrupador.activo:
+        resultado = await modelo.agrupador.predecir(input_final[0])
+    else:
+        # Una sola fila con el bosque plano tarda décimas de ms: se evalúa en el event loop
+        metricas.contar_evaluacion(modelo.version, "directa", 1)
+        prediccion_falla, probabilidad_falla, prediccion_tipo = modelo.paquete.evaluador.evaluar(input_final)
+        resultado = prediccion_falla[0], probabilidad_falla[0], prediccion_tipo[0]
+
+    if cache_predicciones.activa:
+        cache_predicciones.guardar_varios(modelo.version, input_final, [resultado])
+    return resultado
+
+async def evaluar_matriz(modelo, input_final):
+    """
+    Evalúa una matriz de features completa (lotes y ventanas de la ingesta
+    continua). Solo las filas que no están en la caché de predicciones pasan
+    por los modelos, en una sola llamada y en un hilo (con miles de lecturas
+    no debe bloquear el event loop).
+    Retorna (predicciones, probabilidades, salida_tipo), indexables por fila.
+    """
+    if not cache_predicciones.activa:
+        metricas.contar_evaluacion(modelo.version, "lote", len(input_final))
+        return await anyio.to_thread.run_sync(modelo.paquete.evaluador.evaluar, input_final)
+
+    resultados = cache_predicciones.obtener_varios(modelo.version, input_final)
+    faltantes = [i for i, resultado in enumerate(resultados) if resultado is None]
+    if faltantes:
+        X_faltantes = input_final[faltantes]
+        metricas.contar_evaluacion(modelo.version, "lote", len(faltantes))
+        nuevos = list(zip(*await anyio.to_thread.run_sync(modelo.paquete.evaluador.evaluar, X_faltantes)))
+        cache_predicciones.guardar_varios(modelo.version, X_faltantes, nuevos)
+        for i, resultado in zip(faltantes, nuevos):
+            resultados[i] = resultado
+    predicciones, probabilidades, salida_tipo = zip(*resultados)
+    return predicciones, probabilidades, salida_tipo
+
+def verificar_modelos_cargados():
+    if gestor_modelos.actual is None:
+        if not gestor_modelos.carga_inicial_terminada:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Modelos cargándose. Reintenta en unos segundos.",
+                headers={"Retry-After": "1"},
+            )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Modelos no cargados. Revisa la consola del backend."
+        )
+
+# 5. Endpoint de bienvenida
 @app.get("/")
 def bienvenida():
     return {"mensaje": "API del Doctor de Máquinas v2.1 está funcionando. Revisa /docs para la documentación."}
 
-# 5. Endpoint de predicción (Actualizado para guardar en BD)
+# Salud del worker para el orquestador / balanceador:
+#   /salud        el proceso responde (liveness)
+#   /salud/listo  puede atender /predecir: modelos cargados, cargas de
+#                 arranque terminadas y BD accesible (readiness); 503 si no
+@app.get("/salud")
+def salud():
+    return {"estado": "ok"}
+
+@app.get("/salud/listo")
+async def salud_listo():
+    bd = "ok"
+    try:
+        async with engine_async.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=2)
+    except Exception as e:
+        bd = f"{type(e).__name__}: {e}"
+    modelos = gestor_modelos.estado()
+    listo = (
+        gestor_modelos.actual is not None
+        and all(estado == "lista" for estado in estado_arranque.values())
+        and bd == "ok"
+    )
+    cuerpo = {"listo": listo, "modelos": modelos, "cargas": dict(estado_arranque), "bd": bd}
+    if not listo:
+        return JSONResponse(cuerpo, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return cuerpo
+
+# Métricas de este worker en el formato de texto de Prometheus
+@app.get("/metrics", include_in_schema=False)
+def metricas_prometheus():
+    return PlainTextResponse(metricas.exponer(), media_type="text/plain; version=0.0.4")
+
+# Estadísticas de los micro-lotes (tamaño de lote y espera en cola)
+# y de la escritura diferida (pendientes, escritas, rechazadas)
+# y de las cachés de máquinas y de predicciones (aciertos / fallos)
+# y de la ingesta continua (sesiones, ventanas)
+# y de las estadísticas por máquina (checkpoints)
+# y de los buffers de lecturas recientes
+# y de la suma periódica de los deltas de agregados
+@app.get("/predecir/estadisticas")
+def estadisticas_prediccion():
+    agrupador = gestor_modelos.actual.agrupador if gestor_modelos.actual else None
+    return {
+        "cache_maquinas": cache_maquinas.estadisticas(),
+        "cache_predicciones": cache_predicciones.estadisticas(),
+        "modelos": gestor_modelos.estado(),
+        "microlotes": agrupador.estadisticas() if agrupador else {"activo": False},
+        "escritura_diferida": escritor_diferido.estadisticas() if escritor_diferido else {"activo": False},
+        "flujo": ingesta_flujo.estadisticas(),
+        "alertas": bus_alertas.estadisticas(),
+        "estadisticas_maquinas": estadisticas_maquinas.estadisticas(),
+        "agregados": acumulador_agregados.estadisticas(),
+        "buffer_lecturas": buffer_lecturas.estadisticas(),
+    }
+
+# 6. Endpoint de predicción (Actualizado para guardar en BD)
 #    Usa los schemas importados para la entrada (DatosMaquinaPrediccion) y salida (PrediccionResponse)
 @app.post("/predecir", response_model=schemas.PrediccionResponse)
-def predecir_falla(datos: schemas.DatosMaquinaPrediccion, db: Session = Depends(get_db)):
-    if not modelo_falla or not modelo_tipo_falla:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Modelos no cargados. Revisa la consola del backend."
-        )
+async def predecir_falla(datos: schemas.DatosMaquinaPrediccion, db: AsyncSession = Depends(get_db)):
+    verificar_modelos_cargados()
 
-    # Verifica que la máquina exista en la BD
-    db_machine = db.query(models.Machine).filter(models.Machine.machine_id == datos.machine_id).first()
+    # Verifica que la máquina exista (primero en la caché, si no en la BD)
+    with etapa("maquina"):
+        db_machine = await cache_maquinas.obtener(db, datos.machine_id)
     if db_machine is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -95,102 +363,318 @@ def predecir_falla(datos: schemas.DatosMaquinaPrediccion, db: Session = Depends(
             detail=f"El 'Type' {datos.Type} no coincide con el tipo '{db_machine.type}' de la máquina {datos.machine_id}."
         )
 
-    # 6. Procesar los datos de entrada
-    # Excluimos machine_id de los datos del modelo
-    input_data = datos.model_dump(exclude={"machine_id"}) 
-    input_df = pd.DataFrame([input_data])
-    input_dummies = pd.get_dummies(input_df, columns=['Type'])
-    
-    input_final = pd.DataFrame(columns=columnas_modelo)
-    # Concatena y rellena con 0 las columnas que no estaban en input_dummies
-    input_final = pd.concat([input_final, input_dummies]).fillna(0)
-    # Asegura el orden correcto de las columnas
-    input_final = input_final[columnas_modelo] 
-
-        # --- PASO B: PREDICCIÓN CON MODELO 1 (¿Hay Falla?) ---
-        prediccion_falla = modelo_falla.predict(input_final)
-        probabilidad_falla = modelo_falla.predict_proba(input_final)
-        
-        resultado_falla = int(prediccion_falla[0])
-        confianza = float(probabilidad_falla[0][resultado_falla]) * 100
-
-        hubo_falla_bool = (resultado_falla == 1)
-
-        # --- Guardar la LECTURA en la base de datos ---
-        # (Tu código ya hacía esto correctamente)
-        db_reading = models.MachineReading(
-            machine_id=datos.machine_id,
-            air_temperature=datos.temp_aire,
-            process_temperature=datos.temp_proceso,
-            rotational_speed=datos.velocidad_rotacion,
-            torque=datos.torque,
-            tool_wear=datos.desgaste_herramienta,
-            machine_failure=hubo_falla_bool
-        )
-        db.add(db_reading)
-        db.commit()
-        db.refresh(db_reading) # <-- ¡IMPORTANTE! Para obtener el reading_id generado
+    # La versión de los modelos se fija AQUÍ y se usa en toda la petición
+    # (aunque una recarga en caliente la reemplace mientras tanto)
+    modelo = gestor_modelos.actual
+
+    try:
+        # --- PASO A: PROCESAR LOS DATOS DE ENTRADA ---
+        with etapa("features"):
+            input_final = preparar_features(modelo, [datos])
 
+        # --- PASO B: PREDICCIÓN (Modelo 1 y Modelo 2 en una sola pasada) ---
+        with etapa("modelo"):
+            prediccion_falla, probabilidad_falla, prediccion_tipo = await evaluar_una(modelo, input_final)
 
         # 7. Decidir la respuesta
-        if not hubo_falla_bool:
-            # --- CASO: OPERACIÓN NORMAL ---
-            return {
-                "prediccion": "OPERACION NORMAL",
-                "confianza": f"{confianza:.2f}%",
-                "tipo_falla_probable": "N/A",
-                "recomendacion": "Continuar operación estándar.",
-                "reading_saved_id": db_reading.reading_id
-            }
-        
-        else:
-            # --- CASO: FALLA PROBABLE ---
-            prediccion_tipo = modelo_tipo_falla.predict(input_final)
-            
-            falla_str_lista = []
-            rec_str_lista = []
-            
-            # Inicializa el dict de fallas en False
-            detalles_falla_dict = {label.lower(): False for label in labels_tipo_falla} # {'twf': False, ...}
-            detalles_falla_dict["rnf"] = False # Añadir random failure por si acaso
-
-            for i, label in enumerate(labels_tipo_falla): # ['TWF', 'HDF', 'PWF', 'OSF']
-                if prediccion_tipo[0][i] == 1:
-                    recomendacion = RECOMENDACIONES.get(label, "Revisión requerida.")
-                    falla_str_lista.append(recomendacion.split('.')[0])
-                    rec_str_lista.append(recomendacion.split('.')[1].strip())
-                    detalles_falla_dict[label.lower()] = True # Marca la falla como True
-
-            if not falla_str_lista:
-                tipo_falla_str = RECOMENDACIONES["OTRA"].split('.')[0]
-                recomendacion_str = RECOMENDACIONES["OTRA"].split('.')[1].strip()
-                detalles_falla_dict["rnf"] = True # Marcar como falla random
-            else:
-                tipo_falla_str = ", ".join(falla_str_lista)
-                recomendacion_str = " ".join(rec_str_lista)
-
-            # --- Guardar los DETALLES DE FALLA en la base de datos ---
-            # (Tu código ya hacía esto correctamente)
-            db_failure_details = models.FailureType(
-                reading_id=db_reading.reading_id,
-                **detalles_falla_dict # Desempaqueta el dict: twf=True, hdf=False, ...
+        with etapa("interpretacion"):
+            respuesta, detalles_falla_dict = interpretar_prediccion(
+                modelo, prediccion_falla, probabilidad_falla, prediccion_tipo
             )
-            db.add(db_failure_details)
-            db.commit()
 
-            return {
-                "prediccion": "FALLA PROBABLE",
-                "confianza": f"{confianza:.2f}%",
-                "tipo_falla_probable": tipo_falla_str, # Corregido el typo
-                "recomendacion": recomendacion_str,
-                "reading_saved_id": db_reading.reading_id
-            }
+        # --- Guardar la LECTURA (y sus DETALLES DE FALLA) en la base de datos ---
+        with etapa("guardado"):
+            respuesta["reading_saved_id"] = (await guardar_lecturas(
+                db, [(fila_lectura(datos, detalles_falla_dict, modelo.version), detalles_falla_dict)]
+            ))[0]
+        return respuesta
+
+    except ColaLlena as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
 
     # Capturar cualquier error inesperado durante la predicción
     except Exception as e:
-        db.rollback() # Deshacer cualquier cambio en la BD si la predicción falla
+        await db.rollback() # Deshacer cualquier cambio en la BD si la predicción falla
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error durante la predicción: {str(e)}"
         )
 
+def interpretar_prediccion(modelo, prediccion_falla, probabilidad_falla, prediccion_tipo):
+    """
+    Arma la respuesta de UNA lectura (sin 'reading_saved_id') a partir de la
+    salida de los modelos de 'modelo'. Retorna (respuesta, detalles_falla_dict),
+    donde el dict de detalles es None si no hubo falla.
+    """
+    resultado_falla = int(prediccion_falla)
+    confianza = float(probabilidad_falla[resultado_falla]) * 100
+
+    if resultado_falla != 1:
+        # --- CASO: OPERACIÓN NORMAL ---
+        return {
+            "prediccion": "OPERACION NORMAL",
+            "confianza": f"{confianza:.2f}%",
+            "tipo_falla_probable": "N/A",
+            "recomendacion": "Continuar operación estándar.",
+            "model_version": modelo.version,
+        }, None
+
+    # --- CASO: FALLA PROBABLE ---
+    tipo_falla_str, recomendacion_str, detalles_falla_dict = interpretar_tipo_falla(
+        prediccion_tipo, modelo.paquete.labels_tipo_falla
+    )
+    return {
+        "prediccion": "FALLA PROBABLE",
+        "confianza": f"{confianza:.2f}%",
+        "tipo_falla_probable": tipo_falla_str,
+        "recomendacion": recomendacion_str,
+        "model_version": modelo.version,
+    }, detalles_falla_dict
+
+def fila_lectura(datos, detalles_falla_dict, model_version):
+    """
+    Columnas de machine_readings para una lectura de DatosMaquinaPrediccion.
+    Los tipos de falla van en la misma fila (failure_flags): un solo INSERT.
+    """
+    return {
+        "machine_id": datos.machine_id,
+        "air_temperature": datos.temp_aire,
+        "process_temperature": datos.temp_proceso,
+        "rotational_speed": datos.velocidad_rotacion,
+        "torque": datos.torque,
+        "tool_wear": datos.desgaste_herramienta,
+        "machine_failure": detalles_falla_dict is not None,
+        "model_version": model_version,
+        "failure_flags": models.encode_failure_flags(detalles_falla_dict),
+    }
+
+async def guardar_lecturas(db, elementos):
+    """
+    Persiste una lista de (fila_lectura, detalles_falla_dict o None) y retorna
+    sus reading_id en el mismo orden. Las lecturas con falla se publican en
+    el bus de alertas (alertas.py) una vez guardadas (o encoladas), y todas
+    se suman a las estadísticas de su máquina (estadisticas_maquinas.py) y a
+    su buffer de lecturas recientes (buffer_lecturas.py).
+
+    Con la escritura diferida activa solo se encolan (el hilo escritor las
+    inserta después); si no, se insertan en bloque en UNA sola transacción.
+    Su delta de los agregados por hora / día (agregados.py) va en la misma
+    transacción: a machine_rollup_deltas (acumulador_agregados los suma
+    después) o, sin acumulador, directo a los agregados.
+    """
+    # El timestamp se fija aquí (no con el default del modelo) para ubicar la
+    # hora de los agregados; es también el de las alertas de estas lecturas
+    ahora = datetime.now()
+    elementos = [({**fila, "timestamp": ahora}, detalles) for fila, detalles in elementos]
+    if escritor_diferido is not None and escritor_diferido.activo:
+        # Cierra la transacción de lectura para devolver la conexión al pool:
+        # reservar IDs puede necesitar otra conexión y no hay nada que escribir aquí.
+        await db.commit()
+        # encolar_lote puede bloquear (política 'bloquear' o reserva de IDs): en un hilo
+        reading_ids = await anyio.to_thread.run_sync(escritor_diferido.encolar_lote, elementos)
+        _registrar_guardadas(elementos, reading_ids)
+        return reading_ids
+
+    filas = [fila for fila, _ in elementos]
+    reading_ids = (await db.scalars(
+        insert(models.MachineReading).returning(models.MachineReading.reading_id, sort_by_parameter_order=True),
+        filas
+    )).all()
+    if acumulador_agregados.activo:
+        await agregados.registrar_pendiente_async(db, filas)
+    else:
+        await agregados.registrar_async(db, filas)
+    await db.commit()
+    _registrar_guardadas(elementos, reading_ids)
+    return reading_ids
+
+def _registrar_guardadas(elementos, reading_ids):
+    """Alertas, estadísticas y buffer de las lecturas ya guardadas (o encoladas)."""
+    filas = [fila for fila, _ in elementos]
+    bus_alertas.publicar(alertas_de_lecturas(elementos, reading_ids))
+    estadisticas_maquinas.registrar(filas)
+    buffer_lecturas.agregar_filas(filas, reading_ids)
+
+# 8. Endpoint de predicción por LOTE
+#    Pensado para gateways que acumulan cientos de lecturas por ciclo:
+#    una sola consulta de máquinas, una sola pasada por cada modelo y
+#    una sola transacción para todas las lecturas y detalles de falla.
+MAX_LECTURAS_POR_LOTE = 10000
+
+@app.post("/predecir/lote", response_model=schemas.PrediccionLoteResponse)
+async def predecir_falla_lote(lecturas: List[schemas.DatosMaquinaPrediccion], db: AsyncSession = Depends(get_db)):
+    verificar_modelos_cargados()
+
+    if len(lecturas) > MAX_LECTURAS_POR_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote tiene {len(lecturas)} lecturas; el máximo permitido es {MAX_LECTURAS_POR_LOTE}."
+        )
+
+    try:
+        resultados = await predecir_lecturas(db, lecturas)
+
+    except ColaLlena as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error durante la predicción por lote: {str(e)}"
+        )
+
+    return _resumen_lote(resultados)
+
+async def predecir_lecturas(db, lecturas):
+    """
+    Valida, evalúa y guarda una lista de DatosMaquinaPrediccion con una sola
+    consulta de máquinas, una sola pasada por los modelos y una sola escritura.
+    Retorna un PrediccionLoteItem por lectura (en el mismo orden); las
+    lecturas rechazadas llevan 'error'. Compartida por /predecir/lote y la
+    ingesta continua (una llamada por ventana).
+    """
+    resultados = [schemas.PrediccionLoteItem(indice=i, machine_id=datos.machine_id) for i, datos in enumerate(lecturas)]
+
+    # --- PASO A: Validar TODAS las máquinas (caché + una sola consulta para las faltantes) ---
+    with etapa("maquina"):
+        maquinas = await cache_maquinas.obtener_varios(db, [datos.machine_id for datos in lecturas])
+
+    indices_validos = []
+    for i, datos in enumerate(lecturas):
+        maquina = maquinas.get(datos.machine_id)
+        if maquina is None:
+            resultados[i].error = f"Máquina con machine_id {datos.machine_id} no encontrada."
+        elif maquina.type != datos.Type:
+            resultados[i].error = f"El 'Type' {datos.Type} no coincide con el tipo '{maquina.type}' de la máquina {datos.machine_id}."
+        else:
+            indices_validos.append(i)
+
+    if not indices_validos:
+        return resultados
+
+    validos = [lecturas[i] for i in indices_validos]
+    modelo = gestor_modelos.actual  # Una sola versión de modelos para todo el lote
+
+    # --- PASO B: Una sola pasada de AMBOS modelos sobre toda la matriz ---
+    # (solo las filas que no están en la caché de predicciones)
+    with etapa("features"):
+        input_final = preparar_features(modelo, validos)
+    with etapa("modelo"):
+        predicciones, probabilidades, salida_tipo = await evaluar_matriz(modelo, input_final)
+
+    # --- PASO C: Armar la respuesta y las filas de cada lectura ---
+    respuestas = []
+    elementos = []
+    with etapa("interpretacion"):
+        for k, datos in enumerate(validos):
+            respuesta, detalles_falla_dict = interpretar_prediccion(
+                modelo, predicciones[k], probabilidades[k], salida_tipo[k]
+            )
+            respuestas.append(respuesta)
+            elementos.append((fila_lectura(datos, detalles_falla_dict, modelo.version), detalles_falla_dict))
+
+    # --- PASO D: Insertar todas las lecturas en bloque (una transacción) ---
+    with etapa("guardado"):
+        reading_ids = await guardar_lecturas(db, elementos)
+
+    for k, indice in enumerate(indices_validos):
+        resultados[indice].resultado = schemas.PrediccionResponse(**respuestas[k], reading_saved_id=reading_ids[k])
+
+    return resultados
+
+def _resumen_lote(resultados):
+    exitosas = sum(1 for item in resultados if item.error is None)
+    return {
+        "total": len(resultados),
+        "exitosas": exitosas,
+        "fallidas": len(resultados) - exitosas,
+        "resultados": resultados,
+    }
+
+# 9. Ingesta continua (WebSocket y NDJSON)
+#    Para gateways que mantienen la conexión abierta y mandan lecturas cada
+#    pocos cientos de ms: un mensaje por lectura (DatosMaquinaPrediccion) y un
+#    veredicto por mensaje (PrediccionFlujoItem). Las lecturas se agrupan en
+#    ventanas (ver config.FLUJO_*): cada ventana es UNA evaluación de los
+#    modelos y UNA escritura, igual que /predecir/lote.
+async def predecir_ventana_flujo(lecturas):
+    # Una sesión de BD por ventana: una conexión larga no retiene el pool
+    async with AsyncSessionLocal() as db:
+        return await predecir_lecturas(db, lecturas)
+
+ingesta_flujo = IngestaFlujo(
+    predecir_ventana_flujo,
+    max_ventana=config.FLUJO_MAX_VENTANA,
+    max_espera_ms=config.FLUJO_MAX_ESPERA_MS,
+    max_pendientes=config.FLUJO_MAX_PENDIENTES,
+    timeout_envio_s=config.FLUJO_TIMEOUT_ENVIO_S,
+)
+
+@app.websocket("/predecir/ws")
+async def predecir_flujo_websocket(websocket: WebSocket):
+    """
+    Un mensaje de texto (JSON de DatosMaquinaPrediccion) por lectura; se
+    responde un mensaje de texto (JSON de PrediccionFlujoItem) por lectura.
+    """
+    await websocket.accept()
+    if gestor_modelos.actual is None:
+        await websocket.close(code=1013, reason="Modelos no cargados.")  # 1013 = Try Again Later
+        return
+
+    conectado = True
+    try:
+        async for ventana in ingesta_flujo.veredictos(websocket.iter_text()):
+            if not conectado:
+                continue  # Lo ya recibido se termina de guardar aunque el cliente se haya ido
+            try:
+                for veredicto in ventana:
+                    await asyncio.wait_for(websocket.send_text(veredicto.model_dump_json()), ingesta_flujo.timeout_envio)
+            except asyncio.TimeoutError:
+                raise ConsumidorLento("El cliente no leyó los veredictos a tiempo; se cierra la sesión.")
+            except Exception:
+                conectado = False
+    except ConsumidorLento as e:
+        await websocket.close(code=1008, reason=str(e)[:120])  # 1008 = Policy Violation
+        return
+    if conectado:
+        await websocket.close()
+
+class RespuestaFlujo(StreamingResponse):
+    """
+    StreamingResponse que NO escucha la desconexión del cliente con
+    receive(): el cuerpo de la petición se sigue leyendo MIENTRAS se responde
+    (request.stream() ya detecta la desconexión).
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/predecir/flujo", response_class=RespuestaFlujo)
+async def predecir_flujo_ndjson(request: Request):
+    """
+    Alternativa HTTP a /predecir/ws: cuerpo chunked en NDJSON (una lectura
+    por línea) y respuesta NDJSON con un veredicto por línea, que empieza a
+    llegar mientras el cliente sigue enviando. El cliente debe ir leyendo la
+    respuesta: si deja de hacerlo, el servidor deja de leer el cuerpo.
+    """
+    verificar_modelos_cargados()
+
+    async def lineas():
+        resto = b""
+        async for trozo in request.stream():
+            resto += trozo
+            *completas, resto = resto.split(b"\n")
+            for linea in completas:
+                if linea.strip():
+                    yield linea
+        if resto.strip():
+            yield resto
+
+    async def respuesta():
+        try:
+            async for ventana in ingesta_flujo.veredictos(lineas()):
+                yield "".join(veredicto.model_dump_json() + "\n" for veredicto in ventana)
+        except ConsumidorLento as e:
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return RespuestaFlujo(respuesta(), media_type="application/x-ndjson")
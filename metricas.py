@@ -0,0 +1,306 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+from fastapi.routing import APIRoute
+
+# =====================================================
+#  Métricas en formato Prometheus (/metrics)
+# =====================================================
+# Histogramas, contadores y gauges mínimos (sin dependencias) con salida en
+# el formato de texto de Prometheus. Observar un valor es una búsqueda
+# binaria en los límites de los buckets y unas sumas: se puede dejar
+# siempre encendido.
+#
+# Tiempos por etapa: MiddlewareMetricas abre una Medicion por petición (en un
+# ContextVar) y cada 'with etapa("nombre"):' del handler le suma su tiempo.
+# Cada proceso (worker) exporta sus propias métricas; Prometheus las agrega.
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _etiquetas(nombres, valores, extra=""):
+    pares = [f'{nombre}="{str(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}  # tupla de valores de etiquetas -> estado de la serie
+        self._lock = threading.Lock()  # El escritor diferido y el importador observan desde hilos
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            series = list(self._series.items())
+        for valores, estado in sorted(series, key=lambda s: s[0]):
+            lineas.extend(self._lineas_serie(valores, estado))
+        return lineas
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, *valores):
+        with self._lock:
+            self._series[valores] = self._series.get(valores, 0) + cantidad
+
+    def _lineas_serie(self, valores, total):
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}"]
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def sumar(self, cantidad, *valores):
+        with self._lock:
+            self._series[valores] = self._series.get(valores, 0) + cantidad
+
+    def _lineas_serie(self, valores, valor):
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {valor}"]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, *valores):
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                # [conteos por bucket (no acumulados) ..., +Inf], suma
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += valor
+
+    def _lineas_serie(self, valores, serie):
+        conteos, suma = serie
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+            acumulado += conteo
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            etiquetas = _etiquetas(self.etiquetas, valores, 'le="' + le + '"')
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+        lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {suma}")
+        lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}")
+        return lineas
+
+
+# --- Métricas de la API ---
+PETICIONES = Histograma(
+    "api_peticion_segundos", "Duración de las peticiones HTTP (hasta enviar la respuesta).",
+    ("metodo", "ruta", "estado"),
+)
+ETAPAS = Histograma(
+    "api_etapa_segundos",
+    "Tiempo por etapa dentro de una petición. 'bd' es la suma de las sentencias SQL y se superpone con las demás.",
+    ("ruta", "etapa"),
+)
+EN_CURSO = Gauge("api_peticiones_en_curso", "Peticiones HTTP en proceso en este worker.")
+ESPERA_POOL = Histograma(
+    "bd_pool_espera_segundos", "Espera para obtener una conexión del pool (incluye abrirla si hace falta).",
+    ("engine",),
+)
+LLAMADAS_MODELO = Contador(
+    "modelo_llamadas_total", "Evaluaciones de los modelos (cada una evalúa ambos bosques sobre una matriz).",
+    ("version", "via"),
+)
+FILAS_MODELO = Contador("modelo_filas_total", "Filas evaluadas por los modelos.", ("version", "via"))
+CACHE_PREDICCIONES = Contador(
+    "cache_predicciones_total", "Búsquedas en la caché de predicciones por vector de features.", ("resultado",)
+)
+
+ESCRITURA_DIFERIDA = Contador(
+    "escritura_diferida_lecturas_total",
+    "Lecturas de la escritura diferida por resultado (escrita, sincrona, rechazada, pendiente = al archivo de pendientes).",
+    ("resultado",),
+)
+ESCRITURA_DIFERIDA_ERRORES = Contador(
+    "escritura_diferida_errores_total", "Intentos fallidos de escribir un lote diferido.", ("tipo",)
+)
+
+REGISTRO = [PETICIONES, ETAPAS, EN_CURSO, ESPERA_POOL, LLAMADAS_MODELO, FILAS_MODELO, CACHE_PREDICCIONES,
+            ESCRITURA_DIFERIDA, ESCRITURA_DIFERIDA_ERRORES]
+
+
+def exponer():
+    """Todas las métricas en el formato de texto de Prometheus (text/plain; version=0.0.4)."""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+# =====================================================
+#  Medición por petición (etapas)
+# =====================================================
+
+class Medicion:
+    """Tiempos de UNA petición: etapas en orden de aparición (nombre -> segundos)."""
+    __slots__ = ("inicio", "entrada", "salida", "etapas")
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.entrada = None  # Entrada al handler (fin de la validación y dependencias)
+        self.salida = None   # Salida del handler (empieza la serialización)
+        self.etapas = {}
+
+    def sumar(self, nombre, segundos):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + segundos
+
+
+_medicion_actual = contextvars.ContextVar("medicion_actual", default=None)
+
+
+class etapa:
+    """
+    'with etapa("modelo"): ...' suma el tiempo del bloque a la etapa de la
+    petición en curso. Fuera de una petición (scripts, hilos) no hace nada.
+    """
+    __slots__ = ("nombre", "medicion", "inicio")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.medicion = _medicion_actual.get()
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.medicion is not None:
+            self.medicion.sumar(self.nombre, time.perf_counter() - self.inicio)
+
+
+def sumar_etapa(nombre, segundos):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.sumar(nombre, segundos)
+
+
+def marcar_entrada():
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.entrada = time.perf_counter()
+
+
+def marcar_salida():
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.salida = time.perf_counter()
+
+
+def contar_evaluacion(version, via, filas):
+    """Cuenta una evaluación de los modelos. via: 'directa', 'microlote', 'lote'."""
+    version = version or "sin_version"
+    LLAMADAS_MODELO.inc(1, version, via)
+    FILAS_MODELO.inc(filas, version, via)
+
+
+def contar_llamadas(funcion, version, via):
+    """Envuelve una función de evaluación (ej: EvaluadorPlano.evaluar) para contarla en cada llamada."""
+    def evaluar(X):
+        contar_evaluacion(version, via, len(X))
+        return funcion(X)
+    return evaluar
+
+
+def _medir_endpoint(endpoint):
+    """Envuelve el endpoint para marcar la entrada y la salida del handler (conserva la firma)."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def medido(*args, **kwargs):
+            marcar_entrada()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                marcar_salida()
+    else:
+        @functools.wraps(endpoint)
+        def medido(*args, **kwargs):
+            marcar_entrada()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                marcar_salida()
+    return medido
+
+
+class RutaMedida(APIRoute):
+    """route_class de los routers: separa validación, handler y serialización en las etapas."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _medir_endpoint(endpoint), **kwargs)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: mide cada petición HTTP, reparte su tiempo en etapas y
+    (con header_etapas=True) agrega el header Server-Timing con las etapas,
+    visible en las herramientas de desarrollo del navegador.
+
+    Etapas comunes a todas las rutas:
+      validacion   inicio -> entrada al handler (lectura del cuerpo, Pydantic, dependencias)
+      handler      tiempo dentro de la función del endpoint
+      respuesta    salida del handler -> inicio de la respuesta (serialización)
+    más las que el handler marque con etapa(...) y 'bd' (sentencias SQL).
+    """
+
+    def __init__(self, app, header_etapas=False):
+        self.app = app
+        self.header_etapas = header_etapas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        estado = [500]
+        EN_CURSO.sumar(1)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+                self._cerrar_etapas(medicion, time.perf_counter())
+                if self.header_etapas:
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"server-timing", _server_timing(medicion))]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            EN_CURSO.sumar(-1)
+            _medicion_actual.reset(token)
+            ruta = scope["route"].path if "route" in scope else "sin_ruta"
+            PETICIONES.observar(time.perf_counter() - medicion.inicio, scope["method"], ruta, estado[0])
+            for nombre, segundos in medicion.etapas.items():
+                ETAPAS.observar(segundos, ruta, nombre)
+
+    @staticmethod
+    def _cerrar_etapas(medicion, inicio_respuesta):
+        if medicion.entrada is None:
+            return  # No llegó al handler (404, 422 de validación...)
+        medicion.etapas["validacion"] = medicion.entrada - medicion.inicio
+        if medicion.salida is not None:
+            medicion.etapas["handler"] = medicion.salida - medicion.entrada
+            medicion.etapas["respuesta"] = inicio_respuesta - medicion.salida
+
+
+def _server_timing(medicion):
+    return ", ".join(f"{nombre};dur={segundos * 1000:.3f}" for nombre, segundos in medicion.etapas.items()).encode()
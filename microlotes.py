@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import anyio
+import numpy as np
+
+# =====================================================
+#  Micro-lotes: agrupar peticiones concurrentes
+# =====================================================
+# Cuando llegan muchas llamadas a /predecir en los mismos milisegundos, cada
+# una evaluaría los modelos con una sola fila. El AgrupadorPredicciones las
+# encola, junta hasta 'max_lote' filas (o lo que llegue en 'max_espera_ms')
+# y hace UNA sola llamada al modelo; cada petición recibe su propia fila.
+
+
+class AgrupadorPredicciones:
+    """
+    Cola asíncrona que agrupa filas de features en una sola evaluación.
+
+    'funcion_lote' recibe una matriz (n_filas, n_columnas) y retorna una tupla
+    de arrays cuya primera dimensión es n_filas (ej: EvaluadorPlano.evaluar).
+    Se ejecuta en un hilo de trabajo para no bloquear el event loop.
+    """
+
+    def __init__(self, funcion_lote, max_lote=64, max_espera_ms=2.0):
+        self.funcion_lote = funcion_lote
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+        self._cola = None
+        self._tarea = None
+        self._lote_en_curso = None  # Filas ya sacadas de la cola y todavía sin respuesta
+        self._deteniendo = False  # Desde que empieza detener(): las filas nuevas se evalúan directo
+        self._reiniciar_estadisticas()
+
+    def _reiniciar_estadisticas(self):
+        self._lotes = 0
+        self._peticiones = 0
+        self._tamano_max = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done() and not self._deteniendo
+
+    async def iniciar(self):
+        self._deteniendo = False
+        self._cola = asyncio.Queue()
+        self._tarea = asyncio.create_task(self._procesar())
+
+    async def detener(self, vaciar=False):
+        """
+        Detiene el agrupador. Con vaciar=True primero espera a que se evalúen
+        las filas ya encoladas (ej: al reemplazar los modelos en caliente).
+        Desde que empieza, predecir() ya no encola: evalúa la fila directo.
+        """
+        if self._tarea is None:
+            return
+        self._deteniendo = True
+        while vaciar and not self._tarea.done() and (not self._cola.empty() or self._lote_en_curso):
+            await asyncio.sleep(self.max_espera or 0.001)
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+        # Las peticiones que quedaron en la cola (o en un lote a medio juntar)
+        # no deben quedar colgadas: se evalúan en un último lote
+        pendientes = [p for p in (self._lote_en_curso or []) if not p[1].done()]
+        self._lote_en_curso = None
+        while not self._cola.empty():
+            pendientes.append(self._cola.get_nowait())
+        if pendientes:
+            await self._evaluar_lote(pendientes)
+
+    async def predecir(self, fila):
+        """Encola UNA fila de features y espera su resultado (tupla de valores por fila)."""
+        if not self.activo:
+            # Detenido o deteniéndose: una sola fila se evalúa directo (décimas de ms)
+            salidas = self.funcion_lote(fila[np.newaxis])
+            return tuple(salida[0] for salida in salidas)
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((fila, futuro, time.perf_counter()))
+        return await futuro
+
+    async def _procesar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = self._lote_en_curso = [await self._cola.get()]
+            limite = loop.time() + self.max_espera
+
+            while len(lote) < self.max_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._evaluar_lote(lote)
+            self._lote_en_curso = None
+
+    async def _evaluar_lote(self, lote):
+        inicio = time.perf_counter()
+        for _, _, encolado in lote:
+            espera = inicio - encolado
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        self._lotes += 1
+        self._peticiones += len(lote)
+        self._tamano_max = max(self._tamano_max, len(lote))
+
+        try:
+            X = np.stack([fila for fila, _, _ in lote])
+            salidas = await anyio.to_thread.run_sync(self.funcion_lote, X)
+        except Exception as e:
+            for _, futuro, _ in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        for i, (_, futuro, _) in enumerate(lote):
+            if not futuro.done():  # El cliente pudo haber cancelado la petición
+                futuro.set_result(tuple(salida[i] for salida in salidas))
+
+    def estadisticas(self):
+        return {
+            "activo": self.activo,
+            "max_lote": self.max_lote,
+            "max_espera_ms": self.max_espera * 1000,
+            "lotes": self._lotes,
+            "peticiones": self._peticiones,
+            "tamano_medio_lote": self._peticiones / self._lotes if self._lotes else 0.0,
+            "tamano_max_lote": self._tamano_max,
+            "espera_media_ms": self._espera_total / self._peticiones * 1000 if self._peticiones else 0.0,
+            "espera_max_ms": self._espera_max * 1000,
+            "en_cola": self._cola.qsize() if self._cola is not None else 0,
+        }
@@ -0,0 +1,96 @@
+import argparse
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+import agregados
+import models
+import particiones
+from database import Base, engine
+
+# ================================
+#  Migraciones del esquema
+# ================================
+# create_all() solo crea las tablas que NO existen; no agrega índices ni
+# columnas nuevas a tablas ya creadas. Aquí van esos pasos, todos idempotentes
+# (se pueden correr las veces que sea sin efecto si ya están aplicados).
+#
+# La API NO crea el esquema al arrancar (varios workers haciendo DDL a la vez,
+# y un arranque que falla si la BD tarda en responder): se crea con
+#   python migraciones.py
+# en cada despliegue, antes de levantar la API. Para desarrollo y benchmarks
+# sobre una BD desechable, ESQUEMA_AL_ARRANCAR=1 hace que la API lo cree.
+
+def agregar_columnas_faltantes(bind):
+    """
+    Agrega (ALTER TABLE ... ADD COLUMN) las columnas declaradas en models.py
+    que no existan en tablas ya creadas. Solo columnas que admiten NULL.
+    """
+    inspector = inspect(bind)
+    tablas_existentes = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for tabla in Base.metadata.sorted_tables:
+            if tabla.name not in tablas_existentes:
+                continue
+            existentes = {columna["name"] for columna in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in existentes:
+                    continue
+                definicion = CreateColumn(columna).compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {tabla.name} ADD COLUMN {definicion}")
+                print(f"Migración: columna {tabla.name}.{columna.name} agregada.")
+
+def crear_indices_faltantes(bind):
+    """Crea los índices declarados en models.py que todavía no existan en la BD."""
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(bind=bind, checkfirst=True)
+
+def migrar_failure_types(bind):
+    """
+    Pasa los detalles de falla de la tabla failure_types (una fila por lectura
+    con falla) al bitmask machine_readings.failure_flags, con su failure_id en
+    legacy_failure_id, y borra la tabla. Las lecturas que ya tienen
+    failure_flags no se tocan.
+    """
+    if "failure_types" not in inspect(bind).get_table_names():
+        return
+    bits = " + ".join(
+        f"CASE WHEN f.{nombre} THEN {bit} ELSE 0 END" for nombre, bit in models.FAILURE_FLAGS.items()
+    )
+    with bind.begin() as conn:
+        # UPDATE ... FROM: Postgres y SQLite >= 3.33
+        migradas = conn.exec_driver_sql(
+            f"UPDATE machine_readings SET failure_flags = {bits}, legacy_failure_id = f.failure_id FROM failure_types f "
+            f"WHERE f.reading_id = machine_readings.reading_id AND machine_readings.failure_flags IS NULL"
+        ).rowcount
+        conn.exec_driver_sql("DROP TABLE failure_types")
+    print(f"Migración: {migradas} detalles de falla de failure_types pasados a machine_readings.failure_flags.")
+
+def aplicar_migraciones(bind=engine):
+    agregar_columnas_faltantes(bind)
+    crear_indices_faltantes(bind)
+    migrar_failure_types(bind)
+    # Con machine_readings particionada: las particiones de los meses que vienen
+    particiones.asegurar_particiones(bind)
+
+def crear_esquema(bind=engine):
+    """Tablas que falten + migraciones: lo que hace 'python migraciones.py'."""
+    agregados_nuevos = models.MachineRollupHourly.__tablename__ not in inspect(bind).get_table_names()
+    models.Base.metadata.create_all(bind=bind)
+    aplicar_migraciones(bind)
+    if agregados_nuevos:
+        # Tablas de agregados recién creadas: se llenan con el historial que ya exista
+        agregados.reconstruir(bind, reportar=lambda texto: print(f"Migración: {texto}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea o actualiza el esquema de la BD.")
+    parser.add_argument("--particionar", action="store_true",
+                        help="Postgres: convierte machine_readings en una tabla particionada por mes (ver particiones.py)")
+    args = parser.parse_args()
+
+    crear_esquema(engine)
+    if args.particionar:
+        particiones.particionar_lecturas(engine)
+    print("Esquema creado / actualizado.")
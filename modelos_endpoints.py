@@ -0,0 +1,72 @@
+from fastapi import APIRouter, HTTPException
+
+from registro_modelos import VersionNoEncontrada, gestor_modelos
+from metricas import RutaMedida
+
+# Administración del registro de modelos (registro_modelos.py)
+router = APIRouter(
+    prefix="/api/modelos",
+    tags=["Administración de Modelos"],
+    route_class=RutaMedida,  # Tiempos por etapa (metricas.py)
+)
+
+# ================================
+# Versiones de modelos
+# ================================
+# Activar o volver atrás cambia el puntero del registro (compartido por todos
+# los workers) y recarga este worker en el momento; los demás lo toman en su
+# próxima revisión (config.MODELOS_INTERVALO_RECARGA_S).
+
+def _estado_registro():
+    registro = gestor_modelos.registro
+    activa = registro.version_activa()
+    en_servicio = gestor_modelos.actual.version if gestor_modelos.actual else None
+    return {
+        **gestor_modelos.estado(),
+        "versiones": [
+            {
+                **registro.metadata(version),
+                "activa": version == activa,
+                "en_servicio": version == en_servicio,
+            }
+            for version in reversed(registro.versiones())  # La más nueva primero
+        ],
+    }
+
+async def _recargar():
+    try:
+        await gestor_modelos.recargar()
+    except Exception as e:
+        # El puntero ya cambió, pero este worker sigue con la versión anterior
+        raise HTTPException(status_code=500, detail=f"No se pudo cargar la versión: {type(e).__name__}: {e}")
+
+@router.get("/")
+def listar_versiones():
+    """
+    Lista las versiones publicadas por entrenar.py (con su metadata), cuál es
+    la activa en el registro y cuál está sirviendo este worker.
+    """
+    return _estado_registro()
+
+@router.post("/{version}/activar")
+async def activar_version(version: str):
+    """
+    Pone 'version' en servicio. La versión se carga y se calienta en segundo
+    plano; las predicciones no se interrumpen durante el cambio.
+    """
+    try:
+        gestor_modelos.registro.activar(version)
+    except VersionNoEncontrada as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await _recargar()
+    return _estado_registro()
+
+@router.post("/rollback")
+async def rollback_version():
+    """Vuelve a la versión que estaba activa antes de la actual."""
+    try:
+        gestor_modelos.registro.rollback()
+    except VersionNoEncontrada as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await _recargar()
+    return _estado_registro()
@@ -1,7 +1,46 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Numeric, Boolean, DateTime, ForeignKey, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import create_engine, Column, Integer, SmallInteger, String, Text, Numeric, Boolean, DateTime, Float, ForeignKey, Index, and_, func, text
+from sqlalchemy.orm import declared_attr, relationship
+from datetime import datetime
 from database import Base  # Importamos la Base de database.py
 
+# ==========================================
+#  Tipos de falla: bits de failure_flags
+# ==========================================
+# Los tipos de falla de una lectura van en machine_readings.failure_flags,
+# un bit por tipo (antes: una fila aparte en failure_types por cada falla).
+# NULL = la lectura no tiene detalle de falla.
+FAILURE_FLAGS = {"twf": 1, "hdf": 2, "pwf": 4, "osf": 8, "rnf": 16}
+
+def encode_failure_flags(details):
+    """Bitmask de un dict {'twf': bool, ...} (None si no hay detalle)."""
+    if details is None:
+        return None
+    return sum(bit for name, bit in FAILURE_FLAGS.items() if details.get(name))
+
+def decode_failure_flags(flags):
+    """{'twf': bool, ...} de un bitmask."""
+    return {name: bool(flags & bit) for name, bit in FAILURE_FLAGS.items()}
+
+def has_failure_type(column, name):
+    """
+    Condición SQL 'la lectura tiene el tipo de falla name'. Incluye
+    failure_flags <> 0 para que la BD use el índice parcial de fallas.
+    """
+    return and_(column != 0, column.bitwise_and(FAILURE_FLAGS[name]) != 0)
+
+class FailureDetails:
+    """
+    Detalle de falla de una lectura (lo que antes era una fila de
+    failure_types). El failure_id es el reading_id (la relación es 1 a 1),
+    salvo en las fallas migradas de failure_types, que conservan su id.
+    """
+
+    def __init__(self, reading_id, flags, legacy_failure_id=None):
+        self.failure_id = legacy_failure_id if legacy_failure_id is not None else reading_id
+        self.reading_id = reading_id
+        for name, value in decode_failure_flags(flags).items():
+            setattr(self, name, value)
+
 # ================================
 #  TABLA: machines (máquinas)
 # ================================
@@ -12,15 +51,43 @@ class Machine(Base):
     type = Column(String(50), nullable=False)
     location = Column(String(100))
     description = Column(Text, nullable=True)
+    # Identificador de producto del historial de sensores (ej: 'M14860' en el CSV)
+    product_id = Column(String(50), nullable=True, unique=True, index=True)
 
     # RELACIÓN: Una máquina tiene muchas lecturas
-    readings = relationship("MachineReading", back_populates="machine")
+    # passive_deletes: el ON DELETE CASCADE de la BD borra las lecturas; el ORM
+    # no necesita cargarlas (ni intentar poner su machine_id en NULL) al borrar.
+    readings = relationship("MachineReading", back_populates="machine", passive_deletes=True)
 
 # =============================================
 #  TABLA: machine_readings (lecturas de sensores)
 # =============================================
 class MachineReading(Base):
     __tablename__ = "machine_readings"
+    __table_args__ = (
+        # Índice para la paginación por cursor (machine_id, timestamp, reading_id)
+        # y los filtros por rango de tiempo de las lecturas de una máquina
+        Index("ix_machine_readings_machine_ts_id", "machine_id", "timestamp", "reading_id"),
+        # Rangos de tiempo de todas las máquinas: retención y exportación
+        Index("ix_machine_readings_timestamp", "timestamp"),
+        # Solo las lecturas con algún tipo de falla (una fracción mínima de la
+        # tabla): "todas las HDF de un rango de tiempo" es un recorrido de este índice
+        Index(
+            "ix_machine_readings_failures", "timestamp", "failure_flags",
+            postgresql_where=text("failure_flags <> 0"), sqlite_where=text("failure_flags <> 0"),
+        ),
+        # Todas las lecturas con machine_failure, tengan o no tipos (failure_flags
+        # en 0 o NULL): el listado de /failures/ sin filtro de tipo
+        Index(
+            "ix_machine_readings_machine_failure", "timestamp",
+            postgresql_where=text("machine_failure"), sqlite_where=text("machine_failure = 1"),
+        ),
+        # failure_id de las fallas migradas de failure_types (solo esas filas)
+        Index(
+            "ix_machine_readings_legacy_failure", "legacy_failure_id",
+            postgresql_where=text("legacy_failure_id IS NOT NULL"), sqlite_where=text("legacy_failure_id IS NOT NULL"),
+        ),
+    )
 
     reading_id = Column(Integer, primary_key=True, index=True)
     
@@ -33,30 +100,130 @@ class MachineReading(Base):
     torque = Column(Numeric(6, 2))
     tool_wear = Column(Integer)
     machine_failure = Column(Boolean, default=False)
-    timestamp = Column(DateTime, default=func.now()) # func.now() es el CURRENT_TIMESTAMP
+    # Hora de la API (con microsegundos) al insertar; server_default cubre las cargas directas en la BD
+    timestamp = Column(DateTime, default=datetime.now, server_default=func.now())
+    # Versión del registro de modelos que produjo la predicción (NULL si no vino de un modelo)
+    model_version = Column(String(50), nullable=True)
+    # Tipos de falla (bits de FAILURE_FLAGS); NULL si la lectura no tiene detalle de falla
+    failure_flags = Column(SmallInteger, nullable=True)
+    # failure_types.failure_id que tenía la falla antes de migrar a failure_flags
+    # (NULL en las lecturas posteriores): los clientes que lo guardaron lo siguen usando
+    legacy_failure_id = Column(Integer, nullable=True)
 
     # RELACIÓN: Esta lectura pertenece a una máquina
     machine = relationship("Machine", back_populates="readings")
     
-    # RELACIÓN: Esta lectura puede tener UN detalle de falla
-    failure_details = relationship("FailureType", back_populates="reading", uselist=False) # uselist=False = Uno-a-Uno
+    # Detalle de falla (el schema FailureTypeResponse), armado desde failure_flags: sin join ni segunda consulta
+    @property
+    def failure_details(self):
+        if self.failure_flags is None:
+            return None
+        return FailureDetails(self.reading_id, self.failure_flags, self.legacy_failure_id)
 
-# ====================================
-#  TABLA: failure_types (tipos de fallas)
-# ====================================
-class FailureType(Base):
-    __tablename__ = "failure_types"
+# ==========================================================
+#  TABLA: machine_readings_hourly (lecturas resumidas por hora)
+# ==========================================================
+# Nivel "frío" del historial: la retención (retencion.py) reemplaza las
+# lecturas más viejas que RETENCION_DIAS por un resumen por máquina y hora.
+class MachineReadingHourly(Base):
+    __tablename__ = "machine_readings_hourly"
 
-    failure_id = Column(Integer, primary_key=True, index=True)
-    
-    # Llave foránea que apunta a la tabla 'machine_readings'
-    reading_id = Column(Integer, ForeignKey("machine_readings.reading_id", ondelete="CASCADE"), nullable=False, unique=True) # unique=True para relación 1-a-1
-    
-    twf = Column(Boolean, default=False) # Tool Wear Failure
-    hdf = Column(Boolean, default=False) # Hydraulic Failure
-    pwf = Column(Boolean, default=False) # Power Failure
-    osf = Column(Boolean, default=False) # Overstrain Failure
-    rnf = Column(Boolean, default=False) # Random Failure
-
-    # RELACIÓN: Este detalle de falla pertenece a UNA lectura
-    reading = relationship("MachineReading", back_populates="failure_details")
+    machine_id = Column(Integer, ForeignKey("machines.machine_id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # Inicio de la hora
+    reading_count = Column(Integer, nullable=False)
+
+    air_temperature_min = Column(Float)
+    air_temperature_avg = Column(Float)
+    air_temperature_max = Column(Float)
+    process_temperature_min = Column(Float)
+    process_temperature_avg = Column(Float)
+    process_temperature_max = Column(Float)
+    rotational_speed_min = Column(Float)
+    rotational_speed_avg = Column(Float)
+    rotational_speed_max = Column(Float)
+    torque_min = Column(Float)
+    torque_avg = Column(Float)
+    torque_max = Column(Float)
+    tool_wear_min = Column(Float)
+    tool_wear_avg = Column(Float)
+    tool_wear_max = Column(Float)
+
+    # Cantidad de lecturas con falla, en total y por tipo
+    failure_count = Column(Integer, nullable=False, default=0)
+    twf_count = Column(Integer, nullable=False, default=0)
+    hdf_count = Column(Integer, nullable=False, default=0)
+    pwf_count = Column(Integer, nullable=False, default=0)
+    osf_count = Column(Integer, nullable=False, default=0)
+    rnf_count = Column(Integer, nullable=False, default=0)
+
+# ==========================================================
+#  TABLAS: machine_rollups_hourly / machine_rollups_daily
+# ==========================================================
+# Agregados por máquina y hora / día de TODO el historial (lecturas crudas y
+# las ya resumidas por la retención), para la analítica de la flota
+# (agregados.py). Se actualizan al escribir cada lectura. Se guardan sumas
+# (no promedios) para poder reagrupar por Type, ubicación o semana.
+class RollupColumns:
+    @declared_attr
+    def machine_id(cls):
+        return Column(Integer, ForeignKey("machines.machine_id", ondelete="CASCADE"), primary_key=True)
+
+    bucket = Column(DateTime, primary_key=True)  # Inicio de la hora / del día
+    reading_count = Column(Integer, nullable=False, default=0)
+
+    failure_count = Column(Integer, nullable=False, default=0)
+    twf_count = Column(Integer, nullable=False, default=0)
+    hdf_count = Column(Integer, nullable=False, default=0)
+    pwf_count = Column(Integer, nullable=False, default=0)
+    osf_count = Column(Integer, nullable=False, default=0)
+    rnf_count = Column(Integer, nullable=False, default=0)
+
+    air_temperature_sum = Column(Float)
+    air_temperature_min = Column(Float)
+    air_temperature_max = Column(Float)
+    process_temperature_sum = Column(Float)
+    process_temperature_min = Column(Float)
+    process_temperature_max = Column(Float)
+    rotational_speed_sum = Column(Float)
+    rotational_speed_min = Column(Float)
+    rotational_speed_max = Column(Float)
+    torque_sum = Column(Float)
+    torque_min = Column(Float)
+    torque_max = Column(Float)
+    tool_wear_sum = Column(Float)
+    tool_wear_min = Column(Float)
+    tool_wear_max = Column(Float)
+
+class MachineRollupHourly(RollupColumns, Base):
+    __tablename__ = "machine_rollups_hourly"
+    # Consultas de toda la flota por rango de tiempo
+    __table_args__ = (Index("ix_machine_rollups_hourly_bucket", "bucket"),)
+
+class MachineRollupDaily(RollupColumns, Base):
+    __tablename__ = "machine_rollups_daily"
+    __table_args__ = (Index("ix_machine_rollups_daily_bucket", "bucket"),)
+
+# Deltas por hora de las peticiones, insertados en la misma transacción que
+# sus lecturas y sumados a los agregados cada AGREGADOS_INTERVALO_S
+# (agregados.AcumuladorAgregados). Solo INSERTs: no bloquean filas.
+class MachineRollupDelta(RollupColumns, Base):
+    __tablename__ = "machine_rollup_deltas"
+    __table_args__ = (Index("ix_machine_rollup_deltas_machine_bucket", "machine_id", "bucket"),)
+
+    delta_id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.machine_id", ondelete="CASCADE"), nullable=False)
+    bucket = Column(DateTime, nullable=False)  # Inicio de la hora
+
+# ==========================================================
+#  TABLA: machine_stats (estadísticas en línea por máquina)
+# ==========================================================
+# Checkpoint de estadisticas_maquinas.py: media/varianza, mín/máx e
+# histograma de cada sensor de todas las lecturas de la máquina.
+class MachineStats(Base):
+    __tablename__ = "machine_stats"
+
+    machine_id = Column(Integer, ForeignKey("machines.machine_id", ondelete="CASCADE"), primary_key=True)
+    reading_count = Column(Integer, nullable=False, default=0)
+    failure_count = Column(Integer, nullable=False, default=0)
+    state = Column(Text, nullable=False)  # JSON de EstadisticasSensores.a_dict()
+    updated_at = Column(DateTime, default=datetime.now)
@@ -0,0 +1,180 @@
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import models
+
+# =====================================================
+#  Particionado mensual de machine_readings (Postgres)
+# =====================================================
+# machine_readings crece millones de filas por mes. Particionada por rango
+# de 'timestamp' (una partición por mes), las consultas por rango de fechas
+# solo leen los meses que tocan y la retención (retencion.py) descarta un mes
+# entero con DROP TABLE en vez de borrar fila por fila.
+#
+#   machine_readings               tabla particionada (PK: reading_id, timestamp)
+#     machine_readings_p2026_01    [2026-01-01, 2026-02-01)
+#     machine_readings_p2026_02    ...
+#     machine_readings_default     lo que no cae en ningún mes creado (ej: importaciones viejas)
+#
+# Ninguna tabla tiene FK hacia machine_readings (Postgres no la permite hacia
+# una tabla particionada salvo que incluya la llave de partición): los tipos
+# de falla viven en la misma fila (failure_flags, ver models.py).
+#
+# Uso: python migraciones.py --particionar   (una vez; copia las lecturas existentes)
+# Después, aplicar_migraciones() (python migraciones.py en cada despliegue) y
+# el job de retención crean los meses que vienen.
+
+TABLA = "machine_readings"
+PARTICION_DEFAULT = f"{TABLA}_default"
+PATRON_PARTICION = re.compile(rf"^{TABLA}_p(\d{{4}})_(\d{{2}})$")
+MESES_ADELANTE = 3
+
+
+def es_postgres(bind):
+    return bind.dialect.name == "postgresql"
+
+
+def esta_particionada(conn):
+    """True si machine_readings ya es una tabla particionada (siempre False fuera de Postgres)."""
+    if not es_postgres(conn):
+        return False
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :tabla AND pg_table_is_visible(c.oid))"
+    ), {"tabla": TABLA}).scalar())
+
+
+def inicio_mes(fecha):
+    return datetime(fecha.year, fecha.month, 1)
+
+
+def mes_siguiente(mes):
+    return datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def nombre_particion(mes):
+    return f"{TABLA}_p{mes.year:04d}_{mes.month:02d}"
+
+
+def particiones_mensuales(conn):
+    """[(mes, nombre)] de las particiones mensuales existentes, de la más vieja a la más nueva."""
+    nombres = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :tabla"
+    ), {"tabla": TABLA}).scalars().all()
+    particiones = []
+    for nombre in nombres:
+        coincidencia = PATRON_PARTICION.match(nombre)
+        if coincidencia:
+            particiones.append((datetime(int(coincidencia[1]), int(coincidencia[2]), 1), nombre))
+    return sorted(particiones)
+
+
+def crear_particion(conn, mes):
+    """
+    Crea la partición del mes 'mes' si no existe. Las lecturas de ese mes que
+    hayan caído en la partición default se mueven a la nueva (si no, Postgres
+    rechaza el CREATE). Retorna True si la creó.
+    """
+    nombre = nombre_particion(mes)
+    if conn.execute(text("SELECT to_regclass(:nombre)"), {"nombre": nombre}).scalar() is not None:
+        return False
+    desde, hasta = mes, mes_siguiente(mes)
+    rango = {"desde": desde, "hasta": hasta}
+    hay_default = conn.execute(text("SELECT to_regclass(:nombre)"), {"nombre": PARTICION_DEFAULT}).scalar() is not None
+
+    if hay_default:
+        conn.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {PARTICION_DEFAULT}"))
+    conn.execute(text(
+        f"CREATE TABLE {nombre} PARTITION OF {TABLA} "
+        f"FOR VALUES FROM ('{desde.isoformat()}') TO ('{hasta.isoformat()}')"
+    ))
+    if hay_default:
+        conn.execute(text(
+            f"INSERT INTO {TABLA} SELECT * FROM {PARTICION_DEFAULT} WHERE \"timestamp\" >= :desde AND \"timestamp\" < :hasta"
+        ), rango)
+        conn.execute(text(f"DELETE FROM {PARTICION_DEFAULT} WHERE \"timestamp\" >= :desde AND \"timestamp\" < :hasta"), rango)
+        conn.execute(text(f"ALTER TABLE {TABLA} ATTACH PARTITION {PARTICION_DEFAULT} DEFAULT"))
+    return True
+
+
+def asegurar_particiones(bind, meses_adelante=MESES_ADELANTE, reportar=print):
+    """
+    Crea las particiones del mes actual y de los 'meses_adelante' siguientes,
+    más las de los meses que tengan lecturas en la partición default.
+    Idempotente; no hace nada si la tabla no está particionada.
+    """
+    with bind.begin() as conn:
+        if not esta_particionada(conn):
+            return []
+        meses = {inicio_mes(datetime.now())}
+        for _ in range(meses_adelante):
+            meses.add(mes_siguiente(max(meses)))
+        meses.update(conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\") FROM {PARTICION_DEFAULT}"
+        )).scalars().all())
+        creadas = [nombre_particion(mes) for mes in sorted(meses) if crear_particion(conn, mes)]
+    if creadas:
+        reportar(f"Particiones creadas: {', '.join(creadas)}.")
+    return creadas
+
+
+def particionar_lecturas(bind, meses_adelante=MESES_ADELANTE, reportar=print):
+    """
+    Convierte machine_readings (tabla común) en una tabla particionada por mes
+    y copia todas las lecturas, en UNA transacción (la tabla queda bloqueada
+    mientras dura la copia). Retorna False si ya estaba particionada.
+    """
+    if not es_postgres(bind):
+        raise ValueError("El particionado de machine_readings solo está disponible en Postgres.")
+    anterior = f"{TABLA}_sin_particionar"
+
+    with bind.begin() as conn:
+        if esta_particionada(conn):
+            return False
+        conn.execute(text(f"LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE"))
+
+        # 1. La tabla actual se renombra (sus índices se borran: los nombres se reusan en la nueva)
+        conn.execute(text(f"ALTER TABLE {TABLA} RENAME TO {anterior}"))
+        for indice in inspect(conn).get_indexes(anterior):
+            conn.execute(text(f'DROP INDEX "{indice["name"]}"'))
+        pk = inspect(conn).get_pk_constraint(anterior)["name"]
+        conn.execute(text(f'ALTER TABLE {anterior} RENAME CONSTRAINT "{pk}" TO "{anterior}_pkey"'))
+
+        # 2. Tabla particionada con las mismas columnas y defaults (la secuencia de reading_id incluida)
+        conn.execute(text(f"CREATE TABLE {TABLA} (LIKE {anterior} INCLUDING DEFAULTS) PARTITION BY RANGE (\"timestamp\")"))
+        conn.execute(text(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (reading_id, \"timestamp\")"))
+        conn.execute(text(
+            f"ALTER TABLE {TABLA} ADD FOREIGN KEY (machine_id) REFERENCES machines (machine_id) ON DELETE CASCADE"
+        ))
+        for indice in models.MachineReading.__table__.indexes:
+            indice.create(bind=conn)  # En una tabla particionada se crea en cada partición
+
+        # 3. Particiones: todos los meses con lecturas, los que vienen y la default
+        conn.execute(text(f"CREATE TABLE {PARTICION_DEFAULT} PARTITION OF {TABLA} DEFAULT"))
+        meses = set(conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', \"timestamp\") FROM {anterior} WHERE \"timestamp\" IS NOT NULL"
+        )).scalars().all())
+        meses.add(inicio_mes(datetime.now()))
+        for _ in range(meses_adelante):
+            meses.add(mes_siguiente(max(meses)))
+        for mes in sorted(meses):
+            crear_particion(conn, mes)
+
+        # 4. Copia (timestamp pasa a ser NOT NULL por la PK) y traspaso de la secuencia
+        columnas = ", ".join(f'"{c.name}"' for c in models.MachineReading.__table__.columns)
+        origen = ", ".join(
+            'COALESCE("timestamp", now())' if c.name == "timestamp" else f'"{c.name}"'
+            for c in models.MachineReading.__table__.columns
+        )
+        copiadas = conn.execute(text(f"INSERT INTO {TABLA} ({columnas}) SELECT {origen} FROM {anterior}")).rowcount
+        secuencia = conn.execute(text(f"SELECT pg_get_serial_sequence('{anterior}', 'reading_id')")).scalar()
+        if secuencia:
+            conn.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY {TABLA}.reading_id"))
+        conn.execute(text(f"DROP TABLE {anterior}"))
+
+    reportar(f"machine_readings particionada por mes: {len(meses)} particiones, {copiadas} lecturas copiadas.")
+    return True
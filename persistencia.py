@@ -0,0 +1,393 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import exc, insert, select, text
+
+import agregados
+import config
+import metricas
+import models
+
+# =====================================================
+#  Escritura diferida (write-behind) de lecturas
+# =====================================================
+# En modo diferido /predecir NO espera el commit de Postgres: la lectura (con
+# sus tipos de falla en failure_flags) se encola en memoria y un hilo escritor
+# las inserta en lotes (INSERT de varias filas, una transacción por lote). El reading_id se
+# toma de un bloque de IDs reservado por adelantado, así la respuesta puede
+# incluir 'reading_saved_id' de inmediato.
+#
+# Una lectura con reading_id ya entregado al cliente no se descarta: ante
+# errores transitorios (BD caída, conexión cortada) el lote se reintenta sin
+# límite con espera creciente (la cola llena frena a /predecir mientras
+# tanto). Lo que no se puede escribir (error permanente, o BD caída al
+# detener el proceso) va al archivo de pendientes
+# (config.ESCRITURA_DIFERIDA_PENDIENTES), que se reinserta con
+#   python persistencia.py reinsertar [archivo]
+
+registro = logging.getLogger("persistencia")
+
+class ColaLlena(Exception):
+    """La cola de escritura está llena y la política de desborde rechaza la lectura."""
+
+
+# Qué hacer cuando la cola está llena
+POLITICAS_DESBORDE = ("bloquear", "rechazar", "sincrono")
+
+
+class ReservaIds:
+    """
+    Entrega reading_id reservados por bloques.
+
+    En Postgres los IDs salen de la secuencia de machine_readings (nextval), así
+    conviven con cualquier otro proceso que inserte. En otros motores (SQLite
+    local) se parte del MAX(reading_id) actual: válido solo si este proceso es
+    el único que inserta lecturas mientras el modo diferido está activo (la
+    importación de CSV de la API toma sus IDs de aquí, ver reserva_activa).
+    """
+
+    def __init__(self, engine, tamano_bloque=1000):
+        self.engine = engine
+        self.tamano_bloque = tamano_bloque
+        self._disponibles = deque()
+        self._ultimo_local = None
+        self._lock = threading.Lock()
+
+    def siguientes(self, n):
+        with self._lock:
+            while len(self._disponibles) < n:
+                self._disponibles.extend(self._reservar(max(self.tamano_bloque, n - len(self._disponibles))))
+            return [self._disponibles.popleft() for _ in range(n)]
+
+    def siguiente(self):
+        return self.siguientes(1)[0]
+
+    def _reservar(self, n):
+        with self.engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                return conn.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('machine_readings', 'reading_id')) "
+                         "FROM generate_series(1, :n)"),
+                    {"n": n}
+                ).scalars().all()
+
+            if self._ultimo_local is None:
+                self._ultimo_local = conn.execute(
+                    text("SELECT COALESCE(MAX(reading_id), 0) FROM machine_readings")
+                ).scalar()
+        inicio = self._ultimo_local + 1
+        self._ultimo_local += n
+        return range(inicio, inicio + n)
+
+
+# Reservas de IDs en uso por engine (motores sin secuencia): quien más
+# inserte lecturas en este proceso mientras el escritor está activo
+# (importar_csv.py) toma sus reading_id de la misma reserva.
+_reservas_activas = {}
+
+
+def reserva_activa(engine):
+    """La ReservaIds del escritor diferido activo sobre 'engine', o None."""
+    return _reservas_activas.get(engine)
+
+
+def insertar_lecturas(conn, filas_lectura):
+    """
+    Inserta en bloque (dentro de la transacción de 'conn') las lecturas, con
+    sus tipos de falla en failure_flags, y las suma a los agregados por
+    hora / día (agregados.py). Las filas ya traen su reading_id y timestamp.
+    """
+    if filas_lectura:
+        conn.execute(insert(models.MachineReading), filas_lectura)
+        agregados.registrar(conn, filas_lectura)
+
+
+def _es_transitorio(error):
+    """Errores que se arreglan reintentando (BD caída, conexión cortada, pool agotado, SQLite bloqueada)."""
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError, exc.DisconnectionError))
+
+
+def _a_json(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else str(valor)
+
+
+class EscritorDiferido:
+    """
+    Cola acotada + hilo escritor que vacía la cola en lotes.
+
+    - capacidad: máximo de lecturas pendientes en memoria, contando el lote
+      que se está escribiendo (backpressure).
+    - tamano_lote / intervalo_ms: se escribe al juntar 'tamano_lote' lecturas
+      o cuando pasan 'intervalo_ms' desde la primera pendiente.
+    - politica_desborde: si el lote no entra, 'bloquear' espera hasta
+      'timeout_bloqueo_s' por espacio y luego lanza ColaLlena; 'rechazar'
+      lanza ColaLlena de inmediato; 'sincrono' escribe el lote directamente
+      en la BD. Un lote entra completo o no entra.
+    - reintento_max_s: espera máxima entre reintentos de un lote fallido.
+    - archivo_pendientes: JSONL donde quedan las lecturas que no se pudieron
+      escribir (ver reinsertar_pendientes).
+    """
+
+    INTENTOS_AL_DETENER = 3  # Con la BD caída al detener, reintentos antes de pasar todo al archivo
+
+    def __init__(self, engine, capacidad=10000, tamano_lote=500, intervalo_ms=50,
+                 politica_desborde="bloquear", timeout_bloqueo_s=1.0, bloque_ids=1000,
+                 reintento_max_s=5.0, archivo_pendientes="escritura_diferida_pendientes.jsonl"):
+        if politica_desborde not in POLITICAS_DESBORDE:
+            raise ValueError(f"politica_desborde debe ser una de {POLITICAS_DESBORDE}")
+        self.engine = engine
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo_ms / 1000
+        self.politica_desborde = politica_desborde
+        self.timeout_bloqueo = timeout_bloqueo_s
+        self.reintento_max = reintento_max_s
+        self.archivo_pendientes = archivo_pendientes
+        self.reserva_ids = ReservaIds(engine, bloque_ids)
+
+        self._pendientes = deque()
+        self._en_vuelo = 0  # Lecturas del lote que el hilo está escribiendo
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._hilo = None
+
+        self._escritas = 0
+        self._lotes = 0
+        self._rechazadas = 0
+        self._sincronas = 0
+        self._reintentos = 0
+        self._a_archivo = 0
+        self._ultimo_error = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        self._detener.clear()
+        if self.engine.dialect.name != "postgresql":
+            _reservas_activas[self.engine] = self.reserva_ids
+        self._hilo = threading.Thread(target=self._bucle, name="escritor-diferido", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout=30.0):
+        """Deja de aceptar escrituras del hilo y vacía TODO lo pendiente antes de salir."""
+        if self._hilo is None:
+            return
+        self._detener.set()
+        with self._condicion:
+            self._condicion.notify_all()
+        self._hilo.join(timeout)
+        self._hilo = None
+        if _reservas_activas.get(self.engine) is self.reserva_ids:
+            del _reservas_activas[self.engine]
+
+    def encolar(self, fila_lectura, detalle_falla=None):
+        """Encola una lectura (y su detalle de falla, si hay). Retorna el reading_id asignado."""
+        return self.encolar_lote([(fila_lectura, detalle_falla)])[0]
+
+    def encolar_lote(self, elementos):
+        """
+        elementos: lista de (fila_lectura, detalle_falla o None).
+        Retorna la lista de reading_id asignados, en el mismo orden.
+
+        Todo o nada: si el lote no entra en la cola no se encola ninguna
+        lectura (ColaLlena, sin IDs reservados), así el reintento del cliente
+        no las duplica. Con la política 'sincrono' el lote entero se escribe
+        en la BD antes de responder.
+        """
+        n = len(elementos)
+        ahora = datetime.now()
+        with self._condicion:
+            entra = self._esperar_espacio(n)
+            if not entra and self.politica_desborde != "sincrono":
+                self._rechazadas += n
+                metricas.ESCRITURA_DIFERIDA.inc(n, "rechazada")
+                raise ColaLlena("La cola de escritura diferida está llena. Intenta de nuevo más tarde.")
+            ids = self.reserva_ids.siguientes(n)
+            # El detalle de falla ya viene en la fila (failure_flags); el timestamp, si lo fijó quien encola
+            filas = [{"timestamp": ahora, **fila_lectura, "reading_id": reading_id}
+                     for reading_id, (fila_lectura, _) in zip(ids, elementos)]
+            if entra:
+                self._pendientes.extend(filas)
+                self._condicion.notify_all()
+                return ids
+
+        # Desborde con política 'sincrono': el lote completo, fuera del lock
+        self._escribir(filas)
+        self._sincronas += n
+        metricas.ESCRITURA_DIFERIDA.inc(n, "sincrona")
+        return ids
+
+    def _entra(self, n):
+        ocupadas = len(self._pendientes) + self._en_vuelo
+        # Un lote más grande que la capacidad entra solo con la cola vacía
+        return ocupadas + n <= self.capacidad or ocupadas == 0
+
+    def _esperar_espacio(self, n):
+        """Con el lock tomado: True si hay lugar para 'n' lecturas (esperando si la política es 'bloquear')."""
+        if self.politica_desborde == "bloquear":
+            return self._condicion.wait_for(lambda: self._entra(n), timeout=self.timeout_bloqueo)
+        return self._entra(n)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                if not self._pendientes:
+                    if self._detener.is_set():
+                        return
+                    self._condicion.wait(self.intervalo)
+                    continue
+                # Junta hasta 'tamano_lote' lecturas o hasta que pase el intervalo
+                self._condicion.wait_for(
+                    lambda: len(self._pendientes) >= self.tamano_lote or self._detener.is_set(),
+                    timeout=self.intervalo,
+                )
+                lote = [self._pendientes.popleft() for _ in range(min(self.tamano_lote, len(self._pendientes)))]
+                self._en_vuelo = len(lote)
+            try:
+                self._escribir_con_reintento(lote)
+            finally:
+                with self._condicion:
+                    self._en_vuelo = 0
+                    self._condicion.notify_all()
+
+    def _escribir_con_reintento(self, lote):
+        """
+        Escribe 'lote' reintentando los errores transitorios sin límite (espera
+        exponencial hasta reintento_max_s). Un error permanente (ej: la máquina
+        se borró) separa las lecturas que fallan y las pasa al archivo de
+        pendientes; las demás se escriben.
+        """
+        intento = 0
+        while True:
+            try:
+                self._escribir(lote)
+                return
+            except Exception as e:
+                self._ultimo_error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+                if not _es_transitorio(e):
+                    metricas.ESCRITURA_DIFERIDA_ERRORES.inc(1, "permanente")
+                    self._escribir_por_fila(lote)
+                    return
+                metricas.ESCRITURA_DIFERIDA_ERRORES.inc(1, "transitorio")
+                self._reintentos += 1
+                intento += 1
+                if self._detener.is_set() and intento >= self.INTENTOS_AL_DETENER:
+                    # El proceso termina con la BD caída: lo que queda en memoria va al archivo
+                    with self._condicion:
+                        restantes = list(self._pendientes)
+                        self._pendientes.clear()
+                    self._a_pendientes(lote + restantes, self._ultimo_error)
+                    return
+                espera = min(0.1 * 2 ** intento, self.reintento_max)
+                registro.warning("Escritura diferida: lote de %d lecturas falló (%s); reintento %d en %.1f s.",
+                                 len(lote), self._ultimo_error, intento, espera)
+                time.sleep(espera)
+
+    def _escribir_por_fila(self, lote):
+        fallidas = []
+        for fila in lote:
+            try:
+                self._escribir([fila])
+            except Exception as e:
+                if _es_transitorio(e):
+                    # La BD se cayó a mitad de camino: el resto vuelve al reintento normal
+                    self._escribir_con_reintento([fila])
+                else:
+                    fallidas.append(fila)
+        if fallidas:
+            self._a_pendientes(fallidas, self._ultimo_error)
+
+    def _a_pendientes(self, filas, error):
+        """Agrega 'filas' al archivo de pendientes (JSONL, una lectura por línea)."""
+        with open(self.archivo_pendientes, "a", encoding="utf-8") as archivo:
+            for fila in filas:
+                archivo.write(json.dumps({"fila": fila, "error": error}, default=_a_json) + "\n")
+        self._a_archivo += len(filas)
+        metricas.ESCRITURA_DIFERIDA.inc(len(filas), "pendiente")
+        registro.error("Escritura diferida: %d lecturas no se pudieron escribir (%s); guardadas en %s.",
+                       len(filas), error, os.path.abspath(self.archivo_pendientes))
+
+    def _escribir(self, lote):
+        with self.engine.begin() as conn:
+            insertar_lecturas(conn, lote)
+        self._escritas += len(lote)
+        self._lotes += 1
+        metricas.ESCRITURA_DIFERIDA.inc(len(lote), "escrita")
+
+    def estadisticas(self):
+        with self._condicion:
+            pendientes = len(self._pendientes) + self._en_vuelo
+        return {
+            "activo": self.activo,
+            "politica_desborde": self.politica_desborde,
+            "pendientes": pendientes,
+            "capacidad": self.capacidad,
+            "escritas": self._escritas,
+            "lotes": self._lotes,
+            "rechazadas": self._rechazadas,
+            "escritas_sincronas": self._sincronas,
+            "reintentos": self._reintentos,
+            "en_archivo_pendientes": self._a_archivo,
+            "ultimo_error": self._ultimo_error,
+        }
+
+
+def reinsertar_pendientes(engine, archivo, reportar=print):
+    """
+    Inserta las lecturas del archivo de pendientes que todavía no estén en
+    machine_readings (por reading_id). Las que vuelven a fallar quedan en el
+    archivo; si no queda ninguna, se borra.
+    """
+    with open(archivo, encoding="utf-8") as entrada:
+        registros = [json.loads(linea) for linea in entrada if linea.strip()]
+    filas = []
+    for registro_fila in registros:
+        fila = registro_fila["fila"]
+        fila["timestamp"] = datetime.fromisoformat(fila["timestamp"])
+        filas.append(fila)
+
+    insertadas, fallidas = 0, []
+    for fila in filas:
+        try:
+            with engine.begin() as conn:
+                existe = conn.execute(
+                    select(models.MachineReading.reading_id).where(models.MachineReading.reading_id == fila["reading_id"])
+                ).first()
+                if existe is None:
+                    insertar_lecturas(conn, [fila])
+                    insertadas += 1
+        except Exception as e:
+            fallidas.append({"fila": fila, "error": f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"})
+
+    if fallidas:
+        with open(archivo, "w", encoding="utf-8") as salida:
+            for registro_fila in fallidas:
+                salida.write(json.dumps(registro_fila, default=_a_json) + "\n")
+    else:
+        os.remove(archivo)
+    if reportar is not None:
+        reportar(f"Pendientes: {insertadas} lecturas insertadas, {len(filas) - insertadas - len(fallidas)} ya estaban, "
+                 f"{len(fallidas)} siguen fallando.")
+    return {"insertadas": insertadas, "fallidas": len(fallidas)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas de la escritura diferida.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    reinsertar = sub.add_parser("reinsertar", help="Inserta las lecturas del archivo de pendientes")
+    reinsertar.add_argument("archivo", nargs="?", default=config.ESCRITURA_DIFERIDA_PENDIENTES)
+    args = parser.parse_args()
+
+    from database import engine
+
+    reinsertar_pendientes(engine, args.archivo)
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import anyio
+
+import config
+import metricas
+from buffer_lecturas import buffer_lecturas
+from cache_predicciones import cache_predicciones
+from inferencia import cargar_paquete
+from microlotes import AgrupadorPredicciones
+
+# =====================================================
+#  Registro versionado de modelos + recarga en caliente
+# =====================================================
+# entrenar.py publica cada entrenamiento como una versión nueva:
+#
+#   modelos/
+#     20261017-063000/       <- columnas, labels, .pkl, bosques_planos/, metadata.json
+#     20261018-091500/
+#     activa.json            <- {"version": ..., "anteriores": [...]}
+#
+# La API (GestorModelos) revisa activa.json periódicamente; cuando cambia,
+# carga y calienta la versión nueva en un hilo (fuera del camino de las
+# peticiones) y la intercambia de forma atómica. Las peticiones en curso
+# terminan con la versión que tomaron. La primera carga, al arrancar, sigue
+# el mismo camino: la API acepta conexiones antes de tener modelos.
+
+ARCHIVO_ACTIVA = "activa.json"
+SUFIJO_PARCIAL = ".parcial"
+PARCIAL_ABANDONADO_S = 24 * 3600  # Temporales de entrenamientos que murieron sin limpiar (ej: kill -9)
+SIN_VERSION = None  # Modelos sueltos en la raíz del proyecto (antes del registro)
+
+
+class VersionNoEncontrada(Exception):
+    """La versión pedida no existe en el registro (o no hay a cuál volver)."""
+
+
+class RegistroModelos:
+    """Directorio de versiones de modelos y puntero a la versión activa."""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+
+    def ruta(self, version):
+        return os.path.join(self.directorio, version)
+
+    def versiones(self):
+        """Versiones publicadas, de la más vieja a la más nueva (los nombres son fechas)."""
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            nombre for nombre in os.listdir(self.directorio)
+            if not nombre.startswith(".") and os.path.exists(os.path.join(self.directorio, nombre, "metadata.json"))
+        )
+
+    def metadata(self, version):
+        with open(os.path.join(self.ruta(version), "metadata.json")) as f:
+            return json.load(f)
+
+    def _leer_activa(self):
+        try:
+            with open(os.path.join(self.directorio, ARCHIVO_ACTIVA)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": None, "anteriores": []}
+
+    def _escribir_activa(self, estado):
+        # Escritura atómica: los workers nunca leen un activa.json a medio escribir
+        temporal = os.path.join(self.directorio, f".{ARCHIVO_ACTIVA}.{os.getpid()}")
+        with open(temporal, "w") as f:
+            json.dump(estado, f, indent=2)
+        os.replace(temporal, os.path.join(self.directorio, ARCHIVO_ACTIVA))
+
+    def version_activa(self):
+        return self._leer_activa()["version"]
+
+    def directorio_activo(self):
+        """Directorio de los archivos de la versión activa ('.' si el registro está vacío)."""
+        version = self.version_activa()
+        return "." if version is SIN_VERSION else self.ruta(version)
+
+    def activar(self, version):
+        """Marca 'version' como activa; la anterior queda en el historial para rollback."""
+        if version not in self.versiones():
+            raise VersionNoEncontrada(f"La versión '{version}' no existe en {self.directorio}.")
+        estado = self._leer_activa()
+        if estado["version"] == version:
+            return
+        if estado["version"] is not None:
+            estado["anteriores"].append(estado["version"])
+        estado["version"] = version
+        self._escribir_activa(estado)
+
+    def rollback(self):
+        """Vuelve a la versión activa anterior. Retorna la versión que quedó activa."""
+        estado = self._leer_activa()
+        anteriores = [v for v in estado["anteriores"] if v in self.versiones()]
+        if not anteriores:
+            raise VersionNoEncontrada("No hay una versión anterior a la cual volver.")
+        estado["version"] = anteriores.pop()
+        estado["anteriores"] = anteriores
+        self._escribir_activa(estado)
+        return estado["version"]
+
+    def nueva_version(self):
+        """
+        Crea un directorio temporal para un entrenamiento nuevo. Retorna
+        (version, directorio_temporal); publicar() lo vuelve visible.
+        """
+        self._borrar_parciales_abandonados()
+        version = datetime.now().strftime("%Y%m%d-%H%M%S")
+        temporal = os.path.join(self.directorio, f".{version}{SUFIJO_PARCIAL}")
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        return version, temporal
+
+    @contextmanager
+    def version_temporal(self):
+        """nueva_version() que borra el temporal al salir si no se publicó (error o salida anticipada)."""
+        version, temporal = self.nueva_version()
+        try:
+            yield version, temporal
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)  # Ya publicada, el temporal no existe
+
+    def _borrar_parciales_abandonados(self):
+        if not os.path.isdir(self.directorio):
+            return
+        limite = time.time() - PARCIAL_ABANDONADO_S
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            if nombre.startswith(".") and nombre.endswith(SUFIJO_PARCIAL) and os.path.getmtime(ruta) < limite:
+                shutil.rmtree(ruta, ignore_errors=True)
+
+    def cargar_paquete(self, version):
+        """PaqueteModelos de 'version' (SIN_VERSION = archivos sueltos de la raíz)."""
+        if version is SIN_VERSION:
+            return cargar_paquete(".")
+        return cargar_paquete(self.ruta(version), version=version)
+
+    def publicar(self, version, directorio_temporal, metadata):
+        """Escribe metadata.json y mueve la versión a su lugar definitivo (rename atómico)."""
+        with open(os.path.join(directorio_temporal, "metadata.json"), "w") as f:
+            json.dump({"version": version, **metadata}, f, indent=2, default=str)
+        os.rename(directorio_temporal, self.ruta(version))
+
+
+# Modelo en servicio: la versión, su paquete y su agrupador de micro-lotes
+ModeloActivo = namedtuple("ModeloActivo", ["version", "paquete", "agrupador"])
+
+
+class GestorModelos:
+    """
+    Mantiene el ModeloActivo del proceso. Cada petición toma 'actual' UNA vez
+    y usa ese mismo paquete para codificar, evaluar e interpretar, así el
+    intercambio nunca mezcla dos versiones en una predicción.
+    """
+
+    def __init__(self, registro, intervalo_recarga_s=10.0):
+        self.registro = registro
+        self.intervalo_recarga = intervalo_recarga_s
+        self.actual = None
+        self.ultimo_error = None
+        self.carga_inicial_terminada = False
+        self._tarea = None
+        self._lock = None
+
+    def _cargar(self, version):
+        """Carga y calienta una versión (bloqueante: se llama desde un hilo)."""
+        paquete = self.registro.cargar_paquete(version)
+        paquete.calentar()
+        return paquete
+
+    def _nuevo_modelo(self, version, paquete):
+        if paquete.codificador.usa_tendencias:
+            # Las ventanas de la versión deben caber en los buffers de lecturas recientes
+            buffer_lecturas.asegurar_capacidad(paquete.codificador.ventana)
+        agrupador = None
+        if config.MICROLOTES_ACTIVO:
+            agrupador = AgrupadorPredicciones(
+                metricas.contar_llamadas(paquete.evaluador.evaluar, version, "microlote"),
+                max_lote=config.MICROLOTES_MAX_LOTE,
+                max_espera_ms=config.MICROLOTES_MAX_ESPERA_MS,
+            )
+        return ModeloActivo(version, paquete, agrupador)
+
+    async def iniciar(self):
+        """
+        Carga la versión activa en segundo plano (la API atiende desde ya:
+        /predecir responde 503 y /salud/listo lo informa hasta que termine) y
+        después revisa el registro cada 'intervalo_recarga' segundos. Si no hay
+        modelos el proceso sigue igual y los toma cuando entrenar.py publique.
+        """
+        self._lock = asyncio.Lock()
+        self._tarea = asyncio.create_task(self._cargar_y_vigilar())
+
+    async def _cargar_y_vigilar(self):
+        try:
+            if await self.recargar() is None:
+                print("Error: No hay modelos entrenados. Ejecuta 'entrenar.py' primero.")
+        except Exception as e:
+            self.ultimo_error = f"{type(e).__name__}: {e}"
+            print(f"Error cargando modelos: {self.ultimo_error}")
+        finally:
+            self.carga_inicial_terminada = True
+        if self.intervalo_recarga > 0:
+            await self._vigilar()
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self.actual is not None and self.actual.agrupador is not None:
+            await self.actual.agrupador.detener()
+
+    async def _vigilar(self):
+        while True:
+            await asyncio.sleep(self.intervalo_recarga)
+            try:
+                await self.recargar()
+            except Exception as e:
+                # Se sigue sirviendo la versión actual; se reintenta en el próximo ciclo
+                self.ultimo_error = f"{type(e).__name__}: {e}"
+                print(f"Error recargando modelos: {self.ultimo_error}")
+
+    async def recargar(self):
+        """
+        Si la versión activa del registro cambió, la carga en un hilo, la
+        calienta y la pone en servicio. El agrupador viejo se detiene después
+        de vaciar su cola. Retorna la versión en servicio.
+        """
+        async with self._lock:
+            version = self.registro.version_activa()
+            if self.actual is not None and self.actual.version == version:
+                return version
+            if version is SIN_VERSION and self.actual is not None:
+                return self.actual.version  # Registro vacío: se mantiene lo cargado
+
+            try:
+                paquete = await anyio.to_thread.run_sync(self._cargar, version)
+            except FileNotFoundError:
+                if version is SIN_VERSION:
+                    return None  # Todavía no hay nada entrenado
+                raise
+            nuevo = self._nuevo_modelo(version, paquete)
+            if nuevo.agrupador is not None:
+                await nuevo.agrupador.iniciar()
+
+            anterior, self.actual = self.actual, nuevo  # Intercambio atómico
+            cache_predicciones.invalidar()  # Los resultados de la versión anterior ya no sirven
+            self.ultimo_error = None
+            print(f"Modelos cargados: versión {version or 'sin versión'} en servicio.")
+
+            if anterior is not None and anterior.agrupador is not None:
+                await anterior.agrupador.detener(vaciar=True)
+            return version
+
+    def estado(self):
+        return {
+            "version_en_servicio": self.actual.version if self.actual else None,
+            "version_activa_registro": self.registro.version_activa(),
+            "cargando": not self.carga_inicial_terminada,
+            "intervalo_recarga_s": self.intervalo_recarga,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+# Instancia única del proceso, compartida por main.py y los routers
+gestor_modelos = GestorModelos(RegistroModelos(config.MODELOS_DIR), config.MODELOS_INTERVALO_RECARGA_S)
@@ -0,0 +1,242 @@
+import argparse
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, case, delete, func, literal_column, select, text, type_coerce
+
+import config
+import models
+import particiones
+from exportar_lecturas import consulta_exportacion, exportar_csv, lotes_de_filas
+
+# =====================================================
+#  Retención: lecturas viejas -> resúmenes por hora
+# =====================================================
+# El historial tiene dos niveles:
+#
+#   machine_readings          lecturas crudas de los últimos RETENCION_DIAS
+#   machine_readings_hourly   una fila por máquina y hora (min/avg/max de cada
+#                             sensor y conteo de fallas) para lo más viejo
+#
+# aplicar_retencion() resume en machine_readings_hourly todo lo anterior al
+# corte y borra las lecturas crudas (y su detalle de falla). Con la tabla
+# particionada (particiones.py) los meses completos se descartan con DROP
+# TABLE; lo que queda (el mes del corte, la partición default o una tabla sin
+# particionar) se borra por ventanas de VENTANA, una transacción por ventana.
+#
+# El resumen se combina con el que ya exista para esa hora (lecturas
+# importadas tarde), así correr la retención dos veces no duplica nada.
+#
+# Uso (cron, una vez por noche):
+#   python retencion.py [--dias 90] [--archivar-en /ruta/archivo] [--conservar-particiones]
+
+SENSORES = ["air_temperature", "process_temperature", "rotational_speed", "torque", "tool_wear"]
+CONTADORES_FALLA = {"twf_count": "twf", "hdf_count": "hdf", "pwf_count": "pwf", "osf_count": "osf", "rnf_count": "rnf"}
+VENTANA = timedelta(days=1)
+
+
+def truncar_hora(columna, dialecto):
+    """Inicio de la hora de 'columna' en SQL (con el mismo formato que DateTime en cada motor)."""
+    # literal_column: el mismo texto en el SELECT y en el GROUP BY (con parámetros, asyncpg los ve distintos)
+    if dialecto == "postgresql":
+        return func.date_trunc(literal_column("'hour'"), columna)
+    if dialecto == "sqlite":
+        return type_coerce(func.strftime(literal_column("'%Y-%m-%d %H:00:00.000000'"), columna), DateTime)
+    raise NotImplementedError(f"Resumen por hora no implementado para '{dialecto}'.")
+
+
+def consulta_resumen_horario(dialecto, machine_id=None, desde=None, hasta=None):
+    """
+    SELECT de machine_readings con una fila por (máquina, hora) y las columnas
+    de MachineReadingHourly, en el orden de la tabla.
+    """
+    lectura = models.MachineReading
+
+    def contar(condicion):
+        return func.coalesce(func.sum(case((condicion, 1), else_=0)), 0)
+
+    hora = truncar_hora(lectura.timestamp, dialecto)
+    expresiones = {
+        "machine_id": lectura.machine_id,
+        "hour": hora,
+        "reading_count": func.count(),
+        "failure_count": contar(lectura.machine_failure.is_(True)),
+        **{nombre: contar(models.has_failure_type(lectura.failure_flags, tipo)) for nombre, tipo in CONTADORES_FALLA.items()},
+    }
+    for sensor in SENSORES:
+        columna = getattr(lectura, sensor)
+        expresiones[f"{sensor}_min"] = func.min(columna)
+        expresiones[f"{sensor}_avg"] = func.avg(columna)
+        expresiones[f"{sensor}_max"] = func.max(columna)
+
+    consulta = select(*(
+        expresiones[c.name].label(c.name) for c in models.MachineReadingHourly.__table__.columns
+    )).select_from(lectura)\
+      .group_by(lectura.machine_id, hora)
+
+    if machine_id is not None:
+        consulta = consulta.where(lectura.machine_id == machine_id)
+    if desde is not None:
+        consulta = consulta.where(lectura.timestamp >= desde)
+    if hasta is not None:
+        consulta = consulta.where(lectura.timestamp < hasta)
+    return consulta
+
+
+def combinar_resumenes(a, b):
+    """Combina dos resúmenes (dicts con las columnas de MachineReadingHourly) de la misma máquina y hora."""
+    n_a, n_b = a["reading_count"], b["reading_count"]
+    combinado = {**a, "reading_count": n_a + n_b}
+    for sensor in SENSORES:
+        for sufijo, elegir in (("_min", min), ("_max", max)):
+            valores = [v for v in (a[sensor + sufijo], b[sensor + sufijo]) if v is not None]
+            combinado[sensor + sufijo] = elegir(valores) if valores else None
+        promedio_a, promedio_b = a[sensor + "_avg"], b[sensor + "_avg"]
+        if promedio_a is None or promedio_b is None:
+            combinado[sensor + "_avg"] = promedio_a if promedio_b is None else promedio_b
+        else:
+            combinado[sensor + "_avg"] = (float(promedio_a) * n_a + float(promedio_b) * n_b) / (n_a + n_b)
+    for nombre in ["failure_count", *CONTADORES_FALLA]:
+        combinado[nombre] = a[nombre] + b[nombre]
+    return combinado
+
+
+def _resumir(conn, desde, hasta):
+    """INSERT ... SELECT del resumen de [desde, hasta) en machine_readings_hourly, combinando con lo existente."""
+    dialecto = conn.dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        menor, mayor = func.least, func.greatest
+    elif dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        menor, mayor = func.min, func.max  # min/max con dos argumentos son escalares en SQLite
+    else:
+        raise NotImplementedError(f"Retención no implementada para '{dialecto}'.")
+
+    tabla = models.MachineReadingHourly.__table__
+    sentencia = insert(tabla).from_select(
+        [c.name for c in tabla.columns], consulta_resumen_horario(dialecto, desde=desde, hasta=hasta)
+    )
+    nuevo = sentencia.excluded
+    n, n_nuevo = tabla.c.reading_count, nuevo.reading_count
+    cambios = {"reading_count": n + n_nuevo}
+    for sensor in SENSORES:
+        cambios[f"{sensor}_min"] = menor(tabla.c[f"{sensor}_min"], nuevo[f"{sensor}_min"])
+        cambios[f"{sensor}_max"] = mayor(tabla.c[f"{sensor}_max"], nuevo[f"{sensor}_max"])
+        cambios[f"{sensor}_avg"] = (tabla.c[f"{sensor}_avg"] * n + nuevo[f"{sensor}_avg"] * n_nuevo) / (n + n_nuevo)
+    for nombre in ["failure_count", *CONTADORES_FALLA]:
+        cambios[nombre] = tabla.c[nombre] + nuevo[nombre]
+    conn.execute(sentencia.on_conflict_do_update(index_elements=["machine_id", "hour"], set_=cambios))
+
+
+def _archivar(engine, desde, hasta, directorio):
+    """Copia las lecturas crudas de [desde, hasta) a un CSV.gz (formato de 'machine failure.csv') antes de borrarlas."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"lecturas_{desde:%Y%m%d%H}_{hasta:%Y%m%d%H}.csv.gz")
+    lotes = lotes_de_filas(engine, consulta_exportacion(desde=desde, hasta=hasta))
+    with gzip.open(ruta, "wt", newline="") as archivo:
+        for parte in exportar_csv(lotes):
+            archivo.write(parte)
+    return ruta
+
+
+def _descartar_particiones(engine, corte, archivar_en, conservar, reportar):
+    """Resume y descarta las particiones mensuales que terminan antes del corte. Retorna (particiones, lecturas)."""
+    with engine.connect() as conn:
+        viejas = [(mes, nombre) for mes, nombre in particiones.particiones_mensuales(conn)
+                  if particiones.mes_siguiente(mes) <= corte]
+    lecturas = 0
+    for mes, nombre in viejas:
+        hasta = particiones.mes_siguiente(mes)
+        if archivar_en:
+            _archivar(engine, mes, hasta, archivar_en)
+        with engine.begin() as conn:
+            _resumir(conn, mes, hasta)
+            n = conn.execute(text(f"SELECT count(*) FROM {nombre}")).scalar()
+            conn.execute(text(f"ALTER TABLE {particiones.TABLA} DETACH PARTITION {nombre}"))
+            if conservar:
+                conn.execute(text(f"ALTER TABLE {nombre} RENAME TO archivo_{nombre}"))
+            else:
+                conn.execute(text(f"DROP TABLE {nombre}"))
+        lecturas += n
+        reportar(f"  {nombre}: {n} lecturas resumidas, partición {'separada' if conservar else 'eliminada'}.")
+    return len(viejas), lecturas
+
+
+def _borrar_por_ventanas(engine, corte, archivar_en, reportar):
+    """
+    Resume y borra las lecturas anteriores al corte, una ventana (y una
+    transacción) a la vez. Cada ventana empieza en la lectura más vieja que
+    queda (ix_machine_readings_timestamp), así los huecos no cuestan nada.
+    """
+    lectura = models.MachineReading
+    lecturas = 0
+    primera = None
+    desde = datetime.min
+    while True:
+        with engine.connect() as conn:
+            siguiente = conn.execute(
+                select(func.min(lectura.timestamp)).where(lectura.timestamp >= desde, lectura.timestamp < corte)
+            ).scalar()
+        if siguiente is None:
+            break
+        desde = siguiente.replace(minute=0, second=0, microsecond=0)
+        hasta = min(desde + VENTANA, corte)
+        primera = primera or desde
+        if archivar_en:
+            _archivar(engine, desde, hasta, archivar_en)
+        en_rango = (lectura.timestamp >= desde) & (lectura.timestamp < hasta)
+        with engine.begin() as conn:
+            _resumir(conn, desde, hasta)
+            lecturas += conn.execute(delete(lectura).where(en_rango)).rowcount
+        desde = hasta
+    if lecturas:
+        reportar(f"  {lecturas} lecturas resumidas y borradas desde {primera:%Y-%m-%d %H:%M}.")
+    return lecturas
+
+
+def aplicar_retencion(engine, dias=None, archivar_en=None, conservar_particiones=False, reportar=print):
+    """
+    Resume por hora y borra las lecturas crudas de hace más de 'dias' días.
+    'archivar_en': directorio donde dejar las lecturas crudas en CSV.gz antes de borrarlas.
+    'conservar_particiones' (Postgres particionado): las particiones viejas se
+    separan de machine_readings (archivo_machine_readings_pAAAA_MM) en vez de
+    eliminarse.
+    """
+    dias = config.RETENCION_DIAS if dias is None else dias
+    inicio = time.perf_counter()
+    corte = (datetime.now() - timedelta(days=dias)).replace(minute=0, second=0, microsecond=0)
+    reportar(f"Retención: lecturas anteriores a {corte:%Y-%m-%d %H:%M} -> machine_readings_hourly.")
+
+    descartadas, lecturas = 0, 0
+    with engine.connect() as conn:
+        particionada = particiones.esta_particionada(conn)
+    if particionada:
+        descartadas, lecturas = _descartar_particiones(engine, corte, archivar_en, conservar_particiones, reportar)
+        particiones.asegurar_particiones(engine, reportar=reportar)
+    lecturas += _borrar_por_ventanas(engine, corte, archivar_en, reportar)
+
+    return {
+        "corte": corte.isoformat(),
+        "particiones_descartadas": descartadas,
+        "lecturas_resumidas": lecturas,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resume por hora y borra las lecturas crudas más viejas que la retención.")
+    parser.add_argument("--dias", type=int, default=config.RETENCION_DIAS,
+                        help=f"Días de lecturas crudas a conservar (default: RETENCION_DIAS={config.RETENCION_DIAS})")
+    parser.add_argument("--archivar-en", help="Directorio donde guardar las lecturas crudas (CSV.gz) antes de borrarlas")
+    parser.add_argument("--conservar-particiones", action="store_true",
+                        help="Postgres particionado: separar las particiones viejas en vez de eliminarlas")
+    args = parser.parse_args()
+
+    from database import engine
+
+    resumen = aplicar_retencion(engine, args.dias, args.archivar_en, args.conservar_particiones)
+    print(f"¡Retención completa! {resumen['lecturas_resumidas']} lecturas resumidas, "
+          f"{resumen['particiones_descartadas']} particiones descartadas, {resumen['segundos']:.1f} s.")
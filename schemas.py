@@ -36,29 +36,74 @@ class MachineReadingResponse(MachineReadingBase):
     reading_id: int
     machine_id: int
     timestamp: datetime
+    model_version: Optional[str] = None
     # Opcionalmente, incluir los detalles de la falla si existen
     failure_details: Optional[FailureTypeResponse] = None
 
     class Config:
         from_attributes = True
 
+class MachineReadingPage(BaseModel):
+    # Una página de lecturas; 'next_cursor' es None en la última página
+    items: List[MachineReadingResponse]
+    next_cursor: Optional[str] = None
+
+class MachineReadingHourlyResponse(BaseModel):
+    # Resumen de las lecturas de una máquina en una hora (min/avg/max de cada sensor)
+    machine_id: int
+    hour: datetime
+    reading_count: int
+    air_temperature_min: Optional[float] = None
+    air_temperature_avg: Optional[float] = None
+    air_temperature_max: Optional[float] = None
+    process_temperature_min: Optional[float] = None
+    process_temperature_avg: Optional[float] = None
+    process_temperature_max: Optional[float] = None
+    rotational_speed_min: Optional[float] = None
+    rotational_speed_avg: Optional[float] = None
+    rotational_speed_max: Optional[float] = None
+    torque_min: Optional[float] = None
+    torque_avg: Optional[float] = None
+    torque_max: Optional[float] = None
+    tool_wear_min: Optional[float] = None
+    tool_wear_avg: Optional[float] = None
+    tool_wear_max: Optional[float] = None
+    failure_count: int = 0
+    twf_count: int = 0
+    hdf_count: int = 0
+    pwf_count: int = 0
+    osf_count: int = 0
+    rnf_count: int = 0
+
+    class Config:
+        from_attributes = True
+
 # --- Schemas para Machine ---
 class MachineBase(BaseModel):
     type: str
     location: Optional[str] = None
     description: Optional[str] = None
+    product_id: Optional[str] = None
 
 class MachineCreate(MachineBase):
     pass
 
 class MachineResponse(MachineBase):
     machine_id: int
-    # Incluir una lista de las lecturas asociadas
-    readings: List[MachineReadingResponse] = []
 
     class Config:
         from_attributes = True
 
+class MachineSummaryResponse(MachineResponse):
+    # Resumen de las lecturas, calculado con una consulta agregada
+    reading_count: int = 0
+    last_reading_at: Optional[datetime] = None
+    last_machine_failure: Optional[bool] = None
+
+class MachineDetailResponse(MachineResponse):
+    # Las últimas lecturas de la máquina (solo en /machines/detail/, ?readings_limit=)
+    readings: List[MachineReadingResponse] = []
+
 # --- Schema para la ENTRADA de predicción ---
 # (Requerido por main.py)
 class DatosMaquinaPrediccion(BaseModel):
@@ -78,4 +123,24 @@ class PrediccionResponse(BaseModel):
     tipo_falla_probable: str
     recomendacion: str
     reading_saved_id: int
+    model_version: Optional[str] = None  # Versión del registro de modelos que respondió
+
+
+# --- Schemas para la predicción por LOTE ---
+# (Requerido por main.py, endpoint /predecir/lote)
+class PrediccionLoteItem(BaseModel):
+    indice: int # Posición de la lectura dentro del lote recibido
+    machine_id: int
+    resultado: Optional[PrediccionResponse] = None # Presente si la lectura se procesó
+    error: Optional[str] = None # Presente si la lectura fue rechazada
+
+class PrediccionLoteResponse(BaseModel):
+    total: int
+    exitosas: int
+    fallidas: int
+    resultados: List[PrediccionLoteItem]
 
+# --- Schema para la ingesta continua (/predecir/ws y /predecir/flujo) ---
+# Un veredicto por mensaje recibido; 'indice' es su posición dentro de la sesión.
+class PrediccionFlujoItem(PrediccionLoteItem):
+    machine_id: Optional[int] = None # None si el mensaje no se pudo leer
@@ -0,0 +1,111 @@
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# =====================================================
+#  Features de tendencia sobre las últimas N lecturas
+# =====================================================
+# Definición ÚNICA de las ventanas, compartida por entrenar.py (sobre el
+# historial completo, vectorizado por bloques) y la API (sobre el buffer
+# circular de cada máquina, buffer_lecturas.py). Una ventana son las últimas
+# N lecturas de la máquina, la actual incluida, con los sensores en el orden
+# de features.COLUMNAS_NUMERICAS; si la máquina tiene menos de N lecturas las
+# posiciones que faltan (a la izquierda) van en NaN.
+#
+#   tasa_desgaste_N         pendiente del desgaste de herramienta (min por lectura)
+#   pendiente_delta_temp_N  pendiente de (temp. de proceso - temp. del aire)
+#   pico_torque_N           torque máximo de la ventana menos el promedio
+#
+# La N va en el nombre de la columna: columnas_modelo.pkl alcanza para saber
+# qué ventana usa una versión de los modelos.
+
+COLUMNAS_TENDENCIA = ['tasa_desgaste', 'pendiente_delta_temp', 'pico_torque']
+_PATRON_COLUMNA = re.compile(rf"^({'|'.join(COLUMNAS_TENDENCIA)})_(\d+)$")
+
+# Posición de cada sensor en la ventana (orden de features.COLUMNAS_NUMERICAS)
+_AIRE, _PROCESO, _VELOCIDAD, _TORQUE, _DESGASTE = range(5)
+N_SENSORES = 5
+
+
+def columnas_tendencia(ventana):
+    return [f"{columna}_{ventana}" for columna in COLUMNAS_TENDENCIA]
+
+
+def ventana_de_columnas(columnas):
+    """N de las columnas de tendencia de 'columnas' (None si no tiene ninguna)."""
+    ventanas = {int(c[2]) for c in map(_PATRON_COLUMNA.match, columnas) if c}
+    if len(ventanas) > 1:
+        raise ValueError(f"Las columnas de tendencia mezclan ventanas distintas: {sorted(ventanas)}")
+    return ventanas.pop() if ventanas else None
+
+
+def features_tendencia(ventanas):
+    """
+    Matriz (n, len(COLUMNAS_TENDENCIA)) a partir de 'ventanas' (n, N, 5): una
+    ventana por lectura, la lectura actual en la última posición.
+    """
+    n, largo, _ = ventanas.shape
+    validas = ~np.isnan(ventanas[:, :, _DESGASTE])
+    n_validas = validas.sum(axis=1)
+
+    # Pendiente por mínimos cuadrados contra la posición, solo sobre las lecturas
+    # presentes; las dos series (desgaste y delta de temperatura) de una vez
+    posicion = np.arange(largo, dtype=np.float64)
+    media_posicion = np.where(validas, posicion, 0.0).sum(axis=1) / n_validas
+    dx = np.where(validas, posicion - media_posicion[:, None], 0.0)
+    sxx = (dx ** 2).sum(axis=1)
+    series = np.stack([ventanas[:, :, _DESGASTE], ventanas[:, :, _PROCESO] - ventanas[:, :, _AIRE]], axis=2)
+    validas_series = validas[:, :, None]
+    media_series = np.where(validas_series, series, 0.0).sum(axis=1) / n_validas[:, None]
+    sxy = (dx[:, :, None] * np.where(validas_series, series - media_series[:, None, :], 0.0)).sum(axis=1)
+
+    torque = ventanas[:, :, _TORQUE]
+    salida = np.empty((n, len(COLUMNAS_TENDENCIA)))
+    # Una sola lectura (sxx = 0): pendiente 0
+    salida[:, :2] = np.divide(sxy, sxx[:, None], out=np.zeros((n, 2)), where=sxx[:, None] > 0)
+    salida[:, 2] = np.where(validas, torque, -np.inf).max(axis=1) - np.where(validas, torque, 0.0).sum(axis=1) / n_validas
+    return salida
+
+
+def ventanas_de_secuencia(X, previas, ventana):
+    """
+    Ventanas (len(X), ventana, 5) de las lecturas X (n, 5) de UNA máquina, en
+    orden, precedidas por 'previas' (hasta ventana - 1 lecturas anteriores).
+    Son vistas sobre un solo array: no copian N veces los datos.
+    """
+    relleno = np.full((ventana - 1 - len(previas), N_SENSORES), np.nan)
+    serie = np.concatenate([relleno, previas, X])
+    return sliding_window_view(serie, ventana, axis=0).transpose(0, 2, 1)
+
+
+class CalculadorTendencias:
+    """
+    Features de tendencia de un historial leído por bloques (entrenar.py,
+    importar_csv.py). Guarda las últimas ventana - 1 lecturas de cada grupo
+    (máquina) para que las ventanas continúen de un bloque al siguiente.
+    Dentro de cada grupo las lecturas deben llegar en orden cronológico.
+    """
+
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self._colas = {}  # grupo -> (k <= ventana - 1, 5)
+
+    def calcular(self, X, grupos=None):
+        """Matriz (len(X), len(COLUMNAS_TENDENCIA)). 'grupos' None = todo X es una sola máquina."""
+        X = np.asarray(X, dtype=np.float64)
+        salida = np.empty((len(X), len(COLUMNAS_TENDENCIA)))
+        if grupos is None:
+            grupos = np.zeros(len(X), dtype=np.int64)
+        grupos = np.asarray(grupos)
+
+        # Filas de cada grupo sin recorrer el bloque una vez por grupo
+        orden = np.argsort(grupos, kind="stable")
+        valores, inicios = np.unique(grupos[orden], return_index=True)
+        for grupo, indices in zip(valores.tolist(), np.split(orden, inicios[1:])):
+            previas = self._colas.get(grupo, np.empty((0, N_SENSORES)))
+            Xg = X[indices]
+            salida[indices] = features_tendencia(ventanas_de_secuencia(Xg, previas, self.ventana))
+            serie = np.concatenate([previas, Xg])
+            self._colas[grupo] = serie[max(len(serie) - (self.ventana - 1), 0):]
+        return salida
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pytest
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CSV = os.path.join(RAIZ, "machine failure.csv")
+sys.path.insert(0, RAIZ)
+
+# Todo lo que escriben las pruebas (BD, modelos entrenados) va a un directorio temporal
+DIRECTORIO = tempfile.mkdtemp(prefix="pruebas_api_")
+
+# La BD de las pruebas (SQLite; la API la usa con aiosqlite) se fija antes de
+# importar database.py, que crea los engines al importarse
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORIO, 'pruebas.db')}"
+os.environ["MODELOS_DIR"] = os.path.join(DIRECTORIO, "modelos")
+
+import database  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def main():
+    """main.py con una versión de modelos publicada por entrenar.py en el registro de DIRECTORIO."""
+    os.symlink(CSV, os.path.join(DIRECTORIO, "machine failure.csv"))
+    subprocess.run([sys.executable, os.path.join(RAIZ, "entrenar.py")], cwd=DIRECTORIO, check=True, capture_output=True)
+    anterior = os.getcwd()
+    os.chdir(DIRECTORIO)
+    try:
+        import main
+    finally:
+        os.chdir(anterior)
+    return main
+
+
+@pytest.fixture
+def bd():
+    """Engine de pruebas con el esquema vacío."""
+    models.Base.metadata.drop_all(database.engine)
+    models.Base.metadata.create_all(database.engine)
+    return database.engine
+
+
+@pytest.fixture
+def cliente(main, bd):
+    from fastapi.testclient import TestClient
+    from cache_maquinas import cache_maquinas
+    from estadisticas_maquinas import estadisticas_maquinas
+
+    # La caché y las estadísticas son del proceso: no deben arrastrar máquinas de la BD anterior
+    cache_maquinas.invalidar()
+    for machine_id in estadisticas_maquinas.machine_ids():
+        estadisticas_maquinas.reiniciar(bd, machine_id)
+    with TestClient(main.app) as cliente:
+        # Los modelos y las cargas de arranque terminan en segundo plano
+        limite = time.monotonic() + 60
+        while cliente.get("/salud/listo").status_code != 200:
+            assert time.monotonic() < limite, cliente.get("/salud/listo").json()
+            time.sleep(0.05)
+        yield cliente
+
+
+def crear_maquina(cliente, tipo="L", **campos):
+    respuesta = cliente.post("/api/machines/", json={"type": tipo, **campos})
+    assert respuesta.status_code == 201
+    return respuesta.json()["machine_id"]
+
+
+def lecturas_csv(n, maquinas, desde=0):
+    """
+    Las lecturas del CSV de entrenamiento [desde, desde + n) como cuerpo de
+    /predecir; 'maquinas' es {Type: machine_id}.
+    """
+    df = pd.read_csv(CSV, skiprows=range(1, desde + 1), nrows=n)
+    return [
+        {
+            "machine_id": maquinas[fila["Type"]],
+            "Type": fila["Type"],
+            "temp_aire": fila["Air temperature [K]"],
+            "temp_proceso": fila["Process temperature [K]"],
+            "velocidad_rotacion": int(fila["Rotational speed [rpm]"]),
+            "torque": fila["Torque [Nm]"],
+            "desgaste_herramienta": int(fila["Tool wear [min]"]),
+        }
+        for _, fila in df.iterrows()
+    ]
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+import agregados
+import models
+from conftest import crear_maquina, lecturas_csv
+
+INICIO = datetime(2026, 10, 1)
+
+
+def _agregados(bd):
+    """Contenido de las dos tablas de agregados (sumas redondeadas: el orden de suma cambia el último bit)."""
+    with bd.connect() as conn:
+        return {
+            tabla.__tablename__: sorted(
+                tuple(round(valor, 6) if isinstance(valor, float) else valor for valor in fila)
+                for fila in conn.execute(select(tabla.__table__))
+            )
+            for tabla in agregados.TABLAS
+        }
+
+
+def test_agregados_incrementales_igual_a_reconstruir(cliente, bd):
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in ("L", "M", "H")}
+    lote = cliente.post("/predecir/lote", json=lecturas_csv(200, maquinas, desde=4000)).json()
+    assert lote["exitosas"] == 200
+    for item in lote["resultados"][:5]:
+        assert cliente.delete(f"/api/readings/{item['resultado']['reading_saved_id']}").status_code == 204
+    agregados.acumulador_agregados.vaciar(bd)  # Sin esperar al vaciado periódico
+
+    incrementales = _agregados(bd)
+    with bd.connect() as conn:
+        lecturas, fallas = conn.execute(
+            select(func.count(), func.count(models.MachineReading.failure_flags))
+        ).one()
+    with bd.connect() as conn:
+        contados = conn.execute(select(func.sum(models.MachineRollupDaily.reading_count),
+                                       func.sum(models.MachineRollupDaily.failure_count))).one()
+    assert lecturas == 195
+    assert tuple(contados) == (lecturas, fallas)
+
+    agregados.reconstruir(bd, reportar=None)
+    assert _agregados(bd) == incrementales
+
+
+def _guardar_con_deltas(bd, filas):
+    """Lecturas y sus deltas pendientes en una transacción, como main.guardar_lecturas."""
+    with bd.begin() as conn:
+        conn.execute(insert(models.MachineReading), filas)
+        agregados.registrar_pendiente(conn, filas)
+
+
+def _filas(maquinas, n, desde=0):
+    return [
+        {"machine_id": maquinas[i % 2], "timestamp": INICIO + timedelta(minutes=20 * i), "machine_failure": i % 5 == 0,
+         "failure_flags": models.FAILURE_FLAGS["twf"] if i % 5 == 0 else None, "air_temperature": 300.0 + i,
+         "process_temperature": 310.0, "rotational_speed": 1500, "torque": 40.0, "tool_wear": i}
+        for i in range(desde, desde + n)
+    ]
+
+
+def test_acumulador_suma_los_deltas_pendientes(bd):
+    with bd.begin() as conn:
+        maquinas = [conn.execute(insert(models.Machine).values(type="L")).inserted_primary_key[0] for _ in range(2)]
+    filas = _filas(maquinas, 30)
+    _guardar_con_deltas(bd, filas[:7])
+    _guardar_con_deltas(bd, filas[7:])
+
+    acumulador = agregados.AcumuladorAgregados()
+    acumulador.LOTE_DELTAS = 4  # Varias transacciones por vaciado
+    acumulador.vaciar(bd)
+    # 10 horas por máquina; la hora que cortan los dos lotes deja dos deltas
+    assert acumulador.estadisticas()["deltas_leidos"] == 20 + 1
+    assert acumulador.vaciar(bd) == 0
+    with bd.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(models.MachineRollupDelta)).scalar() == 0
+    incrementales = _agregados(bd)
+    agregados.reconstruir(bd, reportar=None)
+    assert _agregados(bd) == incrementales
+
+
+def test_recalculo_no_cuenta_dos_veces_los_deltas_de_otro_worker(bd):
+    with bd.begin() as conn:
+        maquinas = [conn.execute(insert(models.Machine).values(type="L")).inserted_primary_key[0] for _ in range(2)]
+    _guardar_con_deltas(bd, _filas(maquinas, 30))
+    agregados.AcumuladorAgregados().vaciar(bd)
+
+    # Otro worker guarda lecturas del mismo día y todavía no sumó sus deltas
+    _guardar_con_deltas(bd, _filas(maquinas, 20, desde=30))
+    # Este worker borra una lectura y recalcula el día de la máquina
+    with bd.begin() as conn:
+        lectura = conn.execute(select(models.MachineReading.reading_id, models.MachineReading.timestamp)
+                               .where(models.MachineReading.machine_id == maquinas[0])
+                               .order_by(models.MachineReading.reading_id).limit(1)).one()
+        conn.execute(delete(models.MachineReading).where(models.MachineReading.reading_id == lectura.reading_id))
+        agregados.recalcular(conn, maquinas[0], lectura.timestamp)
+    agregados.AcumuladorAgregados().vaciar(bd)
+
+    incrementales = _agregados(bd)
+    agregados.reconstruir(bd, reportar=None)
+    assert _agregados(bd) == incrementales
+    with bd.connect() as conn:
+        assert conn.execute(select(func.sum(models.MachineRollupDaily.reading_count))).scalar() == 49
+
+
+def _cargar_historial(bd, maquinas):
+    """Dos días, una lectura por hora y máquina; falla hdf cada 6 horas y osf cada 8."""
+    filas = []
+    for machine_id in maquinas:
+        for hora in range(48):
+            flags = (models.FAILURE_FLAGS["hdf"] if hora % 6 == 0 else 0) | \
+                    (models.FAILURE_FLAGS["osf"] if hora % 8 == 0 else 0)
+            filas.append({"machine_id": machine_id, "timestamp": INICIO + timedelta(hours=hora, minutes=30),
+                          "machine_failure": flags != 0, "failure_flags": flags or None,
+                          "air_temperature": 300.0 + hora, "process_temperature": 310.0, "rotational_speed": 1500,
+                          "torque": 40.0, "tool_wear": hora})
+    with bd.begin() as conn:
+        conn.execute(insert(models.MachineReading), filas)
+    agregados.reconstruir(bd, reportar=None)
+
+
+def test_analitica_fallas(cliente, bd):
+    maquinas = [crear_maquina(cliente, "L", location="norte"), crear_maquina(cliente, "H", location="sur")]
+    _cargar_historial(bd, maquinas)
+    rango = {"from": INICIO.isoformat(), "to": (INICIO + timedelta(days=2)).isoformat()}
+
+    por_dia = cliente.get("/api/analytics/failures", params={**rango, "group_by": "machine"}).json()
+    assert por_dia["source"] == "machine_rollups_daily"
+    assert [(fila["machine_id"], fila["reading_count"], fila["failure_count"]) for fila in por_dia["rows"]] == [
+        (maquinas[0], 24, 6), (maquinas[1], 24, 6), (maquinas[0], 24, 6), (maquinas[1], 24, 6),
+    ]
+    primera = por_dia["rows"][0]
+    assert (primera["hdf_count"], primera["osf_count"], primera["failure_rate"]) == (4, 3, 0.25)
+    assert primera["sensors"]["air_temperature"] == {"avg": 311.5, "min": 300.0, "max": 323.0}
+
+    # Rango que no cae en días completos: se lee la tabla por hora
+    parcial = cliente.get("/api/analytics/failures", params={
+        "from": (INICIO + timedelta(hours=6)).isoformat(), "bucket": "none", "type": "H",
+    }).json()
+    assert parcial["source"] == "machine_rollups_hourly"
+    assert [(fila["reading_count"], fila["failure_count"]) for fila in parcial["rows"]] == [(42, 11)]
+
+    por_modo = cliente.get("/api/analytics/failures", params={
+        **rango, "bucket": "none", "group_by": ["location", "failure_mode"], "failure_mode": ["hdf", "osf"],
+    }).json()
+    assert [(fila["location"], fila["failure_mode"], fila["failure_count"]) for fila in por_modo["rows"]] == [
+        ("norte", "hdf", 8), ("norte", "osf", 6), ("sur", "hdf", 8), ("sur", "osf", 6),
+    ]
+
+    truncada = cliente.get("/api/analytics/failures", params={"bucket": "hour", "limit": 10}).json()
+    assert truncada["truncated"] and len(truncada["rows"]) == 10
+    assert cliente.get("/api/analytics/failures", params={"from": rango["to"], "to": rango["from"]}).status_code == 400
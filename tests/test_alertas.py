@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select
+
+import models
+from alertas import BusAlertasMemoria, alertas_de_lecturas, bus_alertas
+from conftest import crear_maquina, lecturas_csv
+
+
+def _alerta(machine_id, *tipos):
+    return {"reading_id": 0, "machine_id": machine_id, "tipos": list(tipos)}
+
+
+async def _recibir(suscripcion, n):
+    return [await asyncio.wait_for(suscripcion.__anext__(), 1) for _ in range(n)]
+
+
+def test_filtros_por_maquina_y_tipo():
+    async def prueba():
+        bus = BusAlertasMemoria()
+        maquina = bus.suscribir(machine_ids=[1, 2])
+        tipo = bus.suscribir(tipos=["hdf"])
+        ambos = bus.suscribir(machine_ids=[2], tipos=["osf", "pwf"])
+        # Un generador se registra al pedirle el primer elemento
+        recibidas = [asyncio.ensure_future(_recibir(s, n)) for s, n in ((maquina, 3), (tipo, 2), (ambos, 1))]
+        await asyncio.sleep(0.01)
+
+        bus.publicar([_alerta(1, "twf"), _alerta(3, "hdf"), _alerta(2, "hdf", "osf"), _alerta(2, "rnf")])
+        return [[a["id"] for a in alertas] for alertas in await asyncio.gather(*recibidas)]
+
+    assert asyncio.run(prueba()) == [[1, 3, 4], [2, 3], [3]]
+
+
+def test_reanudar_desde_un_id_sin_repetir():
+    async def prueba():
+        bus = BusAlertasMemoria(historial=10)
+        bus.publicar([_alerta(1, "twf") for _ in range(5)])
+        suscripcion = bus.suscribir(desde_id=3)
+        repetidas = await _recibir(suscripcion, 2)
+        bus.publicar([_alerta(1, "twf")])
+        nuevas = await _recibir(suscripcion, 1)
+        await suscripcion.aclose()
+        return [a["id"] for a in repetidas + nuevas], bus.estadisticas()["suscriptores"]
+
+    assert asyncio.run(prueba()) == ([4, 5, 6], 0)
+
+
+def test_desincronizado():
+    bus = BusAlertasMemoria(historial=3)
+    bus.publicar([_alerta(1, "twf") for _ in range(5)])  # En el historial: 3, 4 y 5
+    assert not bus.desincronizado(None)
+    assert not bus.desincronizado(2)
+    assert bus.desincronizado(1)
+    assert bus.desincronizado(6)  # De otro arranque del proceso
+
+
+def test_suscripcion_desbordada_termina():
+    async def prueba():
+        bus = BusAlertasMemoria(capacidad_suscriptor=2)
+        suscripcion = bus.suscribir()
+        primera = asyncio.ensure_future(suscripcion.__anext__())
+        await asyncio.sleep(0.01)
+        bus.publicar([_alerta(1, "twf") for _ in range(5)])
+        recibidas = [(await primera)["id"]] + [a["id"] async for a in suscripcion]
+        return recibidas, bus.estadisticas()["suscripciones_desbordadas"]
+
+    # Caben 2 en la cola: la 3 la desborda y la suscripción termina al vaciarse
+    assert asyncio.run(prueba()) == ([1, 2], 1)
+
+
+def test_alertas_de_lecturas_solo_con_falla():
+    fila = {"machine_id": 7, "timestamp": datetime(2026, 10, 1, 8, 30), "air_temperature": 300.0,
+            "process_temperature": 310.0, "rotational_speed": 1500, "torque": 40.0, "tool_wear": 10}
+    elementos = [(fila, None), (fila, {"twf": False, "hdf": True, "pwf": False, "osf": True, "rnf": False})]
+    alertas = alertas_de_lecturas(elementos, [11, 12])
+    assert [(a["reading_id"], a["tipos"]) for a in alertas] == [(12, ["hdf", "osf"])]
+    # El momento de la lectura, no el de la publicación
+    assert alertas[0]["timestamp"] == "2026-10-01T08:30:00"
+
+
+def test_websocket_recibe_las_fallas_de_su_maquina(cliente, bd):
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+    desde = bus_alertas.estadisticas()["ultimo_id"]
+    lecturas = lecturas_csv(300, maquinas, desde=4000)
+    resultados = cliente.post("/predecir/lote", json=lecturas).json()["resultados"]
+    fallas = [r["resultado"]["reading_saved_id"] for r, lectura in zip(resultados, lecturas)
+              if lectura["Type"] == "L" and r["resultado"]["prediccion"] == "FALLA PROBABLE"]
+    assert fallas
+
+    with cliente.websocket_connect(f"/api/alertas/ws?machine_id={maquinas['L']}&desde_id={desde}") as websocket:
+        alertas = [websocket.receive_json() for _ in fallas]
+    assert [a["reading_id"] for a in alertas] == fallas
+    assert all(a["evento"] == "falla" and a["machine_id"] == maquinas["L"] and a["tipos"] for a in alertas)
+    with bd.connect() as conn:
+        guardadas = dict(conn.execute(select(models.MachineReading.reading_id, models.MachineReading.timestamp)
+                                      .where(models.MachineReading.reading_id.in_(fallas))).all())
+    assert [a["timestamp"] for a in alertas] == [guardadas[a["reading_id"]].isoformat() for a in alertas]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from bosque_plano import BosquePlano, EvaluadorPlano
+
+
+@pytest.fixture(scope="module")
+def modelos():
+    generador = np.random.default_rng(0)
+    X = generador.normal(size=(600, 7))
+    y_falla = (X[:, 0] + 0.5 * X[:, 1] > 1.0).astype(int)
+    y_tipo = np.column_stack([X[:, 2] > 0, X[:, 3] > 0.5, X[:, 4] + X[:, 5] > 0, X[:, 6] > 1.0]).astype(int)
+    modelo_falla = RandomForestClassifier(n_estimators=15, class_weight={0: 1, 1: 20}, random_state=0).fit(X, y_falla)
+    modelo_tipo = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y_tipo)
+    X_prueba = generador.normal(size=(300, 7))
+    # Filas con valores exactamente en los umbrales: la comparación debe ser la de sklearn (float32, <=)
+    umbrales = modelo_falla.estimators_[0].tree_.threshold
+    columnas = modelo_falla.estimators_[0].tree_.feature
+    en_umbral = X_prueba[:20].copy()
+    for i, (columna, umbral) in enumerate(zip(columnas[columnas >= 0][:20], umbrales[columnas >= 0][:20])):
+        en_umbral[i, columna] = umbral
+    return modelo_falla, modelo_tipo, np.vstack([X_prueba, en_umbral])
+
+
+def _comparar(evaluador, modelo_falla, modelo_tipo, X):
+    prediccion, probabilidad, tipo = evaluador.evaluar(X)
+    assert np.array_equal(prediccion, modelo_falla.predict(X))
+    assert np.array_equal(probabilidad, modelo_falla.predict_proba(X))
+    assert np.array_equal(tipo, modelo_tipo.predict(X))
+
+
+def test_igual_a_sklearn(modelos):
+    modelo_falla, modelo_tipo, X = modelos
+    _comparar(EvaluadorPlano.desde_sklearn(modelo_falla, modelo_tipo), modelo_falla, modelo_tipo, X)
+
+
+def test_una_fila_igual_a_sklearn(modelos):
+    modelo_falla, modelo_tipo, X = modelos
+    evaluador = EvaluadorPlano.desde_sklearn(modelo_falla, modelo_tipo)
+    for i in range(0, len(X), 37):
+        _comparar(evaluador, modelo_falla, modelo_tipo, X[i:i + 1])
+
+
+def test_bosque_multiclase_igual_a_sklearn(modelos):
+    _, _, X = modelos
+    y = np.digitize(X[:, 0] - X[:, 3], [-0.5, 0.5])  # Tres clases
+    modelo = RandomForestClassifier(n_estimators=8, random_state=1).fit(X, y)
+    bosque = BosquePlano.desde_sklearn(modelo)
+    assert np.array_equal(bosque.predict(X), modelo.predict(X))
+    assert np.array_equal(bosque.predict_proba(X), modelo.predict_proba(X))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_guardado_y_cargado_igual_a_sklearn(modelos, tmp_path, mmap):
+    modelo_falla, modelo_tipo, X = modelos
+    EvaluadorPlano.desde_sklearn(modelo_falla, modelo_tipo).guardar(str(tmp_path / "bosques_planos"))
+    evaluador = EvaluadorPlano.cargar(str(tmp_path / "bosques_planos"), mmap=mmap)
+    _comparar(evaluador, modelo_falla, modelo_tipo, X)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import database
+from cache_maquinas import CacheMaquinas, cache_maquinas
+from conftest import crear_maquina, lecturas_csv
+
+
+def _lectura(machine_id, tipo="L"):
+    return {**lecturas_csv(1, {"L": machine_id, "M": machine_id, "H": machine_id})[0], "Type": tipo}
+
+
+def _consultar(metodo, argumento):
+    """Corre un método de la caché con su propia AsyncSession (fuera del loop del TestClient)."""
+    async def consultar():
+        async with database.AsyncSessionLocal() as db:
+            encontradas = await metodo(db, argumento)
+        await database.engine_async.dispose()
+        return set(encontradas) if isinstance(encontradas, dict) else encontradas
+
+    return asyncio.run(consultar())
+
+
+def test_update_invalida_la_entrada(cliente):
+    machine_id = crear_maquina(cliente, "L")
+    assert cliente.post("/predecir", json=_lectura(machine_id, "L")).status_code == 200
+
+    # Cambiar el 'type' se ve de inmediato, aunque la máquina ya estaba en caché
+    assert cliente.put(f"/api/machines/{machine_id}", json={"type": "M"}).status_code == 200
+    assert cliente.post("/predecir", json=_lectura(machine_id, "L")).status_code == 400
+    assert cliente.post("/predecir", json=_lectura(machine_id, "M")).status_code == 200
+
+
+
+def test_delete_invalida_la_entrada(cliente):
+    machine_id = crear_maquina(cliente, "L")
+    # Un 'Type' equivocado deja la máquina en caché sin guardar lecturas
+    assert cliente.post("/predecir", json=_lectura(machine_id, "M")).status_code == 400
+    assert cliente.delete(f"/api/machines/{machine_id}").status_code == 204
+    assert cliente.post("/predecir", json=_lectura(machine_id, "L")).status_code == 404
+
+
+def test_maquina_inexistente_no_se_guarda(cliente):
+    machine_id = crear_maquina(cliente, "L")
+    siguiente = machine_id + 1
+    assert cliente.post("/predecir", json=_lectura(siguiente)).status_code == 404
+    assert crear_maquina(cliente, "L") == siguiente
+    assert cliente.post("/predecir", json=_lectura(siguiente)).status_code == 200
+
+
+def test_aciertos_y_una_consulta_para_las_faltantes(cliente, bd):
+    maquinas = [crear_maquina(cliente, "L") for _ in range(3)]
+    cache_maquinas.invalidar()
+    antes = cache_maquinas.estadisticas()
+
+    assert _consultar(cache_maquinas.obtener_varios, maquinas + [maquinas[0]]) == set(maquinas)
+    assert _consultar(cache_maquinas.obtener_varios, maquinas) == set(maquinas)
+
+    despues = cache_maquinas.estadisticas()
+    assert despues["fallos"] - antes["fallos"] == 3
+    assert despues["aciertos"] - antes["aciertos"] == 3
+
+
+def test_ttl_y_tamano_maximo(cliente, bd):
+    maquinas = [crear_maquina(cliente, "L") for _ in range(3)]
+    cache = CacheMaquinas(max_entradas=2, ttl_s=0.05)
+    _consultar(cache.obtener_varios, maquinas)
+    assert cache.estadisticas()["entradas"] == 2
+
+    _consultar(cache.obtener, maquinas[-1])
+    assert cache.estadisticas()["aciertos"] == 1
+    time.sleep(0.06)
+    _consultar(cache.obtener, maquinas[-1])  # Vencida: se vuelve a consultar
+    assert cache.estadisticas()["aciertos"] == 1
+    assert cache.estadisticas()["fallos"] == 4
@@ -0,0 +1,65 @@
+import numpy as np
+
+from cache_predicciones import CachePredicciones, cache_predicciones
+from conftest import crear_maquina, lecturas_csv
+
+
+def _resultado(i):
+    return i % 2, np.array([0.25, 0.75]), np.array([i, 0, 0])
+
+
+def test_clave_por_version_y_vector():
+    cache = CachePredicciones(max_entradas=10)
+    X = np.arange(12, dtype=np.float32).reshape(3, 4)
+    cache.guardar_varios("v1", X[:2], [_resultado(0), _resultado(1)])
+
+    encontrados = cache.obtener_varios("v1", X)
+    assert encontrados[0][0] == 0 and encontrados[1][0] == 1 and encontrados[2] is None
+    assert cache.obtener_varios("v2", X[:1]) == [None]  # Otra versión de los modelos
+    assert cache.estadisticas()["aciertos"] == 2
+    assert cache.estadisticas()["fallos"] == 2
+
+    cache.invalidar()
+    assert cache.obtener_varios("v1", X[:1]) == [None]
+
+
+def test_tamano_maximo():
+    cache = CachePredicciones(max_entradas=2)
+    X = np.eye(3, dtype=np.float32)
+    cache.guardar_varios("v1", X, [_resultado(i) for i in range(3)])
+    assert cache.estadisticas()["entradas"] == 2
+    assert cache.obtener_varios("v1", X)[0] is None  # La menos usada salió
+
+
+def test_cuantizacion():
+    exacta = CachePredicciones()
+    cuantizada = CachePredicciones(cuantizacion=0.5)
+    X = np.array([[300.1, -0.1]], dtype=np.float32)
+    casi_igual = np.array([[300.05, 0.1]], dtype=np.float32)
+    for cache in (exacta, cuantizada):
+        cache.guardar_varios("v1", X, [_resultado(1)])
+    assert exacta.obtener_varios("v1", casi_igual) == [None]
+    assert cuantizada.obtener_varios("v1", casi_igual)[0][0] == 1
+
+
+def test_lote_con_y_sin_cache_responde_igual(cliente, monkeypatch):
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+    lecturas = lecturas_csv(100, maquinas, desde=6000)
+    lecturas = lecturas + lecturas[:50]
+
+    def predecir():
+        resultados = cliente.post("/predecir/lote", json=lecturas).json()["resultados"]
+        return [{k: v for k, v in r["resultado"].items() if k != "reading_saved_id"} for r in resultados]
+
+    cache_predicciones.invalidar()
+    antes = cache_predicciones.estadisticas()
+    con_cache = predecir()
+    assert predecir() == con_cache
+    despues = cache_predicciones.estadisticas()
+    # El primer lote se busca entero antes de evaluar (los repetidos también fallan); el segundo acierta todo
+    assert despues["fallos"] - antes["fallos"] == 150
+    assert despues["aciertos"] - antes["aciertos"] == 150
+
+    monkeypatch.setattr(cache_predicciones, "activa", False)
+    assert predecir() == con_cache
+    assert cliente.post("/predecir", json=lecturas[0]).status_code == 200
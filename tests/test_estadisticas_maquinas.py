@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import delete
+
+import models
+from conftest import CSV, crear_maquina, lecturas_csv
+from estadisticas_maquinas import (N_CUBETAS, RANGOS_SENSORES, SENSORES, EstadisticasMaquinas,
+                                   EstadisticasSensores, comparar_con_referencia)
+from features import COLUMNAS_CSV, COLUMNAS_NUMERICAS
+
+# Sensores de las primeras 3000 filas del CSV, en el orden de SENSORES
+DATOS = pd.read_csv(CSV, nrows=3000).rename(columns=COLUMNAS_CSV)
+X = DATOS[COLUMNAS_NUMERICAS].to_numpy(dtype=np.float64)
+FALLAS = DATOS["Machine failure"].to_numpy()
+
+
+def _por_partes(X, fallas, cortes):
+    estadisticas = EstadisticasSensores()
+    for inicio, fin in zip([0, *cortes], [*cortes, len(X)]):
+        estadisticas.actualizar(X[inicio:fin], fallas[inicio:fin])
+    return estadisticas
+
+
+def test_en_linea_igual_a_numpy():
+    # Filas sueltas (Welford) y lotes de distintos tamaños (Chan) mezclados
+    estadisticas = _por_partes(X, FALLAS, [1, 2, 3, 50, 51, 700, 2999])
+    assert estadisticas.n == 3000
+    assert estadisticas.fallas == FALLAS.sum()
+    np.testing.assert_allclose(estadisticas.media, X.mean(axis=0))
+    np.testing.assert_allclose(estadisticas.desviacion(), X.std(axis=0, ddof=1))
+    np.testing.assert_array_equal(estadisticas.minimo, X.min(axis=0))
+    np.testing.assert_array_equal(estadisticas.maximo, X.max(axis=0))
+
+    ancho = np.array([(RANGOS_SENSORES[s][1] - RANGOS_SENSORES[s][0]) / N_CUBETAS for s in SENSORES])
+    for p, valores in estadisticas.cuantiles().items():
+        assert np.all(np.abs(valores - np.quantile(X, p, axis=0)) <= ancho)
+
+
+def test_combinar_y_guardar():
+    a = _por_partes(X[:1234], FALLAS[:1234], [600])
+    b = _por_partes(X[1234:], FALLAS[1234:], [])
+    todo = _por_partes(X, FALLAS, [])
+    for combinada in (a.combinar(b), b.combinar(a)):
+        np.testing.assert_allclose(combinada.media, todo.media)
+        np.testing.assert_allclose(combinada.m2, todo.m2)
+        np.testing.assert_array_equal(combinada.histograma, todo.histograma)
+
+    copia = EstadisticasSensores.desde_dict(todo.a_dict())
+    assert copia.resumen() == todo.resumen()
+    assert EstadisticasSensores.desde_dict({**todo.a_dict(), "version": -1}) is None
+
+
+def test_psi_estable_y_deriva():
+    # El CSV está ordenado en el tiempo (la temperatura del aire deriva): se mezcla antes de partirlo
+    orden = np.random.default_rng(0).permutation(len(X))
+    en_referencia, muestra = orden[:2000], orden[2000:]
+    referencia = _por_partes(X[en_referencia], FALLAS[en_referencia], [])
+    igual = _por_partes(X[muestra], FALLAS[muestra], [])
+    assert comparar_con_referencia(igual, referencia)["estado"] == "estable"
+
+    caliente = X[muestra].copy()
+    caliente[:, SENSORES.index("air_temperature")] += 3.0
+    resultado = comparar_con_referencia(_por_partes(caliente, FALLAS[muestra], []), referencia)
+    assert resultado["estado"] == "deriva"
+    assert max(resultado["sensores"], key=lambda s: resultado["sensores"][s]["psi"]) == "air_temperature"
+
+
+def _filas(machine_id, desde, hasta):
+    return [{"machine_id": machine_id, "machine_failure": FALLAS[i], **dict(zip(SENSORES, X[i]))}
+            for i in range(desde, hasta)]
+
+
+def _crear_maquina_bd(bd):
+    with bd.begin() as conn:
+        return conn.execute(models.Machine.__table__.insert().values(type="L")).inserted_primary_key[0]
+
+
+def test_checkpoints_de_dos_workers(bd):
+    maquinas = [_crear_maquina_bd(bd) for _ in range(2)]
+    worker_a, worker_b = EstadisticasMaquinas(), EstadisticasMaquinas()
+    worker_a.registrar(_filas(maquinas[0], 0, 500) + _filas(maquinas[1], 500, 600))
+    worker_b.registrar(_filas(maquinas[0], 1000, 1300))
+    assert worker_a.checkpoint(bd) == 2
+    assert worker_b.checkpoint(bd) == 1
+
+    nuevo = EstadisticasMaquinas()
+    assert nuevo.cargar(bd) == 2
+    combinada = nuevo.obtener(maquinas[0])
+    esperado = np.vstack([X[0:500], X[1000:1300]])
+    assert combinada.n == 800
+    np.testing.assert_allclose(combinada.media, esperado.mean(axis=0))
+
+    # Una máquina borrada antes del checkpoint se descarta
+    worker_a.registrar(_filas(maquinas[1], 0, 10))
+    with bd.begin() as conn:
+        conn.execute(delete(models.Machine).where(models.Machine.machine_id == maquinas[1]))
+    assert worker_a.checkpoint(bd) == 0
+
+
+def test_cargar_trae_lo_de_los_otros_workers(bd):
+    maquinas = [_crear_maquina_bd(bd) for _ in range(2)]
+    worker_a, worker_b = EstadisticasMaquinas(), EstadisticasMaquinas()
+    worker_a.registrar(_filas(maquinas[0], 0, 200))
+    worker_a.checkpoint(bd)
+    assert worker_b.cargar(bd) == 1
+    assert worker_b.cargar(bd) == 0  # Sin cambios no se vuelve a leer
+
+    worker_b.registrar(_filas(maquinas[0], 200, 300) + _filas(maquinas[1], 300, 350))
+    worker_b.checkpoint(bd)
+    assert worker_a.cargar(bd) == 2
+    assert worker_a.obtener(maquinas[0]).n == 300
+    assert worker_a.obtener(maquinas[1]).n == 50
+
+    # Reiniciada por un worker: el otro la olvida en su próxima sincronización
+    worker_b.reiniciar(bd, maquinas[1])
+    worker_a.cargar(bd)
+    assert worker_a.obtener(maquinas[1]) is None
+    assert worker_a.machine_ids() == [maquinas[0]]
+
+
+@pytest.fixture
+def maquinas(cliente):
+    return {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+
+
+def test_endpoints_de_estadisticas_y_deriva(cliente, maquinas):
+    lecturas = lecturas_csv(600, maquinas, desde=5000)
+    assert cliente.post("/predecir/lote", json=lecturas).json()["exitosas"] == 600
+
+    de_l = np.array([[l["temp_aire"], l["temp_proceso"], l["velocidad_rotacion"], l["torque"],
+                      l["desgaste_herramienta"]] for l in lecturas if l["Type"] == "L"])
+    stats = cliente.get(f"/api/machines/{maquinas['L']}/stats").json()
+    assert stats["lecturas"] == len(de_l)
+    for j, sensor in enumerate(SENSORES):
+        assert stats["sensores"][sensor]["media"] == pytest.approx(de_l[:, j].mean())
+        assert stats["sensores"][sensor]["maximo"] == pytest.approx(de_l[:, j].max())
+
+    deriva = cliente.get(f"/api/machines/{maquinas['L']}/drift").json()
+    assert deriva["lecturas"] == len(de_l) and deriva["model_version"] is not None
+    assert deriva["puntaje"] == max(s["psi"] for s in deriva["sensores"].values())
+    assert cliente.get(f"/api/machines/{maquinas['H']}/drift").json()["estado"] == "insuficiente"
+    assert {d["machine_id"] for d in cliente.get("/api/drift/").json()} == set(maquinas.values())
+
+    assert cliente.delete(f"/api/machines/{maquinas['L']}/stats").status_code == 204
+    assert cliente.get(f"/api/machines/{maquinas['L']}/stats").json()["lecturas"] == 0
+    assert cliente.get("/api/machines/999/stats").status_code == 404
+
+    # Al borrar la máquina se van también sus estadísticas en memoria
+    assert cliente.delete(f"/api/machines/{maquinas['M']}").status_code == 204
+    assert maquinas["M"] not in {d["machine_id"] for d in cliente.get("/api/drift/").json()}
@@ -0,0 +1,79 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import exportar_lecturas
+from conftest import CSV
+from importar_csv import importar_csv
+
+INICIO = datetime(2026, 3, 1)
+COLUMNAS_CSV = [c for c in exportar_lecturas.COLUMNAS_EXPORTACION if c not in ("UDI", "RNF", "timestamp")]
+
+
+@pytest.fixture
+def origen(bd):
+    """300 filas del CSV de entrenamiento importadas con un timestamp por minuto."""
+    df = pd.read_csv(CSV, nrows=300)
+    df["timestamp"] = [INICIO + timedelta(minutes=i) for i in range(len(df))]
+    importar_csv(io.StringIO(df.to_csv(index=False)), bd, reportar=None)
+    return df
+
+
+def _exportar(cliente, formato="csv", **filtros):
+    respuesta = cliente.get("/api/datos/exportar", params={"formato": formato, **filtros})
+    assert respuesta.status_code == 200
+    if formato == "csv":
+        return pd.read_csv(io.StringIO(respuesta.text))
+    if formato == "ndjson":
+        return pd.DataFrame([json.loads(linea) for linea in respuesta.text.splitlines()])
+    return pd.read_parquet(io.BytesIO(respuesta.content))
+
+
+def test_csv_vuelve_a_ser_el_csv_de_entrenamiento(cliente, origen):
+    exportado = _exportar(cliente)
+    assert list(exportado.columns) == exportar_lecturas.COLUMNAS_EXPORTACION
+    pd.testing.assert_frame_equal(exportado[COLUMNAS_CSV], origen[COLUMNAS_CSV], check_dtype=False)
+    assert (pd.to_datetime(exportado["timestamp"]) == origen["timestamp"]).all()
+
+    # RNF solo viaja con las lecturas marcadas como falla (ver exportar_lecturas.py)
+    fallas = origen["Machine failure"] == 1
+    assert (exportado.loc[fallas, "RNF"] == origen.loc[fallas, "RNF"]).all()
+    assert exportado["UDI"].is_monotonic_increasing
+
+
+@pytest.mark.parametrize("formato", ["ndjson", "parquet"])
+def test_formatos_con_las_mismas_filas(cliente, origen, formato):
+    pytest.importorskip("pyarrow")
+    csv = _exportar(cliente)
+    otro = _exportar(cliente, formato)
+    otro["timestamp"] = pd.to_datetime(otro["timestamp"])
+    csv["timestamp"] = pd.to_datetime(csv["timestamp"])
+    pd.testing.assert_frame_equal(otro, csv, check_dtype=False)
+
+
+def test_filtros(cliente, origen):
+    desde, hasta = INICIO + timedelta(minutes=50), INICIO + timedelta(minutes=120)
+    rango = _exportar(cliente, **{"from": desde.isoformat(), "to": hasta.isoformat()})
+    assert len(rango) == 70
+    assert pd.to_datetime(rango["timestamp"]).between(desde, hasta, inclusive="left").all()
+
+    fallas = _exportar(cliente, machine_failure=True)
+    assert len(fallas) == origen["Machine failure"].sum()
+    assert (fallas["Machine failure"] == 1).all()
+
+    una = _exportar(cliente, machine_id=1)
+    assert len(una) == (origen["Product ID"] == origen.loc[0, "Product ID"]).sum()
+
+
+def test_lotes_pequenos_y_sin_lecturas(bd, origen):
+    consulta = exportar_lecturas.consulta_exportacion()
+    lotes = list(exportar_lecturas.lotes_de_filas(bd, consulta, filas_por_lote=64))
+    assert [len(lote) for lote in lotes] == [64] * 4 + [44]
+    partes = list(exportar_lecturas.exportar_csv(iter(lotes)))
+    assert len(pd.read_csv(io.StringIO("".join(partes)))) == 300
+
+    vacio = "".join(exportar_lecturas.exportar_csv(iter([])))
+    assert vacio.strip() == ",".join(exportar_lecturas.COLUMNAS_EXPORTACION)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+import schemas
+from conftest import crear_maquina, lecturas_csv
+from flujo_lecturas import ConsumidorLento, IngestaFlujo
+
+LECTURA = {"machine_id": 1, "Type": "L", "temp_aire": 298.1, "temp_proceso": 308.6,
+           "velocidad_rotacion": 1551, "torque": 42.8, "desgaste_herramienta": 0}
+
+
+async def _mensajes(textos):
+    for texto in textos:
+        yield texto
+
+
+def _sesion(ingesta, textos):
+    async def sesion():
+        return [ventana async for ventana in ingesta.veredictos(_mensajes(textos))]
+    return asyncio.run(sesion())
+
+
+def _procesador(tamanos, fallar_en=None):
+    async def procesar_ventana(lecturas):
+        tamanos.append(len(lecturas))
+        if len(tamanos) == fallar_en:
+            raise RuntimeError("BD caída")
+        return [
+            schemas.PrediccionLoteItem(indice=k, machine_id=datos.machine_id, error=f"eco {datos.torque}")
+            for k, datos in enumerate(lecturas)
+        ]
+    return procesar_ventana
+
+
+def test_un_veredicto_por_mensaje_en_orden():
+    tamanos = []
+    ingesta = IngestaFlujo(_procesador(tamanos), max_ventana=8, max_espera_ms=20)
+    textos = [json.dumps({**LECTURA, "torque": float(i)}) for i in range(30)]
+    textos[5] = "{no es json"
+    textos[17] = json.dumps({**LECTURA, "torque": "mucho"})
+
+    veredictos = [v for ventana in _sesion(ingesta, textos) for v in ventana]
+
+    assert [v.indice for v in veredictos] == list(range(30))
+    for i, veredicto in enumerate(veredictos):
+        if i in (5, 17):
+            assert veredicto.error.startswith("Mensaje inválido") and veredicto.machine_id is None
+        else:
+            assert veredicto.error == f"eco {float(i)}" and veredicto.machine_id == 1
+    assert sum(tamanos) == 28 and max(tamanos) <= 8 and len(tamanos) < 28
+
+    estadisticas = ingesta.estadisticas()
+    assert estadisticas["mensajes"] == 30
+    assert estadisticas["mensajes_invalidos"] == 2
+    assert estadisticas["sesiones_activas"] == 0
+
+
+def test_ventana_fallida_no_corta_la_sesion():
+    tamanos = []
+    ingesta = IngestaFlujo(_procesador(tamanos, fallar_en=1), max_ventana=1)
+    veredictos = [v for ventana in _sesion(ingesta, [json.dumps(LECTURA)] * 3) for v in ventana]
+    assert veredictos[0].error == "Error durante la predicción: BD caída"
+    assert [v.error for v in veredictos[1:]] == ["eco 42.8"] * 2
+
+
+def test_consumidor_lento_corta_la_sesion():
+    ingesta = IngestaFlujo(_procesador([]), max_ventana=1, max_pendientes=2, timeout_envio_s=0.05)
+
+    async def sesion():
+        veredictos = ingesta.veredictos(_mensajes([json.dumps(LECTURA)] * 20))
+        await veredictos.__anext__()
+        await asyncio.sleep(0.3)  # El cliente deja de leer
+        with pytest.raises(ConsumidorLento):
+            async for _ in veredictos:
+                pass
+
+    asyncio.run(sesion())
+    assert ingesta.estadisticas()["cortadas_por_lentitud"] == 1
+
+
+def _sin_id(resultado):
+    return {clave: valor for clave, valor in resultado.items() if clave != "reading_saved_id"}
+
+
+def test_ndjson_igual_a_predecir_lote(cliente):
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+    lecturas = lecturas_csv(120, maquinas, desde=2000)
+    lote = cliente.post("/predecir/lote", json=lecturas).json()["resultados"]
+
+    cuerpo = "".join(json.dumps(lectura) + "\n" for lectura in lecturas) + "{roto\n"
+    respuesta = cliente.post("/predecir/flujo", content=cuerpo, headers={"Content-Type": "application/x-ndjson"})
+    assert respuesta.status_code == 200
+    veredictos = [json.loads(linea) for linea in respuesta.text.splitlines()]
+
+    assert [v["indice"] for v in veredictos] == list(range(121))
+    assert [_sin_id(v["resultado"]) for v in veredictos[:120]] == [_sin_id(r["resultado"]) for r in lote]
+    assert veredictos[120]["error"].startswith("Mensaje inválido")
+
+
+def test_websocket(cliente):
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+    lecturas = lecturas_csv(20, maquinas) + [{**LECTURA, "machine_id": 999}]
+    with cliente.websocket_connect("/predecir/ws") as websocket:
+        for lectura in lecturas:
+            websocket.send_text(json.dumps(lectura))
+        veredictos = [json.loads(websocket.receive_text()) for _ in lecturas]
+
+    assert [v["indice"] for v in veredictos] == list(range(21))
+    assert all(v["resultado"]["reading_saved_id"] for v in veredictos[:20])
+    assert "no encontrada" in veredictos[20]["error"]
+    assert cliente.get("/predecir/estadisticas").json()["flujo"]["sesiones_activas"] == 0
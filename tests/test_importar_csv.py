@@ -0,0 +1,88 @@
+import io
+
+import pandas as pd
+import pytest
+from sqlalchemy import func, insert, select
+
+import models
+from conftest import CSV, DIRECTORIO, crear_maquina, lecturas_csv
+from importar_csv import COLUMNAS_FALLA_CSV, importar_csv
+
+
+def _csv(n, desde=0):
+    return pd.read_csv(CSV, skiprows=range(1, desde + 1), nrows=n)
+
+
+def _texto(df):
+    return io.StringIO(df.to_csv(index=False))
+
+
+def _contar(bd, tabla):
+    with bd.connect() as conn:
+        return conn.execute(select(func.count()).select_from(tabla)).scalar()
+
+
+def test_importa_por_bloques_igual_al_csv(bd):
+    df = _csv(250)
+    resumen = importar_csv(_texto(df), bd, tamano_bloque=100, reportar=None)
+
+    assert resumen["filas"] == 250
+    assert resumen["fallas"] == df["Machine failure"].sum() > 0
+    assert resumen["maquinas_creadas"] == df["Product ID"].nunique()
+    assert resumen["rechazadas"] == 0
+    assert _contar(bd, models.MachineReading) == 250
+
+    with bd.connect() as conn:
+        banderas = conn.execute(
+            select(models.MachineReading.failure_flags).where(models.MachineReading.failure_flags.is_not(None))
+        ).scalars().all()
+        tipos = dict(conn.execute(select(models.Machine.product_id, models.Machine.type)).all())
+    fallas = df[df["Machine failure"] == 1]
+    assert len(banderas) == len(fallas)
+    for columna in COLUMNAS_FALLA_CSV:
+        bit = models.FAILURE_FLAGS[columna.lower()]
+        assert sum(bool(b & bit) for b in banderas) == fallas[columna].sum()
+    assert tipos == dict(zip(df["Product ID"], df["Type"]))
+
+    # Importar de nuevo reutiliza las máquinas por 'Product ID'
+    otra_vez = importar_csv(_texto(df), bd, tamano_bloque=100, reportar=None)
+    assert otra_vez["maquinas_creadas"] == 0
+    assert _contar(bd, models.MachineReading) == 500
+
+
+def test_type_distinto_al_de_la_maquina_se_rechaza(bd):
+    df = _csv(20)
+    producto, tipo = df.loc[0, ["Product ID", "Type"]]
+    with bd.begin() as conn:
+        conn.execute(insert(models.Machine).values(product_id=producto, type="H" if tipo != "H" else "L"))
+
+    resumen = importar_csv(_texto(df), bd, reportar=None)
+    assert resumen["rechazadas"] == (df["Product ID"] == producto).sum()
+    assert resumen["filas"] == 20 - resumen["rechazadas"]
+
+
+def test_faltan_columnas(bd):
+    with pytest.raises(ValueError):
+        importar_csv(_texto(_csv(5).drop(columns=["Torque [Nm]"])), bd, reportar=None)
+
+
+def test_puntuar_igual_a_predecir_lote(cliente, bd, monkeypatch):
+    monkeypatch.chdir(DIRECTORIO)  # Donde están los modelos entrenados
+    maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+    assert cliente.post("/predecir/lote", json=lecturas_csv(300, maquinas, desde=3000)).json()["exitosas"] == 300
+
+    df = _csv(300, desde=3000)
+    respuesta = cliente.post("/api/datos/importar", params={"puntuar": True, "bloque": 128},
+                             files={"archivo": ("lecturas.csv", df.to_csv(index=False))})
+    assert respuesta.status_code == 200
+    assert respuesta.json()["filas"] == 300
+
+    def fallas(condicion):
+        with bd.connect() as conn:
+            return conn.execute(
+                select(models.MachineReading.machine_failure).where(condicion).order_by(models.MachineReading.reading_id)
+            ).scalars().all()
+
+    predichas = fallas(models.MachineReading.machine_id.in_(maquinas.values()))
+    assert fallas(models.MachineReading.machine_id.not_in(maquinas.values())) == predichas
+    assert any(predichas)
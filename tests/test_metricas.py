@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import metricas
+
+
+def test_etapa_bd_cuenta_las_sentencias_que_fallan(bd):
+    medicion = metricas.Medicion()
+    token = metricas._medicion_actual.set(medicion)
+    try:
+        with bd.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM tabla_que_no_existe"))
+            assert medicion.etapas["bd"] > 0
+            antes = medicion.etapas["bd"]
+            conn.execute(text("SELECT 1"))
+            # El inicio de la sentencia fallida no queda colgado de la conexión
+            assert 0 < medicion.etapas["bd"] - antes < 1
+            assert "inicio_sentencia" not in conn.connection.info
+    finally:
+        metricas._medicion_actual.reset(token)
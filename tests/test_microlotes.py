@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+
+from microlotes import AgrupadorPredicciones
+
+
+def _suma_y_primera(X):
+    return X.sum(axis=1), X[:, 0]
+
+
+def test_agrupa_filas_concurrentes_y_responde_a_cada_una():
+    llamadas = []
+
+    def funcion_lote(X):
+        llamadas.append(len(X))
+        return _suma_y_primera(X)
+
+    async def escenario():
+        agrupador = AgrupadorPredicciones(funcion_lote, max_lote=8, max_espera_ms=20)
+        await agrupador.iniciar()
+        resultados = await asyncio.gather(*[agrupador.predecir(np.array([i, 1.0])) for i in range(20)])
+        estadisticas = agrupador.estadisticas()
+        await agrupador.detener()
+        return resultados, estadisticas
+
+    resultados, estadisticas = asyncio.run(escenario())
+
+    assert [tuple(map(float, r)) for r in resultados] == [(i + 1.0, float(i)) for i in range(20)]
+    assert max(llamadas) <= 8 and sum(llamadas) == 20
+    assert len(llamadas) < 20  # Se agruparon
+    assert estadisticas["peticiones"] == 20 and estadisticas["lotes"] == len(llamadas)
+
+
+def test_error_del_modelo_llega_a_cada_peticion_del_lote():
+    def falla(X):
+        raise ValueError("modelo roto")
+
+    async def escenario():
+        agrupador = AgrupadorPredicciones(falla, max_lote=4, max_espera_ms=5)
+        await agrupador.iniciar()
+        resultados = await asyncio.gather(*[agrupador.predecir(np.zeros(2)) for _ in range(3)], return_exceptions=True)
+        await agrupador.detener()
+        return resultados
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(escenario()))
+
+
+def test_detener_responde_lo_encolado_y_lo_que_llega_mientras_tanto():
+    async def escenario():
+        # Espera larga: las filas quedan en un lote a medio juntar al detener
+        agrupador = AgrupadorPredicciones(_suma_y_primera, max_lote=64, max_espera_ms=5000)
+        await agrupador.iniciar()
+        encoladas = [asyncio.create_task(agrupador.predecir(np.array([i, 1.0]))) for i in range(5)]
+        await asyncio.sleep(0.01)
+        deteniendo = asyncio.create_task(agrupador.detener())
+        await asyncio.sleep(0)
+        assert not agrupador.activo
+        durante = await agrupador.predecir(np.array([9.0, 1.0]))  # Se evalúa directo, sin RuntimeError
+        await deteniendo
+        return await asyncio.gather(*encoladas), durante
+
+    encoladas, durante = asyncio.run(asyncio.wait_for(escenario(), 10))
+    assert [tuple(map(float, r)) for r in encoladas] == [(i + 1.0, float(i)) for i in range(5)]
+    assert tuple(map(float, durante)) == (10.0, 9.0)
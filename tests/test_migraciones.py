@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, inspect, select
+
+import agregados
+import models
+from conftest import crear_maquina
+from migraciones import migrar_failure_types
+
+# (twf, hdf, pwf, osf, rnf) como los guardaba la tabla failure_types
+DETALLES = [
+    (True, False, False, False, False),
+    (False, True, False, True, False),
+    (False, True, True, False, False),
+    (False, False, False, False, True),
+    (True, True, True, True, True),
+    (False, False, False, False, False),
+    (False, True, False, False, False),
+]
+INICIO = datetime(2026, 10, 1, 8, 0)
+
+
+def _fila(machine_id, i, **cambios):
+    return {"machine_id": machine_id, "timestamp": INICIO + timedelta(minutes=i), "machine_failure": False,
+            "air_temperature": 300.0, "process_temperature": 310.0, "rotational_speed": 1500,
+            "torque": 40.0, "tool_wear": i, **cambios}
+
+
+def _crear_maquina_bd(bd):
+    with bd.begin() as conn:
+        return conn.execute(insert(models.Machine).values(type="L").returning(models.Machine.machine_id)).scalar()
+
+
+def _crear_failure_types(bd, machine_id):
+    """Esquema viejo: lecturas sin failure_flags + su fila en failure_types."""
+    with bd.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE failure_types (failure_id INTEGER PRIMARY KEY, reading_id INTEGER NOT NULL, "
+            "twf BOOLEAN, hdf BOOLEAN, pwf BOOLEAN, osf BOOLEAN, rnf BOOLEAN)"
+        )
+        # Lecturas sin falla intercaladas: no deben recibir ningún bit
+        reading_ids = conn.execute(
+            insert(models.MachineReading).returning(models.MachineReading.reading_id, sort_by_parameter_order=True),
+            [_fila(machine_id, i, machine_failure=i % 2 == 0) for i in range(2 * len(DETALLES))],
+        ).scalars().all()
+        con_falla = reading_ids[::2]
+        for failure_id, (reading_id, detalle) in enumerate(zip(con_falla, DETALLES), start=100):
+            conn.exec_driver_sql(
+                "INSERT INTO failure_types VALUES (?, ?, ?, ?, ?, ?, ?)", (failure_id, reading_id, *detalle)
+            )
+    return con_falla
+
+
+def test_migrar_failure_types_conserva_los_conteos_por_tipo(bd):
+    con_falla = _crear_failure_types(bd, _crear_maquina_bd(bd))
+    esperados = {tipo: sum(detalle[i] for detalle in DETALLES) for i, tipo in enumerate(models.FAILURE_FLAGS)}
+
+    migrar_failure_types(bd)
+
+    assert "failure_types" not in inspect(bd).get_table_names()
+    lectura = models.MachineReading
+    with bd.connect() as conn:
+        for tipo, bit in models.FAILURE_FLAGS.items():
+            cantidad = conn.execute(select(func.count()).where(lectura.failure_flags.op("&")(bit) != 0)).scalar()
+            assert cantidad == esperados[tipo], tipo
+        migradas = conn.execute(
+            select(lectura.reading_id, lectura.legacy_failure_id).where(lectura.failure_flags.is_not(None))
+            .order_by(lectura.reading_id)
+        ).all()
+    # Cada falla conserva su failure_id viejo; las lecturas sin fila en failure_types quedan en NULL
+    assert migradas == list(zip(con_falla, range(100, 100 + len(DETALLES))))
+
+    # Los agregados reconstruidos cuentan lo mismo por tipo
+    agregados.reconstruir(bd, reportar=None)
+    with bd.connect() as conn:
+        totales = conn.execute(
+            select(*[func.sum(getattr(models.MachineRollupDaily, nombre)) for nombre in agregados.CONTADORES_FALLA])
+        ).one()
+    assert dict(zip(agregados.CONTADORES_FALLA.values(), totales)) == esperados
+
+
+def test_migrar_failure_types_no_pisa_failure_flags(bd):
+    con_falla = _crear_failure_types(bd, _crear_maquina_bd(bd))
+    with bd.begin() as conn:
+        conn.execute(models.MachineReading.__table__.update()
+                     .where(models.MachineReading.reading_id == con_falla[0])
+                     .values(failure_flags=models.FAILURE_FLAGS["osf"]))
+    migrar_failure_types(bd)
+    with bd.connect() as conn:
+        flags = conn.execute(select(models.MachineReading.failure_flags)
+                             .where(models.MachineReading.reading_id == con_falla[0])).scalar()
+    assert flags == models.FAILURE_FLAGS["osf"]
+    migrar_failure_types(bd)  # Sin failure_types: no hace nada
+
+
+def test_failure_id_viejo_sigue_funcionando(cliente, bd):
+    con_falla = _crear_failure_types(bd, _crear_maquina_bd(bd))
+    migrar_failure_types(bd)
+
+    respuesta = cliente.put("/api/failure_types/100", json={"osf": True})
+    assert respuesta.status_code == 200
+    assert (respuesta.json()["failure_id"], respuesta.json()["reading_id"]) == (100, con_falla[0])
+    with bd.connect() as conn:
+        flags = conn.execute(select(models.MachineReading.failure_flags)
+                             .where(models.MachineReading.reading_id == con_falla[0])).scalar()
+    assert flags == models.FAILURE_FLAGS["osf"]
+    # Un reading_id de una lectura migrada no se confunde con un failure_id viejo
+    assert cliente.put(f"/api/failure_types/{con_falla[1]}", json={"osf": True}).status_code == 404
+
+
+def test_failures_por_tipo(cliente, bd):
+    machine_id = crear_maquina(cliente)
+    banderas = [models.encode_failure_flags(dict(zip(models.FAILURE_FLAGS, detalle))) for detalle in DETALLES]
+    with bd.begin() as conn:
+        conn.execute(insert(models.MachineReading), [
+            _fila(machine_id, i, machine_failure=True, failure_flags=flags) for i, flags in enumerate(banderas)
+        ] + [_fila(machine_id, 7, machine_failure=True, failure_flags=None),
+             _fila(machine_id, 100, failure_flags=None)])
+
+    def tipos(**filtros):
+        lecturas = cliente.get("/api/failures/", params=filtros).json()
+        return [lectura["tool_wear"] for lectura in lecturas]
+
+    # Sin tipo: toda falla, también sin tipos registrados (flags 0 en la 5, NULL en la 7)
+    assert tipos() == [7, 6, 5, 4, 3, 2, 1, 0]
+    assert tipos(type="hdf") == [6, 4, 2, 1]
+    assert tipos(type=["twf", "pwf"]) == [4, 2, 0]
+    assert tipos(**{"type": "hdf", "from": (INICIO + timedelta(minutes=2)).isoformat()}) == [6, 4, 2]
+
+    detalle = cliente.get("/api/failures/", params={"type": "osf"}).json()[0]["failure_details"]
+    assert {tipo: detalle[tipo] for tipo in models.FAILURE_FLAGS} == dict(zip(models.FAILURE_FLAGS, DETALLES[4]))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+import models
+from conftest import crear_maquina
+
+
+def _insertar(bd, machine_id, cantidades):
+    """cantidades[i] lecturas con el MISMO timestamp, un minuto después del grupo anterior."""
+    inicio = datetime(2026, 10, 1, 8, 0, 0, 123456)
+    filas = [
+        {"machine_id": machine_id, "timestamp": inicio + timedelta(minutes=i), "machine_failure": False,
+         "air_temperature": 298.1, "process_temperature": 308.6, "rotational_speed": 1551,
+         "torque": 42.8, "tool_wear": i}
+        for i, cantidad in enumerate(cantidades) for _ in range(cantidad)
+    ]
+    with bd.begin() as conn:
+        conn.execute(insert(models.MachineReading), filas)
+
+
+def _todas_las_paginas(cliente, machine_id, limit):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        respuesta = cliente.get(f"/api/machines/{machine_id}/readings/", params=params)
+        assert respuesta.status_code == 200
+        pagina = respuesta.json()
+        assert len(pagina["items"]) <= limit
+        ids += [lectura["reading_id"] for lectura in pagina["items"]]
+        paginas += 1
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            return ids, paginas
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 5, 7, 50])
+def test_timestamps_repetidos_en_el_borde_de_pagina(cliente, bd, limit):
+    machine_id = crear_maquina(cliente)
+    otra = crear_maquina(cliente)
+    _insertar(bd, machine_id, [5, 1, 7, 3])
+    _insertar(bd, otra, [4])
+
+    ids, paginas = _todas_las_paginas(cliente, machine_id, limit)
+
+    # Todas las lecturas de la máquina, una sola vez, de la más reciente a la más antigua
+    lectura = models.MachineReading
+    with bd.connect() as conn:
+        esperado = conn.execute(
+            select(lectura.reading_id)
+            .where(lectura.machine_id == machine_id)
+            .order_by(lectura.timestamp.desc(), lectura.reading_id.desc())
+        ).scalars().all()
+    assert ids == esperado
+    assert paginas == -(-len(esperado) // limit)
+
+
+def test_cursor_invalido(cliente):
+    machine_id = crear_maquina(cliente)
+    respuesta = cliente.get(f"/api/machines/{machine_id}/readings/", params={"cursor": "no-es-un-cursor"})
+    assert respuesta.status_code == 400
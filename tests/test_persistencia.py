@@ -0,0 +1,142 @@
+import json
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import models
+from persistencia import ColaLlena, EscritorDiferido, reinsertar_pendientes
+
+
+def fila_lectura(machine_id, detalle=None):
+    return {
+        "machine_id": machine_id,
+        "air_temperature": 298.1,
+        "process_temperature": 308.6,
+        "rotational_speed": 1551,
+        "torque": 42.8,
+        "tool_wear": 0,
+        "machine_failure": detalle is not None,
+        "failure_flags": models.encode_failure_flags(detalle),
+    }
+
+
+def _guardadas(bd):
+    with bd.connect() as conn:
+        return conn.execute(select(func.count()).select_from(models.MachineReading)).scalar()
+
+
+@pytest.fixture
+def machine_id(bd):
+    with bd.begin() as conn:
+        return conn.execute(insert(models.Machine).values(type="L").returning(models.Machine.machine_id)).scalar()
+
+
+def test_escribe_lo_pendiente_al_detener(bd, tmp_path, machine_id):
+    escritor = EscritorDiferido(bd, tamano_lote=4, intervalo_ms=10, bloque_ids=3,
+                                archivo_pendientes=str(tmp_path / "pendientes.jsonl"))
+    escritor.iniciar()
+    detalle = {"twf": False, "hdf": True, "pwf": False, "osf": False, "rnf": False}
+    detalles = [detalle if i % 3 == 0 else None for i in range(10)]
+    ids = escritor.encolar_lote([(fila_lectura(machine_id, d), d) for d in detalles])
+    ids.append(escritor.encolar(fila_lectura(machine_id)))
+    escritor.detener()
+
+    # Los IDs vienen de bloques reservados: consecutivos y sin repetir
+    assert ids == list(range(ids[0], ids[0] + 11))
+    assert _guardadas(bd) == 11
+    lectura = models.MachineReading
+    with bd.connect() as conn:
+        assert set(conn.execute(select(lectura.reading_id)).scalars()) == set(ids)
+        con_falla = conn.execute(
+            select(lectura.reading_id, lectura.failure_flags).where(lectura.failure_flags.is_not(None))
+        ).all()
+    assert sorted(con_falla) == [(ids[i], models.FAILURE_FLAGS["hdf"]) for i in (0, 3, 6, 9)]
+
+    estadisticas = escritor.estadisticas()
+    assert estadisticas["escritas"] == 11
+    assert estadisticas["pendientes"] == 0
+    assert not estadisticas["activo"]
+
+
+def _lote(machine_id, n):
+    return [(fila_lectura(machine_id), None) for _ in range(n)]
+
+
+def _escritor(bd, tmp_path, politica, **opciones):
+    # Sin iniciar el hilo escritor: lo encolado se queda en la cola y la llena
+    return EscritorDiferido(bd, capacidad=5, politica_desborde=politica, bloque_ids=3,
+                            archivo_pendientes=str(tmp_path / "pendientes.jsonl"), **opciones)
+
+
+def test_rechazar_es_todo_o_nada(bd, tmp_path, machine_id):
+    escritor = _escritor(bd, tmp_path, "rechazar")
+    primeros = escritor.encolar_lote(_lote(machine_id, 4))
+
+    with pytest.raises(ColaLlena):
+        escritor.encolar_lote(_lote(machine_id, 2))  # 4 + 2 > 5: no entra ninguna
+    assert escritor.estadisticas()["pendientes"] == 4
+    assert escritor.estadisticas()["rechazadas"] == 2
+
+    # El rechazo no consumió IDs: el lote siguiente sigue la numeración
+    siguientes = escritor.encolar_lote(_lote(machine_id, 1))
+    assert siguientes == [primeros[-1] + 1]
+
+    escritor.iniciar()
+    escritor.detener()
+    assert _guardadas(bd) == 5
+
+
+def test_bloquear_lanza_cola_llena_al_vencer_la_espera(bd, tmp_path, machine_id):
+    escritor = _escritor(bd, tmp_path, "bloquear", timeout_bloqueo_s=0.05)
+    escritor.encolar_lote(_lote(machine_id, 5))
+    with pytest.raises(ColaLlena):
+        escritor.encolar_lote(_lote(machine_id, 1))
+    assert escritor.estadisticas()["pendientes"] == 5
+
+
+def test_sincrono_escribe_el_lote_completo(bd, tmp_path, machine_id):
+    escritor = _escritor(bd, tmp_path, "sincrono")
+    encolados = escritor.encolar_lote(_lote(machine_id, 4))
+    directos = escritor.encolar_lote(_lote(machine_id, 3))  # No entra: se escribe entero, ya
+
+    assert escritor.estadisticas()["pendientes"] == 4
+    with bd.connect() as conn:
+        guardados = set(conn.execute(select(models.MachineReading.reading_id)).scalars())
+    assert guardados == set(directos)
+
+    escritor.iniciar()
+    escritor.detener()
+    assert _guardadas(bd) == 7
+    assert len(set(encolados) | set(directos)) == 7
+
+
+def test_lote_mas_grande_que_la_capacidad_entra_con_la_cola_vacia(bd, tmp_path, machine_id):
+    escritor = _escritor(bd, tmp_path, "rechazar")
+    assert len(escritor.encolar_lote(_lote(machine_id, 8))) == 8
+    with pytest.raises(ColaLlena):
+        escritor.encolar_lote(_lote(machine_id, 1))
+
+
+def test_error_permanente_va_al_archivo_de_pendientes(bd, tmp_path, machine_id):
+    escritor = _escritor(bd, tmp_path, "rechazar")
+    # La máquina 999 no existe: esa lectura falla por la FK, las demás del lote se escriben
+    ids = escritor.encolar_lote(_lote(machine_id, 2) + _lote(999, 1) + _lote(machine_id, 2))
+    escritor.iniciar()
+    escritor.detener()
+
+    assert _guardadas(bd) == 4
+    assert escritor.estadisticas()["en_archivo_pendientes"] == 1
+    archivo = tmp_path / "pendientes.jsonl"
+    assert [json.loads(linea)["fila"]["reading_id"] for linea in archivo.read_text().splitlines()] == [ids[2]]
+
+    # Con la máquina creada, reinsertar escribe lo pendiente y borra el archivo
+    with bd.begin() as conn:
+        conn.execute(insert(models.Machine).values(machine_id=999, type="L"))
+    reinsertar_pendientes(bd, str(archivo), reportar=None)
+    assert _guardadas(bd) == 5
+    assert not archivo.exists()
+
+
+def test_politica_desconocida():
+    with pytest.raises(ValueError):
+        EscritorDiferido(None, politica_desborde="descartar")
@@ -0,0 +1,69 @@
+from sqlalchemy import func, select
+
+import models
+from conftest import crear_maquina, lecturas_csv
+
+
+def _maquinas(cliente):
+    return {tipo: crear_maquina(cliente, tipo) for tipo in ("L", "M", "H")}
+
+
+def _contar(bd, tabla):
+    with bd.connect() as conn:
+        return conn.execute(select(func.count()).select_from(tabla)).scalar()
+
+
+def test_lote_igual_a_predecir_de_a_una(cliente, bd):
+    maquinas = _maquinas(cliente)
+    # Entre estas filas del CSV hay fallas (TWF, HDF, PWF, OSF) además de lecturas normales
+    lecturas = lecturas_csv(200, maquinas, desde=4000)
+
+    lote = cliente.post("/predecir/lote", json=lecturas).json()
+    assert (lote["total"], lote["exitosas"], lote["fallidas"]) == (200, 200, 0)
+
+    for item, datos in zip(lote["resultados"], lecturas):
+        individual = cliente.post("/predecir", json=datos).json()
+        resultado = item["resultado"]
+        assert item["error"] is None
+        assert resultado["reading_saved_id"] != individual["reading_saved_id"]
+        resultado.pop("reading_saved_id"), individual.pop("reading_saved_id")
+        assert resultado == individual
+
+    fallas = sum(item["resultado"]["prediccion"] == "FALLA PROBABLE" for item in lote["resultados"])
+    assert fallas > 0
+    assert _contar(bd, models.MachineReading) == 400
+    with bd.connect() as conn:
+        con_tipos = conn.execute(
+            select(func.count()).where(models.MachineReading.failure_flags.is_not(None))
+        ).scalar()
+    assert con_tipos == 2 * fallas
+
+
+def test_lecturas_rechazadas_no_frenan_al_resto(cliente, bd):
+    maquinas = _maquinas(cliente)
+    buena, tipo_incorrecto, sin_maquina = lecturas_csv(3, maquinas)
+    tipo_incorrecto["Type"] = "H" if tipo_incorrecto["Type"] != "H" else "L"
+    sin_maquina["machine_id"] = 999
+
+    lote = cliente.post("/predecir/lote", json=[buena, tipo_incorrecto, sin_maquina]).json()
+
+    assert (lote["total"], lote["exitosas"], lote["fallidas"]) == (3, 1, 2)
+    resultados = lote["resultados"]
+    assert [item["indice"] for item in resultados] == [0, 1, 2]
+    assert resultados[0]["resultado"] is not None and resultados[0]["error"] is None
+    assert "no coincide" in resultados[1]["error"] and resultados[1]["resultado"] is None
+    assert "999" in resultados[2]["error"] and resultados[2]["resultado"] is None
+    assert _contar(bd, models.MachineReading) == 1
+
+
+def test_lote_vacio_o_sin_lecturas_validas(cliente, bd):
+    assert cliente.post("/predecir/lote", json=[]).json()["total"] == 0
+    lote = cliente.post("/predecir/lote", json=lecturas_csv(2, {"L": 998, "M": 999, "H": 997})).json()
+    assert lote["fallidas"] == 2
+    assert _contar(bd, models.MachineReading) == 0
+
+
+def test_lote_demasiado_grande(cliente, main, monkeypatch):
+    monkeypatch.setattr(main, "MAX_LECTURAS_POR_LOTE", 2)
+    maquinas = _maquinas(cliente)
+    assert cliente.post("/predecir/lote", json=lecturas_csv(3, maquinas)).status_code == 413
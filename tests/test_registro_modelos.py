@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import crear_maquina, lecturas_csv
+from registro_modelos import RegistroModelos, VersionNoEncontrada
+
+
+def _publicar(registro, version, **metadata):
+    _, temporal = registro.nueva_version()
+    registro.publicar(version, temporal, metadata)
+
+
+def test_activar_y_rollback(tmp_path):
+    registro = RegistroModelos(str(tmp_path))
+    assert registro.versiones() == []
+    assert registro.directorio_activo() == "."
+
+    _publicar(registro, "20260101-000000")
+    _publicar(registro, "20260102-000000")
+    registro.nueva_version()  # Un entrenamiento sin terminar no es una versión
+    assert registro.versiones() == ["20260101-000000", "20260102-000000"]
+
+    registro.activar("20260101-000000")
+    registro.activar("20260102-000000")
+    assert registro.version_activa() == "20260102-000000"
+    assert registro.directorio_activo() == os.path.join(str(tmp_path), "20260102-000000")
+    assert registro.rollback() == "20260101-000000"
+    with pytest.raises(VersionNoEncontrada):
+        registro.rollback()
+    with pytest.raises(VersionNoEncontrada):
+        registro.activar("20991231-000000")
+
+
+def test_rollback_salta_versiones_borradas(tmp_path):
+    registro = RegistroModelos(str(tmp_path))
+    for version in ("20260101-000000", "20260102-000000", "20260103-000000"):
+        _publicar(registro, version)
+        registro.activar(version)
+    shutil.rmtree(registro.ruta("20260102-000000"))
+    assert registro.rollback() == "20260101-000000"
+
+
+def test_temporales_sin_publicar_se_borran(tmp_path):
+    registro = RegistroModelos(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with registro.version_temporal() as (_, temporal):
+            raise RuntimeError("falló el entrenamiento")
+    assert not os.path.exists(temporal)
+
+    with registro.version_temporal() as (version, temporal):
+        registro.publicar(version, temporal, {})
+    assert registro.versiones() == [version]
+
+    # Los de entrenamientos que murieron se borran al empezar otro, pasado un día
+    viejo, reciente = tmp_path / ".20260101-000000.parcial", tmp_path / ".20260102-000000.parcial"
+    viejo.mkdir()
+    reciente.mkdir()
+    os.utime(viejo, (0, 0))
+    registro.nueva_version()
+    assert not viejo.exists() and reciente.exists()
+
+
+def test_cambio_de_version_en_caliente(cliente, main):
+    registro = main.gestor_modelos.registro
+    original = registro.version_activa()
+    assert original is not None
+
+    # Una segunda versión con los mismos archivos
+    nueva = "29991231-235959"
+    shutil.copytree(registro.ruta(original), registro.ruta(nueva))
+    with open(os.path.join(registro.ruta(nueva), "metadata.json"), "w") as f:
+        json.dump({**registro.metadata(original), "version": nueva}, f)
+
+    try:
+        maquinas = {tipo: crear_maquina(cliente, tipo) for tipo in "LMH"}
+        lectura = lecturas_csv(1, maquinas)[0]
+        assert cliente.post("/predecir", json=lectura).json()["model_version"] == original
+
+        estado = cliente.post(f"/api/modelos/{nueva}/activar").json()
+        assert estado["version_en_servicio"] == nueva
+        assert [v["version"] for v in estado["versiones"] if v["en_servicio"]] == [nueva]
+        respuesta = cliente.post("/predecir", json=lectura).json()
+        assert respuesta["model_version"] == nueva
+        lectura_guardada = cliente.get(f"/api/readings/{respuesta['reading_saved_id']}").json()
+        assert lectura_guardada["model_version"] == nueva
+
+        assert cliente.post("/api/modelos/rollback").json()["version_en_servicio"] == original
+        assert cliente.post("/predecir", json=lectura).json()["model_version"] == original
+        assert cliente.post("/api/modelos/no-existe/activar").status_code == 404
+    finally:
+        if registro.version_activa() != original:
+            registro.rollback()
+        shutil.rmtree(registro.ruta(nueva))
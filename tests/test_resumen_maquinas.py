@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+import models
+from conftest import crear_maquina
+
+INICIO = datetime(2026, 1, 1)
+
+
+def _insertar_lecturas(bd, machine_id, fallas):
+    """Una lectura por elemento de 'fallas' (machine_failure), un minuto aparte."""
+    with bd.begin() as conn:
+        conn.execute(insert(models.MachineReading), [
+            {"machine_id": machine_id, "machine_failure": falla, "timestamp": INICIO + timedelta(minutes=i),
+             "air_temperature": 298.1, "process_temperature": 308.6, "rotational_speed": 1551,
+             "torque": 42.8, "tool_wear": i}
+            for i, falla in enumerate(fallas)
+        ])
+
+
+def test_resumen_de_cada_maquina(cliente, bd):
+    con_falla = crear_maquina(cliente, "L", location="Nave 1")
+    sin_falla = crear_maquina(cliente, "M")
+    sin_lecturas = crear_maquina(cliente, "H")
+    _insertar_lecturas(bd, con_falla, [False, False, True])
+    _insertar_lecturas(bd, sin_falla, [True, False])
+
+    resumenes = {m["machine_id"]: m for m in cliente.get("/api/machines/").json()}
+    assert list(resumenes) == [con_falla, sin_falla, sin_lecturas]
+    assert resumenes[con_falla]["location"] == "Nave 1"
+    assert resumenes[con_falla]["reading_count"] == 3
+    assert resumenes[con_falla]["last_reading_at"] == (INICIO + timedelta(minutes=2)).isoformat()
+    assert resumenes[con_falla]["last_machine_failure"] is True
+    assert resumenes[sin_falla]["reading_count"] == 2
+    assert resumenes[sin_falla]["last_machine_failure"] is False
+    assert resumenes[sin_lecturas]["reading_count"] == 0
+    assert resumenes[sin_lecturas]["last_reading_at"] is None
+    assert "readings" not in resumenes[con_falla]
+
+    assert cliente.get(f"/api/machines/{sin_falla}").json() == resumenes[sin_falla]
+    assert cliente.get("/api/machines/", params={"skip": 1, "limit": 1}).json() == [resumenes[sin_falla]]
+    assert cliente.get(f"/api/machines/{sin_lecturas + 1}").status_code == 404
+
+
+def test_detalle_es_paginado_y_trae_las_lecturas(cliente, bd):
+    maquinas = [crear_maquina(cliente, "L") for _ in range(3)]
+    _insertar_lecturas(bd, maquinas[1], [False, True])
+
+    detalle = cliente.get("/api/machines/detail/", params={"skip": 1, "limit": 1}).json()
+    assert [m["machine_id"] for m in detalle] == [maquinas[1]]
+    assert len(detalle[0]["readings"]) == 2
+    assert cliente.get("/api/machines/detail/", params={"limit": 51}).status_code == 422
+
+
+def test_detalle_trae_solo_las_ultimas_lecturas(cliente, bd):
+    maquinas = [crear_maquina(cliente, "L") for _ in range(3)]
+    _insertar_lecturas(bd, maquinas[0], [False] * 30)
+    _insertar_lecturas(bd, maquinas[2], [False, True, False])
+
+    detalle = {m["machine_id"]: m["readings"] for m in cliente.get("/api/machines/detail/").json()}
+    assert [len(detalle[m]) for m in maquinas] == [20, 0, 3]  # 20 por máquina por defecto
+    # De la más reciente a la más antigua
+    assert [lectura["tool_wear"] for lectura in detalle[maquinas[0]]] == list(range(29, 9, -1))
+
+    pocas = cliente.get("/api/machines/detail/", params={"readings_limit": 2}).json()
+    assert [[lectura["tool_wear"] for lectura in m["readings"]] for m in pocas] == [[29, 28], [], [2, 1]]
+    assert cliente.get("/api/machines/detail/", params={"readings_limit": 201}).status_code == 422
+
+
+def test_borrar_maquina_con_lecturas(cliente, bd):
+    machine_id = crear_maquina(cliente, "L")
+    _insertar_lecturas(bd, machine_id, [False, True])
+    assert cliente.delete(f"/api/machines/{machine_id}").status_code == 204
+    assert cliente.get(f"/api/machines/{machine_id}").status_code == 404
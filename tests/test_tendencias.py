@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert
+
+import models
+from buffer_lecturas import BufferCircular, BufferMaquinas
+from tendencias import CalculadorTendencias, columnas_tendencia, features_tendencia, ventana_de_columnas
+
+GENERADOR = np.random.default_rng(42)
+
+
+def _lecturas(n):
+    """(n, 5) lecturas plausibles: aire, proceso, velocidad, torque, desgaste."""
+    return np.column_stack([
+        GENERADOR.normal(300, 2, n), GENERADOR.normal(310, 1.5, n), GENERADOR.normal(1500, 150, n),
+        GENERADOR.normal(40, 10, n), GENERADOR.integers(0, 250, n),
+    ])
+
+
+def test_buffer_circular():
+    buffer = BufferCircular(4)
+    X = _lecturas(6)
+    buffer.agregar(X[0])
+    assert np.isnan(buffer.ultimas(3)[:2]).all()
+    np.testing.assert_array_equal(buffer.ultimas(3)[2], X[0])
+    for fila in X[1:]:
+        buffer.agregar(fila)
+    np.testing.assert_array_equal(buffer.ultimas(4), X[2:])
+    np.testing.assert_array_equal(buffer.con_capacidad(8).ultimas(4), X[2:])
+    np.testing.assert_array_equal(buffer.con_capacidad(2).ultimas(2), X[4:])
+
+
+def test_features_de_una_ventana_completa():
+    ventana = _lecturas(10)
+    tasa, pendiente, pico = features_tendencia(ventana[None])[0]
+    posicion = np.arange(10)
+    assert np.isclose(tasa, np.polyfit(posicion, ventana[:, 4], 1)[0])
+    assert np.isclose(pendiente, np.polyfit(posicion, ventana[:, 1] - ventana[:, 0], 1)[0])
+    assert np.isclose(pico, ventana[:, 3].max() - ventana[:, 3].mean())
+
+    # Con menos lecturas que la ventana solo cuentan las presentes; con una sola, pendientes en 0
+    incompleta = np.vstack([np.full((7, 5), np.nan), ventana[:3]])
+    np.testing.assert_allclose(features_tendencia(incompleta[None]), features_tendencia(ventana[None, :3]))
+    assert features_tendencia(ventana[None, -1:])[0, :2].tolist() == [0.0, 0.0]
+
+
+def test_entrenamiento_y_servicio_dan_las_mismas_features():
+    ventana = 6
+    maquinas = GENERADOR.integers(1, 5, 500)
+    X = _lecturas(500)
+
+    # Entrenamiento: bloques de distinto tamaño, con las colas de cada máquina entre bloques
+    calculador = CalculadorTendencias(ventana)
+    cortes = [0, 1, 37, 38, 200, 433, 500]
+    entrenamiento = np.vstack([calculador.calcular(X[a:b], maquinas[a:b]) for a, b in zip(cortes, cortes[1:])])
+
+    # Servicio: el buffer circular, con lotes de /predecir/lote de otro tamaño
+    buffer = BufferMaquinas(capacidad=4)  # Crece solo hasta la ventana
+    servicio = []
+    for a, b in zip(range(0, 500, 64), range(64, 564, 64)):
+        servicio.append(features_tendencia(buffer.ventanas(maquinas[a:b], X[a:b], ventana)))
+        buffer.agregar(maquinas[a:b], X[a:b])  # Recién guardado el lote
+    assert buffer.capacidad == ventana
+    np.testing.assert_array_equal(np.vstack(servicio), entrenamiento)
+
+
+def test_ventanas_no_modifica_el_buffer():
+    buffer = BufferMaquinas(capacidad=4)
+    guardadas = _lecturas(3)
+    buffer.agregar([1, 1, 2], guardadas)
+    lote = _lecturas(3)
+    ventanas = buffer.ventanas([1, 2, 1], lote, 3)
+    np.testing.assert_array_equal(ventanas[2], np.vstack([guardadas[1], lote[0], lote[2]]))
+
+    # Un lote que no se llegó a guardar no aparece en las ventanas siguientes
+    otra = buffer.ventanas([1], lote[:1], 3)
+    np.testing.assert_array_equal(otra[0], np.vstack([guardadas[:2], lote[:1]]))
+
+
+def test_ventana_en_el_nombre_de_las_columnas():
+    assert ventana_de_columnas(["torque", *columnas_tendencia(12)]) == 12
+    assert ventana_de_columnas(["torque"]) is None
+
+
+def test_calentar_desde_la_bd(bd):
+    with bd.begin() as conn:
+        maquinas = [conn.execute(insert(models.Machine).values(type="L")).inserted_primary_key[0] for _ in range(2)]
+    X = _lecturas(10).round(2)
+    X[:, 2] = X[:, 2].round()  # rotational_speed es Integer
+    inicio = datetime(2026, 5, 1)
+    # Insertadas desordenadas: cuenta el timestamp (y el reading_id en los empates), no el orden de inserción
+    orden = [3, 0, 9, 5, 1, 7, 2, 8, 4, 6]
+    with bd.begin() as conn:
+        reading_ids = conn.execute(
+            insert(models.MachineReading).returning(models.MachineReading.reading_id, sort_by_parameter_order=True), [
+                {"machine_id": maquinas[i % 2], "timestamp": inicio + timedelta(minutes=i), "machine_failure": False,
+                 **dict(zip(["air_temperature", "process_temperature", "rotational_speed", "torque", "tool_wear"], X[i]))}
+                for i in orden
+            ]).scalars().all()
+
+    buffer = BufferMaquinas(capacidad=3)
+    llega_antes = _lecturas(1)
+    # Guardadas mientras se calentaba: una después de la consulta y otra que la consulta también trae
+    buffer.agregar([maquinas[0]], llega_antes, [max(reading_ids) + 1])
+    buffer.agregar([maquinas[1]], X[[9]], [reading_ids[orden.index(9)]])
+    assert buffer.calentar(bd) == 6
+
+    # La ventana de una lectura nueva: lo cargado (de la más vieja a la más nueva) y lo que llegó antes, sin repetir
+    nuevas = _lecturas(2)
+    ventanas = buffer.ventanas(maquinas, nuevas, 4)
+    np.testing.assert_allclose(ventanas[0], np.vstack([X[[6, 8]], llega_antes, nuevas[:1]]))
+    np.testing.assert_allclose(ventanas[1], np.vstack([X[[5, 7, 9]], nuevas[1:]]))